@@ -0,0 +1,144 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the benchmark suite of FB-PIC (Fourier-Bessel
+Particle-In-Cell).
+
+It defines generic utilities to time a function, and to store and
+compare the results of the benchmarks (as JSON files).
+"""
+import json
+import numpy as np
+try:
+    from time import perf_counter as wall_clock
+except ImportError: # Python 2
+    from time import time as wall_clock
+
+def time_function( func, n_repeat=5, setup=None ):
+    """
+    Return the median time (in seconds) taken by `func()`
+
+    The function is called once before the measurement, so that the
+    Just-In-Time compilation of the kernels is not included.
+
+    Parameters
+    ----------
+    func: callable
+        The function to be timed (without arguments)
+
+    n_repeat: int, optional
+        The number of times that the function is timed
+
+    setup: callable or None, optional
+        A function that is called (without being timed) before each
+        call to `func` (e.g. to restore data that is modified by `func`)
+    """
+    times = []
+    for i in range( n_repeat+1 ):
+        if setup is not None:
+            setup()
+        start = wall_clock()
+        func()
+        duration = wall_clock() - start
+        # Skip the first call (compilation)
+        if i > 0:
+            times.append( duration )
+    return( float(np.median(times)) )
+
+def make_result( name, params, duration, n_particles=None, n_cells=None ):
+    """
+    Return a dictionary that describes the result of one benchmark
+
+    Parameters
+    ----------
+    name: string
+        The name of the benchmark (e.g. 'deposit_rho_numba_linear')
+
+    params: dict
+        The parameters of the benchmark (e.g. Nm, Nz, Nr, threads)
+
+    duration: float (seconds)
+        The time taken by one call to the benchmarked function
+
+    n_particles, n_cells: int or None, optional
+        The number of particles and cells processed by one call;
+        used to compute the throughput in particles/s and cells/s
+    """
+    result = { 'name': name, 'params': params, 'time': duration }
+    if n_particles is not None:
+        result['particles_per_second'] = n_particles/duration
+    if n_cells is not None:
+        result['cells_per_second'] = n_cells/duration
+    return( result )
+
+def get_key( result ):
+    """
+    Return a string that identifies a benchmark (name and parameters),
+    used to match the results with the baseline
+    """
+    params = ','.join( '%s=%s' %(key, result['params'][key])
+                       for key in sorted(result['params'].keys()) )
+    return( '%s(%s)' %(result['name'], params) )
+
+def save_results( results, file_name ):
+    """
+    Write the list of results to a JSON file
+    """
+    with open( file_name, 'w' ) as f:
+        json.dump( results, f, indent=2 )
+
+def load_results( file_name ):
+    """
+    Read a list of results from a JSON file
+    """
+    with open( file_name ) as f:
+        return( json.load(f) )
+
+def compare_to_baseline( results, baseline, threshold ):
+    """
+    Compare the results with a baseline and return the list of regressions
+
+    Parameters
+    ----------
+    results, baseline: lists of dictionaries
+        The current results and the baseline results
+
+    threshold: float
+        The relative slowdown above which a benchmark is considered as
+        a regression (e.g. 0.2 for 20%)
+
+    Returns
+    -------
+    A list of (key, baseline_time, time) tuples, for the benchmarks that
+    are slower than the baseline by more than `threshold`
+    """
+    baseline_times = { get_key(result): result['time']
+                       for result in baseline }
+    regressions = []
+    for result in results:
+        key = get_key( result )
+        if key in baseline_times:
+            if result['time'] > (1.+threshold)*baseline_times[key]:
+                regressions.append( (key, baseline_times[key], result['time']) )
+    return( regressions )
+
+def print_results( results, baseline=None ):
+    """
+    Print the results as a table (with the ratio to the baseline, if any)
+    """
+    if baseline is not None:
+        baseline_times = { get_key(result): result['time']
+                           for result in baseline }
+    for result in results:
+        key = get_key( result )
+        line = '%-80s %10.3f ms' %(key, 1.e3*result['time'])
+        if 'particles_per_second' in result:
+            line += ' %10.3e ptcl/s' %result['particles_per_second']
+        if 'cells_per_second' in result:
+            line += ' %10.3e cells/s' %result['cells_per_second']
+        if 'file_size' in result:
+            line += ' %10.2f MB' %(1.e-6*result['file_size'])
+        if baseline is not None and key in baseline_times:
+            line += '  (x%.2f)' %(result['time']/baseline_times[key])
+        print( line )
@@ -0,0 +1,316 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the benchmark suite of FB-PIC (Fourier-Bessel
+Particle-In-Cell).
+
+It defines the benchmarks of the hot paths of the PIC cycle on CPU.
+Each kernel is called through the corresponding high-level method
+(e.g. `Particles.gather` calls `gather_field_numba_linear`), on a
+`Simulation` object with a uniform plasma, so that the benchmarks
+exercise the same code path as an actual simulation.
+
+It also defines a benchmark of the writing of the openPMD diagnostics
+(time and size of the files), for several compression settings.
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+from fbpic.openpmd_diag import FieldDiagnostic, ParticleDiagnostic
+from fbpic.utils.threading import nthreads
+from fbpic.boundaries.particle_buffer_handling import remove_particles_cpu
+from harness import time_function, make_result
+try:
+    from importlib.util import spec_from_file_location, module_from_spec
+    def load_script( name, path ):
+        """Import the Python script `path` as a module"""
+        spec = spec_from_file_location( name, path )
+        module = module_from_spec( spec )
+        spec.loader.exec_module( module )
+        return( module )
+except ImportError: # Python 2
+    from imp import load_source as load_script
+
+# Grid sizes (Nz, Nr) used by the benchmarks
+grid_sizes = { 'small': (128, 64), 'medium': (512, 128), 'large': (2048, 256) }
+# Number of macroparticles per cell (along z, r and theta)
+p_nz = 2
+p_nr = 2
+p_nt = 4
+
+# Chunking/compression settings of the diagnostics, in the I/O benchmark
+# (the last one is lossy and only applies to the particles)
+io_settings = [
+    ( 'contiguous', {} ),
+    ( 'gzip1_shuffle',
+        { 'compression': 'gzip', 'compression_level': 1, 'shuffle': True } ),
+    ( 'gzip4_shuffle',
+        { 'compression': 'gzip', 'compression_level': 4, 'shuffle': True } ),
+    ( 'lzf_shuffle', { 'compression': 'lzf', 'shuffle': True } ),
+    ( 'lzf_shuffle_float32', { 'compression': 'lzf', 'shuffle': True,
+        'float32_data': ['position', 'momentum'] } ) ]
+
+# Path to the LWFA example script of the documentation
+lwfa_script = os.path.join( os.path.dirname(os.path.abspath(__file__)),
+                '..', 'docs', 'source', 'example_input', 'lwfa_script.py' )
+
+def create_simulation( Nz, Nr, Nm, particle_shape ):
+    """
+    Return a CPU simulation with a uniform plasma of electrons,
+    which fills the whole box (including the guard cells)
+    """
+    zmax = 40.e-6
+    rmax = 20.e-6
+    dt = zmax/Nz/c
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=p_nz, p_nr=p_nr,
+                      p_nt=p_nt, n_e=1.e24, particle_shape=particle_shape,
+                      boundaries='open', verbose_level=0 )
+    # Give a random momentum to the particles
+    species = sim.ptcl[0]
+    species.ux[:] = np.random.normal( size=species.Ntot )
+    species.uy[:] = np.random.normal( size=species.Ntot )
+    species.uz[:] = np.random.normal( size=species.Ntot )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.ux**2 + species.uy**2 \
+                                         + species.uz**2 )
+    return( sim )
+
+def run_particle_benchmarks( size, Nm, particle_shape, n_repeat ):
+    """
+    Benchmark the deposition, gathering and push of the particles,
+    as well as the removal of the particles in the guard cells.
+
+    Parameters
+    ----------
+    size: string
+        One of the keys of `grid_sizes`
+
+    Nm: int
+        Number of azimuthal modes
+
+    particle_shape: string
+        Either 'linear' or 'cubic'
+
+    n_repeat: int
+        Number of repetitions of the timing
+
+    Returns
+    -------
+    A list of result dictionaries (see `harness.make_result`)
+    """
+    Nz, Nr = grid_sizes[size]
+    sim = create_simulation( Nz, Nr, Nm, particle_shape )
+    species = sim.ptcl[0]
+    fld = sim.fld
+    Ntot = species.Ntot
+    params = { 'size': size, 'Nz': Nz, 'Nr': Nr, 'Nm': Nm,
+               'shape': particle_shape, 'threads': nthreads }
+    results = []
+
+    # Deposition
+    for fieldtype in ['rho', 'J']:
+        duration = time_function(
+            lambda: species.deposit( fld, fieldtype ),
+            n_repeat, setup=lambda: fld.erase( fieldtype ) )
+        results.append( make_result(
+            'deposit_%s_numba_%s' %(fieldtype, particle_shape),
+            params, duration, n_particles=Ntot ) )
+
+    # Gathering
+    duration = time_function(
+        lambda: species.gather( fld.interp ), n_repeat )
+    results.append( make_result( 'gather_field_numba_%s' %particle_shape,
+                    params, duration, n_particles=Ntot ) )
+
+    # Momentum push (independent of the particle shape)
+    if particle_shape == 'linear':
+        duration = time_function( lambda: species.push_p( 0. ), n_repeat )
+        results.append( make_result( 'push_p_numba',
+            dict(params, shape=None), duration, n_particles=Ntot ) )
+
+    # Removal of the particles in the guard cells (independent of the
+    # particle shape). The particle arrays are restored before each call
+    # (through `resize_particle_arrays`, which reuses their storage).
+    if particle_shape == 'linear':
+        saved = [ getattr(obj, name).copy()
+                  for obj, name in species.get_particle_attributes() ]
+        def restore_particles():
+            species.resize_particle_arrays( Ntot )
+            for (obj, name), array in zip(
+                    species.get_particle_attributes(), saved ):
+                getattr( obj, name )[:] = array
+        buffer_handler = sim.comm.get_particle_buffer_handler( species )
+        duration = time_function(
+            lambda: remove_particles_cpu( species, fld, sim.comm.n_guard,
+                sim.comm.left_proc, sim.comm.right_proc, buffer_handler ),
+            n_repeat, setup=restore_particles )
+        restore_particles()
+        results.append( make_result( 'remove_particles_cpu',
+            dict(params, shape=None), duration, n_particles=Ntot ) )
+
+    return( results )
+
+def run_field_benchmarks( size, Nm, n_repeat ):
+    """
+    Benchmark the spectral transforms (for one mode) and the sum
+    of the thread-local deposition arrays (for all modes).
+
+    Parameters
+    ----------
+    size: string
+        One of the keys of `grid_sizes`
+
+    Nm: int
+        Number of azimuthal modes
+
+    n_repeat: int
+        Number of repetitions of the timing
+
+    Returns
+    -------
+    A list of result dictionaries (see `harness.make_result`)
+    """
+    Nz, Nr = grid_sizes[size]
+    sim = create_simulation( Nz, Nr, Nm, 'linear' )
+    fld = sim.fld
+    params = { 'size': size, 'Nz': Nz, 'Nr': Nr, 'Nm': Nm,
+               'threads': nthreads }
+    results = []
+
+    # Number of cells of the local grid (including guard and damp cells)
+    n_cells = fld.interp[0].Nz * fld.interp[0].Nr
+
+    # Sum of the thread-local deposition arrays (all modes)
+    duration = time_function(
+        lambda: fld.sum_reduce_deposition_array('rho'), n_repeat )
+    results.append( make_result( 'sum_reduce_2d_array', params,
+                                 duration, n_cells=Nm*n_cells ) )
+
+    # The transforms are independent of Nm: only run them once
+    if Nm == 1:
+        trans = fld.trans[0]
+        interp_array = fld.interp[0].Ez
+        interp_array[:,:] = np.random.rand( *interp_array.shape )
+        buffer = trans.spect_buffer_r
+        spect_array = fld.spect[0].Ez
+        duration = time_function(
+            lambda: trans.fft.transform( interp_array, buffer ), n_repeat )
+        results.append( make_result( 'FFT.transform', params,
+                                     duration, n_cells=n_cells ) )
+        duration = time_function(
+            lambda: trans.dht0.transform( buffer, spect_array ), n_repeat )
+        results.append( make_result( 'DHT.transform', params,
+                                     duration, n_cells=n_cells ) )
+
+    return( results )
+
+def create_lwfa_simulation():
+    """
+    Return a CPU simulation of the LWFA example of the documentation,
+    in which the plasma has entered the box (so that the PIC iterations
+    and the diagnostics include particles), as well as the module
+    that contains the parameters of the example
+    """
+    # Import the parameters of the example script
+    # (the simulation itself only runs when the script is executed)
+    lwfa = load_script( 'lwfa_script', lwfa_script )
+    from fbpic.lpa_utils.laser import add_laser
+
+    sim = Simulation( lwfa.Nz, lwfa.zmax, lwfa.Nr, lwfa.rmax, lwfa.Nm,
+        lwfa.dt, lwfa.p_zmin, lwfa.p_zmax, lwfa.p_rmin, lwfa.p_rmax,
+        lwfa.p_nz, lwfa.p_nr, lwfa.p_nt, lwfa.n_e, dens_func=lwfa.dens_func,
+        zmin=lwfa.zmin, boundaries='open', n_order=lwfa.n_order,
+        use_cuda=False, verbose_level=0 )
+    add_laser( sim, lwfa.a0, lwfa.w0, lwfa.ctau, lwfa.z0 )
+    sim.set_moving_window( v=lwfa.v_window )
+    # Let the plasma enter the box
+    sim.step( int( 0.5*lwfa.Nz ), show_progress=False )
+    return( sim, lwfa )
+
+def run_lwfa_benchmark( n_steps, n_repeat ):
+    """
+    Benchmark `Simulation.step` on the LWFA example of the documentation
+    (on CPU, without diagnostics)
+
+    Parameters
+    ----------
+    n_steps: int
+        Number of PIC iterations per call to `step`
+
+    n_repeat: int
+        Number of repetitions of the timing
+
+    Returns
+    -------
+    A list of result dictionaries (see `harness.make_result`)
+    """
+    sim, lwfa = create_lwfa_simulation()
+
+    duration = time_function(
+        lambda: sim.step( n_steps, show_progress=False ), n_repeat )
+    params = { 'Nz': lwfa.Nz, 'Nr': lwfa.Nr, 'Nm': lwfa.Nm,
+               'steps': n_steps, 'threads': nthreads }
+    return([ make_result( 'Simulation.step_lwfa', params, duration,
+        n_particles=n_steps*sim.ptcl[0].Ntot,
+        n_cells=n_steps*lwfa.Nz*lwfa.Nr ) ])
+
+def run_io_benchmark( n_repeat ):
+    """
+    Benchmark the writing of the openPMD files (`write_hdf5` of
+    FieldDiagnostic and ParticleDiagnostic) on the LWFA example of the
+    documentation, for several chunking/compression settings
+    (see `io_settings`), and record the size of the files
+
+    Parameters
+    ----------
+    n_repeat: int
+        Number of repetitions of the timing
+
+    Returns
+    -------
+    A list of result dictionaries (see `harness.make_result`), with
+    the additional key 'file_size' (in bytes)
+    """
+    sim, lwfa = create_lwfa_simulation()
+    species = sim.ptcl[0]
+
+    results = []
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for name, kwargs in io_settings:
+            write_dir = os.path.join( tmp_dir, name )
+            diags = []
+            if 'float32_data' not in kwargs:
+                diags.append( FieldDiagnostic( 1, sim.fld, comm=sim.comm,
+                    write_dir=write_dir, **kwargs ) )
+            diags.append( ParticleDiagnostic( 1, {'electrons': species},
+                comm=sim.comm, write_dir=write_dir, **kwargs ) )
+
+            for diag in diags:
+                file_name = os.path.join( write_dir, 'hdf5',
+                                          'data%08d.h5' %sim.iteration )
+                # Write a new file at each call (rather than overwriting
+                # the datasets of the previous one)
+                def remove_file():
+                    if os.path.exists( file_name ):
+                        os.remove( file_name )
+                duration = time_function(
+                    lambda: diag.write_hdf5( sim.iteration ),
+                    n_repeat, setup=remove_file )
+                params = { 'Nz': lwfa.Nz, 'Nr': lwfa.Nr, 'Nm': lwfa.Nm,
+                           'settings': name, 'threads': nthreads }
+                if isinstance( diag, FieldDiagnostic ):
+                    result = make_result( 'FieldDiagnostic.write_hdf5',
+                        params, duration, n_cells=lwfa.Nz*lwfa.Nr )
+                else:
+                    result = make_result( 'ParticleDiagnostic.write_hdf5',
+                        params, duration, n_particles=species.Ntot )
+                result['file_size'] = os.path.getsize( file_name )
+                results.append( result )
+    finally:
+        shutil.rmtree( tmp_dir )
+    return( results )
@@ -0,0 +1,156 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the benchmark suite of FB-PIC (Fourier-Bessel
+Particle-In-Cell).
+
+It runs the benchmarks of the hot paths of the PIC cycle, for several
+grid sizes, numbers of modes, particle shapes and numbers of threads,
+stores the results as JSON, and compares them to a baseline.
+
+Usage
+-----
+Create a baseline (e.g. on the master branch):
+$ python benchmarks/run_benchmarks.py --output baseline.json
+
+Compare a modified version of the code to this baseline:
+$ python benchmarks/run_benchmarks.py --baseline baseline.json
+
+The script exits with a non-zero status if one of the benchmarks is slower
+than the baseline by more than the threshold (20% by default).
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+benchmark_dir = os.path.dirname( os.path.abspath(__file__) )
+
+def parse_args( argv=None ):
+    """
+    Parse the command-line arguments
+    """
+    parser = argparse.ArgumentParser( description=
+        'Run the benchmarks of FBPIC and compare them to a baseline.' )
+    parser.add_argument( '--sizes', nargs='+', default=['small', 'medium'],
+        choices=['small', 'medium', 'large'], help='Grid sizes' )
+    parser.add_argument( '--modes', nargs='+', type=int,
+        default=[1, 2, 3, 5], help='Numbers of azimuthal modes' )
+    parser.add_argument( '--shapes', nargs='+', default=['linear', 'cubic'],
+        choices=['linear', 'cubic'], help='Particle shapes' )
+    parser.add_argument( '--threads', nargs='+', type=int, default=None,
+        help='Numbers of threads (default: 1 and all available threads)' )
+    parser.add_argument( '--groups', nargs='+',
+        default=['particles', 'fields', 'lwfa'],
+        choices=['particles', 'fields', 'lwfa', 'io'],
+        help='Benchmarks to run' )
+    parser.add_argument( '--lwfa_steps', type=int, default=20,
+        help='Number of PIC iterations in the LWFA benchmark' )
+    parser.add_argument( '--repeat', type=int, default=5,
+        help='Number of repetitions of each timing (the median is kept)' )
+    parser.add_argument( '--output', default=None,
+        help='JSON file in which the results are written' )
+    parser.add_argument( '--baseline', default=None,
+        help='JSON file with the baseline results' )
+    parser.add_argument( '--threshold', type=float, default=0.2,
+        help='Relative slowdown above which a benchmark fails' )
+    # Internal argument: run the benchmarks for the current number of
+    # threads only (used by the subprocesses launched for each thread count)
+    parser.add_argument( '--worker', action='store_true',
+        help=argparse.SUPPRESS )
+    return( parser.parse_args(argv) )
+
+def run_worker( args ):
+    """
+    Run the benchmarks in the current process (with the number of threads
+    given by the environment variable NUMBA_NUM_THREADS) and write the
+    results to `args.output`
+    """
+    from harness import save_results
+    from kernels import run_particle_benchmarks, run_field_benchmarks, \
+        run_lwfa_benchmark, run_io_benchmark
+
+    results = []
+    for size in args.sizes:
+        for Nm in args.modes:
+            if 'particles' in args.groups:
+                for shape in args.shapes:
+                    results += run_particle_benchmarks(
+                        size, Nm, shape, args.repeat )
+            if 'fields' in args.groups:
+                results += run_field_benchmarks( size, Nm, args.repeat )
+    if 'lwfa' in args.groups:
+        results += run_lwfa_benchmark( args.lwfa_steps, args.repeat )
+    if 'io' in args.groups:
+        results += run_io_benchmark( args.repeat )
+    save_results( results, args.output )
+
+def run_all( args ):
+    """
+    Launch one subprocess per number of threads (since the number of
+    threads of FBPIC is fixed at import time), gather the results and
+    compare them to the baseline
+
+    Returns
+    -------
+    The exit status (1 if a regression was found, 0 otherwise)
+    """
+    from harness import load_results, save_results, print_results, \
+        compare_to_baseline
+
+    threads = args.threads
+    if threads is None:
+        threads = sorted( set([ 1, multiprocessing.cpu_count() ]) )
+
+    results = []
+    for n in threads:
+        print('Running the benchmarks with %d thread(s) ...' %n)
+        sys.stdout.flush()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            output = os.path.join( tmp_dir, 'results.json' )
+            env = dict( os.environ, NUMBA_NUM_THREADS=str(n) )
+            command = [ sys.executable, os.path.abspath(__file__),
+                '--worker', '--output', output,
+                '--sizes' ] + args.sizes \
+                + [ '--modes' ] + [ str(Nm) for Nm in args.modes ] \
+                + [ '--shapes' ] + args.shapes \
+                + [ '--groups' ] + args.groups \
+                + [ '--lwfa_steps', str(args.lwfa_steps),
+                    '--repeat', str(args.repeat) ]
+            subprocess.check_call( command, env=env )
+            results += load_results( output )
+        finally:
+            shutil.rmtree( tmp_dir )
+
+    baseline = None
+    if args.baseline is not None:
+        baseline = load_results( args.baseline )
+    print('')
+    print_results( results, baseline )
+    if args.output is not None:
+        save_results( results, args.output )
+
+    if baseline is not None:
+        regressions = compare_to_baseline( results, baseline, args.threshold )
+        if len(regressions) > 0:
+            print('\n%d benchmark(s) slower than the baseline by more '
+                  'than %d%%:' %(len(regressions), 100*args.threshold) )
+            for key, baseline_time, time in regressions:
+                print('  %s: %.3f ms -> %.3f ms'
+                      %(key, 1.e3*baseline_time, 1.e3*time) )
+            return( 1 )
+    return( 0 )
+
+if __name__ == '__main__':
+    # Make the modules of the benchmark suite importable
+    sys.path.insert( 0, benchmark_dir )
+    args = parse_args()
+    if args.worker:
+        run_worker( args )
+    else:
+        sys.exit( run_all(args) )
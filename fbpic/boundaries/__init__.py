@@ -1,8 +1,9 @@
 """
 This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
-It imports the BoundaryCommunicator object,
-so that this object can be used at a higher level.
+It imports the BoundaryCommunicator, MovingWindow and LoadBalancer
+objects, so that these objects can be used at a higher level.
 """
 from .boundary_communicator import BoundaryCommunicator
 from .moving_window import MovingWindow
-__all__ = ['BoundaryCommunicator', 'MovingWindow']
+from .load_balancer import LoadBalancer
+__all__ = ['BoundaryCommunicator', 'MovingWindow', 'LoadBalancer']
@@ -10,16 +10,26 @@ from scipy.constants import c
 from fbpic.utils.mpi import MPI, comm, mpi_type_dict, \
     mpi_installed, gpudirect_enabled
 from fbpic.fields.fields import InterpolationGrid
-from fbpic.fields.utility_methods import get_stencil_reach
+from fbpic.fields.utility_methods import get_stencil_reach, \
+    get_radial_domain_bounds
 from fbpic.particles.particles import Particles
 from .field_buffer_handling import BufferHandler
-from .particle_buffer_handling import remove_outside_particles, \
-     add_buffers_to_particles, shift_particles_periodic_subdomain
+from .particle_buffer_handling import ParticleBufferHandler, \
+    remove_outside_particles, remove_radially_outside_particles, \
+    add_buffers_to_particles, shift_particles_periodic_subdomain
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 if cuda_installed:
     from fbpic.utils.cuda import cuda, cuda_tpb_bpg_2d
-    from .cuda_methods import cuda_damp_EB_left, cuda_damp_EB_right
+    from .cuda_methods import cuda_damp_vec_left, cuda_damp_vec_right
+
+# Offset of the MPI tags for each type of field exchange
+# (so that several exchanges can be in flight at the same time)
+field_exchange_tags = { 'E:replace': 10, 'B:replace': 20,
+                        'J:add': 30, 'rho:add': 40 }
+# MPI tag of the particle exchanges of the first species
+# (each species uses 4 tags, see `ParticleBufferHandler`)
+particle_exchange_tag = 100
 
 class BoundaryCommunicator(object):
     """
@@ -27,6 +37,16 @@ class BoundaryCommunicator(object):
     the moving window and MPI communication between domains.
     It also handles the initial domain decomposition.
 
+    Optionally, the MPI ranks can also be divided along r (see the argument
+    `n_radial_domains`). In this case, the ranks that have the same
+    z domain hold the same fields on the interpolation grid, but share
+    the Hankel transforms and the spectral grid (one block of radial modes
+    per rank), as well as the particles (one band of radii per rank).
+    The attributes `mpi_comm`, `rank` and `size` then correspond to the
+    decomposition along z (i.e. to the ranks that have the same radial
+    domain), `r_comm`, `r_rank` and `r_size` to the decomposition along r,
+    and `world_comm`, `world_rank` and `world_size` to all the ranks.
+
     The functions of this object are:
 
     - At each timestep, to exchange the fields between MPI domains
@@ -46,7 +66,8 @@ class BoundaryCommunicator(object):
 
     def __init__( self, Nz, zmin, zmax, Nr, rmax, Nm, dt, v_comoving,
             use_galilean, boundaries, n_order, n_guard=None, n_damp=64,
-            n_inject=None, exchange_period=None, use_all_mpi_ranks=True):
+            n_inject=None, exchange_period=None, use_all_mpi_ranks=True,
+            n_radial_domains=1 ):
         """
         Initializes a communicator object.
 
@@ -134,6 +155,13 @@ class BoundaryCommunicator(object):
             - if `use_all_mpi_ranks` is False:
               Each MPI rank will run an independent simulation.
               This can be useful when running parameter scans.
+
+        n_radial_domains: int, optional
+            The number of domains along r. The MPI ranks are divided into
+            `n_radial_domains` groups of consecutive ranks along r (the
+            total number of ranks should be a multiple of `n_radial_domains`),
+            and the simulation is decomposed along z between these groups.
+            (Only on CPU ; see the class docstring)
         """
         # Initialize global number of cells and modes
         self.Nr = Nr
@@ -147,13 +175,49 @@ class BoundaryCommunicator(object):
         # MPI Setup
         self.use_all_mpi_ranks = use_all_mpi_ranks
         if self.use_all_mpi_ranks and mpi_installed:
-            self.mpi_comm = comm
-            self.rank = self.mpi_comm.rank
-            self.size = self.mpi_comm.size
+            self.world_comm = comm
+            self.world_rank = comm.rank
+            self.world_size = comm.size
         else:
-            self.mpi_comm = None
-            self.rank = 0
-            self.size = 1
+            self.world_comm = None
+            self.world_rank = 0
+            self.world_size = 1
+        if n_radial_domains > 1:
+            # Split the ranks into a communicator along z (ranks that have
+            # the same radial domain) and a communicator along r (ranks that
+            # have the same z domain, and which are consecutive)
+            if self.world_size % n_radial_domains != 0:
+                raise ValueError('The number of MPI ranks (%d) is not a '
+                    'multiple of `n_radial_domains` (%d).'
+                    %(self.world_size, n_radial_domains))
+            iz_domain, ir_domain = divmod( self.world_rank, n_radial_domains )
+            self.mpi_comm = comm.Split( color=ir_domain, key=iz_domain )
+            self.r_comm = comm.Split( color=iz_domain, key=ir_domain )
+            self.r_rank = self.r_comm.rank
+            self.r_size = self.r_comm.size
+        else:
+            self.mpi_comm = self.world_comm
+            self.r_comm = None
+            self.r_rank = 0
+            self.r_size = 1
+        self.rank = self.world_rank // self.r_size
+        self.size = self.world_size // self.r_size
+        # Index of the first radial cell of each radial domain (and total
+        # number of cells), and radial neighbors (None for the axis and
+        # for the upper radial boundary)
+        self._ir_domain_bounds = get_radial_domain_bounds( Nr, self.r_size )
+        self.dr = rmax/Nr
+        self.inner_proc = self.r_rank-1 if self.r_rank > 0 else None
+        self.outer_proc = self.r_rank+1 if self.r_rank < self.r_size-1 \
+                            else None
+        # Index of the first cell of the physical domain of each proc
+        # (and total number of cells, as last element), counted from the
+        # first cell of the global physical domain: initially, divide the
+        # number of cells equally between procs (the last proc gets the
+        # extra cells). This can be modified by the dynamic load balancing.
+        Nz_per_proc = int(self._Nz_global_domain/self.size)
+        self._iz_domain_bounds = np.array(
+            [ k*Nz_per_proc for k in range(self.size) ] + [ Nz ] )
         # Get the rank of the left and the right domain
         self.left_proc = self.rank-1
         self.right_proc = self.rank+1
@@ -246,6 +310,13 @@ class BoundaryCommunicator(object):
         else:
             # User-defined exchange_period. Choose carefully.
             self.exchange_period = exchange_period
+        # With a decomposition along r: number of cells on each side of the
+        # local radial band in which the particles of the band can gather
+        # the fields (Within exchange_period timesteps, the particles travel
+        # at most exchange_period*c*dt outside of the band, and the
+        # "cubic" shape factor extends over 3 additional cells.)
+        self.n_radial_halo = \
+            int( np.ceil( self.exchange_period*c*dt/self.dr ) ) + 3
 
         # Initialize the moving window to None (See the method
         # set_moving_window in main.py to initialize a proper moving window)
@@ -255,6 +326,14 @@ class BoundaryCommunicator(object):
         if self.size > 1:
             self.mpi_buffers = BufferHandler( self.n_guard, Nr, Nm,
                                       self.left_proc, self.right_proc )
+        # MPI requests of the field exchanges that are in progress
+        # (see `start_exchange` and `finish_exchange`)
+        self.pending_exchanges = {}
+        # Buffers and persistent MPI requests of the particle exchanges
+        # (one ParticleBufferHandler per species, see `exchange_particles`,
+        # and per species for the exchanges along r)
+        self.particle_buffers = {}
+        self.radial_particle_buffers = {}
 
         # Create damping arrays for the damping cells at the left
         # and right of the box in the case of "open" boundaries.
@@ -345,13 +424,9 @@ class BoundaryCommunicator(object):
         # Get the local number of cells
         if local:
             # First: get the number of cells without guard cells and damp cells
-            # Divide the number of cells equally between procs
-            Nz_per_proc = int(self._Nz_global_domain/self.size)
-            Nz = Nz_per_proc
-            iz = rank * Nz_per_proc
-            # The last proc gets the extra cells
-            if rank == self.size-1:
-                Nz += (self._Nz_global_domain)%(self.size)
+            # (see `set_domain_bounds` for the division between procs)
+            iz = int( self._iz_domain_bounds[rank] )
+            Nz = int( self._iz_domain_bounds[rank+1] ) - iz
             # Add damp cells if requested (only for first and last sub-domain)
             if with_damp:
                 if rank == 0:
@@ -381,6 +456,40 @@ class BoundaryCommunicator(object):
         return( Nz, iz )
 
 
+    def get_domain_bounds( self ):
+        """
+        Return the index of the first cell of the physical domain of each
+        MPI rank (and the total number of cells, as last element), counted
+        from the first cell of the global physical domain
+
+        Returns:
+        --------
+        iz_bounds: 1darray of ints, of size `self.size+1`
+        """
+        return( self._iz_domain_bounds.copy() )
+
+    def set_domain_bounds( self, iz_bounds ):
+        """
+        Modify the division of the global physical domain between MPI ranks.
+
+        Note that this only modifies the values returned by `get_Nz_and_iz`
+        and `get_zmin_zmax`: the fields and particles need to be
+        redistributed separately (see `LoadBalancer.redistribute`).
+
+        Parameters:
+        -----------
+        iz_bounds: 1darray of ints, of size `self.size+1`
+            The index of the first cell of the physical domain of each
+            MPI rank (and the total number of cells, as last element)
+        """
+        iz_bounds = np.array( iz_bounds, dtype=int )
+        if (len(iz_bounds) != self.size+1) or (iz_bounds[0] != 0) or \
+            (iz_bounds[-1] != self._Nz_global_domain) or \
+            np.any( iz_bounds[1:] <= iz_bounds[:-1] ):
+            raise ValueError('Invalid boundaries of the MPI domains: %s'
+                             %iz_bounds )
+        self._iz_domain_bounds = iz_bounds
+
     def get_zmin_zmax( self, local, with_damp, with_guard, rank=None ):
         """
         Return the positions in z of the edges of either the global grid,
@@ -420,6 +529,32 @@ class BoundaryCommunicator(object):
         return(zmin, zmax)
 
 
+    def get_rmin_rmax( self, r_rank=None ):
+        """
+        Return the radii between which the particles belong to the
+        radial domain of the MPI rank `r_rank` (along r).
+        The first radial domain starts on the axis, and the last
+        radial domain extends to infinity.
+
+        Parameters:
+        -----------
+        r_rank: int, optional
+            The rank along r of the considered domain
+            (By default, the domain of the local MPI rank)
+
+        Returns:
+        --------
+        rmin, rmax: floats (in meters)
+        """
+        if r_rank is None:
+            r_rank = self.r_rank
+        rmin = self._ir_domain_bounds[ r_rank ] * self.dr
+        if r_rank == self.r_size-1:
+            rmax = np.inf
+        else:
+            rmax = self._ir_domain_bounds[ r_rank+1 ] * self.dr
+        return( rmin, rmax )
+
     def shift_global_domain_positions( self, z_shift ):
         """
         Shift the (internally-recorded) position of the global domain
@@ -494,6 +629,62 @@ class BoundaryCommunicator(object):
         - Copy the guard cell region "ng" and the correct part "nc" and
           add it to the same region (ng + nc) of the neighboring domain.
 
+        Parameters:
+        ------------
+        interp: list
+            A list of InterpolationGrid objects
+            (one element per azimuthal mode)
+
+        fieldtype: str
+            An identifier for the field to send
+            (Either 'E', 'B', 'J' or 'rho')
+
+        method: str
+            Can either be 'replace' or 'add' depending on the type
+            of field exchange that is needed
+        """
+        self.start_exchange( interp, fieldtype, method )
+        self.finish_exchange( interp, fieldtype, method )
+
+    def sum_radial_sources( self, interp, fieldtype ):
+        """
+        Sum the charge density or the currents that were deposited by the
+        particles of each radial domain, over the ranks that have the same
+        z domain, so that these ranks all hold the total sources on the
+        interpolation grid. (Only used with a decomposition along r.)
+
+        Parameters:
+        ------------
+        interp: list
+            A list of InterpolationGrid objects
+            (one element per azimuthal mode)
+
+        fieldtype: str
+            An identifier for the field to sum (Either 'J' or 'rho')
+        """
+        if fieldtype == 'rho':
+            names = ['rho']
+        elif fieldtype == 'J':
+            names = ['Jr', 'Jt', 'Jz']
+        else:
+            raise ValueError('Unknown fieldtype: %s' %fieldtype)
+        for grid in interp:
+            for name in names:
+                self.r_comm.Allreduce( MPI.IN_PLACE, getattr(grid, name),
+                                       op=MPI.SUM )
+
+    def start_exchange( self, interp, fieldtype, method ):
+        """
+        Copy the fields `fieldtype` to the sending buffers and post the
+        corresponding non-blocking MPI sends and receives, without waiting
+        for them to complete.
+
+        The exchange is completed by `finish_exchange` (with the same
+        arguments). In between, the caller can perform computations that
+        do not modify the guard cells (for 'replace') or the exchanged
+        region (for 'add') of these fields. Exchanges of different fields
+        (e.g. 'E' and 'B') can be in flight at the same time.
+
         Parameters:
         ------------
         interp: list
@@ -515,23 +706,22 @@ class BoundaryCommunicator(object):
         # Build the string `exchange_type`:
         # This is either 'E:replace', 'B:replace', 'J:add', or 'rho:add'
         exchange_type = ':'.join([ fieldtype, method ])
-
-        # Shortcut
-        Nm = self.Nm
+        if exchange_type in self.pending_exchanges:
+            raise RuntimeError('The exchange %s is already in progress.'
+                                %exchange_type)
         use_cuda = interp[0].use_cuda
 
         # Fill the sending buffers with data from the interpolation grid
         if fieldtype in ('E', 'B', 'J'):
             # Vector field
-            grid_r = [ getattr(interp[m], fieldtype+'r') for m in range(Nm) ]
-            grid_t = [ getattr(interp[m], fieldtype+'t') for m in range(Nm) ]
-            grid_z = [ getattr(interp[m], fieldtype+'z') for m in range(Nm) ]
+            grid_r, grid_t, grid_z = self.get_exchanged_grids(
+                                                    interp, fieldtype )
             self.mpi_buffers.handle_vec_buffer(
                     grid_r, grid_t, grid_z, method, exchange_type, use_cuda,
                     before_sending=True, gpudirect=gpudirect_enabled )
         else:
             # Scalar field
-            grid = [ getattr(interp[m], fieldtype) for m in range(Nm) ]
+            grid, = self.get_exchanged_grids( interp, fieldtype )
             self.mpi_buffers.handle_scal_buffer(
                     grid, method, exchange_type, use_cuda,
                     before_sending=True, gpudirect=gpudirect_enabled )
@@ -559,21 +749,77 @@ class BoundaryCommunicator(object):
             recv_l = self.mpi_buffers.recv_l[ exchange_type ]
             recv_r = self.mpi_buffers.recv_r[ exchange_type ]
 
-        # Send and receive the buffers via MPI
-        self.exchange_domains( send_l, send_r, recv_l, recv_r )
+        # Post the non-blocking sends and receives
+        # (with tags that are specific to this exchange type, so that
+        # several exchanges can be in flight at the same time)
+        self.pending_exchanges[ exchange_type ] = self.start_exchange_domains(
+            send_l, send_r, recv_l, recv_r,
+            tag_offset=field_exchange_tags[ exchange_type ] )
+
+    def finish_exchange( self, interp, fieldtype, method ):
+        """
+        Wait for the exchange of the fields `fieldtype` (posted by
+        `start_exchange`) to complete, and copy/add the received buffers
+        to the guard cells of the interpolation grid.
+
+        Parameters:
+        ------------
+        interp: list
+            A list of InterpolationGrid objects
+            (one element per azimuthal mode)
+
+        fieldtype: str
+            An identifier for the field to send
+            (Either 'E', 'B', 'J' or 'rho')
+
+        method: str
+            Can either be 'replace' or 'add' depending on the type
+            of field exchange that is needed
+        """
+        # Only perform the exchange if there is more than 1 proc
+        if self.size == 1:
+            return
+
+        exchange_type = ':'.join([ fieldtype, method ])
+        if exchange_type not in self.pending_exchanges:
+            raise RuntimeError('The exchange %s was not started.'
+                                %exchange_type)
+        use_cuda = interp[0].use_cuda
+
+        # Wait for the non-blocking sends and receives to complete
+        # (No request is posted with open boundaries: skip the wait,
+        # since MPI.Request may not exist when mpi4py is not installed)
+        requests = self.pending_exchanges.pop( exchange_type )
+        if len(requests) > 0:
+            MPI.Request.Waitall( requests )
 
         # Copy/Add the received buffers to the interpolation grid
         if fieldtype in ('E', 'B', 'J'):
             # Vector field
+            grid_r, grid_t, grid_z = self.get_exchanged_grids(
+                                                    interp, fieldtype )
             self.mpi_buffers.handle_vec_buffer(
                     grid_r, grid_t, grid_z, method, exchange_type, use_cuda,
                     after_receiving=True, gpudirect=gpudirect_enabled )
         else:
             # Scalar field
+            grid, = self.get_exchanged_grids( interp, fieldtype )
             self.mpi_buffers.handle_scal_buffer(
                     grid, method, exchange_type, use_cuda,
                     after_receiving=True, gpudirect=gpudirect_enabled )
 
+    def get_exchanged_grids( self, interp, fieldtype ):
+        """
+        Return the lists of arrays (one element per azimuthal mode) that
+        correspond to `fieldtype`: one list per component for a vector
+        field (r, t, z), and a single list for a scalar field
+        """
+        if fieldtype in ('E', 'B', 'J'):
+            return( [ [ getattr(interp[m], fieldtype+coord)
+                        for m in range(self.Nm) ] for coord in 'rtz' ] )
+        else:
+            return( [ [ getattr(interp[m], fieldtype)
+                        for m in range(self.Nm) ] ] )
 
     def exchange_domains( self, send_left, send_right, recv_left, recv_right ):
         """
@@ -587,28 +833,46 @@ class BoundaryCommunicator(object):
         - send_left, send_right, recv_left, recv_right : arrays
              Sending and receiving buffers
         """
+        requests = self.start_exchange_domains(
+                        send_left, send_right, recv_left, recv_right )
+        # Wait for the non-blocking sends to be received (synchronization)
+        # (No request is posted with open boundaries: skip the wait,
+        # since MPI.Request may not exist when mpi4py is not installed)
+        if len(requests) > 0:
+            MPI.Request.Waitall( requests )
+
+    def start_exchange_domains( self, send_left, send_right,
+                                recv_left, recv_right, tag_offset=0 ):
+        """
+        Post the non-blocking sends of send_left and send_right to the
+        left and right processes, and the non-blocking receives into
+        recv_left and recv_right, and return the list of MPI requests
+        (which need to be completed, e.g. with `MPI.Request.Waitall`,
+        before the buffers are used again).
+
+        Parameters :
+        ------------
+        - send_left, send_right, recv_left, recv_right : arrays
+             Sending and receiving buffers
+        - tag_offset : int
+             Offset of the MPI tags (distinguishes simultaneous exchanges)
+        """
+        requests = []
         # MPI-Exchange: Uses non-blocking send and receive,
         # which return directly and need to be synchronized later.
         # Send to left domain and receive from left domain
         if self.left_proc is not None :
-            req_sl = self.mpi_comm.Isend(
-                send_left, dest=self.left_proc, tag=1 )
-            req_rl = self.mpi_comm.Irecv(
-                recv_left, source=self.left_proc, tag=2 )
+            requests.append( self.mpi_comm.Isend(
+                send_left, dest=self.left_proc, tag=tag_offset+1 ) )
+            requests.append( self.mpi_comm.Irecv(
+                recv_left, source=self.left_proc, tag=tag_offset+2 ) )
         # Send to right domain and receive from right domain
         if self.right_proc is not None :
-            req_sr = self.mpi_comm.Isend(
-                send_right, dest=self.right_proc, tag=2 )
-            req_rr = self.mpi_comm.Irecv(
-                recv_right, source=self.right_proc, tag=1 )
-
-        # Wait for the non-blocking sends to be received (synchronization)
-        if self.left_proc is not None :
-            req_rl.Wait()
-            req_sl.Wait()
-        if self.right_proc is not None :
-            req_rr.Wait()
-            req_sr.Wait()
+            requests.append( self.mpi_comm.Isend(
+                send_right, dest=self.right_proc, tag=tag_offset+2 ) )
+            requests.append( self.mpi_comm.Irecv(
+                recv_right, source=self.right_proc, tag=tag_offset+1 ) )
+        return( requests )
 
 
     def exchange_particles(self, species, fld, time ):
@@ -650,6 +914,10 @@ class BoundaryCommunicator(object):
         # subdomain and send them to neighboring processors
         else:
             self.exchange_particles_aperiodic_subdomain( species, fld, time )
+        # With a decomposition along r, exchange the particles that
+        # are outside of the local radial band
+        if self.r_size > 1:
+            self.exchange_particles_radially( species )
 
     def exchange_particles_aperiodic_subdomain(self, species, fld, time ):
         """
@@ -677,32 +945,15 @@ class BoundaryCommunicator(object):
             order to infer how much the plasma has moved)
         """
         # Remove out-of-domain particles from particle arrays (either on
-        # CPU or GPU) and store them in sending buffers on the CPU
-        float_send_left, float_send_right, uint_send_left, uint_send_right = \
-            remove_outside_particles( species, fld, self.n_guard,
-                                    self.left_proc, self.right_proc )
-
-        # Send/receive the number of particles (need to be stored in arrays)
-        N_send_l = np.array( float_send_left.shape[1], dtype=np.uint32 )
-        N_send_r = np.array( float_send_right.shape[1], dtype=np.uint32 )
-        N_recv_l = np.array( 0, dtype=np.uint32 )
-        N_recv_r = np.array( 0, dtype=np.uint32 )
-        # Note: if left_proc or right_proc is None, the
-        # corresponding N_recv remains 0 (no exchange)
-        self.exchange_domains(N_send_l, N_send_r, N_recv_l, N_recv_r)
-        # Allocate the receiving buffers and exchange particles
-        n_float = float_send_left.shape[0]
-        float_recv_left = np.zeros((n_float, N_recv_l), dtype=np.float64)
-        float_recv_right = np.zeros((n_float, N_recv_r), dtype=np.float64)
-        self.exchange_domains( float_send_left, float_send_right,
-                                float_recv_left, float_recv_right )
-        # Integers (e.g. particle id), if any
-        n_int = uint_send_left.shape[0]
-        uint_recv_left = np.zeros((n_int, N_recv_l), dtype=np.uint64 )
-        uint_recv_right = np.zeros((n_int, N_recv_r), dtype=np.uint64 )
-        if n_int > 0:
-            self.exchange_domains( uint_send_left, uint_send_right,
-                                    uint_recv_left, uint_recv_right )
+        # CPU or GPU) and store them in the sending buffers on the CPU
+        buffer_handler = self.get_particle_buffer_handler( species )
+        remove_outside_particles( species, fld, self.n_guard,
+                    self.left_proc, self.right_proc, buffer_handler )
+
+        # Send/receive the particles (Note: if left_proc or right_proc
+        # is None, the corresponding receiving buffers contain no particle)
+        float_recv_left, float_recv_right, uint_recv_left, uint_recv_right = \
+            buffer_handler.exchange()
 
         # When using a moving window, create new particles in recv_right
         # (Overlap this with the exchange of domains, since recv_right
@@ -729,7 +980,69 @@ class BoundaryCommunicator(object):
         add_buffers_to_particles( species, float_recv_left, float_recv_right,
                                     uint_recv_left, uint_recv_right )
 
-    def damp_EB_open_boundary( self, interp ):
+    def exchange_particles_radially( self, species ):
+        """
+        Exchange the particles that are outside of the radial band of the
+        local domain with the inner and outer neighbors along r.
+        (Only used with a decomposition along r, on CPU.)
+
+        Parameters:
+        ------------
+        species: a Particle object
+            The object corresponding to a given species
+        """
+        # Remove the particles that are outside of the radial band,
+        # and store them in the sending buffers
+        buffer_handler = self.get_particle_buffer_handler( species,
+                                                           radial=True )
+        rmin, rmax = self.get_rmin_rmax()
+        remove_radially_outside_particles( species, rmin, rmax,
+                    self.inner_proc, self.outer_proc, buffer_handler )
+        # Send/receive the particles, and add them to the particle arrays
+        float_recv_in, float_recv_out, uint_recv_in, uint_recv_out = \
+            buffer_handler.exchange()
+        add_buffers_to_particles( species, float_recv_in, float_recv_out,
+                                    uint_recv_in, uint_recv_out )
+
+    def get_particle_buffer_handler( self, species, radial=False ):
+        """
+        Return the ParticleBufferHandler that is used to exchange the
+        particles of `species` (created at the first exchange, and created
+        again if the number of particle quantities changed)
+
+        Parameters:
+        ------------
+        species: a Particle object
+            The object corresponding to a given species
+
+        radial: bool, optional
+            Whether to return the handler of the exchanges along r
+            (with the inner and outer neighbors) instead of along z
+        """
+        if radial:
+            buffers = self.radial_particle_buffers
+            mpi_comm, left_proc, right_proc = \
+                self.r_comm, self.inner_proc, self.outer_proc
+        else:
+            buffers = self.particle_buffers
+            mpi_comm, left_proc, right_proc = \
+                self.mpi_comm, self.left_proc, self.right_proc
+        handler = buffers.get( species )
+        if handler is None:
+            tag = particle_exchange_tag + 4*len( buffers )
+        elif (handler.n_float, handler.n_int) != \
+            (species.n_float_quantities, species.n_integer_quantities):
+            tag = handler.send_tags['left']
+            handler.free()
+        else:
+            return( handler )
+        handler = ParticleBufferHandler( mpi_comm,
+            species.n_float_quantities, species.n_integer_quantities,
+            left_proc, right_proc, tag )
+        buffers[ species ] = handler
+        return( handler )
+
+    def damp_EB_open_boundary( self, interp, fieldtype='EB' ):
         """
         Damp the fields E and B in the damp cells, at the right and left
         of the *global* simulation box.
@@ -738,55 +1051,57 @@ class BoundaryCommunicator(object):
         -----------
         interp: list of InterpolationGrid objects (one per azimuthal mode)
             Objects that contain the fields to be damped.
+
+        fieldtype: str, optional
+            The fields to be damped (either 'E', 'B' or 'EB')
         """
         # Do not damp the fields for 0 n_damp cells (periodic)
         if self.n_damp != 0:
             # Total size of the damping and guard region
             nd = self.n_guard + self.n_damp + self.n_inject
-
-            if self.left_proc is None:
-                # Damp the fields on the CPU or the GPU
-                if interp[0].use_cuda:
-                    # Damp the fields on the GPU
-                    dim_grid, dim_block = cuda_tpb_bpg_2d(
-                        nd, interp[0].Nr )
-                    for m in range(len(interp)):
-                        cuda_damp_EB_left[dim_grid, dim_block](
-                            interp[m].Er, interp[m].Et, interp[m].Ez,
-                            interp[m].Br, interp[m].Bt, interp[m].Bz,
-                            self.d_left_damp, nd)
-                else:
-                    # Damp the fields on the CPU
-                    for m in range(len(interp)):
-                        # Damp the fields in left guard cells
-                        interp[m].Er[:nd,:]*=self.left_damp[:,np.newaxis]
-                        interp[m].Et[:nd,:]*=self.left_damp[:,np.newaxis]
-                        interp[m].Ez[:nd,:]*=self.left_damp[:,np.newaxis]
-                        interp[m].Br[:nd,:]*=self.left_damp[:,np.newaxis]
-                        interp[m].Bt[:nd,:]*=self.left_damp[:,np.newaxis]
-                        interp[m].Bz[:nd,:]*=self.left_damp[:,np.newaxis]
-
-            if self.right_proc is None:
-                # Damp the fields on the CPU or the GPU
-                if interp[0].use_cuda:
-                    # Damp the fields on the GPU
-                    dim_grid, dim_block = cuda_tpb_bpg_2d(
-                        nd, interp[0].Nr )
-                    for m in range(len(interp)):
-                        cuda_damp_EB_right[dim_grid, dim_block](
-                            interp[m].Er, interp[m].Et, interp[m].Ez,
-                            interp[m].Br, interp[m].Bt, interp[m].Bz,
-                            self.d_right_damp, nd)
-                else:
-                    # Damp the fields on the CPU
-                    for m in range(len(interp)):
-                        # Damp the fields in left guard cells
-                        interp[m].Er[-nd:,:]*=self.right_damp[::-1,np.newaxis]
-                        interp[m].Et[-nd:,:]*=self.right_damp[::-1,np.newaxis]
-                        interp[m].Ez[-nd:,:]*=self.right_damp[::-1,np.newaxis]
-                        interp[m].Br[-nd:,:]*=self.right_damp[::-1,np.newaxis]
-                        interp[m].Bt[-nd:,:]*=self.right_damp[::-1,np.newaxis]
-                        interp[m].Bz[-nd:,:]*=self.right_damp[::-1,np.newaxis]
+            Nm = len(interp)
+
+            for field in fieldtype:
+                # Get the components of the vector field
+                grid_r = [ getattr(interp[m], field+'r') for m in range(Nm) ]
+                grid_t = [ getattr(interp[m], field+'t') for m in range(Nm) ]
+                grid_z = [ getattr(interp[m], field+'z') for m in range(Nm) ]
+
+                if self.left_proc is None:
+                    # Damp the fields on the CPU or the GPU
+                    if interp[0].use_cuda:
+                        # Damp the fields on the GPU
+                        dim_grid, dim_block = cuda_tpb_bpg_2d(
+                            nd, interp[0].Nr )
+                        for m in range(Nm):
+                            cuda_damp_vec_left[dim_grid, dim_block](
+                                grid_r[m], grid_t[m], grid_z[m],
+                                self.d_left_damp, nd)
+                    else:
+                        # Damp the fields on the CPU
+                        for m in range(Nm):
+                            # Damp the fields in left guard cells
+                            grid_r[m][:nd,:]*=self.left_damp[:,np.newaxis]
+                            grid_t[m][:nd,:]*=self.left_damp[:,np.newaxis]
+                            grid_z[m][:nd,:]*=self.left_damp[:,np.newaxis]
+
+                if self.right_proc is None:
+                    # Damp the fields on the CPU or the GPU
+                    if interp[0].use_cuda:
+                        # Damp the fields on the GPU
+                        dim_grid, dim_block = cuda_tpb_bpg_2d(
+                            nd, interp[0].Nr )
+                        for m in range(Nm):
+                            cuda_damp_vec_right[dim_grid, dim_block](
+                                grid_r[m], grid_t[m], grid_z[m],
+                                self.d_right_damp, nd)
+                    else:
+                        # Damp the fields on the CPU
+                        for m in range(Nm):
+                            # Damp the fields in right guard cells
+                            grid_r[m][-nd:,:]*=self.right_damp[::-1,np.newaxis]
+                            grid_t[m][-nd:,:]*=self.right_damp[::-1,np.newaxis]
+                            grid_z[m][-nd:,:]*=self.right_damp[::-1,np.newaxis]
 
     def generate_damp_array( self, n_guard, n_damp, n_inject ):
         """
@@ -907,12 +1222,7 @@ class BoundaryCommunicator(object):
             gathered_array = None
 
         # Select the physical region of the local box
-        Nz_local, iz_start_local_domain = self.get_Nz_and_iz(
-            local=True, with_damp=with_damp, with_guard=False, rank=self.rank )
-        _, iz_start_local_array = self.get_Nz_and_iz(
-            local=True, with_damp=True, with_guard=True, rank=self.rank )
-        iz_in_array = iz_start_local_domain - iz_start_local_array
-        local_array = array[ iz_in_array:iz_in_array+Nz_local, : ]
+        local_array, _ = self.get_local_physical_array( array, with_damp )
 
         # Then send the arrays
         if self.size > 1:
@@ -934,6 +1244,38 @@ class BoundaryCommunicator(object):
             return(gathered_array)
 
 
+    def get_local_physical_array(self, array, with_damp=False):
+        """
+        Select the physical region of a local grid array (i.e. without
+        the guard cells, and without the damp cells unless `with_damp`
+        is True), as it appears in the global array of `gather_grid_array`
+
+        Parameter:
+        -----------
+        array: 2darray (grid array)
+            The local grid of the current MPI rank (with guard and damp cells.)
+
+        with_damp: bool, optional
+            Whether to include the damp cells in the selected region.
+
+        Returns:
+        ---------
+        local_array: 2darray
+            A view of `array` that contains the physical region
+
+        iz_global: int
+            The index of the first cell of `local_array` in the global array
+        """
+        _, iz_start_global = self.get_Nz_and_iz(
+                    local=False, with_damp=with_damp, with_guard=False)
+        Nz_local, iz_start_local_domain = self.get_Nz_and_iz(
+            local=True, with_damp=with_damp, with_guard=False, rank=self.rank )
+        _, iz_start_local_array = self.get_Nz_and_iz(
+            local=True, with_damp=True, with_guard=True, rank=self.rank )
+        iz_in_array = iz_start_local_domain - iz_start_local_array
+        local_array = array[ iz_in_array:iz_in_array+Nz_local, : ]
+        return( local_array, iz_start_local_domain - iz_start_global )
+
     def scatter_grid_array(self, array, root=0, with_damp=False):
         """
         Scatter an array that has the size of the global physical domain
@@ -1008,7 +1350,7 @@ class BoundaryCommunicator(object):
         gathered_ptcl: Particle object
             A gathered particle object that contains the global simulation data
         """
-        if self.rank == root:
+        if self.world_rank == root:
             # Initialize new Particle object that
             # is used to gather the global grid data
             gathered_ptcl = Particles(ptcl.q, ptcl.m, ptcl.n, 0, self.zmin,
@@ -1017,7 +1359,7 @@ class BoundaryCommunicator(object):
             # Other processes do not need to initialize new Particle object
             gathered_ptcl = None
         # Get the local number of particle on each proc, and the particle number
-        n_rank = self.mpi_comm.allgather( ptcl.Ntot )
+        n_rank = self.world_comm.allgather( ptcl.Ntot )
         Ntot = sum(n_rank)
         # Loop over particle attributes that need to be gathered
         for particle_attr in ['x', 'y', 'z', 'ux', 'uy',
@@ -1026,7 +1368,7 @@ class BoundaryCommunicator(object):
             array = getattr(ptcl, particle_attr)
             # Gather array on process root
             gathered_array = self.gather_ptcl_array(array, n_rank, Ntot, root)
-            if self.rank == root:
+            if self.world_rank == root:
                 # Write array to particle attribute in the gathered object
                 setattr(gathered_ptcl, particle_attr, gathered_array)
         # Return the gathered particle object
@@ -1058,27 +1400,27 @@ class BoundaryCommunicator(object):
             A gathered array that contains the global simulation data
         """
         # Prepare the output array
-        if self.rank == root:
+        if self.world_rank == root:
             # Root process creates empty numpy array
             gathered_array = np.empty(Ntot, dtype=array.dtype)
         else:
             # Other processes do not need to initialize a new array
             gathered_array = None
 
-        if self.size > 1:
+        if self.world_size > 1:
             # Prepare the send and receive buffers
             i_start_procs = tuple( np.cumsum([0] + n_rank[:-1]) )
             n_rank_procs = tuple( n_rank )
             mpi_type = mpi_type_dict[ str(array.dtype) ]
-            sendbuf = [ array, n_rank_procs[self.rank] ]
+            sendbuf = [ array, n_rank_procs[self.world_rank] ]
             recvbuf = [ gathered_array, n_rank_procs, i_start_procs, mpi_type ]
             # Send/receive the arrays
-            self.mpi_comm.Gatherv( sendbuf, recvbuf, root=root )
+            self.world_comm.Gatherv( sendbuf, recvbuf, root=root )
         else:
             gathered_array[:] = array[:]
 
         # Return the gathered_array only on process root
-        if self.rank == root:
+        if self.world_rank == root:
             return(gathered_array)
 
 
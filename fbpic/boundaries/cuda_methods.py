@@ -347,14 +347,14 @@ def add_scal_from_gpu_buffer( scal_buffer_l, scal_buffer_r, grid, m,
 # CUDA damping kernels:
 # --------------------
 @cuda.jit
-def cuda_damp_EB_left( Er, Et, Ez, Br, Bt, Bz, damp_array, nd ):
+def cuda_damp_vec_left( Fr, Ft, Fz, damp_array, nd ):
     """
-    Multiply the E and B fields in the left guard cells
+    Multiply the vector field F (i.e. E or B) in the left guard cells
     by damp_array.
 
     Parameters :
     ------------
-    Er, Et, Ez, Br, Bt, Bz: 2darrays of complexs
+    Fr, Ft, Fz: 2darrays of complexs
         Contain the fields to be damped
         The first axis corresponds to z and the second to r
 
@@ -369,7 +369,7 @@ def cuda_damp_EB_left( Er, Et, Ez, Br, Bt, Bz, damp_array, nd ):
     iz, ir = cuda.grid(2)
 
     # Obtain the size of the array along z and r
-    Nz, Nr = Er.shape
+    Nz, Nr = Fr.shape
 
     # Modify the fields
     if ir < Nr :
@@ -378,22 +378,19 @@ def cuda_damp_EB_left( Er, Et, Ez, Br, Bt, Bz, damp_array, nd ):
             damp_factor_left = damp_array[iz]
 
             # At the left end
-            Er[iz, ir] *= damp_factor_left
-            Et[iz, ir] *= damp_factor_left
-            Ez[iz, ir] *= damp_factor_left
-            Br[iz, ir] *= damp_factor_left
-            Bt[iz, ir] *= damp_factor_left
-            Bz[iz, ir] *= damp_factor_left
+            Fr[iz, ir] *= damp_factor_left
+            Ft[iz, ir] *= damp_factor_left
+            Fz[iz, ir] *= damp_factor_left
 
 @cuda.jit
-def cuda_damp_EB_right( Er, Et, Ez, Br, Bt, Bz, damp_array, nd ):
+def cuda_damp_vec_right( Fr, Ft, Fz, damp_array, nd ):
     """
-    Multiply the E and B fields in the right guard cells
+    Multiply the vector field F (i.e. E or B) in the right guard cells
     by damp_array.
 
     Parameters :
     ------------
-    Er, Et, Ez, Br, Bt, Bz : 2darrays of complexs
+    Fr, Ft, Fz : 2darrays of complexs
         Contain the fields to be damped
         The first axis corresponds to z and the second to r
 
@@ -408,7 +405,7 @@ def cuda_damp_EB_right( Er, Et, Ez, Br, Bt, Bz, damp_array, nd ):
     iz, ir = cuda.grid(2)
 
     # Obtain the size of the array along z and r
-    Nz, Nr = Er.shape
+    Nz, Nr = Fr.shape
 
     # Modify the fields
     if ir < Nr :
@@ -418,9 +415,6 @@ def cuda_damp_EB_right( Er, Et, Ez, Br, Bt, Bz, damp_array, nd ):
 
             # At the right end
             iz_right = Nz - iz - 1
-            Er[iz_right, ir] *= damp_factor_right
-            Et[iz_right, ir] *= damp_factor_right
-            Ez[iz_right, ir] *= damp_factor_right
-            Br[iz_right, ir] *= damp_factor_right
-            Bt[iz_right, ir] *= damp_factor_right
-            Bz[iz_right, ir] *= damp_factor_right
+            Fr[iz_right, ir] *= damp_factor_right
+            Ft[iz_right, ir] *= damp_factor_right
+            Fz[iz_right, ir] *= damp_factor_right
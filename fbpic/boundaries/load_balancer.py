@@ -0,0 +1,296 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the dynamic load balancing of the domain decomposition along z.
+"""
+import numpy as np
+from fbpic.utils.mpi import MPI
+from fbpic.utils.cuda import send_data_to_gpu, receive_data_from_gpu
+
+# Phases of the profiler that are not counted in the measured cost
+# of a rank (since they include the time spent waiting for other ranks)
+communication_phases = [ 'exchange_fields', 'exchange_particles',
+                         'diagnostics', 'load_balancing' ]
+
+class LoadBalancer(object):
+    """
+    Class that periodically recomputes the boundaries of the MPI
+    subdomains along z, so that each rank has a similar computational cost,
+    and that redistributes the fields and particles accordingly.
+
+    The cost of each rank is estimated from a cost profile along z, with
+    one value per cell of the global physical domain: the number of
+    macroparticles in the cell (all species, without the dead particles of
+    `particle_removal='mask'`) plus a fixed cost per cell
+    (`cell_cost`, in units of the cost of one macroparticle).
+    With `cost='time'`, the profile of each rank is rescaled so that its
+    sum is the compute time of this rank, measured by the profiler since
+    the last balancing.
+
+    In order to reuse the existing exchange machinery, each boundary
+    between subdomains moves by at most `n_guard` cells per balancing:
+    the fields in the new cells of a subdomain are then already known
+    (from its guard cells), and the particles that change subdomain
+    are sent to the neighboring rank by the regular particle exchange.
+    (When the imbalance is large, the boundaries thus converge over
+    several balancing periods.)
+    """
+
+    def __init__( self, comm, period, cost='particles', cell_cost=0.1,
+                    threshold=0.1, max_shift=None ):
+        """
+        Initialize a load balancer.
+
+        Parameters
+        ----------
+        comm: a BoundaryCommunicator object
+            Contains the information on the MPI decomposition
+
+        period: int
+            Number of iterations between two balancings. (The balancing is
+            done at the first particle exchange after this number of
+            iterations.)
+
+        cost: string, optional
+            How the cost of each rank is estimated. Either 'particles'
+            (number of macroparticles and number of cells) or 'time'
+            (time measured by the profiler, distributed along z according
+            to the number of macroparticles and cells)
+
+        cell_cost: float, optional
+            The cost of one cell along z (i.e. of Nr cells of the grid),
+            in units of the cost of one macroparticle
+
+        threshold: float, optional
+            The subdomains are only modified if the maximal cost of a rank
+            exceeds the mean cost by more than this fraction
+
+        max_shift: int or None, optional
+            The maximal number of cells by which each boundary moves
+            at each balancing (at most, and by default, `n_guard`)
+        """
+        if cost not in ['particles', 'time']:
+            raise ValueError('Unknown cost for the load balancing: %s' %cost)
+        if max_shift is None:
+            max_shift = comm.n_guard
+        if max_shift > comm.n_guard:
+            raise ValueError('`max_shift` cannot be larger than `n_guard`.')
+        self.period = period
+        self.cost = cost
+        self.cell_cost = cell_cost
+        self.threshold = threshold
+        self.max_shift = max_shift
+        # Minimal number of physical cells per subdomain
+        # (see `BoundaryCommunicator.divide_into_domain`)
+        self.min_cells = max( 2*comm.n_guard, 1 )
+
+        # Iteration of the last balancing, and profiler time at this point
+        self.last_iteration = None
+        self.last_compute_time = 0.
+        self.last_n_steps = 0
+
+    def balance( self, sim ):
+        """
+        Recompute the boundaries of the subdomains if `period` iterations
+        passed since the last balancing, and redistribute the fields and
+        particles if the load is imbalanced.
+
+        This needs to be called right before the particle exchange.
+
+        Parameters
+        ----------
+        sim: a Simulation object
+
+        Returns
+        -------
+        Whether the subdomains have been modified
+        """
+        comm = sim.comm
+        if comm.size == 1:
+            return( False )
+        # Check whether to balance at this iteration
+        if self.last_iteration is None:
+            self.last_iteration = sim.iteration
+        if sim.iteration - self.last_iteration < self.period:
+            return( False )
+        self.last_iteration = sim.iteration
+
+        # Get the global cost profile (identical on all ranks)
+        # (With a decomposition along r, the cost of each z domain
+        # is summed over the ranks of the radial group)
+        local_cost = self.get_local_cost( sim )
+        if comm.r_size > 1:
+            comm.r_comm.Allreduce( MPI.IN_PLACE, local_cost, op=MPI.SUM )
+        global_cost = np.concatenate( comm.mpi_comm.allgather(local_cost) )
+
+        # Check whether the load is imbalanced
+        old_bounds = comm.get_domain_bounds()
+        rank_cost = np.array([ global_cost[ old_bounds[k]:old_bounds[k+1] ].sum()
+                               for k in range(comm.size) ])
+        if rank_cost.max() <= (1. + self.threshold)*rank_cost.mean():
+            return( False )
+
+        # Compute the new boundaries, and redistribute the data
+        new_bounds = self.get_new_bounds( global_cost, old_bounds )
+        if np.all( new_bounds == old_bounds ):
+            return( False )
+        self.redistribute( sim, new_bounds )
+        return( True )
+
+    def get_local_cost( self, sim ):
+        """
+        Return the cost profile of the physical domain of the local rank
+        (1darray with one element per cell along z)
+
+        Parameters
+        ----------
+        sim: a Simulation object
+        """
+        comm = sim.comm
+        Nz, iz = comm.get_Nz_and_iz( local=True, with_damp=False,
+                                     with_guard=False, rank=comm.rank )
+        zmin, _ = comm.get_zmin_zmax( local=True, with_damp=False,
+                                      with_guard=False, rank=comm.rank )
+        # Number of macroparticles per cell (particles in the guard cells
+        # are counted in the first/last cell of the physical domain)
+        cost = self.cell_cost * np.ones( Nz )
+        for species in sim.ptcl:
+            if species.Ntot == 0:
+                continue
+            z = species.z[:species.Ntot]
+            if species.use_cuda:
+                z = z.copy_to_host()
+            elif species.n_dead > 0:
+                # The dead particles (with `particle_removal='mask'`)
+                # are skipped by the PIC loop, and have no cost
+                z = z[ np.logical_not( species.dead ) ]
+            iz_ptcl = np.clip( np.floor( (z - zmin)/comm.dz ).astype(int),
+                               0, Nz-1 )
+            cost += np.bincount( iz_ptcl, minlength=Nz )
+
+        # Rescale the profile with the measured compute time
+        if self.cost == 'time':
+            compute_time = self.get_compute_time( sim.profiler )
+            cost *= compute_time / cost.sum()
+
+        return( cost )
+
+    def get_compute_time( self, profiler ):
+        """
+        Return the time spent by the local rank outside of the
+        communication phases, since the last balancing
+
+        Parameters
+        ----------
+        profiler: a Profiler object
+        """
+        compute_time = sum( time for (phase, _), time in
+                            profiler.times.items()
+                            if phase not in communication_phases )
+        # The profiler is reset at each call to `Simulation.step`
+        if profiler.n_steps >= self.last_n_steps:
+            elapsed = compute_time - self.last_compute_time
+        else:
+            elapsed = compute_time
+        self.last_compute_time = compute_time
+        self.last_n_steps = profiler.n_steps
+        return( elapsed )
+
+    def get_new_bounds( self, global_cost, old_bounds ):
+        """
+        Return the new boundaries of the subdomains, such that the cost is
+        evenly distributed, within the constraints on the shift of the
+        boundaries and on the minimal size of the subdomains
+
+        Parameters
+        ----------
+        global_cost: 1darray of floats
+            The cost profile of the global physical domain
+
+        old_bounds: 1darray of ints
+            The current boundaries of the subdomains
+            (see `BoundaryCommunicator.get_domain_bounds`)
+        """
+        n_domains = len(old_bounds) - 1
+        cumulative_cost = np.concatenate( ([0.], np.cumsum(global_cost)) )
+        targets = np.arange(1, n_domains)*cumulative_cost[-1]/n_domains
+        ideal_bounds = np.searchsorted( cumulative_cost, targets )
+
+        # Limit the shift of the boundaries
+        new_bounds = old_bounds.copy()
+        new_bounds[1:-1] = np.clip( ideal_bounds,
+            old_bounds[1:-1] - self.max_shift,
+            old_bounds[1:-1] + self.max_shift )
+        # Impose the minimal size of the subdomains
+        for k in range(1, n_domains):
+            new_bounds[k] = max( new_bounds[k], new_bounds[k-1]+self.min_cells )
+        for k in range(n_domains-1, 0, -1):
+            new_bounds[k] = min( new_bounds[k], new_bounds[k+1]-self.min_cells )
+
+        # Keep the current boundaries if the constraints cannot be satisfied
+        if np.any( abs(new_bounds - old_bounds) > self.max_shift ) or \
+            np.any( new_bounds[1:] - new_bounds[:-1] < self.min_cells ):
+            return( old_bounds )
+        return( new_bounds )
+
+    def redistribute( self, sim, new_bounds ):
+        """
+        Modify the boundaries of the subdomains, resize the local grid,
+        and copy the fields E and B from the old local grid
+        (The particles are redistributed by the next particle exchange,
+        and the charge density is deposited again at this point.)
+
+        Parameters
+        ----------
+        sim: a Simulation object
+
+        new_bounds: 1darray of ints
+            The new boundaries of the subdomains
+        """
+        comm = sim.comm
+        fld = sim.fld
+
+        # Get E and B on the interpolation grid, including the guard cells
+        # (which contain the fields of the new cells of the subdomain)
+        fld.require_interp('EB')
+        comm.exchange_fields( fld.interp, 'E', 'replace' )
+        comm.exchange_fields( fld.interp, 'B', 'replace' )
+        # The grids are resized on the CPU
+        if sim.use_cuda:
+            receive_data_from_gpu( sim )
+        old_fields = [ { field: getattr( fld.interp[m], field ) for field in
+                       ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz'] }
+                       for m in range(fld.Nm) ]
+        Nz_old, iz_old = comm.get_Nz_and_iz( local=True, with_damp=True,
+                                        with_guard=True, rank=comm.rank )
+
+        # Resize the local grid
+        comm.set_domain_bounds( new_bounds )
+        zmin, zmax, Nz = comm.divide_into_domain()
+        _, iz_new = comm.get_Nz_and_iz( local=True, with_damp=True,
+                                        with_guard=True, rank=comm.rank )
+        fld.create_grids( Nz, zmin, zmax )
+
+        # Copy the fields in the cells that are common to the old and new grid
+        iz_start = max( iz_old, iz_new )
+        iz_end = min( iz_old + Nz_old, iz_new + Nz )
+        for m in range(fld.Nm):
+            for field in ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz']:
+                new_array = getattr( fld.interp[m], field )
+                new_array[ iz_start-iz_new:iz_end-iz_new ] = \
+                    old_fields[m][field][ iz_start-iz_old:iz_end-iz_old ]
+
+        # Resize the grid-dependent arrays of the particles
+        sim.grid_shape = fld.interp[0].Ez.shape
+        for species in sim.ptcl:
+            species.resize_grid_arrays( sim.grid_shape )
+        if sim.use_cuda:
+            send_data_to_gpu( sim )
+
+        # Get the fields in the new guard cells, and in spectral space
+        comm.exchange_fields( fld.interp, 'E', 'replace' )
+        comm.exchange_fields( fld.interp, 'B', 'replace' )
+        comm.damp_EB_open_boundary( fld.interp )
+        fld.interp2spect('EB')
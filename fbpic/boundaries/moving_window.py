@@ -108,6 +108,9 @@ class MovingWindow(object):
                 fld.interp[m].zmax += n_move*fld.interp[m].dz
                 # Shift/move fields by n_move cells in spectral space
                 self.shift_spect_grid( fld.spect[m], n_move )
+            # The fields on the interpolation grid are now outdated
+            for fieldtype in ['EB', 'J', 'rho']:
+                fld.invalidate_interp( fieldtype )
 
         # Because the grids have just been shifted, there is a shift
         # in the cell indices that are used for the prefix sum.
@@ -7,16 +7,230 @@ It defines the structure necessary to handle mpi buffers for the particles
 """
 import numpy as np
 import numba
+from fbpic.utils.mpi import MPI
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 from fbpic.utils.printing import catch_gpu_memory_error
 if cuda_installed:
     from fbpic.utils.cuda import cuda, cuda_tpb_bpg_1d
 
-def remove_outside_particles(species, fld, n_guard, left_proc, right_proc):
+# Initial capacity (in number of particles) of the exchange buffers
+initial_exchange_capacity = 1024
+
+class ParticleBufferHandler(object):
+    """
+    Class that handles the buffers and the MPI requests that are used
+    to exchange the particles of one species between MPI domains.
+
+    For each neighbor, the particles are sent in a single message, which
+    contains the number of particles followed by the float quantities and
+    the integer quantities (reinterpreted as float64) of the particles.
+    The messages are sent and received with persistent MPI requests, on
+    preallocated buffers that have a fixed capacity (in number of particles).
+
+    When more particles than the capacity need to be sent, the regular
+    message only contains the number of particles, and the full data is
+    sent in an additional (non-persistent) message. Both the sender and
+    the receiver then enlarge their buffers in the same way (the capacity
+    only grows), and recreate the persistent requests.
+    """
+
+    def __init__( self, mpi_comm, n_float, n_int, left_proc, right_proc, tag ):
+        """
+        Initialize the buffers and the persistent MPI requests.
+
+        Parameters
+        ----------
+        mpi_comm: an mpi4py communicator
+            The communicator used for the exchanges
+
+        n_float, n_int: int
+            Number of float and integer quantities of each particle
+
+        left_proc, right_proc: int or None
+           Rank of the proc to the left and to the right
+           (None for open boundary)
+
+        tag: int
+            The MPI tags tag to tag+3 are used by this object
+        """
+        self.mpi_comm = mpi_comm
+        self.n_float = n_float
+        self.n_int = n_int
+        self.procs = { 'left': left_proc, 'right': right_proc }
+        # Tags of the messages sent to the left and to the right
+        # (the overflow messages use the tag +2)
+        self.send_tags = { 'left': tag, 'right': tag+1 }
+        self.recv_tags = { 'left': tag+1, 'right': tag }
+        self.sides = [ side for side in ['left', 'right']
+                       if self.procs[side] is not None ]
+
+        # Allocate the buffers and initialize the persistent requests
+        self.send_buffers = {}
+        self.recv_buffers = {}
+        self.send_capacity = {}
+        self.recv_capacity = {}
+        self.send_requests = {}
+        self.recv_requests = {}
+        for side in self.sides:
+            self.allocate_send_buffer( side, initial_exchange_capacity )
+            self.allocate_recv_buffer( side, initial_exchange_capacity )
+        # Number of particles to send, and enlarged sending buffers
+        # (for messages that exceed the capacity), for the next exchange
+        self.n_send = { 'left': 0, 'right': 0 }
+        self.overflow_buffers = {}
+
+    def get_buffer_size( self, capacity ):
+        """
+        Return the number of float64 elements in a buffer that can
+        contain `capacity` particles (and the number of particles)
+        """
+        return( 1 + (self.n_float + self.n_int)*capacity )
+
+    def allocate_send_buffer( self, side, capacity, buffer=None ):
+        """
+        Allocate the sending buffer for the neighbor `side` (unless
+        `buffer` is provided), and create the corresponding persistent request
+        """
+        if buffer is None:
+            buffer = np.empty( self.get_buffer_size(capacity),
+                               dtype=np.float64 )
+        self.send_buffers[side] = buffer
+        self.send_capacity[side] = capacity
+        self.send_requests[side] = self.mpi_comm.Send_init( buffer,
+                        dest=self.procs[side], tag=self.send_tags[side] )
+
+    def allocate_recv_buffer( self, side, capacity ):
+        """
+        Allocate the receiving buffer for the neighbor `side`, and create
+        the corresponding persistent request
+        """
+        buffer = np.empty( self.get_buffer_size(capacity), dtype=np.float64 )
+        self.recv_buffers[side] = buffer
+        self.recv_capacity[side] = capacity
+        self.recv_requests[side] = self.mpi_comm.Recv_init( buffer,
+                        source=self.procs[side], tag=self.recv_tags[side] )
+
+    def get_send_arrays( self, side, N ):
+        """
+        Return the arrays in which the `N` particles that are sent to the
+        neighbor `side` should be written, of shape (n_float, N) (float64)
+        and (n_int, N) (uint64). These arrays are views of the sending
+        buffer (enlarged if needed), and are sent by `exchange`.
+        """
+        self.n_send[side] = N
+        if N > self.send_capacity[side]:
+            # The data is sent in a separate, larger buffer ; the regular
+            # buffer only transmits the number of particles
+            capacity = get_enlarged_capacity( self.send_capacity[side], N )
+            buffer = np.empty( self.get_buffer_size(capacity),
+                               dtype=np.float64 )
+            self.overflow_buffers[side] = buffer
+        else:
+            buffer = self.send_buffers[side]
+        return( unpack_particle_buffer( buffer, N, self.n_float, self.n_int ) )
+
+    def exchange( self ):
+        """
+        Send the particles that were written in the arrays returned by
+        `get_send_arrays`, and receive the particles from the neighbors.
+
+        Returns
+        -------
+        float_recv_left, float_recv_right, uint_recv_left, uint_recv_right:
+            arrays of shape (n_float,Nptcl) and (n_int,Nptcl) where Nptcl
+            is the number of particles that are received from the left
+            proc and right proc respectively (Nptcl=0 for open boundaries).
+            These arrays are views of the receiving buffers, and are only
+            valid until the next exchange.
+        """
+        # Start the persistent requests, and send the large messages
+        overflow_requests = []
+        for side in self.sides:
+            self.recv_requests[side].Start()
+        for side in self.sides:
+            self.send_buffers[side][0] = self.n_send[side]
+            self.send_requests[side].Start()
+            if side in self.overflow_buffers:
+                buffer = self.overflow_buffers[side]
+                buffer[0] = self.n_send[side]
+                size = self.get_buffer_size( self.n_send[side] )
+                overflow_requests.append( self.mpi_comm.Isend( buffer[:size],
+                    dest=self.procs[side], tag=self.send_tags[side]+2 ) )
+
+        # Receive the particles
+        received = {}
+        for side in ['left', 'right']:
+            if side not in self.sides:
+                received[side] = unpack_particle_buffer(
+                    np.zeros(1), 0, self.n_float, self.n_int )
+                continue
+            self.recv_requests[side].Wait()
+            N = int( self.recv_buffers[side][0] )
+            if N > self.recv_capacity[side]:
+                # Enlarge the buffer and receive the large message
+                self.recv_requests[side].Free()
+                self.allocate_recv_buffer( side,
+                    get_enlarged_capacity( self.recv_capacity[side], N ) )
+                size = self.get_buffer_size( N )
+                self.mpi_comm.Recv( self.recv_buffers[side][:size],
+                    source=self.procs[side], tag=self.recv_tags[side]+2 )
+            received[side] = unpack_particle_buffer(
+                self.recv_buffers[side], N, self.n_float, self.n_int )
+
+        # Wait for the sends to complete, and enlarge the sending buffers
+        for side in self.sides:
+            self.send_requests[side].Wait()
+        # (No large message is sent with open boundaries: skip the wait,
+        # since MPI.Request may not exist when mpi4py is not installed)
+        if len(overflow_requests) > 0:
+            MPI.Request.Waitall( overflow_requests )
+        for side in list( self.overflow_buffers.keys() ):
+            self.send_requests[side].Free()
+            self.allocate_send_buffer( side,
+                    get_enlarged_capacity( self.send_capacity[side],
+                                           self.n_send[side] ),
+                    buffer=self.overflow_buffers.pop( side ) )
+        self.n_send = { 'left': 0, 'right': 0 }
+
+        float_recv_left, uint_recv_left = received['left']
+        float_recv_right, uint_recv_right = received['right']
+        return( float_recv_left, float_recv_right,
+                uint_recv_left, uint_recv_right )
+
+    def free( self ):
+        """
+        Free the persistent MPI requests
+        """
+        for side in self.sides:
+            self.send_requests[side].Free()
+            self.recv_requests[side].Free()
+        self.sides = []
+
+def get_enlarged_capacity( capacity, N ):
+    """
+    Return the capacity of a buffer that needs to contain `N` particles,
+    when its current capacity is `capacity` (smaller than `N`)
+    """
+    return( max( N, 2*capacity ) )
+
+def unpack_particle_buffer( buffer, N, n_float, n_int ):
+    """
+    Return views of the float quantities, of shape (n_float, N), and of
+    the integer quantities, of shape (n_int, N), of the `N` particles
+    that are stored in `buffer` (after the number of particles)
+    """
+    i_int = 1 + n_float*N
+    float_array = buffer[ 1:i_int ].reshape( (n_float, N) )
+    uint_array = buffer[ i_int:i_int+n_int*N ].view( np.uint64 )
+    return( float_array, uint_array.reshape( (n_int, N) ) )
+
+def remove_outside_particles( species, fld, n_guard, left_proc, right_proc,
+                              buffer_handler ):
     """
     Remove the particles that are outside of the physical domain (i.e.
-    in the guard cells). Store them in sending buffers, which are returned.
+    in the guard cells). Store them in the sending buffers of
+    `buffer_handler`.
 
     Parameters
     ----------
@@ -34,30 +248,41 @@ def remove_outside_particles(species, fld, n_guard, left_proc, right_proc):
         Indicate whether there is a left or right processor or if the
         boundary is open (None).
 
-    Returns
-    -------
-    float_send_left, float_send_right, uint_send_left, uint_send_right:
-        arrays of shape (n_float,Nptcl) and (n_int,Nptcl) where Nptcl
-        is the number of particles that are sent to the left
-        proc and right proc respectively, and where n_float and n_int
-        are the number of float and integer quantities respectively
-    If left_proc or right_proc is None, the corresponding array has Nptcl=0
+    buffer_handler: a ParticleBufferHandler object
+        Provides the sending buffers (see `get_send_arrays`)
     """
     if species.use_cuda:
         # Remove outside particles on GPU, and copy buffers on CPU
-        float_send_left, float_send_right, uint_send_left, uint_send_right = \
-            remove_particles_gpu( species, fld, n_guard, left_proc, right_proc )
+        remove_particles_gpu( species, fld, n_guard,
+                              left_proc, right_proc, buffer_handler )
     else:
         # Remove outside particles on the CPU
-        float_send_left, float_send_right, uint_send_left, uint_send_right = \
-            remove_particles_cpu( species, fld, n_guard, left_proc, right_proc )
+        remove_particles_cpu( species, fld, n_guard,
+                              left_proc, right_proc, buffer_handler )
 
-    return(float_send_left, float_send_right, uint_send_left, uint_send_right)
+def get_send_arrays( buffer_handler, side, proc, N, n_float, n_int ):
+    """
+    Return the arrays in which the `N` particles that are sent to the
+    neighbor `side` should be written (empty arrays for an open boundary,
+    in which case the particles are simply removed)
+    """
+    if proc is not None:
+        return( buffer_handler.get_send_arrays( side, N ) )
+    else:
+        return( np.empty((n_float, 0), dtype=np.float64),
+                np.empty((n_int, 0), dtype=np.uint64) )
 
-def remove_particles_cpu(species, fld, n_guard, left_proc, right_proc):
+def remove_particles_cpu( species, fld, n_guard, left_proc, right_proc,
+                          buffer_handler ):
     """
     Remove the particles that are outside of the physical domain (i.e.
-    in the guard cells). Store them in sending buffers, which are returned.
+    in the guard cells). Store them in the sending buffers of
+    `buffer_handler`.
+
+    The particles that stay in the domain are compacted in place
+    (keeping their order), at the beginning of the particle arrays.
+    (With `particle_removal='mask'`, the removed particles are instead
+    marked as dead, see `kill_outside_particles`.)
 
     Parameters
     ----------
@@ -75,13 +300,8 @@ def remove_particles_cpu(species, fld, n_guard, left_proc, right_proc):
         Indicate whether there is a left or right processor or if the
         boundary is open (None).
 
-    Returns
-    -------
-    float_send_left, float_send_right, uint_send_left, uint_send_right:
-        arrays of shape (n_float,Nptcl) and (n_int,Nptcl) where Nptcl
-        is the number of particles that are sent to the left
-        proc and right proc respectively, and where n_float and n_int
-        are the number of float and integer quantities respectively
+    buffer_handler: a ParticleBufferHandler object
+        Provides the sending buffers (see `get_send_arrays`)
     """
     # Calculate the positions between which to remove particles
     # For the open boundaries, only the particles in the outermost
@@ -89,95 +309,295 @@ def remove_particles_cpu(species, fld, n_guard, left_proc, right_proc):
     zbox_min = fld.interp[0].zmin + n_guard*fld.interp[0].dz
     zbox_max = fld.interp[0].zmax - n_guard*fld.interp[0].dz
 
-    # Select the particles that are in the left or right guard cells,
-    # and those that stay on the local process
-    selec_left = ( species.z < zbox_min )
-    selec_right = ( species.z > zbox_max )
-    selec_stay = (np.logical_not(selec_left) & np.logical_not(selec_right))
+    # With `particle_removal='mask'`, only mark the particles as dead
+    if species.dead is not None:
+        kill_outside_particles( species, species.z[:species.Ntot],
+            zbox_min, zbox_max, left_proc, right_proc, buffer_handler,
+            zbox_min=zbox_min, zbox_max=zbox_max )
+        return
 
-    # Shortcuts
+    # Count the particles that are in the left or right guard cells,
+    # and get the corresponding sending buffers
     n_float = species.n_float_quantities
     n_int = species.n_integer_quantities
+    N_send_l, N_send_r = count_outside_particles(
+        species.z[:species.Ntot], zbox_min, zbox_max )
+    float_send_left, uint_send_left = get_send_arrays(
+        buffer_handler, 'left', left_proc, N_send_l, n_float, n_int )
+    float_send_right, uint_send_right = get_send_arrays(
+        buffer_handler, 'right', right_proc, N_send_r, n_float, n_int )
+
+    # Get the list of particle quantities (and their index in the
+    # sending buffers) ; z is treated last, since it is used
+    # to select the particles
+    float_attrs, int_attrs = get_exchanged_quantities( species )
+
+    # Split the particle arrays: copy the outside particles to the sending
+    # buffers, and compact the particles that stay in the domain
+    z = species.z[:species.Ntot]
+    for obj, attr, i_attr in float_attrs:
+        split_particles_cpu( getattr(obj, attr), z, zbox_min, zbox_max,
+                    float_send_left[i_attr], float_send_right[i_attr] )
+    for i_attr, (obj, attr) in enumerate(int_attrs):
+        split_particles_cpu( getattr(obj, attr), z, zbox_min, zbox_max,
+                    uint_send_left[i_attr], uint_send_right[i_attr] )
+    N_stay = split_particles_cpu( species.z, z, zbox_min, zbox_max,
+                    float_send_left[2], float_send_right[2] )
+
+    # Resize the particle arrays (without copying the data)
+    species.resize_particle_arrays( N_stay )
+
+def remove_radially_outside_particles( species, rmin, rmax,
+                            inner_proc, outer_proc, buffer_handler ):
+    """
+    Remove the particles whose radius is below `rmin` or above `rmax`
+    (i.e. outside of the radial band of the local domain, when the
+    simulation is decomposed along r). Store them in the sending buffers
+    of `buffer_handler` (where 'left' is the inner neighbor and 'right'
+    is the outer neighbor).
+
+    The particles that stay in the domain are compacted in place
+    (keeping their order), at the beginning of the particle arrays.
+    (With `particle_removal='mask'`, the removed particles are instead
+    marked as dead, see `kill_outside_particles`.)
+    (Only implemented on CPU.)
 
-    # Allocate and fill left sending buffer
-    if left_proc is not None:
-        N_send_l = selec_left.sum()
-        float_send_left = np.empty((n_float, N_send_l), dtype=np.float64)
-        uint_send_left = np.empty((n_int, N_send_l), dtype=np.uint64)
-        float_send_left[0,:] = species.x[selec_left]
-        float_send_left[1,:] = species.y[selec_left]
-        float_send_left[2,:] = species.z[selec_left]
-        float_send_left[3,:] = species.ux[selec_left]
-        float_send_left[4,:] = species.uy[selec_left]
-        float_send_left[5,:] = species.uz[selec_left]
-        float_send_left[6,:] = species.inv_gamma[selec_left]
-        float_send_left[7,:] = species.w[selec_left]
-        i_attr = 0
-        if species.tracker is not None:
-            uint_send_left[i_attr,:] = species.tracker.id[selec_left]
-            i_attr += 1
-        if species.ionizer is not None:
-            uint_send_left[i_attr,:] = \
-                species.ionizer.ionization_level[selec_left]
-            float_send_left[8,:] = species.ionizer.w_times_level[selec_left]
-    else:
-        # No need to allocate and copy data ; return an empty array
-        float_send_left = np.empty((n_float, 0), dtype=np.float64)
-        uint_send_left = np.empty((n_int, 0), dtype=np.uint64)
-
-    # Allocate and fill right sending buffer
-    if right_proc is not None:
-        N_send_r = selec_right.sum()
-        float_send_right = np.empty((n_float, N_send_r), dtype=np.float64)
-        uint_send_right = np.empty((n_int, N_send_r), dtype=np.float64)
-        float_send_right[0,:] = species.x[selec_right]
-        float_send_right[1,:] = species.y[selec_right]
-        float_send_right[2,:] = species.z[selec_right]
-        float_send_right[3,:] = species.ux[selec_right]
-        float_send_right[4,:] = species.uy[selec_right]
-        float_send_right[5,:] = species.uz[selec_right]
-        float_send_right[6,:] = species.inv_gamma[selec_right]
-        float_send_right[7,:] = species.w[selec_right]
-        i_attr = 0
-        if species.tracker is not None:
-            uint_send_right[i_attr,:] = species.tracker.id[selec_right]
-            i_attr += 1
-        if species.ionizer is not None:
-            uint_send_right[i_attr,:] = \
-                species.ionizer.ionization_level[selec_right]
-            float_send_right[8,:] = species.ionizer.w_times_level[selec_right]
-    else:
-        # No need to allocate and copy data ; return an empty array
-        float_send_right = np.empty((n_float, 0), dtype = np.float64)
-        uint_send_right = np.empty((n_int, 0), dtype=np.float64)
-
-    # Resize the particle arrays
-    N_stay = selec_stay.sum()
-    species.Ntot = N_stay
-    species.x = species.x[selec_stay]
-    species.y = species.y[selec_stay]
-    species.z = species.z[selec_stay]
-    species.ux = species.ux[selec_stay]
-    species.uy = species.uy[selec_stay]
-    species.uz = species.uz[selec_stay]
-    species.inv_gamma = species.inv_gamma[selec_stay]
-    species.w = species.w[selec_stay]
+    Parameters
+    ----------
+    species: a Particles object
+        Contains the data of this species
+
+    rmin, rmax: floats (in meters)
+        The radii between which the particles stay in the domain
+
+    inner_proc, outer_proc: int or None
+        The rank of the inner and outer radial neighbors (or None if there
+        is no neighbor, in which case the particles are removed)
+
+    buffer_handler: a ParticleBufferHandler object
+        Provides the sending buffers (see `get_send_arrays`)
+    """
+    r = np.sqrt( species.x[:species.Ntot]**2 + species.y[:species.Ntot]**2 )
+    # With `particle_removal='mask'`, only mark the particles as dead
+    if species.dead is not None:
+        kill_outside_particles( species, r, rmin, rmax,
+                                inner_proc, outer_proc, buffer_handler )
+        return
+
+    # Count the particles that are outside of the radial band,
+    # and get the corresponding sending buffers
+    n_float = species.n_float_quantities
+    n_int = species.n_integer_quantities
+    N_send_in, N_send_out = count_outside_particles( r, rmin, rmax )
+    float_send_in, uint_send_in = get_send_arrays(
+        buffer_handler, 'left', inner_proc, N_send_in, n_float, n_int )
+    float_send_out, uint_send_out = get_send_arrays(
+        buffer_handler, 'right', outer_proc, N_send_out, n_float, n_int )
+
+    # Split the particle arrays (since the radius is stored in a separate
+    # array, z is treated like the other quantities)
+    float_attrs, int_attrs = get_exchanged_quantities( species )
+    float_attrs.append( (species,'z',2) )
+    for obj, attr, i_attr in float_attrs:
+        N_stay = split_particles_cpu( getattr(obj, attr), r, rmin, rmax,
+                    float_send_in[i_attr], float_send_out[i_attr] )
+    for i_attr, (obj, attr) in enumerate(int_attrs):
+        split_particles_cpu( getattr(obj, attr), r, rmin, rmax,
+                    uint_send_in[i_attr], uint_send_out[i_attr] )
+
+    # Resize the particle arrays (without copying the data)
+    species.resize_particle_arrays( N_stay )
+
+def kill_outside_particles( species, s, s_min, s_max, left_proc, right_proc,
+                            buffer_handler, zbox_min=None, zbox_max=None ):
+    """
+    Copy the particles that are not dead and whose position `s` (z or r)
+    is below `s_min` or above `s_max` to the sending buffers of
+    `buffer_handler`, and mark them as dead (with `particle_removal='mask'`,
+    see `Particles.kill_particles`) instead of compacting the particle
+    arrays. Only the removed particles are accessed (apart from the
+    search for them), and the particle arrays keep their size until
+    the dead particles are compacted in bulk.
+
+    Parameters
+    ----------
+    species: a Particles object
+        Contains the data of this species
+
+    s: 1darray of floats
+        The positions of the particles that are used to select them
+
+    s_min, s_max: floats
+        The positions between which the particles stay in the domain
+
+    left_proc, right_proc: int or None
+        The rank of the neighbors to which the particles below `s_min`
+        and above `s_max` are sent (or None if they are simply removed)
+
+    buffer_handler: a ParticleBufferHandler object
+        Provides the sending buffers (see `get_send_arrays`)
+
+    zbox_min, zbox_max: floats (in meters), optional
+        The bounds of the local physical domain along z, inside of which
+        the dead particles are kept (see `Particles.kill_particles`)
+    """
+    # Find the particles that leave the domain, and get the sending buffers
+    n_float = species.n_float_quantities
+    n_int = species.n_integer_quantities
+    left_indices, right_indices = get_outside_particle_indices(
+                                    s, s_min, s_max, species.dead )
+    float_send_left, uint_send_left = get_send_arrays( buffer_handler,
+        'left', left_proc, len(left_indices), n_float, n_int )
+    float_send_right, uint_send_right = get_send_arrays( buffer_handler,
+        'right', right_proc, len(right_indices), n_float, n_int )
+
+    # Copy the particles to the sending buffers
+    float_attrs, int_attrs = get_exchanged_quantities( species )
+    float_attrs.append( (species,'z',2) )
+    for obj, attr, i_attr in float_attrs:
+        copy_selected_particles( getattr(obj, attr), left_indices,
+                                 float_send_left[i_attr] )
+        copy_selected_particles( getattr(obj, attr), right_indices,
+                                 float_send_right[i_attr] )
+    for i_attr, (obj, attr) in enumerate(int_attrs):
+        copy_selected_particles( getattr(obj, attr), left_indices,
+                                 uint_send_left[i_attr] )
+        copy_selected_particles( getattr(obj, attr), right_indices,
+                                 uint_send_right[i_attr] )
+
+    # Mark the particles as dead
+    species.kill_particles( np.concatenate( (left_indices, right_indices) ),
+                            zbox_min=zbox_min, zbox_max=zbox_max )
+
+def get_exchanged_quantities( species ):
+    """
+    Return the list of the float quantities of `species` that are
+    exchanged, except z (as tuples of the object that holds the array,
+    the name of the array, and its index in the sending buffers), and
+    the list of the integer quantities (as tuples of the object and the
+    name of the array, in the order of the sending buffers).
+    """
+    float_attrs = [ (species,'x',0), (species,'y',1),
+                    (species,'ux',3), (species,'uy',4), (species,'uz',5),
+                    (species,'inv_gamma',6), (species,'w',7) ]
+    if species.ionizer is not None:
+        float_attrs.append( (species.ionizer,'w_times_level',8) )
+    int_attrs = []
     if species.tracker is not None:
-        species.tracker.id = species.tracker.id[selec_stay]
+        int_attrs.append( (species.tracker,'id') )
     if species.ionizer is not None:
-        species.ionizer.w_times_level = \
-            species.ionizer.w_times_level[selec_stay]
-        species.ionizer.ionization_level = \
-            species.ionizer.ionization_level[selec_stay]
+        int_attrs.append( (species.ionizer,'ionization_level') )
+    return( float_attrs, int_attrs )
 
-    # Return the sending buffers
-    return(float_send_left, float_send_right, uint_send_left, uint_send_right)
+@numba.njit
+def count_outside_particles( z, zbox_min, zbox_max ):
+    """
+    Return the number of particles that are below `zbox_min`
+    and above `zbox_max`
+    """
+    n_left = 0
+    n_right = 0
+    for i in range( z.shape[0] ):
+        if z[i] < zbox_min:
+            n_left += 1
+        elif z[i] > zbox_max:
+            n_right += 1
+    return( n_left, n_right )
+
+@numba.njit
+def get_outside_particle_indices( z, zbox_min, zbox_max, dead ):
+    """
+    Return the indices of the particles that are not dead and that
+    are below `zbox_min`, and the indices of those above `zbox_max`
+    """
+    n_left = 0
+    n_right = 0
+    for i in range( z.shape[0] ):
+        if not dead[i]:
+            if z[i] < zbox_min:
+                n_left += 1
+            elif z[i] > zbox_max:
+                n_right += 1
+    left_indices = np.empty( n_left, dtype=np.int64 )
+    right_indices = np.empty( n_right, dtype=np.int64 )
+    n_left = 0
+    n_right = 0
+    for i in range( z.shape[0] ):
+        if not dead[i]:
+            if z[i] < zbox_min:
+                left_indices[n_left] = i
+                n_left += 1
+            elif z[i] > zbox_max:
+                right_indices[n_right] = i
+                n_right += 1
+    return( left_indices, right_indices )
+
+@numba.njit
+def copy_selected_particles( particle_array, indices, buffer ):
+    """
+    Copy the particles `indices` of `particle_array` to `buffer`
+    (unless `buffer` has size 0, i.e. the particles are simply removed)
+    """
+    if buffer.shape[0] != 0:
+        for k in range( indices.shape[0] ):
+            buffer[k] = particle_array[ indices[k] ]
+
+@numba.njit
+def split_particles_cpu( particle_array, z, zbox_min, zbox_max,
+                         left_buffer, right_buffer ):
+    """
+    Copy the particles that are below `zbox_min` (resp. above `zbox_max`)
+    to left_buffer (resp. right_buffer), and move the other particles
+    to the beginning of `particle_array` (in the same order).
+
+    Parameters:
+    ------------
+    particle_array: 1d array
+        Array of particles (represents *one* of the particle quantities)
+        Modified in place.
+
+    z: 1d array of floats
+        The positions of the particles, used to select them
+        (If `particle_array` is `z` itself, it needs to be split last.)
+
+    zbox_min, zbox_max: floats
+        The positions between which particles stay in the domain
+
+    left_buffer, right_buffer: 1d arrays
+        Will contain the particles that are outside of the physical domain
+        Note: if the boundary is open, then these buffers have size 0
+        and in this case, they will not be filled
+        (the corresponding particles are simply lost)
+
+    Returns
+    -------
+    The number of particles that stay in the domain
+    """
+    n_left = 0
+    n_right = 0
+    n_stay = 0
+    for i in range( z.shape[0] ):
+        zi = z[i]
+        if zi < zbox_min:
+            if left_buffer.shape[0] != 0:
+                left_buffer[n_left] = particle_array[i]
+            n_left += 1
+        elif zi > zbox_max:
+            if right_buffer.shape[0] != 0:
+                right_buffer[n_right] = particle_array[i]
+            n_right += 1
+        else:
+            particle_array[n_stay] = particle_array[i]
+            n_stay += 1
+    return( n_stay )
 
 @catch_gpu_memory_error
-def remove_particles_gpu(species, fld, n_guard, left_proc, right_proc):
+def remove_particles_gpu( species, fld, n_guard, left_proc, right_proc,
+                          buffer_handler ):
     """
     Remove the particles that are outside of the physical domain (i.e.
-    in the guard cells). Store them in sending buffers, which are returned.
+    in the guard cells). Store them in the sending buffers of
+    `buffer_handler` (on the CPU).
 
     Parameters
     ----------
@@ -195,13 +615,8 @@ def remove_particles_gpu(species, fld, n_guard, left_proc, right_proc):
         Indicate whether there is a left or right processor or if the
         boundary is open (None).
 
-    Returns
-    -------
-    float_send_left, float_send_right, uint_send_left, uint_send_right:
-        arrays of shape (n_float,Nptcl) and (n_int,Nptcl) where Nptcl
-        is the number of particles that are sent to the left
-        proc and right proc respectively, and where n_float and n_int
-        are the number of float and integer quantities respectively
+    buffer_handler: a ParticleBufferHandler object
+        Provides the sending buffers (see `get_send_arrays`)
     """
     # Check if particles are sorted
     # (The particles are usually expected to be sorted from the previous
@@ -234,21 +649,13 @@ def remove_particles_gpu(species, fld, n_guard, left_proc, right_proc):
     new_Ntot = i_max - i_min
     N_send_r = species.Ntot - i_max
 
-    # Allocate the sending buffers on the CPU
+    # Get the sending buffers on the CPU
     n_float = species.n_float_quantities
     n_int = species.n_integer_quantities
-    if left_proc is not None:
-        float_send_left = np.empty((n_float, N_send_l), dtype=np.float64)
-        uint_send_left = np.empty((n_int, N_send_l), dtype=np.uint64)
-    else:
-        float_send_left = np.empty((n_float, 0), dtype=np.float64)
-        uint_send_left = np.empty((n_int, 0), dtype=np.uint64)
-    if right_proc is not None:
-        float_send_right = np.empty((n_float, N_send_r), dtype=np.float64)
-        uint_send_right = np.empty((n_int, N_send_r), dtype=np.uint64)
-    else:
-        float_send_right = np.empty((n_float, 0), dtype=np.float64)
-        uint_send_right = np.empty((n_int, 0), dtype=np.uint64)
+    float_send_left, uint_send_left = get_send_arrays(
+        buffer_handler, 'left', left_proc, N_send_l, n_float, n_int )
+    float_send_right, uint_send_right = get_send_arrays(
+        buffer_handler, 'right', right_proc, N_send_r, n_float, n_int )
 
     # Get the threads per block and the blocks per grid
     dim_grid_1d, dim_block_1d = cuda_tpb_bpg_1d( species.Ntot )
@@ -261,27 +668,35 @@ def remove_particles_gpu(species, fld, n_guard, left_proc, right_proc):
         attr_list.append( (species.ionizer,'w_times_level') )
     # Loop through the float attributes
     for i_attr in range(n_float):
-        # Initialize 3 buffer arrays on the GPU (need to be initialized
+        particle_array = getattr( attr_list[i_attr][0], attr_list[i_attr][1] )
+        # Initialize 2 buffer arrays on the GPU (need to be initialized
         # inside the loop, as `copy_to_host` invalidates these arrays)
-        left_buffer = cuda.device_array((N_send_l,), dtype=np.float64)
-        right_buffer = cuda.device_array((N_send_r,), dtype=np.float64)
-        stay_buffer = cuda.device_array((new_Ntot,), dtype=np.float64)
+        # (The buffers have the same precision as the particle array)
+        dtype = particle_array.dtype
+        left_buffer = cuda.device_array((N_send_l,), dtype=dtype)
+        right_buffer = cuda.device_array((N_send_r,), dtype=dtype)
         # Check that the buffers are still on GPU
         # (safeguard against automatic memory management)
         assert type(left_buffer) != np.ndarray
         assert type(right_buffer) != np.ndarray
-        assert type(left_buffer) != np.ndarray
+        # The particles that stay are written in the sorting buffer
+        # that has the same precision
+        if dtype == species.sorting_buffer.dtype:
+            buffer_name = 'sorting_buffer'
+        else:
+            buffer_name = 'position_sorting_buffer'
+        stay_buffer = getattr( species, buffer_name )
         # Split the particle array into the 3 buffers on the GPU
-        particle_array = getattr( attr_list[i_attr][0], attr_list[i_attr][1] )
         split_particles_to_buffers[dim_grid_1d, dim_block_1d]( particle_array,
                     left_buffer, stay_buffer, right_buffer, i_min, i_max)
         # Assign the stay_buffer to the initial particle data array
         # and fill the sending buffers (if needed for MPI)
-        setattr( attr_list[i_attr][0], attr_list[i_attr][1], stay_buffer)
+        species.swap_particle_arrays( attr_list[i_attr][0],
+                                attr_list[i_attr][1], species, buffer_name )
         if left_proc is not None:
-            left_buffer.copy_to_host( float_send_left[i_attr] )
+            float_send_left[i_attr] = left_buffer.copy_to_host()
         if right_proc is not None:
-            right_buffer.copy_to_host( float_send_right[i_attr] )
+            float_send_right[i_attr] = right_buffer.copy_to_host()
 
     # Integer quantities:
     if n_int > 0:
@@ -291,28 +706,27 @@ def remove_particles_gpu(species, fld, n_guard, left_proc, right_proc):
     if species.ionizer is not None:
         attr_list.append( (species.ionizer,'ionization_level') )
     for i_attr in range(n_int):
-        # Initialize 3 buffer arrays on the GPU (need to be initialized
+        # Initialize 2 buffer arrays on the GPU (need to be initialized
         # inside the loop, as `copy_to_host` invalidates these arrays)
         left_buffer = cuda.device_array((N_send_l,), dtype=np.uint64)
         right_buffer = cuda.device_array((N_send_r,), dtype=np.uint64)
-        stay_buffer = cuda.device_array((new_Ntot,), dtype=np.uint64)
         # Split the particle array into the 3 buffers on the GPU
+        # (the particles that stay are written in the sorting buffer)
         particle_array = getattr( attr_list[i_attr][0], attr_list[i_attr][1] )
         split_particles_to_buffers[dim_grid_1d, dim_block_1d]( particle_array,
-            left_buffer, stay_buffer, right_buffer, i_min, i_max)
+            left_buffer, species.int_sorting_buffer, right_buffer,
+            i_min, i_max)
         # Assign the stay_buffer to the initial particle data array
         # and fill the sending buffers (if needed for MPI)
-        setattr( attr_list[i_attr][0], attr_list[i_attr][1], stay_buffer)
+        species.swap_particle_arrays( attr_list[i_attr][0],
+                        attr_list[i_attr][1], species, 'int_sorting_buffer' )
         if left_proc is not None:
             left_buffer.copy_to_host( uint_send_left[i_attr] )
         if right_proc is not None:
             right_buffer.copy_to_host( uint_send_right[i_attr] )
 
-    # Change the new total number of particles
-    species.Ntot = new_Ntot
-
-    # Return the sending buffers
-    return(float_send_left, float_send_right, uint_send_left, uint_send_right)
+    # Resize the particle arrays (without copying the data)
+    species.resize_particle_arrays( new_Ntot )
 
 
 def add_buffers_to_particles( species, float_recv_left, float_recv_right,
@@ -321,8 +735,9 @@ def add_buffers_to_particles( species, float_recv_left, float_recv_right,
     Add the particles stored in recv_left and recv_right
     to the existing particle in species.
 
-    Resize the auxiliary arrays of the particles Ex, Ey, Ez, Bx, By, Bz,
-    as well as cell_idx, sorted_idx and sorting_buffer
+    (The particle arrays, the auxiliary arrays of the particles Ex, Ey, Ez,
+    Bx, By, Bz, as well as cell_idx, sorted_idx and sorting_buffer, are
+    resized by `Particles.resize_particle_arrays`)
 
     Parameters
     ----------
@@ -336,7 +751,7 @@ def add_buffers_to_particles( species, float_recv_left, float_recv_right,
         are the number of float and integer quantities respectively
         These arrays are always on the CPU (since they were used for MPI)
     """
-    # Copy the buffers to an enlarged array
+    # Append the buffers to the particle arrays
     if species.use_cuda:
         add_buffers_gpu( species, float_recv_left, float_recv_right,
                                 uint_recv_left, uint_recv_right )
@@ -344,34 +759,6 @@ def add_buffers_to_particles( species, float_recv_left, float_recv_right,
         add_buffers_cpu( species, float_recv_left, float_recv_right,
                                 uint_recv_left, uint_recv_right )
 
-    # Reallocate the particles auxiliary arrays. This needs to be done,
-    # as the total number of particles in this domain has changed.
-    if species.use_cuda:
-        shape = (species.Ntot,)
-        # Reallocate empty field-on-particle arrays on the GPU
-        species.Ex = cuda.device_array( shape, dtype=np.float64 )
-        species.Ex = cuda.device_array( shape, dtype=np.float64 )
-        species.Ey = cuda.device_array( shape, dtype=np.float64 )
-        species.Ez = cuda.device_array( shape, dtype=np.float64 )
-        species.Bx = cuda.device_array( shape, dtype=np.float64 )
-        species.By = cuda.device_array( shape, dtype=np.float64 )
-        species.Bz = cuda.device_array( shape, dtype=np.float64 )
-        # Reallocate empty auxiliary sorting arrays on the GPU
-        species.cell_idx = cuda.device_array( shape, dtype=np.int32 )
-        species.sorted_idx = cuda.device_array( shape, dtype=np.int32 )
-        species.sorting_buffer = cuda.device_array( shape, dtype=np.float64 )
-        if species.n_integer_quantities > 0:
-            species.int_sorting_buffer = \
-                cuda.device_array( shape, dtype=np.uint64 )
-    else:
-        # Reallocate empty field-on-particle arrays on the CPU
-        species.Ex = np.empty(species.Ntot, dtype=np.float64)
-        species.Ey = np.empty(species.Ntot, dtype=np.float64)
-        species.Ez = np.empty(species.Ntot, dtype=np.float64)
-        species.Bx = np.empty(species.Ntot, dtype=np.float64)
-        species.By = np.empty(species.Ntot, dtype=np.float64)
-        species.Bz = np.empty(species.Ntot, dtype=np.float64)
-
     # The particles are unsorted after adding new particles.
     species.sorted = False
 
@@ -393,31 +780,42 @@ def add_buffers_cpu( species, float_recv_left, float_recv_right,
         are the number of float and integer quantities respectively
         These arrays are always on the CPU (since they were used for MPI)
     """
-    # Form the new particle arrays by adding the received particles
-    # from the left and the right to the particles that stay in the domain
-    species.x = np.hstack((float_recv_left[0], species.x, float_recv_right[0]))
-    species.y = np.hstack((float_recv_left[1], species.y, float_recv_right[1]))
-    species.z = np.hstack((float_recv_left[2], species.z, float_recv_right[2]))
-    species.ux = np.hstack((float_recv_left[3],species.ux,float_recv_right[3]))
-    species.uy = np.hstack((float_recv_left[4],species.uy,float_recv_right[4]))
-    species.uz = np.hstack((float_recv_left[5],species.uz,float_recv_right[5]))
-    species.inv_gamma = \
-        np.hstack((float_recv_left[6], species.inv_gamma, float_recv_right[6]))
-    species.w = np.hstack((float_recv_left[7], species.w, float_recv_right[7]))
-    i_attr = 0
+    # Resize the particle arrays (the storage arrays are only reallocated
+    # when their capacity is exceeded)
+    old_Ntot = species.Ntot
+    n_left = float_recv_left.shape[1]
+    n_right = float_recv_right.shape[1]
+    species.resize_particle_arrays( old_Ntot + n_left + n_right )
+
+    # Append the received particles from the left and the right
+    # after the particles that stayed in the domain
+    # (The received buffers are in double precision: they are converted
+    # to the precision of the particle arrays)
+    attr_list = [ (species,'x'), (species,'y'), (species,'z'),
+                  (species,'ux'), (species,'uy'), (species,'uz'),
+                  (species,'inv_gamma'), (species,'w') ]
+    if species.ionizer is not None:
+        attr_list.append( (species.ionizer,'w_times_level') )
+    for i_attr, (obj, name) in enumerate( attr_list ):
+        append_buffers( getattr(obj, name), old_Ntot,
+                        float_recv_left[i_attr], float_recv_right[i_attr] )
+    attr_list = []
     if species.tracker is not None:
-        species.tracker.id = np.hstack( (uint_recv_left[i_attr],
-            species.tracker.id, uint_recv_right[i_attr]))
-        i_attr += 1
+        attr_list.append( (species.tracker,'id') )
     if species.ionizer is not None:
-        species.ionizer.ionization_level = np.hstack( (uint_recv_left[i_attr],
-            species.ionizer.ionization_level, uint_recv_right[i_attr]))
-        species.ionizer.w_times_level = np.hstack( (float_recv_left[8],
-            species.ionizer.w_times_level, float_recv_right[8]))
+        attr_list.append( (species.ionizer,'ionization_level') )
+    for i_attr, (obj, name) in enumerate( attr_list ):
+        append_buffers( getattr(obj, name), old_Ntot,
+                        uint_recv_left[i_attr], uint_recv_right[i_attr] )
 
-    # Adapt the total number of particles
-    species.Ntot = species.Ntot + float_recv_left.shape[1] \
-                                + float_recv_right.shape[1]
+def append_buffers( array, i_start, recv_left, recv_right ):
+    """
+    Copy the received buffers `recv_left` and `recv_right` into
+    the particle array `array`, starting at the index `i_start`
+    """
+    n_left = recv_left.shape[0]
+    array[ i_start:i_start+n_left ] = recv_left
+    array[ i_start+n_left:i_start+n_left+recv_right.shape[0] ] = recv_right
 
 @catch_gpu_memory_error
 def add_buffers_gpu( species, float_recv_left, float_recv_right,
@@ -438,76 +836,46 @@ def add_buffers_gpu( species, float_recv_left, float_recv_right,
         are the number of float and integer quantities respectively
         These arrays are always on the CPU (since they were used for MPI)
     """
-    # Get the new number of particles
+    # Resize the particle arrays (the storage arrays are only reallocated
+    # when their capacity is exceeded)
     old_Ntot = species.Ntot
     n_left = float_recv_left.shape[1]
     n_right = float_recv_right.shape[1]
-    new_Ntot = old_Ntot + n_left + n_right
+    species.resize_particle_arrays( old_Ntot + n_left + n_right )
 
     # Get the threads per block and the blocks per grid
     n_left_grid, n_left_block = cuda_tpb_bpg_1d( n_left )
     n_right_grid, n_right_block = cuda_tpb_bpg_1d( n_right )
-    n_old_grid, n_old_block = cuda_tpb_bpg_1d( old_Ntot )
 
-    # Iterate over particle attributes
-    # Build list of float attributes to copy
+    # Build list of float and integer attributes to copy
     attr_list = [ (species,'x'), (species,'y'), (species,'z'), \
                   (species,'ux'), (species,'uy'), (species,'uz'), \
                   (species,'inv_gamma'), (species,'w') ]
     if species.ionizer is not None:
         attr_list += [ (species.ionizer, 'w_times_level') ]
-    # Loop through the float quantities
-    for i_attr in range( len(attr_list) ):
-        # Copy the proper buffers to the GPU
-        left_buffer = cuda.to_device( float_recv_left[i_attr] )
-        right_buffer = cuda.to_device( float_recv_right[i_attr] )
-        # Initialize the new particle array
-        particle_array = cuda.device_array( (new_Ntot,), dtype=np.float64)
-        # Merge the arrays on the GPU
-        stay_buffer = getattr( attr_list[i_attr][0], attr_list[i_attr][1])
-        if n_left != 0:
-            copy_particles[n_left_grid, n_left_block](
-                n_left, left_buffer, 0, particle_array, 0 )
-        if old_Ntot != 0:
-            copy_particles[n_old_grid, n_old_block](
-                old_Ntot, stay_buffer, 0, particle_array, n_left )
-        if n_right != 0:
-            copy_particles[n_right_grid, n_right_block](
-                n_right, right_buffer, 0, particle_array, n_left+old_Ntot )
-        # Assign the stay_buffer to the initial particle data array
-        # and fill the sending buffers (if needed for MPI)
-        setattr(attr_list[i_attr][0], attr_list[i_attr][1], particle_array)
-
-    # Build list of integer quantities to copy
-    attr_list = []
+    buffer_list = [ (float_recv_left[i_attr], float_recv_right[i_attr])
+                    for i_attr in range( len(attr_list) ) ]
     if species.tracker is not None:
         attr_list.append( (species.tracker,'id') )
     if species.ionizer is not None:
         attr_list.append( (species.ionizer,'ionization_level') )
-    # Loop through the integer quantities
-    for i_attr in range( len(attr_list) ):
-        # Copy the proper buffers to the GPU
-        left_buffer = cuda.to_device( uint_recv_left[i_attr] )
-        right_buffer = cuda.to_device( uint_recv_right[i_attr] )
-        # Initialize the new particle array
-        particle_array = cuda.device_array( (new_Ntot,), dtype=np.uint64)
-        # Merge the arrays on the GPU
-        stay_buffer = getattr( attr_list[i_attr][0], attr_list[i_attr][1])
+    buffer_list += [ (uint_recv_left[i_attr], uint_recv_right[i_attr])
+                     for i_attr in range( len(attr_list)-len(buffer_list) ) ]
+    # Loop through the quantities, and append the received particles
+    # from the left and the right after the particles that stayed
+    for (obj, name), (recv_left, recv_right) in zip( attr_list, buffer_list ):
+        particle_array = getattr( obj, name )
+        # Copy the proper buffers to the GPU (with the same precision)
+        dtype = particle_array.dtype
+        left_buffer = cuda.to_device( recv_left.astype( dtype, copy=False ) )
+        right_buffer = cuda.to_device( recv_right.astype( dtype, copy=False ) )
+        # Copy them into the particle array on the GPU
         if n_left != 0:
             copy_particles[n_left_grid, n_left_block](
-                n_left, left_buffer, 0, particle_array, 0 )
-        if old_Ntot != 0:
-            copy_particles[n_old_grid, n_old_block](
-                old_Ntot, stay_buffer, 0, particle_array, n_left )
+                n_left, left_buffer, 0, particle_array, old_Ntot )
         if n_right != 0:
             copy_particles[n_right_grid, n_right_block](
-                n_right, right_buffer, 0, particle_array, n_left+old_Ntot )
-        # Assign the stay_buffer to the initial particle data array
-        # and fill the sending buffers (if needed for MPI)
-        setattr(attr_list[i_attr][0], attr_list[i_attr][1], particle_array)
-
-    # Adapt the total number of particles
-    species.Ntot = new_Ntot
+                n_right, right_buffer, 0, particle_array, old_Ntot+n_left )
 
 
 def shift_particles_periodic_subdomain( species, zmin, zmax ):
@@ -0,0 +1,177 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the CoefficientCache class, which stores the DHT matrices and
+the PSATD coefficients on disk, so that they can be reused by other
+simulations (or other MPI ranks) that use the same grid and timestep.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from fbpic import __version__
+try:
+    # File locking (only available on POSIX systems)
+    import fcntl
+    fcntl_installed = True
+except ImportError:
+    fcntl_installed = False
+
+class CoefficientCache(object):
+    """
+    Content-addressed cache of precomputed arrays, on disk.
+
+    Each entry is a directory that contains one `.npy` file per array.
+    The name of the directory is a hash of the name of the function
+    that computes the arrays and of its arguments. The entries are
+    loaded as read-only memory-mapped arrays.
+
+    When several processes (e.g. MPI ranks) request the same entry
+    simultaneously, a lock file ensures that only one of them computes it,
+    while the others wait and then load the result from disk.
+    """
+
+    def __init__( self, cache_dir ):
+        """
+        Initialize the cache, and create the cache directory if needed
+
+        Parameters
+        ----------
+        cache_dir: string
+            Path to the directory where the cached arrays are stored
+        """
+        self.cache_dir = os.path.abspath( cache_dir )
+        if not os.path.exists( self.cache_dir ):
+            try:
+                os.makedirs( self.cache_dir )
+            except OSError:
+                # The directory may have been created by another process
+                if not os.path.isdir( self.cache_dir ):
+                    raise
+
+        # Statistics
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def load_or_compute( self, compute_function, *args ):
+        """
+        Return the arrays computed by `compute_function(*args)`, either
+        by loading them from the cache, or by calling the function
+        (in which case the result is stored in the cache)
+
+        Parameters
+        ----------
+        compute_function: callable
+            A function which returns a dictionary of numpy arrays
+
+        args: floats, ints, bools, None or numpy arrays
+            The arguments of `compute_function`. (These are used to build
+            the key of the entry in the cache.)
+
+        Returns
+        -------
+        A dictionary of (read-only, memory-mapped) numpy arrays
+        """
+        key = get_key( compute_function.__name__, *args )
+        entry_dir = os.path.join( self.cache_dir, key )
+
+        # Fast path: the entry already exists
+        if os.path.isdir( entry_dir ):
+            self.n_hits += 1
+            return( load_entry( entry_dir ) )
+
+        # Otherwise, take the lock, and check again whether
+        # another process created the entry in the meantime
+        lock_file = open( entry_dir + '.lock', 'w' )
+        try:
+            lock( lock_file )
+            if os.path.isdir( entry_dir ):
+                self.n_hits += 1
+            else:
+                self.n_misses += 1
+                arrays = compute_function( *args )
+                write_entry( arrays, self.cache_dir, entry_dir )
+        finally:
+            unlock( lock_file )
+            lock_file.close()
+
+        return( load_entry( entry_dir ) )
+
+    def get_statistics( self ):
+        """
+        Return a dictionary with the number of hits and misses of the cache
+        """
+        return( {'hits': self.n_hits, 'misses': self.n_misses} )
+
+# Utility functions
+# -----------------
+
+def get_key( function_name, *args ):
+    """
+    Return a string which uniquely identifies the result of
+    `function_name(*args)` for the current version of FBPIC
+    """
+    h = hashlib.sha1()
+    h.update( __version__.encode() )
+    for arg in args:
+        if isinstance( arg, np.ndarray ):
+            h.update( str( (arg.dtype.str, arg.shape) ).encode() )
+            h.update( np.ascontiguousarray(arg).tobytes() )
+        else:
+            # (repr gives the exact value of floats)
+            h.update( repr(arg).encode() )
+        # Separator between arguments
+        h.update( b'|' )
+    return( '%s_%s' %(function_name, h.hexdigest()) )
+
+def write_entry( arrays, cache_dir, entry_dir ):
+    """
+    Write the dictionary of arrays `arrays` into the directory `entry_dir`
+
+    The arrays are first written into a temporary directory, which
+    is then renamed, so that other processes never see an incomplete entry.
+    """
+    tmp_dir = tempfile.mkdtemp( dir=cache_dir )
+    for name, array in arrays.items():
+        np.save( os.path.join( tmp_dir, name + '.npy' ), array )
+    try:
+        os.rename( tmp_dir, entry_dir )
+    except OSError:
+        # The entry was created by another process in the meantime
+        # (e.g. when file locking is not supported)
+        shutil.rmtree( tmp_dir )
+        if not os.path.isdir( entry_dir ):
+            raise
+
+def load_entry( entry_dir ):
+    """
+    Return the arrays of the entry `entry_dir`, as a dictionary
+    of read-only memory-mapped arrays
+    """
+    arrays = {}
+    for filename in os.listdir( entry_dir ):
+        if filename.endswith('.npy'):
+            arrays[ filename[:-4] ] = np.load(
+                os.path.join( entry_dir, filename ), mmap_mode='r' )
+    return( arrays )
+
+def lock( lock_file ):
+    """Acquire an exclusive lock on the open file `lock_file`"""
+    if fcntl_installed:
+        try:
+            fcntl.flock( lock_file, fcntl.LOCK_EX )
+        except OSError:
+            # Locking is not supported by some (network) file systems;
+            # in this case, several processes may compute the same entry
+            pass
+
+def unlock( lock_file ):
+    """Release the lock on the open file `lock_file`"""
+    if fcntl_installed:
+        try:
+            fcntl.flock( lock_file, fcntl.LOCK_UN )
+        except OSError:
+            pass
@@ -5,15 +5,19 @@
 This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
 It defines the high-level Fields class.
 """
+import os
 import warnings
 import numpy as np
 from fbpic.utils.threading import nthreads
+from fbpic.utils.precision import get_dtypes
 from .numba_methods import sum_reduce_2d_array, numba_erase_threading_buffer
 from .utility_methods import get_modified_k
-from .spectral_transform import SpectralTransformer
+from .spectral_transform import SpectralTransformer, \
+    BatchedSpectralTransformer, select_dht_backend
 from .interpolation_grid import InterpolationGrid
 from .spectral_grid import SpectralGrid
 from .psatd_coefs import PsatdCoeffs
+from .coefficient_cache import CoefficientCache
 from fbpic.utils.cuda import cuda_installed
 from .smoothing import BinomialSmoother
 
@@ -28,6 +32,8 @@ class Fields(object) :
            interpolation grid to the spectral grid
     - spect2interp : Transforms the fields from the
            spectral grid to the interpolation grid
+    - require_interp : Transforms the fields from the spectral grid
+           to the interpolation grid, only if they are outdated
     - correct_currents : Corrects the currents so that
            they satisfy the conservation equation
     - erase : sets the fields to zero on the interpolation grid
@@ -50,7 +56,11 @@ class Fields(object) :
     def __init__( self, Nz, zmax, Nr, rmax, Nm, dt, zmin=0.,
                   n_order=-1, v_comoving=None, use_galilean=True,
                   current_correction='cross-deposition', use_cuda=False,
-                  smoother=None, create_threading_buffers=False ):
+                  smoother=None, create_threading_buffers=False,
+                  precision='double', cache_dir=None,
+                  transform_engine='per-component', dht_backend='matrix',
+                  cpu_deposition='particle-chunks', radial_comm=None,
+                  n_radial_halo=0 ):
         """
         Initialize the components of the Fields object
 
@@ -110,6 +120,54 @@ class Fields(object) :
             Whether to create the buffers used in order to perform
             charge/current deposition with threading on CPU
             (buffers are duplicated with the number of threads)
+
+        precision: string, optional
+            The floating-point precision of the field arrays.
+            Either 'double', 'single' or 'mixed'. (See the corresponding
+            argument of the `Simulation` class for more information.)
+
+        cache_dir: string or None, optional
+            Directory of the on-disk cache for the DHT matrices and the
+            PSATD coefficients. If None, the environment variable
+            FBPIC_CACHE_DIR is used, if it is set; otherwise, these
+            arrays are recomputed and not cached.
+
+        transform_engine: string, optional
+            How the vector fields are transformed between the interpolation
+            grid and the spectral grid. Either 'per-component' (each
+            component is transformed separately) or 'batched' (the
+            components of E and B are transformed in one batched FFT and
+            one matrix product per order of the Hankel transform, which
+            reduces the overhead for small grids ; only available on CPU).
+
+        dht_backend: string, optional
+            The algorithm of the discrete Hankel transform. Either 'matrix'
+            (dense matrix product), 'low-memory' (without the Nr x Nr
+            matrices, but slower ; only available on CPU) or 'auto' (selects
+            'low-memory' only when the dense matrices would not fit
+            in memory).
+
+        cpu_deposition: string, optional
+            How the charge and current are deposited on CPU. With
+            'particle-chunks', the deposition buffers are duplicated
+            with the number of threads ; with 'sorted-tiles' or 'z-chunks',
+            a single copy is created. (See the corresponding argument of the
+            `Simulation` class for more information.)
+
+        radial_comm: an mpi4py communicator, or None, optional
+            With a radial domain decomposition: the communicator of the
+            ranks that share the same fields along r. The Hankel transforms
+            are then distributed over these ranks (see `DistributedDHT`),
+            and the spectral grid only contains the local block of radial
+            modes, while the interpolation grid contains all the radial
+            cells. Only on CPU.
+
+        n_radial_halo: int, optional
+            With a radial domain decomposition: the number of cells on each
+            side of the local radial band that are obtained (in addition to
+            the band) when the fields are transformed with `band_only=True`
+            (see `spect2interp`), i.e. the cells in which the particles of
+            the band can gather the fields.
         """
         # Register the arguments inside the object
         self.Nz = Nz
@@ -121,6 +179,9 @@ class Fields(object) :
         self.v_comoving = v_comoving
         self.use_galilean = use_galilean
 
+        # Register the data types of the field arrays
+        self.precision = precision
+
         # Set the default smoother
         if smoother is None:
             smoother = BinomialSmoother( n_passes=1, compensator=False )
@@ -140,13 +201,104 @@ class Fields(object) :
         else:
             raise ValueError('Unkown current correction:%s'%current_correction)
 
+        # Initialize the on-disk cache of the DHT matrices and PSATD coefs
+        if cache_dir is None:
+            cache_dir = os.environ.get('FBPIC_CACHE_DIR')
+        if cache_dir is not None:
+            self.coef_cache = CoefficientCache( cache_dir )
+        else:
+            self.coef_cache = None
+
+        # Select the algorithm of the Hankel transform
+        # (With a radial domain decomposition, the transform is always
+        # distributed over the ranks of the radial communicator)
+        if (radial_comm is not None) and (radial_comm.size > 1):
+            if self.use_cuda:
+                raise ValueError(
+                    'The radial domain decomposition is not available on GPU.')
+            if dht_backend == 'low-memory':
+                warnings.warn(
+                    'The low-memory Hankel transform is not available with '
+                    'a radial domain decomposition.\nUsing the distributed '
+                    'Hankel transform instead.' )
+            self.radial_comm = radial_comm
+            self.n_radial_halo = n_radial_halo
+            self.dht_backend = 'distributed'
+        else:
+            self.radial_comm = None
+            self.n_radial_halo = 0
+            self.dht_backend = select_dht_backend(
+                                    dht_backend, Nr, Nm, self.use_cuda )
+
+        # Register the transform engine
+        if transform_engine not in ['per-component', 'batched']:
+            raise ValueError('Unknown transform engine: %s' %transform_engine)
+        if transform_engine == 'batched' and self.use_cuda:
+            warnings.warn(
+                'The batched transform engine is not available on GPU.\n'
+                'Using the per-component transform engine instead.' )
+            transform_engine = 'per-component'
+        if transform_engine == 'batched' and self.dht_backend != 'matrix':
+            warnings.warn(
+                'The batched transform engine requires the matrix DHT.\n'
+                'Using the per-component transform engine instead.' )
+            transform_engine = 'per-component'
+        self.transform_engine = transform_engine
+
+        # Register the deposition method on CPU
+        if cpu_deposition not in ['particle-chunks', 'sorted-tiles',
+                                  'z-chunks']:
+            raise ValueError('Unknown `cpu_deposition`: %s' %cpu_deposition)
+        self.cpu_deposition = cpu_deposition
+        self.create_threading_buffers = create_threading_buffers
+
+        # Create the grids, the transformers and the PSATD coefficients
+        self.create_grids( Nz, zmin, zmax )
+
+    def create_grids( self, Nz, zmin, zmax ):
+        """
+        Create the interpolation and spectral grids, the spectral
+        transformers, the PSATD coefficients and the deposition buffers,
+        for a local grid of `Nz` cells between `zmin` and `zmax`.
+
+        This is called at initialization, and again when the size of the
+        local domain changes (e.g. with dynamic load balancing ; the field
+        values are then reset to zero and need to be copied by the caller).
+
+        Parameters
+        ----------
+        Nz : int
+            The number of gridpoints in z
+
+        zmin, zmax : float
+            The position of the edges of the box along z
+        """
+        self.Nz = Nz
+        Nr = self.Nr
+        Nm = self.Nm
+        rmax = self.rmax
+        dt = self.dt
+        n_order = self.n_order
+        current_correction = self.current_correction
+        smoother = self.smoother
+        dtypes = get_dtypes( self.precision )
+
         # Create the list of the transformers, which convert the fields
         # back and forth between the spatial and spectral grid
         # (one object per azimuthal mode)
         self.trans = []
         for m in range(Nm) :
-            self.trans.append( SpectralTransformer(
-                Nz, Nr, m, rmax, use_cuda=self.use_cuda ) )
+            self.trans.append( SpectralTransformer( Nz, Nr, m, rmax,
+                use_cuda=self.use_cuda, dtype=dtypes['spectral'],
+                cache=self.coef_cache, dht_backend=self.dht_backend,
+                radial_comm=self.radial_comm,
+                n_radial_halo=self.n_radial_halo ) )
+
+        # Create the batched transformers if needed
+        # (one object per azimuthal mode)
+        if self.transform_engine == 'batched':
+            self.batched_trans = [ BatchedSpectralTransformer(self.trans[m])
+                                    for m in range(Nm) ]
 
         # Create the interpolation grid for each modes
         # (one grid per azimuthal mode)
@@ -154,7 +306,9 @@ class Fields(object) :
         for m in range(Nm) :
             # Create the object
             self.interp.append( InterpolationGrid(
-                Nz, Nr, m, zmin, zmax, rmax, use_cuda=self.use_cuda ) )
+                Nz, Nr, m, zmin, zmax, rmax, use_cuda=self.use_cuda,
+                field_dtype=dtypes['interp_field'],
+                source_dtype=dtypes['interp_source'] ) )
 
         # Get the kz and (finite-order) modified kz arrays
         # (According to FFT conventions, the kz array starts with
@@ -174,12 +328,15 @@ class Fields(object) :
             # Create the object
             self.spect.append( SpectralGrid( kz_modified, kr, m,
                 kz_true, self.interp[m].dz, self.interp[m].dr,
-                current_correction, smoother, use_cuda=self.use_cuda ) )
+                current_correction, smoother, use_cuda=self.use_cuda,
+                dtype=dtypes['spectral'] ) )
             self.psatd.append( PsatdCoeffs( self.spect[m].kz,
                                 self.spect[m].kr, m, dt, Nz, Nr,
                                 V=self.v_comoving,
                                 use_galilean=self.use_galilean,
-                                use_cuda=self.use_cuda ) )
+                                use_cuda=self.use_cuda,
+                                dtype=dtypes['spectral_real'],
+                                cache=self.coef_cache ) )
 
         # Record flags that indicates whether, for the sources *in
         # spectral space*, the guard cells have been exchanged via MPI
@@ -187,20 +344,37 @@ class Fields(object) :
             {'J': False, 'rho_prev': False, 'rho_new': False,
                 'rho_next_xy': False, 'rho_next_z': False }
 
+        # Record which fields of the spectral grid are currently represented
+        # (i.e. up-to-date) on the interpolation grid, for each array of the
+        # interpolation grid (None if the array is not up-to-date ; note that
+        # the array 'rho' is shared by 'rho_prev', 'rho_next', etc. ; with a
+        # radial domain decomposition, the name of the field is followed by
+        # '_band' if only the local radial band and its halo are up-to-date)
+        # This allows to skip the transforms that are not needed.
+        self.interp_content = {'E': None, 'B': None, 'J': None, 'rho': None}
+
         # Generate duplicated deposition arrays, when using threading
         # (One copy per thread ; 2 guard cells on each side in z and r,
         # in order to store contributions from, at most, cubic shape factors ;
         # these deposition guard cells are folded into the regular box
         # inside `sum_reduce_2d_array`)
-        if create_threading_buffers:
-            self.rho_global = np.zeros( dtype=np.complex128,
-                shape=(nthreads, self.Nm, self.Nz+4, self.Nr+4) )
-            self.Jr_global = np.zeros( dtype=np.complex128,
-                    shape=(nthreads, self.Nm, self.Nz+4, self.Nr+4) )
-            self.Jt_global = np.zeros( dtype=np.complex128,
-                    shape=(nthreads, self.Nm, self.Nz+4, self.Nr+4) )
-            self.Jz_global = np.zeros( dtype=np.complex128,
-                    shape=(nthreads, self.Nm, self.Nz+4, self.Nr+4) )
+        if self.create_threading_buffers:
+            source_dtype = dtypes['interp_source']
+            # With the sorted deposition, the threads deposit into
+            # separate regions of a single copy (or into small tile-local
+            # arrays or halos, which are then added to this copy)
+            if self.cpu_deposition in ['sorted-tiles', 'z-chunks']:
+                n_copies = 1
+            else:
+                n_copies = nthreads
+            self.rho_global = np.zeros( dtype=source_dtype,
+                shape=(n_copies, self.Nm, self.Nz+4, self.Nr+4) )
+            self.Jr_global = np.zeros( dtype=source_dtype,
+                    shape=(n_copies, self.Nm, self.Nz+4, self.Nr+4) )
+            self.Jt_global = np.zeros( dtype=source_dtype,
+                    shape=(n_copies, self.Nm, self.Nz+4, self.Nr+4) )
+            self.Jz_global = np.zeros( dtype=source_dtype,
+                    shape=(n_copies, self.Nm, self.Nz+4, self.Nr+4) )
 
 
     def send_fields_to_gpu( self ):
@@ -227,11 +401,17 @@ class Fields(object) :
                 self.interp[m].receive_fields_from_gpu()
                 self.spect[m].receive_fields_from_gpu()
 
-    def push(self, use_true_rho=False, check_exchanges=False):
+    def push(self, use_true_rho=False, check_exchanges=False,
+                correct_currents=False, filter_sources=False):
         """
         Push the different azimuthal modes over one timestep,
         in spectral space.
 
+        If `correct_currents` or `filter_sources` is True, the sources
+        are also filtered and/or corrected before the push. On CPU, all
+        these operations are then performed in a single pass over
+        the spectral grid (see `SpectralGrid.push_eb_fused`).
+
         Parameters
         ----------
         use_true_rho : bool, optional
@@ -244,19 +424,46 @@ class Fields(object) :
         check_exchanges: bool, optional
             Check whether the guard cells of the fields rho and J
             have been properly exchanged via MPI
+        correct_currents: bool, optional
+            Whether to correct the currents before the push (see
+            `correct_currents`). This requires that the currents do
+            not need to be exchanged via MPI between the correction
+            and the push.
+        filter_sources: bool, optional
+            Whether to filter J and rho_next (and rho_next_xy, rho_next_z
+            for cross-deposition) before the correction and the push,
+            i.e. when these were not filtered after the deposition.
         """
         if check_exchanges:
-            # Ensure consistency: fields should be exchanged
-            assert self.exchanged_source['J'] == True
+            if correct_currents:
+                # Ensure consistency (charge and current should
+                # not be exchanged via MPI before correction)
+                assert self.exchanged_source['J'] == False
+            else:
+                # Ensure consistency: fields should be exchanged
+                assert self.exchanged_source['J'] == True
             if use_true_rho:
                 assert self.exchanged_source['rho_prev'] == True
                 assert self.exchanged_source['rho_next'] == True
 
         # Push each azimuthal grid individually, by passing the
         # corresponding psatd coefficients
-        for m in range(self.Nm) :
-            self.spect[m].push_eb_with( self.psatd[m], use_true_rho )
-            self.spect[m].push_rho()
+        if correct_currents or filter_sources:
+            if correct_currents:
+                current_correction = self.current_correction
+            else:
+                current_correction = None
+            for m in range(self.Nm) :
+                self.spect[m].push_eb_fused( self.psatd[m], use_true_rho,
+                                    current_correction, filter_sources )
+            self.invalidate_interp('J')
+        else:
+            for m in range(self.Nm) :
+                self.spect[m].push_eb_with( self.psatd[m], use_true_rho )
+                self.spect[m].push_rho()
+        # The fields on the interpolation grid are now outdated
+        self.invalidate_interp('EB')
+        self.invalidate_interp('rho_prev')
 
     def correct_currents(self, check_exchanges=False) :
         """
@@ -283,6 +490,7 @@ class Fields(object) :
         for m in range(self.Nm) :
             self.spect[m].correct_currents(
                 self.dt, self.psatd[m], self.current_correction )
+        self.invalidate_interp('J')
 
     def correct_divE(self) :
         """
@@ -292,6 +500,7 @@ class Fields(object) :
         # Correct each azimuthal grid individually
         for m in range(self.Nm) :
             self.spect[m].correct_divE()
+        self.invalidate_interp('E')
 
     def interp2spect(self, fieldtype) :
         """
@@ -302,8 +511,20 @@ class Fields(object) :
         ---------
         fieldtype :
             A string which represents the kind of field to transform
-            (either 'E', 'B', 'J', 'rho_next', 'rho_prev')
+            (either 'E', 'B', 'EB' (i.e. E and B), 'J',
+            'rho_next', 'rho_prev')
         """
+        # Use the batched transform for vector fields, if requested
+        # (each letter of `fieldtype` corresponds to one vector field)
+        if self.transform_engine == 'batched' and \
+                fieldtype in ['E', 'B', 'EB', 'J']:
+            for m in range(self.Nm) :
+                self.batched_trans[m].interp2spect_vect(
+                    [ self.get_interp_vect( m, field ) for field in fieldtype ],
+                    [ self.get_spect_vect( m, field ) for field in fieldtype ])
+            self.record_interp2spect( fieldtype )
+            return
+
         # Use the appropriate transformation depending on the fieldtype.
         if fieldtype == 'E' :
             for m in range(self.Nm) :
@@ -321,6 +542,9 @@ class Fields(object) :
                 self.trans[m].interp2spect_vect(
                     self.interp[m].Br, self.interp[m].Bt,
                     self.spect[m].Bp, self.spect[m].Bm )
+        elif fieldtype == 'EB' :
+            self.interp2spect('E')
+            self.interp2spect('B')
         elif fieldtype == 'J' :
             # Transform each azimuthal grid individually
             for m in range(self.Nm) :
@@ -337,8 +561,25 @@ class Fields(object) :
                     self.interp[m].rho, spectral_rho )
         else:
             raise ValueError( 'Invalid string for fieldtype: %s' %fieldtype )
+        self.record_interp2spect( fieldtype )
 
-    def spect2interp(self, fieldtype) :
+    def record_interp2spect(self, fieldtype) :
+        """
+        After `interp2spect`: record that the interpolation and spectral grids
+        hold the same fields E and B. (The sources deposited on the
+        interpolation grid are not recorded as up-to-date, since their guard
+        cells may not be exchanged via MPI: they are up-to-date only after
+        `spect2interp` and the corresponding exchange.)
+        """
+        if fieldtype in ['E', 'B', 'EB']:
+            for field in self.split_fieldtype( fieldtype ):
+                # (If only the local radial band of the interpolation grid
+                # was up-to-date, this is still the case)
+                band_only = ( self.interp_content[ get_interp_array(field) ]
+                                == field + '_band' )
+                self.record_interp_content( field, band_only )
+
+    def spect2interp(self, fieldtype, band_only=False) :
         """
         Transform the fields `fieldtype` from the spectral grid
         to the interpolation grid
@@ -347,45 +588,159 @@ class Fields(object) :
         ---------
         fieldtype :
             A string which represents the kind of field to transform
-            (either 'E', 'B', 'J', 'rho_next', 'rho_prev')
+            (either 'E', 'B', 'EB' (i.e. E and B), 'J',
+            'rho_next', 'rho_prev')
+
+        band_only : bool, optional
+            With a radial domain decomposition: whether to only obtain the
+            local radial band of the interpolation grid and its halo
+            (`n_radial_halo` cells on each side), which requires less
+            communication than the full grid
         """
+        band_only = band_only and (self.radial_comm is not None)
+        # Use the batched transform for vector fields, if requested
+        # (each letter of `fieldtype` corresponds to one vector field)
+        if self.transform_engine == 'batched' and \
+                fieldtype in ['E', 'B', 'EB', 'J']:
+            for m in range(self.Nm) :
+                self.batched_trans[m].spect2interp_vect(
+                    [ self.get_spect_vect( m, field ) for field in fieldtype ],
+                    [ self.get_interp_vect( m, field ) for field in fieldtype ])
+            self.record_interp_content( fieldtype )
+            return
+
         # Use the appropriate transformation depending on the fieldtype.
         if fieldtype == 'E' :
             # Transform each azimuthal grid individually
             for m in range(self.Nm) :
                 self.trans[m].spect2interp_scal(
-                    self.spect[m].Ez, self.interp[m].Ez )
+                    self.spect[m].Ez, self.interp[m].Ez, band_only )
                 self.trans[m].spect2interp_vect(
                     self.spect[m].Ep,  self.spect[m].Em,
-                    self.interp[m].Er, self.interp[m].Et )
+                    self.interp[m].Er, self.interp[m].Et, band_only )
         elif fieldtype == 'B' :
             # Transform each azimuthal grid individually
             for m in range(self.Nm) :
                 self.trans[m].spect2interp_scal(
-                    self.spect[m].Bz, self.interp[m].Bz )
+                    self.spect[m].Bz, self.interp[m].Bz, band_only )
                 self.trans[m].spect2interp_vect(
                     self.spect[m].Bp, self.spect[m].Bm,
-                    self.interp[m].Br, self.interp[m].Bt )
+                    self.interp[m].Br, self.interp[m].Bt, band_only )
+        elif fieldtype == 'EB' :
+            self.spect2interp('E', band_only)
+            self.spect2interp('B', band_only)
         elif fieldtype == 'J' :
             # Transform each azimuthal grid individually
             for m in range(self.Nm) :
                 self.trans[m].spect2interp_scal(
-                    self.spect[m].Jz, self.interp[m].Jz )
+                    self.spect[m].Jz, self.interp[m].Jz, band_only )
                 self.trans[m].spect2interp_vect(
                     self.spect[m].Jp,  self.spect[m].Jm,
-                    self.interp[m].Jr, self.interp[m].Jt )
+                    self.interp[m].Jr, self.interp[m].Jt, band_only )
         elif fieldtype == 'rho_next' :
             # Transform each azimuthal grid individually
             for m in range(self.Nm) :
                 self.trans[m].spect2interp_scal(
-                    self.spect[m].rho_next, self.interp[m].rho )
+                    self.spect[m].rho_next, self.interp[m].rho, band_only )
         elif fieldtype == 'rho_prev' :
             # Transform each azimuthal grid individually
             for m in range(self.Nm) :
                 self.trans[m].spect2interp_scal(
-                    self.spect[m].rho_prev, self.interp[m].rho )
+                    self.spect[m].rho_prev, self.interp[m].rho, band_only )
         else :
             raise ValueError( 'Invalid string for fieldtype: %s' %fieldtype )
+        # The interpolation and spectral grids now hold the same fields
+        self.record_interp_content( fieldtype, band_only )
+
+    def require_interp(self, fieldtype, band_only=False) :
+        """
+        Make sure that the fields `fieldtype` on the interpolation grid
+        are up-to-date, by calling `spect2interp` only if needed, i.e. if
+        the spectral fields were modified or the interpolation arrays were
+        overwritten since the last transform.
+
+        Parameter
+        ---------
+        fieldtype :
+            A string which represents the kind of field to transform
+            (either 'E', 'B', 'EB' (i.e. E and B), 'J',
+            'rho_next', 'rho_prev')
+
+        band_only : bool, optional
+            With a radial domain decomposition: whether only the local
+            radial band of the interpolation grid and its halo are needed
+            (see `spect2interp`)
+
+        Returns
+        -------
+        transformed : bool
+            Whether a transform was performed (in which case the guard
+            cells of the sources may need to be exchanged via MPI again)
+        """
+        outdated = ''
+        for field in self.split_fieldtype( fieldtype ):
+            content = self.interp_content[ get_interp_array(field) ]
+            if (content != field) and \
+                    not (band_only and content == field + '_band'):
+                outdated += field
+        if outdated == '':
+            return( False )
+        self.spect2interp( outdated, band_only )
+        return( True )
+
+    def invalidate_interp(self, fieldtype) :
+        """
+        Record that the fields `fieldtype` on the interpolation grid are
+        not up-to-date anymore, either because the corresponding spectral
+        fields were modified, or because the interpolation arrays were
+        overwritten (e.g. by the deposition or by `spect2partial_interp`)
+
+        Parameter
+        ---------
+        fieldtype :
+            A string which represents the kind of field
+            (either 'E', 'B', 'EB' (i.e. E and B), 'J', 'rho',
+            'rho_next', 'rho_prev', 'rho_next_xy', 'rho_next_z')
+        """
+        for field in self.split_fieldtype( fieldtype ):
+            self.interp_content[ get_interp_array(field) ] = None
+
+    def record_interp_content(self, fieldtype, band_only=False) :
+        """
+        Record that the interpolation grid holds the same fields
+        `fieldtype` as the spectral grid (after a full transform, or
+        only in the local radial band and its halo if `band_only` is True)
+        """
+        for field in self.split_fieldtype( fieldtype ):
+            if band_only:
+                self.interp_content[ get_interp_array(field) ] = field+'_band'
+            else:
+                self.interp_content[ get_interp_array(field) ] = field
+
+    def split_fieldtype(self, fieldtype) :
+        """
+        Return the list of individual fields that correspond to `fieldtype`
+        (i.e. ['E', 'B'] for 'EB', and [fieldtype] otherwise)
+        """
+        if fieldtype == 'EB':
+            return( ['E', 'B'] )
+        return( [fieldtype] )
+
+    def get_interp_vect( self, m, field ):
+        """
+        Return the components r, t, z of the vector field `field`
+        ('E', 'B' or 'J') on the interpolation grid of mode `m`
+        """
+        return( tuple( getattr( self.interp[m], field + coord )
+                        for coord in ['r', 't', 'z'] ) )
+
+    def get_spect_vect( self, m, field ):
+        """
+        Return the components p, m, z of the vector field `field`
+        ('E', 'B' or 'J') on the spectral grid of mode `m`
+        """
+        return( tuple( getattr( self.spect[m], field + coord )
+                        for coord in ['p', 'm', 'z'] ) )
 
     def spect2partial_interp(self, fieldtype) :
         """
@@ -406,6 +761,18 @@ class Fields(object) :
             A string which represents the kind of field to transform
             (either 'E', 'B', 'J', 'rho_next', 'rho_prev')
         """
+        # With a radial domain decomposition, the spectral grid only contains
+        # a block of the radial modes, while the exchange of guard cells
+        # needs all of them: perform the full transform instead (but only
+        # for the local radial band and its halo, which are the only cells
+        # that are used by `partial_interp2spect` and by the gathering)
+        if self.radial_comm is not None:
+            self.spect2interp( fieldtype, band_only=True )
+            return
+
+        # The interpolation arrays will not hold the actual fields anymore
+        self.invalidate_interp( fieldtype )
+
         # Use the appropriate transformation depending on the fieldtype.
         if fieldtype == 'E' :
             for m in range(self.Nm) :
@@ -458,6 +825,12 @@ class Fields(object) :
             A string which represents the kind of field to transform
             (either 'E', 'B', 'J', 'rho_next', 'rho_prev')
         """
+        # With a radial domain decomposition, `spect2partial_interp`
+        # performed the full transform (see above)
+        if self.radial_comm is not None:
+            self.interp2spect( fieldtype )
+            return
+
         # Use the appropriate transformation depending on the fieldtype.
         if fieldtype == 'E' :
             for m in range(self.Nm) :
@@ -511,6 +884,7 @@ class Fields(object) :
         # Erase the fields in the interpolation grid
         for m in range(self.Nm):
             self.interp[m].erase(fieldtype)
+        self.invalidate_interp( fieldtype )
 
         # Erase the duplicated deposition buffer
         if not self.use_cuda:
@@ -564,6 +938,7 @@ class Fields(object) :
         """
         for m in range(self.Nm) :
             self.spect[m].filter( fieldtype )
+        self.invalidate_interp( fieldtype )
 
 
     def divide_by_volume( self, fieldtype ) :
@@ -582,3 +957,16 @@ class Fields(object) :
         """
         for m in range(self.Nm):
             self.interp[m].divide_by_volume( fieldtype )
+
+
+def get_interp_array( fieldtype ):
+    """
+    Return the name of the array of the interpolation grid that holds
+    the field `fieldtype` (e.g. 'rho' for 'rho_prev' or 'rho_next')
+    """
+    if fieldtype.startswith('rho'):
+        return( 'rho' )
+    elif fieldtype in ['E', 'B', 'J']:
+        return( fieldtype )
+    else:
+        raise ValueError( 'Invalid string for fieldtype: %s' %fieldtype )
@@ -25,7 +25,8 @@ class InterpolationGrid(object) :
       2darrays containing the fields.
     """
 
-    def __init__(self, Nz, Nr, m, zmin, zmax, rmax, use_cuda=False ) :
+    def __init__(self, Nz, Nr, m, zmin, zmax, rmax, use_cuda=False,
+                    field_dtype=np.complex128, source_dtype=np.complex128 ):
         """
         Allocates the matrices corresponding to the spatial grid
 
@@ -46,6 +47,9 @@ class InterpolationGrid(object) :
 
         use_cuda : bool, optional
             Wether to use the GPU or not
+
+        field_dtype, source_dtype : numpy complex types, optional
+            The precision of the fields (E, B) and of the sources (J, rho)
         """
         # Register the size of the arrays
         self.Nz = Nz
@@ -71,16 +75,16 @@ class InterpolationGrid(object) :
         self.invvol = 1./vol
 
         # Allocate the fields arrays
-        self.Er = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Et = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Ez = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Br = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Bt = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Bz = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Jr = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Jt = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Jz = np.zeros( (Nz, Nr), dtype='complex' )
-        self.rho = np.zeros( (Nz, Nr), dtype='complex' )
+        self.Er = np.zeros( (Nz, Nr), dtype=field_dtype )
+        self.Et = np.zeros( (Nz, Nr), dtype=field_dtype )
+        self.Ez = np.zeros( (Nz, Nr), dtype=field_dtype )
+        self.Br = np.zeros( (Nz, Nr), dtype=field_dtype )
+        self.Bt = np.zeros( (Nz, Nr), dtype=field_dtype )
+        self.Bz = np.zeros( (Nz, Nr), dtype=field_dtype )
+        self.Jr = np.zeros( (Nz, Nr), dtype=source_dtype )
+        self.Jt = np.zeros( (Nz, Nr), dtype=source_dtype )
+        self.Jz = np.zeros( (Nz, Nr), dtype=source_dtype )
+        self.rho = np.zeros( (Nz, Nr), dtype=source_dtype )
 
         # Check whether the GPU should be used
         self.use_cuda = use_cuda
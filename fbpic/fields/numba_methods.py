@@ -340,6 +340,202 @@ def numba_push_eb_comoving( Ep, Em, Ez, Bp, Bm, Bz, Jp, Jm, Jz,
     return
 
 
+# -----------------------------------------------------------------------
+# Fused field solve: filter + current correction + push of E, B and rho
+# -----------------------------------------------------------------------
+
+# Integer codes for the current correction, in the fused kernel
+no_correction = 0
+curlfree_correction = 1
+crossdeposition_correction = 2
+
+@njit_parallel
+def numba_push_eb_fused( Ep, Em, Ez, Bp, Bm, Bz, Jp, Jm, Jz,
+                    rho_prev, rho_next, rho_next_z, rho_next_xy,
+                    rho_prev_coef, rho_next_coef, j_coef, C, S_w,
+                    T_eb, T_cc, T_rho, j_corr_coef, inv_k2,
+                    filter_array_z, filter_array_r, kr, kz, dt, V,
+                    comoving, correction, filter_sources, use_true_rho,
+                    Nz, Nr, n_tiles_r ):
+    """
+    Filter the sources, correct the currents, push the fields E and B over
+    one timestep and transfer rho_next to rho_prev, in a single pass over
+    the spectral grid. This performs the same operations as successive calls
+    to `numba_filter_vector`/`numba_filter_scalar`, to the current
+    correction kernels, to `numba_push_eb_standard`/`numba_push_eb_comoving`
+    and to `SpectralGrid.push_rho`, but reads and writes each array only once.
+
+    Parameters :
+    ------------
+    comoving: bool
+        Whether to use the galilean/comoving algorithm (in which case
+        T_eb, T_cc, T_rho and j_corr_coef are used) or the standard
+        psatd algorithm (in which case these arrays are not used)
+
+    correction: int
+        Either `no_correction`, `curlfree_correction` (uses inv_k2)
+        or `crossdeposition_correction` (uses rho_next_z and rho_next_xy)
+
+    filter_sources: bool
+        Whether to multiply J and rho_next (and rho_next_z, rho_next_xy)
+        by the filter arrays, before the correction and the push
+
+    n_tiles_r: int
+        Number of tiles along r, for each row in z: the loop is parallel
+        over the Nz*n_tiles_r tiles (allows to use all threads when Nz is
+        small)
+
+    (See the documentation of the corresponding separate kernels
+    for the other parameters.)
+    """
+    inv_dt = 1./dt
+    tile_size = (Nr + n_tiles_r - 1) // n_tiles_r
+    # Loop over the tiles (parallel, if threading is installed)
+    for i_tile in prange(Nz*n_tiles_r):
+        iz = i_tile // n_tiles_r
+        ir_min = (i_tile % n_tiles_r) * tile_size
+        ir_max = min( ir_min + tile_size, Nr )
+        for ir in range(ir_min, ir_max):
+
+            # Load the sources
+            Jp_ = Jp[iz, ir]
+            Jm_ = Jm[iz, ir]
+            Jz_ = Jz[iz, ir]
+            rho_prev_ = rho_prev[iz, ir]
+            rho_next_ = rho_next[iz, ir]
+            rho_next_z_ = rho_next_
+            rho_next_xy_ = rho_next_
+            if correction == crossdeposition_correction:
+                rho_next_z_ = rho_next_z[iz, ir]
+                rho_next_xy_ = rho_next_xy[iz, ir]
+
+            # Filter the sources
+            if filter_sources:
+                filter_coef = filter_array_z[iz]*filter_array_r[ir]
+                Jp_ = filter_coef*Jp_
+                Jm_ = filter_coef*Jm_
+                Jz_ = filter_coef*Jz_
+                rho_next_ = filter_coef*rho_next_
+                if correction == crossdeposition_correction:
+                    rho_next_z_ = filter_coef*rho_next_z_
+                    rho_next_xy_ = filter_coef*rho_next_xy_
+
+            # Correct the currents
+            kr_ = kr[iz, ir]
+            kz_ = kz[iz, ir]
+            if correction == curlfree_correction:
+                # Calculate the intermediate variable F
+                if comoving:
+                    F = - inv_k2[iz, ir] * ( T_cc[iz, ir]*j_corr_coef[iz, ir] \
+                        * (rho_next_ - rho_prev_*T_eb[iz, ir]) \
+                        + 1.j*kz_*Jz_ + kr_*( Jp_ - Jm_ ) )
+                else:
+                    F = - inv_k2[iz, ir] * ( (rho_next_ - rho_prev_)*inv_dt \
+                        + 1.j*kz_*Jz_ + kr_*( Jp_ - Jm_ ) )
+                Jp_ +=  0.5 * kr_ * F
+                Jm_ += -0.5 * kr_ * F
+                Jz_ += -1.j * kz_ * F
+            elif correction == crossdeposition_correction:
+                # Calculate the intermediate variable Dz and Dxy
+                # (Such that Dz + Dxy is the error in the continuity equation)
+                if comoving:
+                    coef = 0.5 * T_cc[iz, ir]*j_corr_coef[iz, ir]
+                    Dz = 1.j*kz_*Jz_ + coef * \
+                        ( rho_next_ - T_eb[iz, ir] * rho_next_xy_ \
+                        + rho_next_z_ - T_eb[iz, ir] * rho_prev_ )
+                    Dxy = kr_*( Jp_ - Jm_ ) + coef * \
+                        ( rho_next_ + T_eb[iz, ir] * rho_next_xy_ \
+                        - rho_next_z_ - T_eb[iz, ir] * rho_prev_ )
+                else:
+                    Dz = 1.j*kz_*Jz_ + 0.5 * inv_dt * \
+                        ( rho_next_ - rho_next_xy_ + rho_next_z_ - rho_prev_ )
+                    Dxy = kr_*( Jp_ - Jm_ ) + 0.5 * inv_dt * \
+                        ( rho_next_ - rho_next_z_ + rho_next_xy_ - rho_prev_ )
+                if kr_ != 0:
+                    inv_kr = 1./kr_
+                    Jp_ += -0.5 * Dxy * inv_kr
+                    Jm_ +=  0.5 * Dxy * inv_kr
+                if kz_ != 0:
+                    inv_kz = 1./kz_
+                    Jz_ += 1.j * Dz * inv_kz
+
+            # Store the filtered/corrected currents
+            Jp[iz, ir] = Jp_
+            Jm[iz, ir] = Jm_
+            Jz[iz, ir] = Jz_
+
+            # Push the fields E and B
+            Ep_old = Ep[iz, ir]
+            Em_old = Em[iz, ir]
+            Ez_old = Ez[iz, ir]
+            Bp_old = Bp[iz, ir]
+            Bm_old = Bm[iz, ir]
+            Bz_old = Bz[iz, ir]
+            C_ = C[iz, ir]
+            S_w_ = S_w[iz, ir]
+            j_coef_ = j_coef[iz, ir]
+            if comoving:
+                T_eb_ = T_eb[iz, ir]
+                T_cc_ = T_cc[iz, ir]
+            else:
+                T_eb_ = 1.
+                T_cc_ = 1.
+
+            # Calculate useful auxiliary arrays
+            if use_true_rho:
+                # Evaluation using the rho projected on the grid
+                rho_diff = rho_next_coef[iz, ir] * rho_next_ \
+                        - rho_prev_coef[iz, ir] * rho_prev_
+            else:
+                # Evaluation using div(E) and div(J)
+                divE = kr_*( Ep_old - Em_old ) + 1.j*kz_*Ez_old
+                divJ = kr_*( Jp_ - Jm_ ) + 1.j*kz_*Jz_
+                if comoving:
+                    rho_diff = ( T_eb_ * rho_next_coef[iz, ir] \
+                      - rho_prev_coef[iz, ir] ) \
+                      * epsilon_0 * divE + T_rho[iz, ir] \
+                      * rho_next_coef[iz, ir] * divJ
+                else:
+                    rho_diff = (rho_next_coef[iz, ir] - rho_prev_coef[iz, ir]) \
+                      * epsilon_0 * divE - rho_next_coef[iz, ir] * dt * divJ
+
+            # Push the E field
+            # (In the standard algorithm, T_eb = T_cc = 1 and V = 0)
+            Ep_new = T_eb_*C_*Ep_old + 0.5*kr_*rho_diff \
+                + c2*T_eb_*S_w_*( -1.j*0.5*kr_*Bz_old \
+                + kz_*Bp_old - mu_0*T_cc_*Jp_ )
+            Em_new = T_eb_*C_*Em_old - 0.5*kr_*rho_diff \
+                + c2*T_eb_*S_w_*( -1.j*0.5*kr_*Bz_old \
+                - kz_*Bm_old - mu_0*T_cc_*Jm_ )
+            Ez_new = T_eb_*C_*Ez_old - 1.j*kz_*rho_diff \
+                + c2*T_eb_*S_w_*( 1.j*kr_*Bp_old \
+                + 1.j*kr_*Bm_old - mu_0*T_cc_*Jz_ )
+            if comoving:
+                Ep_new += j_coef_*1.j*kz_*V*Jp_
+                Em_new += j_coef_*1.j*kz_*V*Jm_
+                Ez_new += j_coef_*1.j*kz_*V*Jz_
+            Ep[iz, ir] = Ep_new
+            Em[iz, ir] = Em_new
+            Ez[iz, ir] = Ez_new
+
+            # Push the B field
+            Bp[iz, ir] = T_eb_*C_*Bp_old \
+                - T_eb_*S_w_*( -1.j*0.5*kr_*Ez_old + kz_*Ep_old ) \
+                + j_coef_*( -1.j*0.5*kr_*Jz_ + kz_*Jp_ )
+            Bm[iz, ir] = T_eb_*C_*Bm_old \
+                - T_eb_*S_w_*( -1.j*0.5*kr_*Ez_old - kz_*Em_old ) \
+                + j_coef_*( -1.j*0.5*kr_*Jz_ - kz_*Jm_ )
+            Bz[iz, ir] = T_eb_*C_*Bz_old \
+                - T_eb_*S_w_*( 1.j*kr_*Ep_old + 1.j*kr_*Em_old ) \
+                + j_coef_*( 1.j*kr_*Jp_ + 1.j*kr_*Jm_ )
+
+            # Transfer the values of rho_next to rho_prev
+            rho_prev[iz, ir] = rho_next_
+            rho_next[iz, ir] = 0.
+
+    return
+
+
 # -----------------------------------------------------------------------
 # Parallel reduction of the global arrays for threads into a single array
 # -----------------------------------------------------------------------
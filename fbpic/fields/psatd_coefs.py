@@ -8,6 +8,7 @@ It defines the PsatdCoeffs class.
 import numpy as np
 from scipy.constants import c, mu_0, epsilon_0
 from numba import cuda
+from fbpic.utils.precision import complex_dtype
 
 
 class PsatdCoeffs(object) :
@@ -16,7 +17,8 @@ class PsatdCoeffs(object) :
     """
 
     def __init__( self, kz, kr, m, dt, Nz, Nr, V=None,
-                  use_galilean=False, use_cuda=False ) :
+                  use_galilean=False, use_cuda=False, dtype=np.float64,
+                  cache=None ) :
         """
         Allocates the coefficients matrices for the psatd scheme.
 
@@ -49,116 +51,35 @@ class PsatdCoeffs(object) :
 
         use_cuda : bool, optional
             Wether to use the GPU or not
-        """
-        # Shortcuts
-        i = 1.j
 
+        dtype : numpy real type, optional
+            The precision in which the coefficients are stored
+            (The coefficients are always calculated in double precision.)
+
+        cache : a CoefficientCache object, or None, optional
+            If not None, the coefficients are loaded from this on-disk cache
+            (and computed and stored in the cache if they are not found)
+        """
         # Register m and dt
         self.m = m
         self.dt = dt
-        inv_dt = 1./dt
         # Register velocity of galilean/comoving frame
         self.V = V
 
-        # Construct the omega and inverse omega array
-        w = c*np.sqrt( kz**2 + kr**2 )
-        inv_w = 1./np.where( w == 0, 1., w ) # Avoid division by 0
-
-        # Construct the C coefficient arrays
-        self.C = np.cos( w*dt )
-        # Construct the S/w coefficient arrays
-        self.S_w = np.sin( w*dt )*inv_w
-        # Enforce the right value for w==0
-        self.S_w[ w==0 ] = dt
-
-        # Calculate coefficients that are specific to galilean/comoving scheme
-        if self.V is not None:
-
-            # Theta coefficients due to galilean/comoving scheme
-            T2 = np.exp(i*kz*V*dt)
-            if use_galilean is False:
-                T = np.exp(i*0.5*kz*V*dt)
-            # The coefficients T_cc and T_eb abstract the modification
-            # of the comoving current or galilean frame, so that the Maxwell
-            # equations can be written in the same form
-            if use_galilean:
-                self.T_eb = T2
-                self.T_cc = np.ones_like(T2)
-            else:
-                self.T_cc = T
-                self.T_eb = np.ones_like(T2)
-
-            # Theta-like coefficient for calculation of rho_diff
-            if V != 0.:
-                i_kz_V = i*kz*self.V
-                i_kz_V[ kz==0 ] = 1.
-                self.T_rho = np.where(
-                    kz == 0., -self.dt, (1.-T2)/(self.T_cc*i_kz_V) )
-            else:
-                self.T_rho = -self.dt*np.ones_like(kz)
-
-            # Precalculate some coefficients
-            if V != 0.:
-                # Calculate pre-factor
-                inv_w_kzV = 1./np.where(
-                                (w**2 - kz**2 * V**2)==0,
-                                1.,
-                                (w**2 - kz**2 * V**2) )
-                # Calculate factor involving 1/T2
-                inv_1_T2 = 1./np.where(T2 == 1, 1., 1-T2)
-                # Calculate Xi 1 coefficient
-                xi_1 = 1./self.T_cc * inv_w_kzV \
-                       * (1. - T2*self.C + i*kz*V*T2*self.S_w)
-                # Calculate Xi 2 coefficient
-                xi_2 = np.where(
-                        kz!=0,
-                        inv_w_kzV * ( 1. \
-                            + i*kz*V * T2 * self.S_w * inv_1_T2 \
-                            + kz**2*V**2 * inv_w**2 * T2 * \
-                            inv_1_T2*(1-self.C) ),
-                        1.*inv_w**2 * (1.-self.S_w*inv_dt) )
-                # Calculate Xi 3 coefficient
-                xi_3 = np.where(
-                        kz!=0,
-                        self.T_eb * inv_w_kzV * ( self.C \
-                            + i*kz*V * T2 *self.S_w * inv_1_T2 \
-                            + kz**2*V**2 * inv_w**2 * \
-                            inv_1_T2 * (1-self.C) ),
-                        1.*inv_w**2 * (self.C-self.S_w*inv_dt) )
-
-            # Calculate correction coefficient for j
-            if V !=0:
-                self.j_corr_coef = np.where( kz != 0,
-                            (-i*kz*V)*inv_1_T2,
-                            inv_dt )
-            else:
-                self.j_corr_coef = inv_dt*np.ones_like(kz)
-
-        # Construct j_coef array (for use in the Maxwell equations)
-        if V is None or V == 0:
-            self.j_coef = mu_0*c**2*(1.-self.C)*inv_w**2
-        else:
-            self.j_coef = mu_0*c**2*(xi_1)
-        # Enforce the right value for w==0
-        self.j_coef[ w==0 ] = mu_0*c**2*(0.5*dt**2)
-
-        # Calculate rho_prev coefficient array
-        if V is None or V == 0:
-            self.rho_prev_coef = c**2/epsilon_0*(
-                self.C - inv_dt*self.S_w )*inv_w**2
+        # Calculate the coefficients (or load them from the cache)
+        if cache is not None:
+            coefs = cache.load_or_compute(
+                compute_psatd_coefs, kz, kr, dt, V, use_galilean )
         else:
-            self.rho_prev_coef = c**2/epsilon_0*(xi_3)
-        # Enforce the right value for w==0
-        self.rho_prev_coef[ w==0 ] = c**2/epsilon_0*(-1./3*dt**2)
-
-        # Calculate rho_next coefficient array
-        if V is None or V == 0:
-            self.rho_next_coef = c**2/epsilon_0*(
-                1 - inv_dt*self.S_w )*inv_w**2
-        else:
-            self.rho_next_coef = c**2/epsilon_0*(xi_2)
-        # Enforce the right value for w==0
-        self.rho_next_coef[ w==0 ] = c**2/epsilon_0*(1./6*dt**2)
+            coefs = compute_psatd_coefs( kz, kr, dt, V, use_galilean )
+
+        # Convert the coefficients to the requested precision
+        for name, coef in coefs.items():
+            if np.iscomplexobj( coef ):
+                coef = np.array( coef, dtype=complex_dtype(dtype) )
+            else:
+                coef = np.array( coef, dtype=dtype )
+            setattr( self, name, coef )
 
         # Replace these array by arrays on the GPU, when using cuda
         if use_cuda:
@@ -173,3 +94,129 @@ class PsatdCoeffs(object) :
                 self.d_T_cc = cuda.to_device(self.T_cc)
                 self.d_T_rho = cuda.to_device(self.T_rho)
                 self.d_j_corr_coef = cuda.to_device(self.j_corr_coef)
+
+def compute_psatd_coefs( kz, kr, dt, V, use_galilean ):
+    """
+    Calculate the coefficients of the PSATD scheme, in double precision
+
+    Parameters
+    ----------
+    kz, kr, dt, V, use_galilean:
+        See the docstring of the PsatdCoeffs class
+
+    Returns
+    -------
+    A dictionary of 2darrays, whose keys are the names of
+    the corresponding attributes of the PsatdCoeffs class
+    """
+    # Shortcuts
+    i = 1.j
+    inv_dt = 1./dt
+    coefs = {}
+
+    # Construct the omega and inverse omega array
+    w = c*np.sqrt( kz**2 + kr**2 )
+    inv_w = 1./np.where( w == 0, 1., w ) # Avoid division by 0
+
+    # Construct the C coefficient arrays
+    C = np.cos( w*dt )
+    # Construct the S/w coefficient arrays
+    S_w = np.sin( w*dt )*inv_w
+    # Enforce the right value for w==0
+    S_w[ w==0 ] = dt
+    coefs['C'] = C
+    coefs['S_w'] = S_w
+
+    # Calculate coefficients that are specific to galilean/comoving scheme
+    if V is not None:
+
+        # Theta coefficients due to galilean/comoving scheme
+        T2 = np.exp(i*kz*V*dt)
+        if use_galilean is False:
+            T = np.exp(i*0.5*kz*V*dt)
+        # The coefficients T_cc and T_eb abstract the modification
+        # of the comoving current or galilean frame, so that the Maxwell
+        # equations can be written in the same form
+        if use_galilean:
+            T_eb = T2
+            T_cc = np.ones_like(T2)
+        else:
+            T_cc = T
+            T_eb = np.ones_like(T2)
+        coefs['T_eb'] = T_eb
+        coefs['T_cc'] = T_cc
+
+        # Theta-like coefficient for calculation of rho_diff
+        if V != 0.:
+            i_kz_V = i*kz*V
+            i_kz_V[ kz==0 ] = 1.
+            coefs['T_rho'] = np.where(
+                kz == 0., -dt, (1.-T2)/(T_cc*i_kz_V) )
+        else:
+            coefs['T_rho'] = -dt*np.ones_like(kz)
+
+        # Precalculate some coefficients
+        if V != 0.:
+            # Calculate pre-factor
+            inv_w_kzV = 1./np.where(
+                            (w**2 - kz**2 * V**2)==0,
+                            1.,
+                            (w**2 - kz**2 * V**2) )
+            # Calculate factor involving 1/T2
+            inv_1_T2 = 1./np.where(T2 == 1, 1., 1-T2)
+            # Calculate Xi 1 coefficient
+            xi_1 = 1./T_cc * inv_w_kzV \
+                   * (1. - T2*C + i*kz*V*T2*S_w)
+            # Calculate Xi 2 coefficient
+            xi_2 = np.where(
+                    kz!=0,
+                    inv_w_kzV * ( 1. \
+                        + i*kz*V * T2 * S_w * inv_1_T2 \
+                        + kz**2*V**2 * inv_w**2 * T2 * \
+                        inv_1_T2*(1-C) ),
+                    1.*inv_w**2 * (1.-S_w*inv_dt) )
+            # Calculate Xi 3 coefficient
+            xi_3 = np.where(
+                    kz!=0,
+                    T_eb * inv_w_kzV * ( C \
+                        + i*kz*V * T2 *S_w * inv_1_T2 \
+                        + kz**2*V**2 * inv_w**2 * \
+                        inv_1_T2 * (1-C) ),
+                    1.*inv_w**2 * (C-S_w*inv_dt) )
+
+        # Calculate correction coefficient for j
+        if V !=0:
+            coefs['j_corr_coef'] = np.where( kz != 0,
+                        (-i*kz*V)*inv_1_T2,
+                        inv_dt )
+        else:
+            coefs['j_corr_coef'] = inv_dt*np.ones_like(kz)
+
+    # Construct j_coef array (for use in the Maxwell equations)
+    if V is None or V == 0:
+        j_coef = mu_0*c**2*(1.-C)*inv_w**2
+    else:
+        j_coef = mu_0*c**2*(xi_1)
+    # Enforce the right value for w==0
+    j_coef[ w==0 ] = mu_0*c**2*(0.5*dt**2)
+    coefs['j_coef'] = j_coef
+
+    # Calculate rho_prev coefficient array
+    if V is None or V == 0:
+        rho_prev_coef = c**2/epsilon_0*( C - inv_dt*S_w )*inv_w**2
+    else:
+        rho_prev_coef = c**2/epsilon_0*(xi_3)
+    # Enforce the right value for w==0
+    rho_prev_coef[ w==0 ] = c**2/epsilon_0*(-1./3*dt**2)
+    coefs['rho_prev_coef'] = rho_prev_coef
+
+    # Calculate rho_next coefficient array
+    if V is None or V == 0:
+        rho_next_coef = c**2/epsilon_0*( 1 - inv_dt*S_w )*inv_w**2
+    else:
+        rho_next_coef = c**2/epsilon_0*(xi_2)
+    # Enforce the right value for w==0
+    rho_next_coef[ w==0 ] = c**2/epsilon_0*(1./6*dt**2)
+    coefs['rho_next_coef'] = rho_next_coef
+
+    return( coefs )
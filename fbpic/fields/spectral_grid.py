@@ -7,12 +7,14 @@ It defines the SpectralGrid class.
 """
 import numpy as np
 from scipy.constants import epsilon_0
+from fbpic.utils.threading import nthreads
 from .numba_methods import numba_push_eb_standard, numba_push_eb_comoving, \
     numba_correct_currents_curlfree_standard, \
     numba_correct_currents_crossdeposition_standard, \
     numba_correct_currents_curlfree_comoving, \
     numba_correct_currents_crossdeposition_comoving, \
-    numba_filter_scalar, numba_filter_vector
+    numba_filter_scalar, numba_filter_vector, numba_push_eb_fused, \
+    no_correction, curlfree_correction, crossdeposition_correction
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 if cuda_installed:
@@ -32,7 +34,8 @@ class SpectralGrid(object) :
     """
 
     def __init__(self, kz_modified, kr, m, kz_true, dz, dr,
-                        current_correction, smoother, use_cuda=False ) :
+                        current_correction, smoother, use_cuda=False,
+                        dtype=np.complex128 ) :
         """
         Allocates the matrices corresponding to the spectral grid
 
@@ -66,6 +69,9 @@ class SpectralGrid(object) :
 
         use_cuda : bool, optional
             Wether to use the GPU or not
+
+        dtype : numpy complex type, optional
+            The precision of the field arrays in spectral space
         """
         # Register the arrays and their length
         Nz = len(kz_modified)
@@ -75,20 +81,20 @@ class SpectralGrid(object) :
         self.m = m
 
         # Allocate the fields arrays
-        self.Ep = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Em = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Ez = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Bp = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Bm = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Bz = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Jp = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Jm = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Jz = np.zeros( (Nz, Nr), dtype='complex' )
-        self.rho_prev = np.zeros( (Nz, Nr), dtype='complex' )
-        self.rho_next = np.zeros( (Nz, Nr), dtype='complex' )
+        self.Ep = np.zeros( (Nz, Nr), dtype=dtype )
+        self.Em = np.zeros( (Nz, Nr), dtype=dtype )
+        self.Ez = np.zeros( (Nz, Nr), dtype=dtype )
+        self.Bp = np.zeros( (Nz, Nr), dtype=dtype )
+        self.Bm = np.zeros( (Nz, Nr), dtype=dtype )
+        self.Bz = np.zeros( (Nz, Nr), dtype=dtype )
+        self.Jp = np.zeros( (Nz, Nr), dtype=dtype )
+        self.Jm = np.zeros( (Nz, Nr), dtype=dtype )
+        self.Jz = np.zeros( (Nz, Nr), dtype=dtype )
+        self.rho_prev = np.zeros( (Nz, Nr), dtype=dtype )
+        self.rho_next = np.zeros( (Nz, Nr), dtype=dtype )
         if current_correction == 'cross-deposition':
-            self.rho_next_z = np.zeros( (Nz, Nr), dtype='complex' )
-            self.rho_next_xy = np.zeros( (Nz, Nr), dtype='complex' )
+            self.rho_next_z = np.zeros( (Nz, Nr), dtype=dtype )
+            self.rho_next_xy = np.zeros( (Nz, Nr), dtype=dtype )
 
         # Auxiliary arrays
         # - for the field solve
@@ -108,6 +114,10 @@ class SpectralGrid(object) :
         # in the spectral domain when using a moving window
         self.field_shift = np.exp(1.j*kz_true*dz)
 
+        # Number of tiles along r for each row in z, in the fused field
+        # solve (on CPU): ensures that there are enough tiles for all threads
+        self.n_tiles_r = min( Nr, max( 1, -(-4*nthreads // Nz) ) )
+
         # Check whether to use the GPU
         self.use_cuda = use_cuda
 
@@ -350,6 +360,91 @@ class SpectralGrid(object) :
                     self.kr, self.kz, ps.dt, ps.V,
                     use_true_rho, self.Nz, self.Nr )
 
+    def push_eb_fused(self, ps, use_true_rho=False,
+                        current_correction=None, filter_sources=False ) :
+        """
+        Filter the sources, correct the currents, push the fields over
+        one timestep and transfer the values of rho_next to rho_prev,
+        in a single pass over the spectral grid (on CPU).
+
+        This is equivalent to calling `filter` (for J and rho_next, and for
+        rho_next_z and rho_next_xy in the case of cross-deposition),
+        `correct_currents`, `push_eb_with` and `push_rho` successively.
+        (The filtered values of rho_next_z and rho_next_xy are not stored.)
+
+        Parameters
+        ----------
+        ps : PsatdCoeffs object
+            psatd object corresponding to the same m mode
+
+        use_true_rho : bool, optional
+            Whether to use the rho projected on the grid
+            (see `push_eb_with`)
+
+        current_correction: string or None, optional
+            The type of current correction performed
+            (`curl-free`, `cross-deposition`, or None for no correction)
+
+        filter_sources: bool, optional
+            Whether to filter the sources before the correction and the push
+        """
+        # Check that psatd object passed as argument is the right one
+        # (i.e. corresponds to the right mode)
+        assert( self.m == ps.m )
+
+        if self.use_cuda:
+            # Perform the operations successively on the GPU
+            if filter_sources:
+                fieldtypes = ['J', 'rho_next']
+                if current_correction == 'cross-deposition':
+                    fieldtypes += ['rho_next_z', 'rho_next_xy']
+                for fieldtype in fieldtypes:
+                    self.filter( fieldtype )
+            if current_correction is not None:
+                self.correct_currents( ps.dt, ps, current_correction )
+            self.push_eb_with( ps, use_true_rho )
+            self.push_rho()
+            return
+
+        # Select the arrays that are used by the fused kernel
+        # (the unused arrays are replaced by placeholders)
+        if current_correction is None:
+            correction = no_correction
+            inv_k2 = ps.C
+            rho_next_z, rho_next_xy = self.rho_next, self.rho_next
+        elif current_correction == 'curl-free':
+            correction = curlfree_correction
+            inv_k2 = self.inv_k2
+            rho_next_z, rho_next_xy = self.rho_next, self.rho_next
+        elif current_correction == 'cross-deposition':
+            correction = crossdeposition_correction
+            inv_k2 = ps.C
+            rho_next_z, rho_next_xy = self.rho_next_z, self.rho_next_xy
+        else:
+            raise ValueError('Unknown current correction: %s'
+                                %current_correction)
+        if ps.V is None:
+            # With the standard PSATD algorithm
+            comoving = False
+            V = 0.
+            T_eb, T_cc, T_rho, j_corr_coef = ps.C, ps.C, ps.C, ps.C
+        else:
+            # With the Galilean/comoving algorithm
+            comoving = True
+            V = ps.V
+            T_eb, T_cc, T_rho, j_corr_coef = \
+                ps.T_eb, ps.T_cc, ps.T_rho, ps.j_corr_coef
+
+        numba_push_eb_fused(
+            self.Ep, self.Em, self.Ez, self.Bp, self.Bm, self.Bz,
+            self.Jp, self.Jm, self.Jz, self.rho_prev, self.rho_next,
+            rho_next_z, rho_next_xy,
+            ps.rho_prev_coef, ps.rho_next_coef, ps.j_coef, ps.C, ps.S_w,
+            T_eb, T_cc, T_rho, j_corr_coef, inv_k2,
+            self.filter_array_z, self.filter_array_r, self.kr, self.kz,
+            ps.dt, V, comoving, correction, filter_sources, use_true_rho,
+            self.Nz, self.Nr, self.n_tiles_r )
+
     def push_rho(self) :
         """
         Transfer the values of rho_next to rho_prev,
@@ -1,8 +1,12 @@
 """
 This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
-It imports the SpectralTransformer object, so that
-this object can be used at a higher level.
+It imports the SpectralTransformer and BatchedSpectralTransformer objects,
+as well as the function that selects the backend of the Hankel transform,
+so that these objects can be used at a higher level.
 """
 
 from .spectral_transformer import SpectralTransformer, cuda_installed
-__all__ = ['SpectralTransformer', 'cuda_installed']
+from .batched_transformer import BatchedSpectralTransformer
+from .lowmem_hankel import select_dht_backend
+__all__ = ['SpectralTransformer', 'BatchedSpectralTransformer',
+            'select_dht_backend', 'cuda_installed']
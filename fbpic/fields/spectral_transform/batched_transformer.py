@@ -0,0 +1,167 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the BatchedSpectralTransformer class, which transforms
+several vector fields of one azimuthal mode at once.
+"""
+import numpy as np
+from .fourier import FFT
+from .numba_methods import numba_stack_vect, numba_unstack_vect, \
+    numba_rt_to_pm_real, numba_real_to_rt, \
+    numba_vect_to_real, numba_real_to_vect
+
+class BatchedSpectralTransformer(object) :
+    """
+    Object that transforms vector fields (e.g. E and B) back and forth between
+    the interpolation grid and the spectral grid, for one azimuthal mode.
+
+    Contrary to the SpectralTransformer, which transforms each component
+    separately, the components r, t, z of all the fields are Fourier-transformed
+    in a single batched FFT, and the components p (resp. m, z) of all the
+    fields are Hankel-transformed in a single matrix product.
+    This reduces the number of Python calls and increases the size of
+    the matrix products, which is more efficient for small grids.
+
+    This object is only implemented on CPU.
+    """
+
+    def __init__( self, trans, n_fields_max=2 ) :
+        """
+        Initialize the buffers of the batched transform
+
+        Parameters
+        ----------
+        trans : a SpectralTransformer object
+            The transformer of the same azimuthal mode
+            (whose DHT matrices are reused by this object)
+
+        n_fields_max : int, optional
+            The maximum number of vector fields that are transformed at once
+        """
+        # Register the DHT matrices for the components p, m, z
+        self.dhts = [ trans.dhtp, trans.dhtm, trans.dht0 ]
+        Nz = trans.spect_buffer_r.shape[0]
+        Nr = trans.spect_buffer_r.shape[1]
+        self.Nz = Nz
+        self.Nr = Nr
+        self.dtype = trans.spect_buffer_r.dtype
+        self.n_fields_max = n_fields_max
+
+        # Real buffers for the matrix products (one per DHT order)
+        real_dtype = trans.dht0.M.dtype
+        self.real_in = np.zeros( (3, 2*n_fields_max*Nz, Nr), dtype=real_dtype )
+        self.real_out = np.zeros( (3, 2*n_fields_max*Nz, Nr), dtype=real_dtype )
+
+        # FFT objects and complex buffers, for each number of fields
+        # (Allocated only when needed, see `get_fft`)
+        self.fft = {}
+        self.fft_in = {}
+        self.fft_out = {}
+
+    def get_fft( self, n_fields ) :
+        """
+        Return the FFT object and the buffers that are used
+        in order to transform `n_fields` fields at once
+
+        Parameters
+        ----------
+        n_fields : int
+            The number of vector fields that are transformed
+
+        Returns
+        -------
+        fft : an FFT object
+        fft_in, fft_out : 2darrays of complexs, of shape (Nz, 3*n_fields*Nr)
+        """
+        if n_fields > self.n_fields_max:
+            raise ValueError( 'Cannot transform more than %d fields at once.'
+                                %self.n_fields_max )
+        if n_fields not in self.fft:
+            shape = ( self.Nz, 3*n_fields*self.Nr )
+            self.fft[n_fields] = FFT( 3*n_fields*self.Nr, self.Nz,
+                                        dtype=self.dtype )
+            self.fft_in[n_fields] = np.zeros( shape, dtype=self.dtype )
+            self.fft_out[n_fields] = np.zeros( shape, dtype=self.dtype )
+        return( self.fft[n_fields], self.fft_in[n_fields],
+                self.fft_out[n_fields] )
+
+    def interp2spect_vect( self, interp_fields, spect_fields ) :
+        """
+        Convert vector fields from the interpolation grid
+        (e.g. Er, Et, Ez) to the spectral space (e.g. Ep, Em, Ez)
+
+        Parameters
+        ----------
+        interp_fields : list of tuples of 2darrays
+            For each field, the complex arrays of the components r, t, z
+            on the interpolation grid
+
+        spect_fields : list of tuples of 2darrays
+            For each field, the complex arrays of the components p, m, z
+            in spectral space, which are overwritten by this function
+        """
+        n_fields = len( interp_fields )
+        fft, fft_in, fft_out = self.get_fft( n_fields )
+        n_rows = 2*n_fields*self.Nz
+
+        # Perform the FFT of all the components at once
+        for i_field, (array_r, array_t, array_z) in enumerate(interp_fields):
+            numba_stack_vect( array_r, array_t, array_z, fft_in, i_field )
+        fft.transform( fft_in, fft_out )
+
+        # Combine the r and t components, and convert to real arrays
+        real_p, real_m, real_z = self.real_in[:, :n_rows]
+        for i_field in range( n_fields ):
+            numba_rt_to_pm_real( fft_out, i_field, real_p, real_m, real_z )
+
+        # Perform the DHT of all the fields at once, for each order
+        for i_order in range(3):
+            np.dot( self.real_in[i_order, :n_rows], self.dhts[i_order].M,
+                    out=self.real_out[i_order, :n_rows] )
+
+        # Convert the result to the complex spectral arrays
+        real_p, real_m, real_z = self.real_out[:, :n_rows]
+        for i_field, (array_p, array_m, array_z) in enumerate(spect_fields):
+            numba_real_to_vect( real_p, real_m, real_z, i_field,
+                                array_p, array_m, array_z )
+
+    def spect2interp_vect( self, spect_fields, interp_fields ) :
+        """
+        Convert vector fields from the spectral space
+        (e.g. Ep, Em, Ez) to the interpolation grid (e.g. Er, Et, Ez)
+
+        Parameters
+        ----------
+        spect_fields : list of tuples of 2darrays
+            For each field, the complex arrays of the components p, m, z
+            in spectral space
+
+        interp_fields : list of tuples of 2darrays
+            For each field, the complex arrays of the components r, t, z
+            on the interpolation grid, which are overwritten by this function
+        """
+        n_fields = len( spect_fields )
+        fft, fft_in, fft_out = self.get_fft( n_fields )
+        n_rows = 2*n_fields*self.Nz
+
+        # Convert the complex spectral arrays to real arrays
+        real_p, real_m, real_z = self.real_in[:, :n_rows]
+        for i_field, (array_p, array_m, array_z) in enumerate(spect_fields):
+            numba_vect_to_real( array_p, array_m, array_z, i_field,
+                                real_p, real_m, real_z )
+
+        # Perform the inverse DHT of all the fields at once, for each order
+        for i_order in range(3):
+            np.dot( self.real_in[i_order, :n_rows], self.dhts[i_order].invM,
+                    out=self.real_out[i_order, :n_rows] )
+
+        # Combine the p and m components, and perform the inverse FFT
+        # of all the components at once
+        real_p, real_m, real_z = self.real_out[:, :n_rows]
+        for i_field in range( n_fields ):
+            numba_real_to_rt( real_p, real_m, real_z, i_field, fft_in )
+        fft.inverse_transform( fft_in, fft_out )
+        for i_field, (array_r, array_t, array_z) in enumerate(interp_fields):
+            numba_unstack_vect( fft_out, i_field, array_r, array_t, array_z )
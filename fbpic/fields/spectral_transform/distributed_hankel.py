@@ -0,0 +1,256 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of FBPIC (Fourier-Bessel Particle-In-Cell code).
+It defines the DistributedDHT class, which performs the same Hankel transform
+as the DHT class (see hankel.py), but shares the matrices and the matrix
+products between the MPI ranks of a radial communicator.
+
+Principle of the algorithm:
+- The radial cells and the radial modes are divided into contiguous blocks,
+  one per rank of the radial communicator (see `get_radial_domain_bounds`).
+  Each rank only computes and stores the rows of the matrices M and invM
+  that correspond to its block of cells (for M) or to its block of modes
+  (for invM) ; see `compute_dht_matrix_rows`.
+- Forward transform: each rank multiplies its block of cells of the
+  input array by its rows of M. The sum of these partial products over
+  the ranks is the full transform ; it is computed with a reduce-scatter,
+  so that each rank only receives its block of modes.
+- Inverse transform: each rank multiplies its block of modes by its rows of
+  invM, and the partial products are summed with a reduce-scatter, so that
+  each rank receives its block of cells. Then, either the few cells on each
+  side of this block (`n_halo`, which covers the particles of the radial
+  band) are exchanged with the radial neighbors (`band_only=True`, used at
+  each PIC iteration), or the blocks of all the ranks are gathered, so that
+  each rank obtains the full array on the interpolation grid.
+"""
+import numpy as np
+from fbpic.utils.mpi import MPI
+from fbpic.fields.utility_methods import get_radial_domain_bounds
+from .hankel import compute_dht_matrix_rows
+from .numba_methods import numba_copy_2dC_to_2dR_transposed, \
+    numba_copy_2dR_to_2dC_transposed
+
+class DistributedDHT(object):
+    """
+    Class that allows to perform the Discrete Hankel Transform as a blocked
+    matrix product, distributed over the MPI ranks of a radial communicator.
+
+    This class has the same interface as the DHT class, except that
+    the spectral arrays only contain the local block of radial modes
+    (i.e. they have the shape (Nz, Nkr_local), where Nkr_local is the
+    size of `get_nu()`), while the arrays on the interpolation grid
+    have the shape (Nz, Nr) (but, with `band_only=True`, the inverse
+    transform only obtains the local block of cells and its halo cells).
+    It is only implemented on CPU.
+    """
+
+    def __init__(self, p, m, Nr, Nz, rmax, use_cuda=False, dtype=np.float64,
+                    cache=None, radial_comm=None, n_halo=0 ):
+        """
+        Calculate the r (position) and nu (frequency) grid
+        on which the transform will operate.
+
+        Also store the blocks of the matrices that are used by this rank.
+
+        Parameters:
+        ------------
+        p: int
+        Order of the Hankel transform
+
+        m: int
+        The azimuthal mode for which the Hankel transform is calculated
+
+        Nr, Nz: float
+        Number of points in the r direction and z direction
+
+        rmax: float
+        Edge of the box in which the Hankel transform is taken
+        (The function is assumed to be zero at that point.)
+
+        use_cuda: bool, optional
+        Whether to use the GPU for the Hankel transform
+        (Not implemented for the DistributedDHT.)
+
+        dtype: numpy real type, optional
+        The type of the matrices and buffers used in the transform
+
+        cache: a CoefficientCache object, or None, optional
+        If not None, the local blocks of the matrices are loaded from
+        this on-disk cache
+
+        radial_comm: an mpi4py communicator
+        The communicator of the ranks that share the transform
+
+        n_halo: int, optional
+        The number of cells on each side of the local block of cells, that
+        are also obtained by the inverse transform with `band_only=True`
+        (If this is larger than the blocks of cells, the inverse transform
+        always obtains the full array.)
+        """
+        if use_cuda:
+            raise ValueError(
+                'The distributed Hankel transform is not available on GPU.')
+        if (m in [p-1, p, p+1]) == False:
+            raise ValueError('m must be either p-1, p or p+1')
+
+        # Register values of the arguments
+        self.p = p
+        self.m = m
+        self.Nr = Nr
+        self.rmax = rmax
+        self.radial_comm = radial_comm
+
+        # Get the block of cells (and of modes) of this rank, and the number
+        # of values of the partial products that are received by each rank
+        bounds = get_radial_domain_bounds( Nr, radial_comm.size )
+        self.ir_min = bounds[ radial_comm.rank ]
+        self.ir_max = bounds[ radial_comm.rank + 1 ]
+        self.recv_counts = [ int( 2*Nz*(bounds[k+1] - bounds[k]) )
+                                for k in range(radial_comm.size) ]
+        self.recv_displs = [ int( 2*Nz*bounds[k] )
+                                for k in range(radial_comm.size) ]
+        Nr_local = self.ir_max - self.ir_min
+
+        # Get the cells of the radial neighbors that are obtained by the
+        # inverse transform with `band_only=True` (none on the axis side
+        # of the first block and on the outer side of the last block)
+        self.band_only = ( n_halo <= min( np.diff(bounds) ) )
+        if self.band_only:
+            self.n_halo_in = min( n_halo, self.ir_min )
+            self.n_halo_out = min( n_halo, Nr - self.ir_max )
+        else:
+            self.n_halo_in = self.n_halo_out = 0
+        if radial_comm.rank > 0:
+            self.inner_proc = radial_comm.rank - 1
+        else:
+            self.inner_proc = MPI.PROC_NULL
+        if radial_comm.rank < radial_comm.size - 1:
+            self.outer_proc = radial_comm.rank + 1
+        else:
+            self.outer_proc = MPI.PROC_NULL
+
+        # Calculate the local blocks of the spectral grid and of the
+        # transformation matrices (or load them from the cache, if a cache
+        # is provided)
+        if cache is not None:
+            matrices = cache.load_or_compute( compute_dht_matrix_rows,
+                                p, m, Nr, rmax, self.ir_min, self.ir_max )
+        else:
+            matrices = compute_dht_matrix_rows(
+                                p, m, Nr, rmax, self.ir_min, self.ir_max )
+        self.nu = np.array( matrices['nu'] )
+
+        # Calculate the spatial grid (Uniform grid with an half-cell offset)
+        self.r = (rmax*1./Nr) * ( np.arange(Nr) + 0.5 )
+
+        # Keep the local rows of the (transposed) matrices M and invM.
+        # They are transposed again, so that the partial products have
+        # the radial index along their first axis: the blocks that are
+        # sent to each rank by the reduce-scatter are then contiguous.
+        self.Mt = np.ascontiguousarray( matrices['M'].T, dtype=dtype )
+        self.invMt = np.ascontiguousarray( matrices['invM'].T, dtype=dtype )
+
+        # Initialize buffer arrays to store the local block of the complex
+        # Nz x Nr grid as a real Nr_local x 2Nz grid, the partial products,
+        # and the local block of cells and the halo cells after the inverse
+        # transform (in this order along the first axis)
+        self.array_in = np.zeros( (Nr_local, 2*Nz), dtype=dtype )
+        self.array_out = np.zeros( (Nr_local, 2*Nz), dtype=dtype )
+        self.partial_product = np.zeros( (Nr, 2*Nz), dtype=dtype )
+        self.band_array = np.zeros(
+            (self.n_halo_in + Nr_local + self.n_halo_out, 2*Nz), dtype=dtype )
+        self.local_block = self.band_array[
+                            self.n_halo_in : self.n_halo_in + Nr_local ]
+
+    def get_r(self):
+        """
+        Return the r grid
+
+        Returns:
+        ---------
+        A real 1darray containing the values of the positions
+        """
+        return( self.r )
+
+    def get_nu(self):
+        """
+        Return the local block of the natural, non-uniform nu grid
+
+        Returns:
+        ---------
+        A real 1darray containing the values of the frequencies
+        """
+        return( self.nu )
+
+    def transform( self, F, G ):
+        """
+        Perform the Hankel transform of F.
+
+        Parameters:
+        ------------
+        F: 2darray of complex values, of shape (Nz, Nr)
+        Array containing the discrete values of the function for which
+        the discrete Hankel transform is to be calculated.
+        (Only the local block of cells of this array is used.)
+
+        G: 2darray of complex values, of shape (Nz, Nkr_local)
+        Array where the local block of the result will be stored
+        """
+        # Convert the local block of `F` to the real array `array_in`
+        numba_copy_2dC_to_2dR_transposed( F, self.ir_min, self.array_in )
+        # Multiply by the local rows of M
+        np.dot( self.Mt, self.array_in, out=self.partial_product )
+        # Sum the partial products of all ranks, and receive the local block
+        self.radial_comm.Reduce_scatter( self.partial_product,
+                    self.array_out, recvcounts=self.recv_counts, op=MPI.SUM )
+        # Convert real array `array_out` to complex array `G`
+        numba_copy_2dR_to_2dC_transposed( self.array_out, G )
+
+    def inverse_transform( self, G, F, band_only=False ):
+        """
+        Performs the MDHT of G and stores the result in F
+        Reference: see the paper associated with FBPIC
+
+        G: 2darray of complex values, of shape (Nz, Nkr_local)
+        Array containing the local block of the values
+        from which to compute the DHT
+
+        F: 2darray of complex values, of shape (Nz, Nr)
+        Array where the result will be stored
+
+        band_only: bool, optional
+        Whether to only obtain the local block of cells and `n_halo` cells
+        on each side of it (the other cells of `F` are not modified),
+        instead of the full array
+        """
+        # Convert the complex array `G` to the real array `array_in`
+        numba_copy_2dC_to_2dR_transposed( G, 0, self.array_in )
+        # Multiply by the local rows of invM
+        np.dot( self.invMt, self.array_in, out=self.partial_product )
+        # Sum the partial products of all ranks, and receive the local block
+        self.radial_comm.Reduce_scatter( self.partial_product,
+                    self.local_block, recvcounts=self.recv_counts, op=MPI.SUM )
+
+        if band_only and self.band_only:
+            # Exchange the halo cells with the radial neighbors
+            n_in, n_out = self.n_halo_in, self.n_halo_out
+            N_band = self.band_array.shape[0]
+            self.radial_comm.Sendrecv(
+                self.local_block[:n_in], dest=self.inner_proc,
+                recvbuf=self.band_array[N_band-n_out:], source=self.outer_proc )
+            self.radial_comm.Sendrecv(
+                self.local_block[len(self.local_block)-n_out:],
+                dest=self.outer_proc,
+                recvbuf=self.band_array[:n_in], source=self.inner_proc )
+            # Convert these cells to the corresponding columns of `F`
+            numba_copy_2dR_to_2dC_transposed( self.band_array,
+                F[:, self.ir_min-n_in : self.ir_max+n_out] )
+        else:
+            # Gather the blocks of all ranks
+            self.radial_comm.Allgatherv( self.local_block,
+                [ self.partial_product, ( self.recv_counts, self.recv_displs ),
+                  MPI.DOUBLE ] )
+            # Convert the real array `partial_product` to the complex array `F`
+            numba_copy_2dR_to_2dC_transposed( self.partial_product, F )
@@ -8,6 +8,7 @@ and is used in spectral_transformer.py
 """
 import numpy as np
 import numba
+from .numba_methods import numba_copy_2d
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 if cuda_installed:
@@ -30,7 +31,8 @@ class FFT(object):
     See the methods `transform` and `inverse transform` for more information
     """
 
-    def __init__(self, Nr, Nz, use_cuda=False, nthreads=None ):
+    def __init__(self, Nr, Nz, use_cuda=False, nthreads=None,
+                    dtype=np.complex128 ):
         """
         Initialize an FFT object
 
@@ -49,6 +51,10 @@ class FFT(object):
             Number of threads for the FFTW transform.
             If None, the default number of threads of numba is used
             (environment variable NUMBA_NUM_THREADS)
+
+        dtype: numpy complex type, optional
+            The type of the arrays that are transformed
+            (either np.complex128 or np.complex64)
         """
         # Check whether to use cuda
         self.use_cuda = use_cuda
@@ -59,6 +65,8 @@ class FFT(object):
 
         # Check whether to use MKL
         self.use_mkl = mkl_installed
+        # Register the type of the transformed arrays
+        self.dtype = dtype
 
         # Initialize the object for calculation on the GPU
         if self.use_cuda:
@@ -67,12 +75,12 @@ class FFT(object):
 
             # Initialize 1d buffer for cufft
             self.buffer1d_in = cuda.device_array(
-                (Nz*Nr,), dtype=np.complex128)
+                (Nz*Nr,), dtype=dtype)
             self.buffer1d_out = cuda.device_array(
-                (Nz*Nr,), dtype=np.complex128)
+                (Nz*Nr,), dtype=dtype)
             # Initialize the cuda libraries object
-            self.fft = cufft.FFTPlan( shape=(Nz,), itype=np.complex128,
-                                      otype=np.complex128, batch=Nr )
+            self.fft = cufft.FFTPlan( shape=(Nz,), itype=dtype,
+                                      otype=dtype, batch=Nr )
             self.blas = cublas.Blas()   # For normalization of the iFFT
             self.inv_Nz = 1./Nz         # For normalization of the iFFT
 
@@ -82,7 +90,7 @@ class FFT(object):
             # For MKL FFT
             if self.use_mkl:
                 # Initialize the MKL plan with dummy array
-                spect_buffer = np.zeros( (Nz, Nr), dtype=np.complex128 )
+                spect_buffer = np.zeros( (Nz, Nr), dtype=dtype )
                 self.mklfft = MKLFFT( spect_buffer )
 
             # For FFTW
@@ -92,13 +100,18 @@ class FFT(object):
                     # Get the default number of threads for numba
                     nthreads = numba.config.NUMBA_NUM_THREADS
                 # Initialize the FFT plan with dummy arrays
-                interp_buffer = np.zeros( (Nz, Nr), dtype=np.complex128 )
-                spect_buffer = np.zeros( (Nz, Nr), dtype=np.complex128 )
+                interp_buffer = np.zeros( (Nz, Nr), dtype=dtype )
+                spect_buffer = np.zeros( (Nz, Nr), dtype=dtype )
                 self.fft = pyfftw.FFTW( interp_buffer, spect_buffer,
                         axes=(0,), direction='FFTW_FORWARD', threads=nthreads)
                 self.ifft = pyfftw.FFTW( spect_buffer, interp_buffer,
                         axes=(0,), direction='FFTW_BACKWARD', threads=nthreads)
 
+            # Buffer for arrays on the interpolation grid that do not have
+            # the same precision as the FFT (e.g. E and B in mixed precision)
+            # (Allocated only when needed, see `get_cast_buffer`)
+            self.cast_buffer = None
+
 
     def transform( self, array_in, array_out ):
         """
@@ -120,14 +133,20 @@ class FFT(object):
             self.fft.forward( self.buffer1d_in, out=self.buffer1d_out )
             cuda_copy_1d_to_2d[self.dim_grid, self.dim_block](
                 self.buffer1d_out, array_out )
-        elif self.use_mkl:
-            # Perform the FFT on the CPU using MKL
-            self.mklfft.transform( array_in, array_out )
-        else :
-            # Perform the FFT on the CPU using FFTW
-            self.fft.update_arrays( new_input_array=array_in,
-                                    new_output_array=array_out )
-            self.fft()
+        else:
+            # Convert the input array to the precision of the FFT if needed
+            if array_in.dtype != self.dtype:
+                cast_buffer = self.get_cast_buffer( array_in.shape )
+                numba_copy_2d( array_in, cast_buffer )
+                array_in = cast_buffer
+            if self.use_mkl:
+                # Perform the FFT on the CPU using MKL
+                self.mklfft.transform( array_in, array_out )
+            else :
+                # Perform the FFT on the CPU using FFTW
+                self.fft.update_arrays( new_input_array=array_in,
+                                        new_output_array=array_out )
+                self.fft()
 
     def inverse_transform( self, array_in, array_out ):
         """
@@ -150,11 +169,35 @@ class FFT(object):
             self.blas.scal( self.inv_Nz, self.buffer1d_out ) # Normalization
             cuda_copy_1d_to_2d[self.dim_grid, self.dim_block](
                 self.buffer1d_out, array_out )
-        elif self.use_mkl:
-            # Perform the inverse FFT on the CPU using MKL
-            self.mklfft.inverse_transform( array_in, array_out )
-        else :
-            # Perform the inverse FFT on the CPU using FFTW
-            self.ifft.update_arrays( new_input_array=array_in,
-                                    new_output_array=array_out )
-            self.ifft()
+        else:
+            # If the output array does not have the precision of the FFT,
+            # perform the FFT into a buffer, and then convert it
+            if array_out.dtype != self.dtype:
+                final_array_out = array_out
+                array_out = self.get_cast_buffer( array_out.shape )
+            else:
+                final_array_out = None
+            if self.use_mkl:
+                # Perform the inverse FFT on the CPU using MKL
+                self.mklfft.inverse_transform( array_in, array_out )
+            else :
+                # Perform the inverse FFT on the CPU using FFTW
+                self.ifft.update_arrays( new_input_array=array_in,
+                                        new_output_array=array_out )
+                self.ifft()
+            if final_array_out is not None:
+                numba_copy_2d( array_out, final_array_out )
+
+    def get_cast_buffer( self, shape ):
+        """
+        Return a buffer that has the precision of the FFT, and which is
+        used to transform arrays of a different precision (on the CPU)
+
+        Parameters
+        ----------
+        shape: tuple of ints
+            The shape of the arrays that are transformed
+        """
+        if self.cast_buffer is None:
+            self.cast_buffer = np.zeros( shape, dtype=self.dtype )
+        return( self.cast_buffer )
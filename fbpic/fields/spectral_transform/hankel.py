@@ -10,6 +10,7 @@ g(\nu) = 2 \pi \int_0^\infty f(r) J_p( 2 \pi \nu r) r dr
 f( r ) = 2 \pi \int_0^\infty g(\nu) J_p( 2 \pi \nu r) \nu d\nu d
 """
 import numpy as np
+from scipy import linalg
 from scipy.special import jn, jn_zeros
 
 # Check if CUDA is available, then import CUDA functions
@@ -26,7 +27,8 @@ class DHT(object):
     Class that allows to perform the Discrete Hankel Transform.
     """
 
-    def __init__(self, p, m, Nr, Nz, rmax, use_cuda=False ):
+    def __init__(self, p, m, Nr, Nz, rmax, use_cuda=False, dtype=np.float64,
+                    cache=None ):
         """
         Calculate the r (position) and nu (frequency) grid
         on which the transform will operate.
@@ -50,6 +52,15 @@ class DHT(object):
 
         use_cuda: bool, optional
         Whether to use the GPU for the Hankel transform
+
+        dtype: numpy real type, optional
+        The type of the matrices and buffers used in the transform
+        (The matrices are always calculated in double precision, and
+        then converted to `dtype`.)
+
+        cache: a CoefficientCache object, or None, optional
+        If not None, the matrices are loaded from this on-disk cache
+        (and computed and stored in the cache if they are not found)
         """
         # Register whether to use the GPU.
         # If yes, initialize the corresponding cuda object
@@ -69,63 +80,33 @@ class DHT(object):
         self.Nr = Nr
         self.rmax = rmax
 
-        # Calculate the zeros of the Bessel function
-        if m !=0:
-            # In this case, 0 is a zero of the Bessel function of order m.
-            # It turns out that it is needed to reconstruct the signal for p=0.
-            alphas = np.hstack( (np.array([0.]), jn_zeros(m, Nr-1)) )
+        # Calculate the spectral grid and the transformation matrices
+        # (or load them from the cache, if a cache is provided)
+        if cache is not None:
+            matrices = cache.load_or_compute(
+                compute_dht_matrices, p, m, Nr, rmax )
         else:
-            alphas = jn_zeros(m, Nr)
-
-        # Calculate the spectral grid
-        self.nu = 1./(2*np.pi*rmax) * alphas
+            matrices = compute_dht_matrices( p, m, Nr, rmax )
+        self.nu = np.asarray( matrices['nu'] )
 
         # Calculate the spatial grid (Uniform grid with an half-cell offset)
         self.r = (rmax*1./Nr) * ( np.arange(Nr) + 0.5 )
 
-        # Calculate and store the inverse matrix invM
-        # (imposed by the constraints on the DHT of Bessel modes)
+        # Convert the matrices to the requested precision
         # NB: When compared with the FBPIC article, all the matrices here
         # are calculated in transposed form. This is done so as to use the
         # `dot` and `gemm` functions, in the `transform` method.
-        self.invM = np.empty((Nr, Nr))
-        if p == m:
-            p_denom = p+1
-        else:
-            p_denom = p
-        denom = np.pi * rmax**2 * jn( p_denom, alphas)**2
-        num = jn( p, 2*np.pi* self.r[np.newaxis,:]*self.nu[:,np.newaxis] )
-        # Get the inverse matrix
-        if m!=0:
-            self.invM[1:, :] = num[1:, :] / denom[1:, np.newaxis]
-            # In this case, the functions are represented by Bessel functions
-            # *and* an additional mode (below) which satisfies the same
-            # algebric relations for curl/div/grad as the regular Bessel modes,
-            # with the value kperp=0.
-            # The normalization of this mode is arbitrary, and is chosen
-            # so that the condition number of invM is close to 1
-            if p==m-1:
-                self.invM[0, :] = self.r**(m-1) * 1./( np.pi * rmax**(m+1) )
-            else:
-                self.invM[0, :] = 0.
-        else :
-            self.invM[:, :] = num[:, :] / denom[:, np.newaxis]
-
-        # Calculate the matrix M by inverting invM
-        self.M = np.empty((Nr, Nr))
-        if m !=0 and p != m-1:
-            self.M[:, 1:] = np.linalg.pinv( self.invM[1:,:] )
-            self.M[:, 0] = 0.
-        else:
-            self.M = np.linalg.inv( self.invM )
+        # (No copy is made when the precision is unchanged: the matrices
+        # loaded from the cache then remain memory-mapped, and are shared
+        # between the processes that run on the same node.)
+        self.M = np.asarray( matrices['M'], dtype=dtype )
+        self.invM = np.asarray( matrices['invM'], dtype=dtype )
 
         # Copy the matrices to the GPU if needed
         if self.use_cuda:
             # Conversion to Fortran order is needed for the cuBlas API
-            self.d_M = cuda.to_device(
-                np.asfortranarray( self.M, dtype=np.float64 ) )
-            self.d_invM = cuda.to_device(
-                np.asfortranarray( self.invM, dtype=np.float64 ) )
+            self.d_M = cuda.to_device( np.asfortranarray( self.M ) )
+            self.d_invM = cuda.to_device( np.asfortranarray( self.invM ) )
 
         # Initialize buffer arrays to store the complex Nz x Nr grid
         # as a real 2Nz x Nr grid, before performing the matrix product
@@ -133,13 +114,13 @@ class DHT(object):
         # product of complexs, and the real-complex conversion is negligible.)
         if not self.use_cuda:
             # Initialize real buffer arrays on the CPU
-            zero_array = np.zeros((2*Nz, Nr), dtype=np.float64 )
+            zero_array = np.zeros((2*Nz, Nr), dtype=dtype )
             self.array_in = zero_array.copy()
             self.array_out = zero_array.copy()
         else:
             # Initialize real buffer arrays on the GPU
             # The cuBlas API requires that these arrays be in Fortran order
-            zero_array = np.zeros((2*Nz, Nr), dtype=np.float64, order='F')
+            zero_array = np.zeros((2*Nz, Nr), dtype=dtype, order='F')
             self.d_in = cuda.to_device( zero_array )
             self.d_out = cuda.to_device( zero_array )
             # Initialize a cuda stream (required by cublas)
@@ -201,7 +182,7 @@ class DHT(object):
             numba_copy_2dR_to_2dC( self.array_out, G )
 
 
-    def inverse_transform( self, G, F ):
+    def inverse_transform( self, G, F, band_only=False ):
         """
         Performs the MDHT of G and stores the result in F
         Reference: see the paper associated with FBPIC
@@ -211,6 +192,10 @@ class DHT(object):
 
         F: 2darray of real or complex values
         Array where the result will be stored
+
+        band_only: bool, optional
+        Not used here (the full array is always obtained ; this argument
+        is only used by the DistributedDHT)
         """
         # Perform the matrix product with invM
         if self.use_cuda:
@@ -228,3 +213,175 @@ class DHT(object):
             np.dot( self.array_in, self.invM, out=self.array_out )
             # Convert real array `array_out` to complex array `F`
             numba_copy_2dR_to_2dC( self.array_out, F )
+
+
+def compute_dht_matrices( p, m, Nr, rmax ):
+    """
+    Calculate the spectral grid nu, as well as the matrix M of the
+    Hankel transform and the matrix invM of the inverse transform
+
+    Parameters
+    ----------
+    p: int
+        Order of the Hankel transform
+
+    m: int
+        The azimuthal mode for which the Hankel transform is calculated
+
+    Nr: int
+        Number of points in the r direction
+
+    rmax: float
+        Edge of the box in which the Hankel transform is taken
+
+    Returns
+    -------
+    A dictionary with the keys 'nu', 'M' and 'invM'
+    """
+    # Calculate the spectral grid and the inverse matrix invM
+    nu = compute_dht_nu( m, Nr, rmax )
+    invM = compute_dht_invM_rows( p, m, Nr, rmax, nu, 0, Nr )
+
+    # Calculate the matrix M by inverting invM
+    M = np.empty((Nr, Nr))
+    if m !=0 and p != m-1:
+        M[:, 1:] = np.linalg.pinv( invM[1:,:] )
+        M[:, 0] = 0.
+    else:
+        M = np.linalg.inv( invM )
+
+    return( {'nu': nu, 'M': M, 'invM': invM} )
+
+
+def compute_dht_matrix_rows( p, m, Nr, rmax, ir_min, ir_max ):
+    """
+    Calculate the rows `ir_min` to `ir_max` of the spectral grid nu,
+    of the matrix M and of the matrix invM (see `compute_dht_matrices`),
+    without storing the full matrices.
+
+    The rows of invM are calculated directly. The rows of M (i.e. of the
+    inverse, or pseudo-inverse, of invM) are obtained by solving a linear
+    system with the full matrix invM, which is only allocated temporarily.
+
+    Parameters
+    ----------
+    p, m, Nr, rmax:
+        See `compute_dht_matrices`
+
+    ir_min, ir_max: ints
+        The index of the first row, and the index after the last row
+
+    Returns
+    -------
+    A dictionary with the keys 'nu', 'M' and 'invM' (the arrays
+    'M' and 'invM' have the shape (ir_max-ir_min, Nr))
+    """
+    nu = compute_dht_nu( m, Nr, rmax )
+    invM_rows = compute_dht_invM_rows( p, m, Nr, rmax, nu, ir_min, ir_max )
+
+    # The rows of M are the columns of the transpose of the inverse (or
+    # pseudo-inverse) of invM, i.e. the (least-squares) solutions X of
+    # invM^T X = E, where E contains the corresponding columns of identity
+    N_rows = ir_max - ir_min
+    E = np.zeros( (Nr, N_rows) )
+    E[ np.arange(ir_min, ir_max), np.arange(N_rows) ] = 1.
+    invM = compute_dht_invM_rows( p, m, Nr, rmax, nu, 0, Nr )
+    M_rows = np.empty( (N_rows, Nr) )
+    if m !=0 and p != m-1:
+        M_rows[:, 1:] = linalg.lstsq( invM[1:,:].T, E, lapack_driver='gelsy',
+                                      check_finite=False )[0].T
+        M_rows[:, 0] = 0.
+    else:
+        lu_and_piv = linalg.lu_factor( invM, overwrite_a=True,
+                                       check_finite=False )
+        M_rows[:, :] = linalg.lu_solve( lu_and_piv, E, trans=1,
+                                        check_finite=False ).T
+
+    return( {'nu': nu[ir_min:ir_max], 'M': M_rows, 'invM': invM_rows} )
+
+
+def compute_dht_invM_rows( p, m, Nr, rmax, nu, ir_min, ir_max ):
+    """
+    Calculate the rows `ir_min` to `ir_max` of the matrix invM
+    of the inverse Hankel transform
+
+    Parameters
+    ----------
+    p, m, Nr, rmax:
+        See `compute_dht_matrices`
+
+    nu: 1darray of floats
+        The full spectral grid (see `compute_dht_nu`)
+
+    ir_min, ir_max: ints
+        The index of the first row, and the index after the last row
+
+    Returns
+    -------
+    A real 2darray of shape (ir_max-ir_min, Nr)
+    """
+    nu_rows = nu[ir_min:ir_max]
+    alphas = 2*np.pi*rmax * nu_rows
+
+    # Calculate the spatial grid (Uniform grid with an half-cell offset)
+    r = (rmax*1./Nr) * ( np.arange(Nr) + 0.5 )
+
+    # Calculate the inverse matrix invM
+    # (imposed by the constraints on the DHT of Bessel modes)
+    # NB: When compared with the FBPIC article, all the matrices here
+    # are calculated in transposed form. This is done so as to use the
+    # `dot` and `gemm` functions, in the `transform` method.
+    invM = np.empty((ir_max-ir_min, Nr))
+    if p == m:
+        p_denom = p+1
+    else:
+        p_denom = p
+    denom = np.pi * rmax**2 * jn( p_denom, alphas)**2
+    num = jn( p, 2*np.pi* r[np.newaxis,:]*nu_rows[:,np.newaxis] )
+    # Get the inverse matrix
+    if m!=0 and ir_min == 0:
+        invM[1:, :] = num[1:, :] / denom[1:, np.newaxis]
+        # In this case, the functions are represented by Bessel functions
+        # *and* an additional mode (below) which satisfies the same
+        # algebric relations for curl/div/grad as the regular Bessel modes,
+        # with the value kperp=0.
+        # The normalization of this mode is arbitrary, and is chosen
+        # so that the condition number of invM is close to 1
+        if p==m-1:
+            invM[0, :] = r**(m-1) * 1./( np.pi * rmax**(m+1) )
+        else:
+            invM[0, :] = 0.
+    else :
+        invM[:, :] = num[:, :] / denom[:, np.newaxis]
+
+    return( invM )
+
+
+def compute_dht_nu( m, Nr, rmax ):
+    """
+    Calculate the spectral grid nu of the Hankel transform
+
+    Parameters
+    ----------
+    m: int
+        The azimuthal mode for which the Hankel transform is calculated
+
+    Nr: int
+        Number of points in the r direction
+
+    rmax: float
+        Edge of the box in which the Hankel transform is taken
+
+    Returns
+    -------
+    A real 1darray containing the values of the frequencies
+    """
+    # Calculate the zeros of the Bessel function
+    if m !=0:
+        # In this case, 0 is a zero of the Bessel function of order m.
+        # It turns out that it is needed to reconstruct the signal for p=0.
+        alphas = np.hstack( (np.array([0.]), jn_zeros(m, Nr-1)) )
+    else:
+        alphas = jn_zeros(m, Nr)
+
+    return( 1./(2*np.pi*rmax) * alphas )
@@ -0,0 +1,540 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of FBPIC (Fourier-Bessel Particle-In-Cell code).
+It defines the LowMemoryDHT class, which performs the same Hankel transform
+as the DHT class (see hankel.py), but without storing the Nr x Nr matrices
+of the dense matrix product: its memory is O(Nr) instead of O(Nr^2), and its
+setup avoids the O(Nr^3) computation of the matrices.
+
+This is a fallback for radial grids whose matrices do not fit in memory,
+not a speedup: each transform performs FFTs of about 2 pi Nr ln(2 Nr) points
+per row (the logarithmic grids below need about pi ln(2 Nr) points per cell
+of the uniform grid, in order to resolve the oscillations of the kernel at
+the largest k*r), as well as a low-rank correction, and is thus about 10 to
+40 times slower than the matrix product for Nr between 512 and 4096.
+
+Principle of the algorithm:
+- The inverse transform is the sum of Bessel modes
+  F(r_j) = sum_k G_k J_p(k_k r_j) / denom_k
+  (i.e. the matrix invM of hankel.py)
+- The forward transform is first approximated by the quadrature
+  g_k = sum_j 2 pi r_j dr F(r_j) J_p(k_k r_j)
+  and then corrected by a low-rank matrix, so that it becomes the inverse
+  of the inverse transform (i.e. the matrix M of hankel.py), to high accuracy.
+- In both sums, the kernel J_p(k r) is interpolated onto logarithmic grids
+  in r and k, with the same logarithmic step. On these grids, the kernel only
+  depends on the sum of the indices, and thus the sums become discrete
+  correlations, which are computed with FFTs.
+"""
+import warnings
+import numpy as np
+from scipy.special import jn
+from fbpic.utils.threading import nthreads
+try:
+    # scipy >= 1.4: multithreaded FFTs
+    from scipy.fft import rfft, irfft, next_fast_len
+    fft_kwargs = { 'workers': nthreads }
+except ImportError:
+    # Older scipy (e.g. on Python 2.7): single-threaded numpy FFTs
+    from numpy.fft import rfft, irfft
+    from scipy.fftpack import next_fast_len as fftpack_next_fast_len
+    def next_fast_len( target, real=False ):
+        return( fftpack_next_fast_len( target ) )
+    fft_kwargs = {}
+from .hankel import compute_dht_nu
+from .numba_methods import numba_copy_2dC_to_2dR, numba_copy_2dR_to_2dC, \
+    numba_lagrange_interp, numba_lagrange_spread
+
+# Memory (in bytes) of the dense DHT matrices above which the 'auto' backend
+# uses the LowMemoryDHT. (The matrix product is faster than the LowMemoryDHT
+# for all the grids where the matrices fit in memory: the LowMemoryDHT is
+# only selected when the matrices become too large to store and compute.)
+dense_dht_memory_limit = 4.e9
+
+class LowMemoryDHT(object):
+    """
+    Class that allows to perform the Discrete Hankel Transform
+    without storing any Nr x Nr matrix (with O(Nr) memory).
+
+    This class has the same interface as the DHT class (except that its
+    arrays are not cached), and gives the same result within a relative
+    accuracy of about 1.e-5. It is slower than the DHT class, and is thus
+    only useful when the matrices of the DHT class do not fit in memory.
+    It is only implemented on CPU.
+    """
+
+    def __init__(self, p, m, Nr, Nz, rmax, use_cuda=False, dtype=np.float64,
+                    max_phase_step=1., interp_order=13,
+                    n_samples=48, chunk_size=32 ):
+        """
+        Calculate the r (position) and nu (frequency) grid
+        on which the transform will operate.
+
+        Also store auxiliary data needed for the transform.
+
+        Parameters:
+        ------------
+        p: int
+        Order of the Hankel transform
+
+        m: int
+        The azimuthal mode for which the Hankel transform is calculated
+
+        Nr, Nz: float
+        Number of points in the r direction and z direction
+
+        rmax: float
+        Edge of the box in which the Hankel transform is taken
+        (The function is assumed to be zero at that point.)
+
+        use_cuda: bool, optional
+        Whether to use the GPU for the Hankel transform
+        (Not implemented for the LowMemoryDHT.)
+
+        dtype: numpy real type, optional
+        The type of the arrays used in the transform
+        (The auxiliary arrays are always calculated in double precision,
+        and then converted to `dtype`, except for the FFT of the kernel.)
+
+        max_phase_step: float, optional
+        The maximal variation of the phase k*r of the kernel between two
+        points of the logarithmic grids (sets the size of the FFTs)
+
+        interp_order: int, optional
+        The order of the Lagrange interpolation to/from the
+        logarithmic grids
+
+        n_samples: int, optional
+        The number of random vectors used to compute the low-rank
+        correction of the forward transform (i.e. its maximal rank)
+
+        chunk_size: int, optional
+        The number of rows (along z) that are transformed at once
+        (limits the size of the FFT buffers)
+        """
+        if use_cuda:
+            raise ValueError('The LowMemoryDHT is not available on GPU.')
+
+        # Check that m has a valid value
+        if (m in [p-1, p, p+1]) == False:
+            raise ValueError('m must be either p-1, p or p+1')
+
+        # Register values of the arguments
+        self.p = p
+        self.m = m
+        self.Nr = Nr
+        self.rmax = rmax
+        self.chunk_size = chunk_size
+
+        # Calculate the spectral grid and the spatial grid
+        # (Uniform grid with an half-cell offset)
+        self.nu = compute_dht_nu( m, Nr, rmax )
+        dr = rmax*1./Nr
+        self.r = dr * ( np.arange(Nr) + 0.5 )
+        k = 2*np.pi*self.nu
+
+        # For m != 0, the first mode (kperp=0) is not a Bessel mode.
+        # Its contribution is calculated separately (see
+        # compute_dht_matrices in hankel.py): it is non-zero only for p=m-1.
+        self.k0 = 0 if m == 0 else 1
+        self.zero_mode = (m != 0) and (p == m-1)
+        if self.zero_mode:
+            self.q0 = 2*np.pi*(p+1)/rmax**p * self.r**(p+1) * dr
+            self.v0 = self.r**(m-1) * 1./( np.pi * rmax**(m+1) )
+        # Quadrature weights (forward sum) and denominators (inverse sum)
+        k = k[self.k0:]
+        if p == m:
+            p_denom = p+1
+        else:
+            p_denom = p
+        self.q = 2*np.pi * self.r * dr
+        self.denom = np.pi * rmax**2 * jn( p_denom, k*rmax )**2
+
+        # Build the logarithmic grids in r and k, with the same step, and
+        # with a few extra points on each side for the interpolation stencils
+        dlog = max_phase_step / ( k[-1] * self.r[-1] )
+        log_r0 = np.log( self.r[0] ) - interp_order*dlog
+        log_k0 = np.log( k[0] ) - interp_order*dlog
+        self.n_r = int( np.ceil( (np.log(self.r[-1]) - log_r0)/dlog ) ) \
+                    + interp_order + 1
+        self.n_k = int( np.ceil( (np.log(k[-1]) - log_k0)/dlog ) ) \
+                    + interp_order + 1
+        r_start, r_weights = get_lagrange_stencil(
+            self.r, log_r0, dlog, self.n_r, interp_order )
+        k_start, k_weights = get_lagrange_stencil(
+            k, log_k0, dlog, self.n_k, interp_order )
+
+        # Sums over r: spread onto the (reversed) log grid in r,
+        # correlate, and interpolate from the log grid in k
+        self.r_spread_start = self.n_r - 1 - interp_order - r_start
+        self.r_spread_weights = r_weights[:, ::-1]
+        self.k_interp_start = k_start + self.n_r - 1
+        self.k_interp_weights = k_weights
+        # Sums over k: spread onto the (reversed) log grid in k,
+        # correlate, and interpolate from the log grid in r
+        self.k_spread_start = self.n_k - 1 - interp_order - k_start
+        self.k_spread_weights = k_weights[:, ::-1]
+        self.r_interp_start = r_start + self.n_k - 1
+        self.r_interp_weights = r_weights
+
+        # On the log grids, the kernel J_p( k r ) only depends on
+        # the sum of the indices in r and k: store its Fourier transform
+        self.n_fft = next_fast_len( self.n_r + self.n_k - 1, real=True )
+        s = np.arange( self.n_r + self.n_k - 1 )
+        self.kernel_fft = rfft(
+            jn( p, np.exp( log_r0 + log_k0 + s*dlog ) ), self.n_fft )
+
+        # Calculate the low-rank correction of the forward transform
+        self.P, self.V = get_lowrank_correction( self, n_samples )
+        # For m != 0 and p != m-1, only Nr-1 modes are used, and the
+        # forward transform should give the least-squares fit of F
+        self.least_squares = (m != 0) and (p != m-1)
+        if self.least_squares:
+            self.u, self.h = get_least_squares_correction( self )
+
+        # Convert the arrays used in the transform to the requested precision
+        # (and include the quadrature weights and denominators in the
+        # weights of the spreading stencils)
+        self.forward_spread = ( self.r_spread_start,
+            np.array( self.q[:,np.newaxis]*self.r_spread_weights, dtype=dtype))
+        self.forward_interp = ( self.k_interp_start,
+            np.array( self.k_interp_weights, dtype=dtype ) )
+        self.inverse_spread = ( self.k_spread_start,
+            np.array( self.k_spread_weights/self.denom[:,np.newaxis],
+                        dtype=dtype ) )
+        self.inverse_interp = ( self.r_interp_start,
+            np.array( self.r_interp_weights, dtype=dtype ) )
+        self.P = np.array( self.P, dtype=dtype )
+        self.V = np.array( self.V, dtype=dtype )
+        if self.least_squares:
+            self.u = np.array( self.u, dtype=dtype )
+            self.h = np.array( self.h, dtype=dtype )
+        if self.zero_mode:
+            self.q0 = np.array( self.q0, dtype=dtype )
+            self.v0 = np.array( self.v0, dtype=dtype )
+
+        # Initialize buffer arrays to store the complex Nz x Nr grid
+        # as a real 2Nz x Nr grid (see the DHT class)
+        self.array_in = np.zeros( (2*Nz, Nr), dtype=dtype )
+        self.array_out = np.zeros( (2*Nz, Nr), dtype=dtype )
+        self.lowrank_buffer = np.zeros( (2*Nz, n_samples), dtype=dtype )
+
+
+    def get_r(self):
+        """
+        Return the r grid
+
+        Returns:
+        ---------
+        A real 1darray containing the values of the positions
+        """
+        return( self.r )
+
+
+    def get_nu(self):
+        """
+        Return the natural, non-uniform nu grid
+
+        Returns:
+        ---------
+        A real 1darray containing the values of the frequencies
+        """
+        return( self.nu )
+
+
+    def transform( self, F, G ):
+        """
+        Perform the Hankel transform of F.
+
+        Parameters:
+        ------------
+        F: 2darray of complex values
+        Array containing the discrete values of the function for which
+        the discrete Hankel transform is to be calculated.
+
+        G: 2darray of complex values
+        Array where the result will be stored
+        """
+        # Convert complex array `F` to real array `array_in`
+        numba_copy_2dC_to_2dR( F, self.array_in )
+        if self.least_squares:
+            # Component of F that is orthogonal to the Bessel modes
+            u_component = np.dot( self.array_in, self.u )
+
+        # Quadrature of the Hankel integral, for the Bessel modes
+        self.kernel_sum( self.array_in, self.forward_spread,
+                    self.forward_interp, self.array_out[:, self.k0:] )
+        # Mode kperp=0 (for m != 0)
+        if self.zero_mode:
+            self.array_out[:, 0] = np.dot( self.array_in, self.q0 )
+        elif self.k0 == 1:
+            self.array_out[:, 0] = 0.
+
+        # Low-rank correction (uses `array_in` as a buffer)
+        np.dot( self.array_out, self.P, out=self.lowrank_buffer )
+        np.dot( self.lowrank_buffer, self.V, out=self.array_in )
+        self.array_out -= self.array_in
+        if self.least_squares:
+            self.array_out -= np.outer( u_component, self.h )
+
+        # Convert real array `array_out` to complex array `G`
+        numba_copy_2dR_to_2dC( self.array_out, G )
+
+
+    def inverse_transform( self, G, F, band_only=False ):
+        """
+        Performs the MDHT of G and stores the result in F
+        Reference: see the paper associated with FBPIC
+
+        G: 2darray of real or complex values
+        Array containing the values from which to compute the DHT
+
+        F: 2darray of real or complex values
+        Array where the result will be stored
+
+        band_only: bool, optional
+        Not used here (the full array is always obtained ; this argument
+        is only used by the DistributedDHT)
+        """
+        # Convert complex array `G` to real array `array_in`
+        numba_copy_2dC_to_2dR( G, self.array_in )
+
+        # Sum of the Bessel modes
+        self.kernel_sum( self.array_in[:, self.k0:], self.inverse_spread,
+                            self.inverse_interp, self.array_out )
+        # Mode kperp=0 (for m != 0)
+        if self.zero_mode:
+            self.array_out += np.outer( self.array_in[:, 0], self.v0 )
+
+        # Convert real array `array_out` to complex array `F`
+        numba_copy_2dR_to_2dC( self.array_out, F )
+
+
+    def kernel_sum( self, array_in, spread, interp, array_out ):
+        """
+        Calculate the sum of the rows of `array_in` multiplied by the
+        kernel J_p( k r ), either over r (for each k) or over k (for each r)
+        depending on the stencils `spread` and `interp`
+
+        Parameters:
+        ------------
+        array_in: 2darray of reals
+            The values on the grid in r (or k)
+
+        spread: tuple of 2 arrays
+            The start index and the weights of the stencils that spread
+            the values of `array_in` onto the (reversed) log grid
+
+        interp: tuple of 2 arrays
+            The start index and the weights of the stencils that interpolate
+            the result of the correlation onto the grid in k (or r)
+
+        array_out: 2darray of reals
+            Array where the result will be stored
+        """
+        n_rows = array_in.shape[0]
+        # Process the rows by chunks, to limit the size of the buffers
+        # (The correlation is always performed in double precision: in
+        # single precision, the rounding errors of the FFTs are of the order
+        # of the largest values, and spoil the small high-k components.)
+        for i_min in range( 0, n_rows, self.chunk_size ):
+            i_max = min( i_min + self.chunk_size, n_rows )
+            buffer = np.empty( (i_max-i_min, self.n_fft), dtype=np.float64 )
+            numba_lagrange_spread( array_in[i_min:i_max],
+                                   spread[0], spread[1], buffer )
+            # Correlation with the kernel
+            spect = rfft( buffer, axis=-1, **fft_kwargs )
+            spect *= self.kernel_fft
+            buffer = irfft( spect, self.n_fft, axis=-1, **fft_kwargs )
+            numba_lagrange_interp( buffer, interp[0], interp[1],
+                                   array_out[i_min:i_max] )
+
+    # Linear operators used in order to calculate the low-rank correction
+    # (in the convention of hankel.py, where the rows are transformed:
+    # the quadrature is f -> f Q and the inverse transform is g -> g invM)
+
+    def quadrature( self, f ):
+        """Return f Q, for the real 2darray f (one function per row)"""
+        g = np.zeros( f.shape )
+        self.kernel_sum( f * self.q,
+            (self.r_spread_start, self.r_spread_weights),
+            (self.k_interp_start, self.k_interp_weights), g[:, self.k0:] )
+        if self.zero_mode:
+            g[:, 0] = np.dot( f, self.q0 )
+        return( g )
+
+    def quadrature_T( self, g ):
+        """Return g Q^T, for the real 2darray g (one function per row)"""
+        f = np.zeros( g.shape )
+        self.kernel_sum( g[:, self.k0:],
+            (self.k_spread_start, self.k_spread_weights),
+            (self.r_interp_start, self.r_interp_weights), f )
+        f *= self.q
+        if self.zero_mode:
+            f += np.outer( g[:, 0], self.q0 )
+        return( f )
+
+    def bessel_sum( self, g ):
+        """Return g invM, for the real 2darray g (one function per row)"""
+        return( self.quadrature_T( g * self.get_mode_scaling() ) / self.q )
+
+    def bessel_sum_T( self, f ):
+        """Return f invM^T, for the real 2darray f (one function per row)"""
+        return( self.quadrature( f / self.q ) * self.get_mode_scaling() )
+
+    def corrected_quadrature( self, f ):
+        """Return the forward transform of the real 2darray f"""
+        g = self.quadrature( f )
+        return( g - np.dot( np.dot( g, self.P ), self.V ) )
+
+    def get_mode_scaling( self ):
+        """
+        Return the ratio between the coefficients of invM and Q^T
+        for each mode (see `bessel_sum` and `bessel_sum_T`)
+        """
+        scaling = np.zeros( self.Nr )
+        scaling[ self.k0: ] = 1./self.denom
+        if self.zero_mode:
+            # The zero mode of invM is v0, while that of Q^T is q0/q
+            # (after division by q), and both are proportional to r^p
+            scaling[0] = self.v0[0] * self.q[0] / self.q0[0]
+        return( scaling )
+
+
+def get_lagrange_stencil( x, log_x0, dlog, n_log, order ):
+    """
+    Return the stencils of the Lagrange interpolation from the logarithmic
+    grid exp( log_x0 + i*dlog ) (for 0 <= i < n_log) to the points x
+
+    Returns
+    -------
+    start: 1darray of ints
+        The index of the first point of the stencil, for each point of x
+
+    weights: 2darray of floats
+        The weights of the stencil, of shape (len(x), order+1)
+    """
+    t = ( np.log(x) - log_x0 ) / dlog
+    start = np.floor( t ).astype( np.int64 ) - (order-1)//2
+    start = np.clip( start, 0, n_log-order-1 )
+    weights = np.ones( (len(x), order+1) )
+    for a in range( order+1 ):
+        for b in range( order+1 ):
+            if b != a:
+                weights[:, a] *= ( t - (start+b) )/( a - b )
+    return( start, weights )
+
+
+def get_lowrank_correction( dht, n_samples ):
+    """
+    Return the matrices P (of shape (Nr, n_samples)) and V (of shape
+    (n_samples, Nr)) such that the forward transform is g -> g - (g P) V,
+    where g is the quadrature of the Hankel integral.
+
+    Writing the quadrature and the inverse transform as the matrices Q
+    and invM, the exact forward transform is M = invM^-1 = Q (invM Q)^-1.
+    The matrix E = invM Q - 1 turns out to be dominated by a small number of
+    modes (close to the largest kperp), and is well approximated by a
+    low-rank matrix X V, obtained with a randomized range finder.
+    The Woodbury identity then gives (1 + X V)^-1 = 1 - X (1 + V X)^-1 V.
+
+    Parameters
+    ----------
+    dht: a LowMemoryDHT object
+        The object whose quadrature and Bessel sums are used
+
+    n_samples: int
+        The number of random vectors (i.e. the maximal rank of X V)
+    """
+    # Random vectors (with a fixed seed, so that all MPI ranks agree)
+    # The first mode is excluded when it is not used (m!=0 and p!=m-1)
+    i_min = dht.k0 if not dht.zero_mode else 0
+    omega = np.zeros( (n_samples, dht.Nr) )
+    omega[:, i_min:] = np.random.RandomState(0).standard_normal(
+                                                (n_samples, dht.Nr-i_min) )
+
+    # Orthonormal basis V of the row space of E
+    Z = dht.quadrature( dht.bessel_sum( omega ) ) - omega
+    V = np.linalg.qr( Z.T )[0].T
+    # X = E V^T, obtained from V E^T = V Q^T invM^T - V
+    X = ( dht.bessel_sum_T( dht.quadrature_T( V ) ) - V ).T
+
+    # Woodbury identity
+    P = np.dot( X, np.linalg.inv( np.eye(n_samples) + np.dot( V, X ) ) )
+    return( P, V )
+
+
+def get_least_squares_correction( dht ):
+    """
+    Return the vectors u and h (of size Nr) such that F -> G - (F.u) h
+    is the least-squares fit of F by the Bessel modes, where G is the
+    forward transform with the low-rank correction (see
+    `get_lowrank_correction`), and F.u is the scalar product.
+
+    For m != 0 and p != m-1, the inverse transform only uses Nr-1 modes, and
+    the DHT class uses the pseudo-inverse of invM (i.e. the least-squares
+    fit). On the other hand, the forward transform with the low-rank
+    correction projects F onto the Nr-1 modes along the direction w such
+    that w Q = 0. Since invM^T = Q / (q denom) (for Nr-1 modes), the vector
+    u = q w is orthogonal to the modes, and correcting the projection
+    along u gives the least-squares fit.
+
+    Parameters
+    ----------
+    dht: a LowMemoryDHT object
+        The object whose quadrature and Bessel sums are used
+    """
+    # Residual of the projection of a random vector (along w)
+    f = np.random.RandomState(1).standard_normal( (1, dht.Nr) )
+    w = f - dht.bessel_sum( dht.corrected_quadrature( f ) )
+    # Normalized vector orthogonal to the modes, and its transform
+    u = dht.q * w
+    u = u / np.linalg.norm( u )
+    h = dht.corrected_quadrature( u )
+    return( u[0], h[0] )
+
+
+def select_dht_backend( dht_backend, Nr, Nm, use_cuda=False ):
+    """
+    Return the backend of the Hankel transform that should be used
+
+    Parameters
+    ----------
+    dht_backend: string
+        Either 'matrix' (dense matrix product, see the DHT class),
+        'low-memory' (see the LowMemoryDHT class) or 'auto' (the
+        LowMemoryDHT is used when the dense matrices of all the modes
+        would take more memory than `dense_dht_memory_limit`)
+
+    Nr: int
+        Number of points in the r direction
+
+    Nm: int
+        Number of azimuthal modes
+
+    use_cuda: bool, optional
+        Whether the transform is performed on the GPU
+        (in which case the 'matrix' backend is always used)
+
+    Returns
+    -------
+    Either 'matrix' or 'low-memory'
+    """
+    if dht_backend not in ['matrix', 'low-memory', 'auto']:
+        raise ValueError('Unknown DHT backend: %s' %dht_backend)
+    if dht_backend == 'auto':
+        # Each mode uses 3 Hankel transforms (p=m-1, m, m+1), with 2 dense
+        # matrices each, which are computed in double precision
+        matrix_memory = 3 * 2 * Nm * Nr**2 * np.dtype(np.float64).itemsize
+        if (matrix_memory > dense_dht_memory_limit) and (not use_cuda):
+            dht_backend = 'low-memory'
+        else:
+            dht_backend = 'matrix'
+    if dht_backend == 'low-memory' and use_cuda:
+        warnings.warn(
+            'The low-memory Hankel transform is not available on GPU.\n'
+            'Using the matrix Hankel transform instead.' )
+        dht_backend = 'matrix'
+    return( dht_backend )
@@ -49,7 +49,8 @@ DFTI_NOT_INPLACE            = ctypes.c_int(44)
 class MKLFFT( object ):
     """
     Minimal MKL FFT class that only performs the type of FFT relevant for
-    FBPIC, i.e. from complex128 to complex128, along the axis 0 of a 2D array
+    FBPIC, i.e. from complex to complex (either complex128 or complex64),
+    along the axis 0 of a 2D array
 
     Note: the number of thread used is determined by the environment variable
     MKL_NUM_THREADS
@@ -63,26 +64,32 @@ class MKLFFT( object ):
 
         Parameters
         ----------
-        a: 2darray of complex128
-            Array of the same shape as the ones that will later be
-            passed to the methods `transform` and `inverse_transform`
+        a: 2darray of complex128 or complex64
+            Array of the same shape and type as the ones that will later
+            be passed to the methods `transform` and `inverse_transform`
         """
         # Perform a few checks on the array type and shape
         assert a.ndim == 2
-        assert a.dtype == np.complex128
+        assert a.dtype in [ np.complex128, np.complex64 ]
         self.shape = a.shape
+        self.dtype = a.dtype
 
         # Prepare the descriptor for the FFT:
-        # from complex128 to complex128, along the axis 0 of a 2D array
+        # from complex to complex, along the axis 0 of a 2D array
         descriptor = ctypes.c_void_p(0)
         length = ctypes.c_int(a.shape[0])
-        ifft_scale = ctypes.c_double( 1. / a.shape[0] )
+        if a.dtype == np.complex128:
+            precision = DFTI_DOUBLE
+            ifft_scale = ctypes.c_double( 1. / a.shape[0] )
+        else:
+            precision = DFTI_SINGLE
+            ifft_scale = ctypes.c_float( 1. / a.shape[0] )
         n_transforms = ctypes.c_int(a.shape[1])
         distance = ctypes.c_int(a.strides[1] // a.itemsize)
         # For strides, the C type used *must* be long
         strides = (ctypes.c_long*2)(0, a.strides[0] // a.itemsize)
         mkl.DftiCreateDescriptor( ctypes.byref(descriptor),
-            DFTI_DOUBLE, DFTI_COMPLEX, ctypes.c_int(1), length)
+            precision, DFTI_COMPLEX, ctypes.c_int(1), length)
         mkl.DftiSetValue(descriptor, DFTI_NUMBER_OF_TRANSFORMS, n_transforms)
         mkl.DftiSetValue(descriptor, DFTI_INPUT_DISTANCE, distance)
         mkl.DftiSetValue(descriptor, DFTI_OUTPUT_DISTANCE, distance)
@@ -100,13 +107,14 @@ class MKLFFT( object ):
 
         Parameters
         ----------
-        array_in, array_out: 2darrays of complex128
+        array_in, array_out: 2darrays of complex128 or complex64
+            (same type as the array used at initialization)
         """
         # Perform a few checks
         assert array_in.shape == self.shape
-        assert array_in.dtype == np.complex128
+        assert array_in.dtype == self.dtype
         assert array_out.shape == self.shape
-        assert array_out.dtype == np.complex128
+        assert array_out.dtype == self.dtype
 
         # Compute the FFT
         mkl.DftiComputeForward( self.descriptor,
@@ -120,13 +128,14 @@ class MKLFFT( object ):
 
         Parameters
         ----------
-        array_in, array_out: 2darrays of complex128
+        array_in, array_out: 2darrays of complex128 or complex64
+            (same type as the array used at initialization)
         """
         # Perform a few checks
         assert array_in.shape == self.shape
-        assert array_in.dtype == np.complex128
+        assert array_in.dtype == self.dtype
         assert array_out.shape == self.shape
-        assert array_out.dtype == np.complex128
+        assert array_out.dtype == self.dtype
 
         # Compute the FFT
         mkl.DftiComputeBackward( self.descriptor,
@@ -53,6 +53,73 @@ def numba_copy_2dR_to_2dC( array_in, array_out ) :
         for ir in range(Nr):
             array_out[iz, ir] = array_in[iz, ir] + 1.j*array_in[iz+Nz, ir]
 
+@njit_parallel
+def numba_copy_2dC_to_2dR_transposed( array_in, ir_start, array_out ) :
+    """
+    Store the columns `ir_start` to `ir_start+N` of the complex Nz x Nr
+    array `array_in` into the real N x 2Nz array `array_out` (i.e. in
+    transposed form), by storing the real part in the first Nz elements
+    of `array_out` along its last axis, and the imaginary part in the next
+    Nz elements.
+
+    Parameters :
+    ------------
+    array_in: 2darray of complexs
+        Array of shape (Nz, Nr)
+    ir_start: int
+        Index of the first column of `array_in` that is copied
+    array_out: 2darray of reals
+        Array of shape (N, 2*Nz)
+    """
+    N = array_out.shape[0]
+    Nz = array_in.shape[0]
+
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    for iz in prange(Nz):
+        for i in range(N):
+            array_out[i, iz] = array_in[iz, ir_start+i].real
+            array_out[i, iz+Nz] = array_in[iz, ir_start+i].imag
+
+@njit_parallel
+def numba_copy_2dR_to_2dC_transposed( array_in, array_out ) :
+    """
+    Reconstruct the complex Nz x N array `array_out`,
+    from the real N x 2Nz array `array_in` (i.e. in transposed form),
+    by interpreting the first Nz elements of `array_in` along its last
+    axis as the real part, and the next Nz elements as the imaginary part.
+
+    Parameters :
+    ------------
+    array_in: 2darray of reals
+        Array of shape (N, 2*Nz)
+    array_out: 2darray of complexs
+        Array of shape (Nz, N)
+    """
+    Nz, N = array_out.shape
+
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    for iz in prange(Nz):
+        for i in range(N):
+            array_out[iz, i] = array_in[i, iz] + 1.j*array_in[i, iz+Nz]
+
+@njit_parallel
+def numba_copy_2d( array_in, array_out ) :
+    """
+    Copy the 2d array `array_in` into the 2d array `array_out`
+    (which may have a different precision, e.g. complex64 / complex128)
+
+    Parameters :
+    ------------
+    array_in, array_out: 2darrays of complexs
+        Arrays of shape (Nz, Nr)
+    """
+    Nz, Nr = array_in.shape
+
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    for iz in prange(Nz):
+        for ir in range(Nr):
+            array_out[iz, ir] = array_in[iz, ir]
+
 # ----------------------------------------------------
 # Functions that combine components in spectral space
 # ----------------------------------------------------
@@ -101,3 +168,203 @@ def numba_pm_to_rt( buffer_p, buffer_m, buffer_r, buffer_t ) :
             # Combine the values
             buffer_r[iz, ir] =     ( value_p + value_m )
             buffer_t[iz, ir] = 1.j*( value_p - value_m )
+
+# -----------------------------------------------------------
+# Functions used by the BatchedSpectralTransformer
+# (The components r, t, z of `n_fields` vector fields are stored side by
+# side along axis 1 of a complex (Nz, 3*n_fields*Nr) buffer, so that they
+# can be Fourier-transformed in one batch ; the spectral components p, m, z
+# are stored one above the other along axis 0 of real (2*n_fields*Nz, Nr)
+# buffers, with one buffer per order of the DHT, so that each order can be
+# Hankel-transformed with one matrix product.)
+# -----------------------------------------------------------
+
+@njit_parallel
+def numba_stack_vect( array_r, array_t, array_z, buffer, i_field ) :
+    """
+    Copy the components r, t, z of a field on the interpolation grid
+    into the columns of `buffer` that correspond to the field `i_field`
+    (The arrays may have a different precision than the buffer.)
+    """
+    Nz, Nr = array_r.shape
+    col = 3*i_field*Nr
+
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    for iz in prange(Nz):
+        for ir in range(Nr):
+            buffer[iz, col+ir] = array_r[iz, ir]
+            buffer[iz, col+Nr+ir] = array_t[iz, ir]
+            buffer[iz, col+2*Nr+ir] = array_z[iz, ir]
+
+@njit_parallel
+def numba_unstack_vect( buffer, i_field, array_r, array_t, array_z ) :
+    """
+    Copy the columns of `buffer` that correspond to the field `i_field`
+    into the components r, t, z of a field on the interpolation grid
+    (The arrays may have a different precision than the buffer.)
+    """
+    Nz, Nr = array_r.shape
+    col = 3*i_field*Nr
+
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    for iz in prange(Nz):
+        for ir in range(Nr):
+            array_r[iz, ir] = buffer[iz, col+ir]
+            array_t[iz, ir] = buffer[iz, col+Nr+ir]
+            array_z[iz, ir] = buffer[iz, col+2*Nr+ir]
+
+@njit_parallel
+def numba_rt_to_pm_real( buffer, i_field, real_p, real_m, real_z ) :
+    """
+    Combine the components r and t of the field `i_field` in `buffer`
+    into the components p and m (see `numba_rt_to_pm`), and store the
+    components p, m, z as real arrays (see `numba_copy_2dC_to_2dR`), in
+    the rows of `real_p`, `real_m`, `real_z` that correspond to `i_field`
+    """
+    Nz = buffer.shape[0]
+    Nr = real_p.shape[1]
+    col = 3*i_field*Nr
+    row = 2*i_field*Nz
+
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    for iz in prange(Nz):
+        for ir in range(Nr):
+            value_r = buffer[iz, col+ir]
+            value_t = buffer[iz, col+Nr+ir]
+            value_z = buffer[iz, col+2*Nr+ir]
+            value_p = 0.5*( value_r - 1.j*value_t )
+            value_m = 0.5*( value_r + 1.j*value_t )
+            real_p[row+iz, ir] = value_p.real
+            real_p[row+Nz+iz, ir] = value_p.imag
+            real_m[row+iz, ir] = value_m.real
+            real_m[row+Nz+iz, ir] = value_m.imag
+            real_z[row+iz, ir] = value_z.real
+            real_z[row+Nz+iz, ir] = value_z.imag
+
+@njit_parallel
+def numba_real_to_rt( real_p, real_m, real_z, i_field, buffer ) :
+    """
+    Reconstruct the complex components p, m, z of the field `i_field`
+    from the real arrays `real_p`, `real_m`, `real_z`, combine them into
+    the components r and t (see `numba_pm_to_rt`), and store the
+    components r, t, z in the columns of `buffer` that correspond to `i_field`
+    """
+    Nz = buffer.shape[0]
+    Nr = real_p.shape[1]
+    col = 3*i_field*Nr
+    row = 2*i_field*Nz
+
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    for iz in prange(Nz):
+        for ir in range(Nr):
+            value_p = real_p[row+iz, ir] + 1.j*real_p[row+Nz+iz, ir]
+            value_m = real_m[row+iz, ir] + 1.j*real_m[row+Nz+iz, ir]
+            value_z = real_z[row+iz, ir] + 1.j*real_z[row+Nz+iz, ir]
+            buffer[iz, col+ir] =     ( value_p + value_m )
+            buffer[iz, col+Nr+ir] = 1.j*( value_p - value_m )
+            buffer[iz, col+2*Nr+ir] = value_z
+
+@njit_parallel
+def numba_vect_to_real( array_p, array_m, array_z, i_field,
+                        real_p, real_m, real_z ) :
+    """
+    Store the complex spectral components p, m, z of a field as real
+    arrays (see `numba_copy_2dC_to_2dR`), in the rows of
+    `real_p`, `real_m`, `real_z` that correspond to the field `i_field`
+    """
+    Nz, Nr = array_p.shape
+    row = 2*i_field*Nz
+
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    for iz in prange(Nz):
+        for ir in range(Nr):
+            real_p[row+iz, ir] = array_p[iz, ir].real
+            real_p[row+Nz+iz, ir] = array_p[iz, ir].imag
+            real_m[row+iz, ir] = array_m[iz, ir].real
+            real_m[row+Nz+iz, ir] = array_m[iz, ir].imag
+            real_z[row+iz, ir] = array_z[iz, ir].real
+            real_z[row+Nz+iz, ir] = array_z[iz, ir].imag
+
+@njit_parallel
+def numba_real_to_vect( real_p, real_m, real_z, i_field,
+                        array_p, array_m, array_z ) :
+    """
+    Reconstruct the complex spectral components p, m, z of a field
+    from the rows of `real_p`, `real_m`, `real_z` that correspond
+    to the field `i_field` (see `numba_copy_2dR_to_2dC`)
+    """
+    Nz, Nr = array_p.shape
+    row = 2*i_field*Nz
+
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    for iz in prange(Nz):
+        for ir in range(Nr):
+            array_p[iz, ir] = real_p[row+iz, ir] + 1.j*real_p[row+Nz+iz, ir]
+            array_m[iz, ir] = real_m[row+iz, ir] + 1.j*real_m[row+Nz+iz, ir]
+            array_z[iz, ir] = real_z[row+iz, ir] + 1.j*real_z[row+Nz+iz, ir]
+
+# -----------------------------------------------------------
+# Functions used by the LowMemoryDHT
+# (Lagrange interpolation from/to a logarithmic grid, along axis 1)
+# -----------------------------------------------------------
+
+@njit_parallel
+def numba_lagrange_interp( array_in, start, weights, array_out ) :
+    """
+    Interpolate the rows of `array_in` (given on a logarithmic grid)
+    at the points of `array_out`, i.e. for each point j:
+    array_out[:, j] = sum_a weights[j, a] * array_in[:, start[j]+a]
+
+    Parameters :
+    ------------
+    array_in: 2darray of reals
+        Array of shape (n_rows, n_in)
+    start: 1darray of ints
+        Index of the first point of the stencil, for each point of array_out
+    weights: 2darray of reals
+        Weights of the stencil, of shape (n_out, n_weights)
+    array_out: 2darray of reals
+        Array of shape (n_rows, n_out)
+    """
+    n_rows, n_out = array_out.shape
+    n_weights = weights.shape[1]
+
+    # Loop over the rows (parallel, if threading is installed)
+    for i in prange(n_rows):
+        for j in range(n_out):
+            value = 0.
+            for a in range(n_weights):
+                value += weights[j, a] * array_in[i, start[j]+a]
+            array_out[i, j] = value
+
+@njit_parallel
+def numba_lagrange_spread( array_in, start, weights, array_out ) :
+    """
+    Spread the rows of `array_in` onto the logarithmic grid of `array_out`
+    (i.e. apply the transpose of `numba_lagrange_interp`):
+    array_out[:, start[j]+a] += weights[j, a] * array_in[:, j]
+    The array `array_out` is set to zero beforehand.
+
+    Parameters :
+    ------------
+    array_in: 2darray of reals
+        Array of shape (n_rows, n_in)
+    start: 1darray of ints
+        Index of the first point of the stencil, for each point of array_in
+    weights: 2darray of reals
+        Weights of the stencil, of shape (n_in, n_weights)
+    array_out: 2darray of reals
+        Array of shape (n_rows, n_out)
+    """
+    n_rows, n_in = array_in.shape
+    n_out = array_out.shape[1]
+    n_weights = weights.shape[1]
+
+    # Loop over the rows (parallel, if threading is installed)
+    for i in prange(n_rows):
+        for l in range(n_out):
+            array_out[i, l] = 0.
+        for j in range(n_in):
+            value = array_in[i, j]
+            for a in range(n_weights):
+                array_out[i, start[j]+a] += weights[j, a] * value
@@ -8,9 +8,12 @@ the fields from the interpolation grid to the spectral grid and vice-versa.
 """
 import numpy as np
 from .hankel import DHT
+from .lowmem_hankel import LowMemoryDHT
+from .distributed_hankel import DistributedDHT
 from .fourier import FFT
 
 from .numba_methods import numba_rt_to_pm, numba_pm_to_rt
+from fbpic.utils.precision import real_dtype
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed, cuda
 if cuda_installed:
@@ -38,7 +41,9 @@ class SpectralTransformer(object) :
         converts a vector field from the interpolation to the spectral grid
     """
 
-    def __init__(self, Nz, Nr, m, rmax, use_cuda=False ) :
+    def __init__(self, Nz, Nr, m, rmax, use_cuda=False, dtype=np.complex128,
+                    cache=None, dht_backend='matrix', radial_comm=None,
+                    n_radial_halo=0 ):
         """
         Initializes the dht and fft attributes, which contain auxiliary
         matrices allowing to transform the fields quickly
@@ -53,6 +58,33 @@ class SpectralTransformer(object) :
 
         rmax : float
             The size of the simulation box along r.
+
+        use_cuda : bool, optional
+            Whether to perform the transforms on the GPU
+
+        dtype : numpy complex type, optional
+            The precision of the spectral buffers and of the transforms
+            (either np.complex128 or np.complex64)
+
+        cache : a CoefficientCache object, or None, optional
+            If not None, the DHT matrices are loaded from this on-disk cache
+
+        dht_backend : string, optional
+            The algorithm of the Hankel transform: either 'matrix'
+            (dense matrix product, see hankel.py), 'low-memory' (without
+            the Nr x Nr matrices, but slower ; only on CPU, see
+            lowmem_hankel.py) or 'distributed'
+            (matrix product distributed over the ranks of `radial_comm`,
+            only on CPU, see distributed_hankel.py ; the spectral arrays
+            then only contain the local block of radial modes)
+
+        radial_comm : an mpi4py communicator, optional
+            The communicator of the ranks that share the 'distributed' DHT
+
+        n_radial_halo : int, optional
+            The number of cells on each side of the local radial band, that
+            are also obtained by `spect2interp_scal` and `spect2interp_vect`
+            with `band_only=True` (only for the 'distributed' DHT)
         """
         # Check whether to use the GPU
         self.use_cuda = use_cuda
@@ -62,30 +94,44 @@ class SpectralTransformer(object) :
             # Initialize the dimension of the grid and blocks
             self.dim_grid, self.dim_block = cuda_tpb_bpg_2d( Nz, Nr)
 
-        # Initialize the DHT (local implementation, see hankel.py)
-        self.dht0 = DHT(  m, m, Nr, Nz, rmax, use_cuda=self.use_cuda )
-        self.dhtp = DHT(m+1, m, Nr, Nz, rmax, use_cuda=self.use_cuda )
-        self.dhtm = DHT(m-1, m, Nr, Nz, rmax, use_cuda=self.use_cuda )
+        # Initialize the DHT (see hankel.py, lowmem_hankel.py and
+        # distributed_hankel.py ; these classes have the same interface)
+        self.dht_backend = dht_backend
+        real_type = real_dtype( dtype )
+        if dht_backend == 'distributed':
+            dht_args = ( Nr, Nz, rmax, self.use_cuda, real_type, cache,
+                         radial_comm, n_radial_halo )
+            DHTClass = DistributedDHT
+        elif dht_backend == 'matrix':
+            dht_args = ( Nr, Nz, rmax, self.use_cuda, real_type, cache )
+            DHTClass = DHT
+        elif dht_backend == 'low-memory':
+            # (The arrays of the LowMemoryDHT are not cached)
+            dht_args = ( Nr, Nz, rmax, self.use_cuda, real_type )
+            DHTClass = LowMemoryDHT
+        else:
+            raise ValueError('Unknown DHT backend: %s' %dht_backend)
+        self.dht0 = DHTClass(  m, m, *dht_args )
+        self.dhtp = DHTClass(m+1, m, *dht_args )
+        self.dhtm = DHTClass(m-1, m, *dht_args )
 
         # Initialize the FFT
-        self.fft = FFT( Nr, Nz, use_cuda=self.use_cuda )
+        self.fft = FFT( Nr, Nz, use_cuda=self.use_cuda, dtype=dtype )
 
         # Initialize the spectral buffers
         if self.use_cuda:
-            self.spect_buffer_r = cuda.device_array(
-                (Nz, Nr), dtype=np.complex128)
-            self.spect_buffer_t = cuda.device_array(
-                (Nz, Nr), dtype=np.complex128)
+            self.spect_buffer_r = cuda.device_array( (Nz, Nr), dtype=dtype )
+            self.spect_buffer_t = cuda.device_array( (Nz, Nr), dtype=dtype )
         else:
             # Initialize the spectral buffers
-            self.spect_buffer_r = np.zeros( (Nz, Nr), dtype=np.complex128 )
-            self.spect_buffer_t = np.zeros( (Nz, Nr), dtype=np.complex128 )
+            self.spect_buffer_r = np.zeros( (Nz, Nr), dtype=dtype )
+            self.spect_buffer_t = np.zeros( (Nz, Nr), dtype=dtype )
 
         # Different names for same object (for economy of memory)
         self.spect_buffer_p = self.spect_buffer_r
         self.spect_buffer_m = self.spect_buffer_t
 
-    def spect2interp_scal( self, spect_array, interp_array ) :
+    def spect2interp_scal( self, spect_array, interp_array, band_only=False ):
         """
         Convert a scalar field from the spectral grid
         to the interpolation grid.
@@ -100,15 +146,20 @@ class SpectralTransformer(object) :
         interp_array : 2darray of complexs
            A complex array representing the fields on the interpolation
            grid, and which is overwritten by this function.
+
+        band_only : bool, optional
+           With the 'distributed' DHT: whether to only obtain the cells of
+           the local radial band and its halo (see DistributedDHT)
         """
         # Perform the inverse DHT (along axis -1, which corresponds to r)
-        self.dht0.inverse_transform( spect_array, self.spect_buffer_r )
+        self.dht0.inverse_transform( spect_array, self.spect_buffer_r,
+                                     band_only )
 
         # Then perform the inverse FFT (along axis 0, which corresponds to z)
         self.fft.inverse_transform( self.spect_buffer_r, interp_array )
 
     def spect2interp_vect( self, spect_array_p, spect_array_m,
-                          interp_array_r, interp_array_t ) :
+                          interp_array_r, interp_array_t, band_only=False ):
         """
         Convert a transverse vector field in the spectral space (e.g. Ep, Em)
         to the interpolation grid (e.g. Er, Et)
@@ -123,10 +174,16 @@ class SpectralTransformer(object) :
         interp_array_r, interp_array_t : 2darray
            Complex arrays representing the fields on the interpolation
            grid, and which are overwritten by this function.
+
+        band_only : bool, optional
+           With the 'distributed' DHT: whether to only obtain the cells of
+           the local radial band and its halo (see DistributedDHT)
         """
         # Perform the inverse DHT (along axis -1, which corresponds to r)
-        self.dhtp.inverse_transform( spect_array_p, self.spect_buffer_p )
-        self.dhtm.inverse_transform( spect_array_m, self.spect_buffer_m )
+        self.dhtp.inverse_transform( spect_array_p, self.spect_buffer_p,
+                                     band_only )
+        self.dhtm.inverse_transform( spect_array_m, self.spect_buffer_m,
+                                     band_only )
 
         # Combine the p and m components to obtain the r and t components
         if self.use_cuda :
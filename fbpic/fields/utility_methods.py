@@ -183,3 +183,31 @@ def get_stencil_reach(Nz, dz, cdt, n_order, v_comoving, use_galilean):
     # (Note: The stencil reach depends only weakly on kperp)
 
     return stencil_reach(kz, 0.5, cdt, v_comoving, use_galilean)
+
+
+def get_radial_domain_bounds(Nr, n_radial_domains):
+    """
+    Return the indices of the first radial cell of each radial domain
+    (and the total number of cells, as last element), when the radial
+    cells (and the radial modes of the spectral grid) are divided between
+    `n_radial_domains` MPI ranks. The cells are divided equally between
+    the ranks, and the last rank gets the extra cells.
+
+    Parameters:
+    ----------
+    Nr: int
+        The number of cells in the radial direction
+
+    n_radial_domains: int
+        The number of radial domains
+
+    Returns:
+    -------
+    A 1darray of ints, of size `n_radial_domains+1`
+    """
+    Nr_per_domain = int(Nr/n_radial_domains)
+    if Nr_per_domain < 1:
+        raise ValueError('The number of radial domains (%d) is larger '
+            'than the number of radial cells (%d).' %(n_radial_domains, Nr))
+    return np.array( [ k*Nr_per_domain for k in range(n_radial_domains) ]
+                     + [ Nr ] )
@@ -8,8 +8,6 @@ It defines a set of utilities for the initialization of an electron bunch.
 import numpy as np
 from scipy.constants import m_e, c, e, epsilon_0, mu_0
 from fbpic.fields import Fields
-from fbpic.particles.elementary_process.cuda_numba_utils import \
-    reallocate_and_copy_old
 from fbpic.particles.injection import BallisticBeforePlane
 import warnings
 
@@ -391,9 +389,12 @@ def add_elec_bunch_from_arrays( sim, x, y, z, ux, uy, uz, w,
                                         x, y, z, ux, uy, uz, inv_gamma )
 
     # Select the particles that are in the local subdomain
+    # (and in the local radial band, with a decomposition along r)
     zmin, zmax = sim.comm.get_zmin_zmax(
         local=True, with_damp=False, with_guard=False, rank=sim.comm.rank )
-    selected = (z >= zmin) & (z < zmax)
+    rmin, rmax = sim.comm.get_rmin_rmax()
+    r = np.sqrt( x**2 + y**2 )
+    selected = (z >= zmin) & (z < zmax) & (r >= rmin) & (r < rmax)
     x = x[selected]
     y = y[selected]
     z = z[selected]
@@ -406,9 +407,9 @@ def add_elec_bunch_from_arrays( sim, x, y, z, ux, uy, uz, w,
     # Create electron species with no macroparticles
     relat_elec = sim.add_new_species( q=-e, m=m_e )
 
-    # Reallocate empty arrays with the right number of electrons
+    # Resize the (empty) particle arrays to the right number of electrons
     Ntot = len(x)
-    reallocate_and_copy_old( relat_elec, relat_elec.use_cuda, 0, Ntot )
+    relat_elec.resize_particle_arrays( Ntot )
 
     # Fill the empty particle arrays with the right values
     relat_elec.x[:] = x[:]
@@ -449,18 +450,18 @@ def get_space_charge_fields( sim, ptcl, direction='forward' ):
         Can be either "forward" or "backward".
         Propagation direction of the beam.
     """
-    if sim.comm.rank == 0:
+    if sim.comm.world_rank == 0:
         print("Calculating initial space charge field...")
 
     # Calculate the mean gamma by computing weighted sum on each subdomain
     w_sum_local = ptcl.w.sum()
     w_gamma_sum_local = (ptcl.w*1./ptcl.inv_gamma).sum()
-    if sim.comm.mpi_comm is None:
+    if sim.comm.world_comm is None:
         w_sum = w_sum_local
         w_gamma_sum = w_gamma_sum_local
     else:
-        w_sum = sim.comm.mpi_comm.allreduce(w_sum_local)
-        w_gamma_sum = sim.comm.mpi_comm.allreduce(w_gamma_sum_local)
+        w_sum = sim.comm.world_comm.allreduce(w_sum_local)
+        w_gamma_sum = sim.comm.world_comm.allreduce(w_gamma_sum_local)
     # Check that the number of particles is not 0
     if w_sum == 0:
         warnings.warn(
@@ -531,7 +532,7 @@ def get_space_charge_fields( sim, ptcl, direction='forward' ):
             local_field = getattr( sim.fld.interp[m], field )
             local_field[ iz_in_array:iz_in_array+Nz_local, : ] += local_array
 
-    if sim.comm.rank == 0:
+    if sim.comm.world_rank == 0:
         print("Done.\n")
 
 
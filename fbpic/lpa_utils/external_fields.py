@@ -1,7 +1,7 @@
 # Copyright 2016, FBPIC contributors
 # Authors: Remi Lehe, Manuel Kirchen
 # License: 3-Clause-BSD-LBNL
-from numba import vectorize, float64, njit
+from numba import vectorize, float32, float64, njit
 from scipy.constants import c
 inv_c = 1./c
 import numpy as np
@@ -125,7 +125,14 @@ class ExternalField( object ):
             func = field_func
 
         # Compile the field_func for cpu and gpu
-        signature = [ float64( float64, float64, float64,
+        # (The single-precision signatures are listed first, so that they
+        # are selected for single-precision and mixed-precision particles,
+        # see the argument `precision` of the `Simulation` class)
+        signature = [ float32( float32, float32, float32,
+                               float32, float64, float64, float64 ),
+                      float32( float32, float64, float64,
+                               float64, float64, float64, float64 ),
+                      float64( float64, float64, float64,
                                float64, float64, float64, float64 ) ]
         cpu_compiler = vectorize( signature, target='cpu', nopython=True )
         self.cpu_func = cpu_compiler( func )
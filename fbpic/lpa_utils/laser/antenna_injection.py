@@ -194,10 +194,13 @@ class LaserAntenna( object ):
         """
         # Check if the antenna is in the local physical domain
         # and update the flag `deposit_on_this_rank` accordingly
+        # (With a decomposition along r, the deposited sources are summed
+        # over the radial domains: only the first radial domain deposits)
         zmin_local, zmax_local = comm.get_zmin_zmax(
             local=True, with_damp=True, with_guard=False, rank=comm.rank )
         z_antenna = self.baseline_z[0]
-        if (z_antenna >= zmin_local) and (z_antenna < zmax_local):
+        if (z_antenna >= zmin_local) and (z_antenna < zmax_local) \
+                and (comm.r_rank == 0):
             self.deposit_on_this_rank = True
         else:
             self.deposit_on_this_rank = False
@@ -34,7 +34,7 @@ def add_laser_direct( sim, laser_profile, boost ):
     boost: a BoostConverter object or None
        Contains the information about the boost to be applied
     """
-    if sim.comm.rank == 0:
+    if sim.comm.world_rank == 0:
         print("Initializing laser pulse on the mesh...")
 
     # Get the local azimuthally-decomposed laser fields Er and Et on each proc
@@ -96,7 +96,7 @@ def add_laser_direct( sim, laser_profile, boost ):
             local_field = getattr( sim.fld.interp[m], field )
             local_field[ iz_in_array:iz_in_array+Nz_local, : ] += local_array
 
-    if sim.comm.rank == 0:
+    if sim.comm.world_rank == 0:
         print("Done.\n")
 
 
@@ -25,10 +25,12 @@ import numba
 import numpy as np
 from scipy.constants import m_e, m_p, e, c
 from .utils.printing import ProgressBar, print_simulation_setup
+from .utils.precision import get_dtypes
+from .utils.profiler import Profiler, get_species_name
 from .particles import Particles
 from .lpa_utils.boosted_frame import BoostConverter
 from .fields import Fields
-from .boundaries import BoundaryCommunicator, MovingWindow
+from .boundaries import BoundaryCommunicator, MovingWindow, LoadBalancer
 
 class Simulation(object):
     """
@@ -53,7 +55,11 @@ class Simulation(object):
                  current_correction='curl-free', boundaries='periodic',
                  gamma_boost=None, use_all_mpi_ranks=True,
                  particle_shape='linear', verbose_level=1,
-                 smoother=None ):
+                 smoother=None, precision='double', cache_dir=None,
+                 transform_engine='per-component', dht_backend='matrix',
+                 cpu_deposition='particle-chunks', n_radial_domains=1,
+                 particle_removal='compact', fused_particle_push=False,
+                 fused_field_solve=False, gpu_kernels='hand-written' ):
         """
         Initializes a simulation.
 
@@ -196,6 +202,159 @@ class Simulation(object):
         smoother: an instance of :any:`BinomialSmoother`, optional
             Determines how the charge and currents are smoothed.
             (Default: one-pass binomial filter and no compensator.)
+
+        precision: str, optional
+            The floating-point precision of the field and particle arrays.
+
+            - 'double' (default): all arrays are in double precision
+            - 'single': all arrays are in single precision (complex64
+              and float32), which halves the memory footprint but
+              reduces the accuracy of the simulation
+            - 'mixed': the fields E and B on the interpolation grid and
+              the particle momenta, weights and gathered fields are in
+              single precision, while the particle positions, the deposited
+              charge/current and the fields in spectral space (which are
+              accumulated over many particles or timesteps) remain in
+              double precision
+
+        cache_dir: str or None, optional
+            Path to a directory where the matrices of the discrete Hankel
+            transform and the coefficients of the PSATD scheme are stored,
+            after being computed. Subsequent simulations with the same
+            grid and timestep (e.g. in a parameter scan) then load these
+            arrays from disk instead of recomputing them. This directory
+            can be shared by all MPI ranks (a lock file ensures that
+            each array is computed only once).
+            If None, the environment variable FBPIC_CACHE_DIR is used,
+            if it is set; otherwise, no cache is used.
+
+        transform_engine: str, optional
+            How the fields E, B and J are transformed between the
+            interpolation grid and the spectral grid.
+
+            - 'per-component' (default): each component is transformed
+              separately
+            - 'batched': for each azimuthal mode, all the components of E and
+              B are transformed in one batched FFT and one matrix product per
+              order of the Hankel transform. This reduces the Python overhead
+              and is typically faster for small grids. (Only available on CPU.)
+
+        dht_backend: str, optional
+            The algorithm of the discrete Hankel transform (along r).
+
+            - 'matrix' (default): dense matrix product, with O(Nr^2)
+              operations and memory per transform
+            - 'low-memory': the Bessel kernel is interpolated onto a
+              logarithmic grid, where the transform becomes a correlation
+              that is evaluated with FFTs. This uses O(Nr) memory, and
+              avoids the O(Nr^3) setup of the matrices, but each transform
+              is about 10 to 40 times slower than the matrix product, with
+              a relative error of order 1.e-5. (Only available on CPU, and
+              with the 'per-component' transform engine.)
+            - 'auto': uses 'low-memory' only when the dense matrices of
+              all the modes would take more than a few GB of memory (the
+              matrix product is faster whenever the matrices fit in
+              memory), and 'matrix' otherwise
+
+        cpu_deposition: str, optional
+            How the charge and current of the particles are deposited on
+            the grid, when running on CPU with several threads.
+            (This is ignored when running on GPU.)
+
+            - 'particle-chunks' (default): each thread deposits a
+              contiguous chunk of the particle arrays into its own copy of
+              the grid, and the copies are summed afterwards. The memory
+              and the time of the sum scale with the number of threads.
+            - 'sorted-tiles': the particles are sorted by cell (with a
+              counting sort), and the grid is divided into tiles along z.
+              Each thread deposits the particles of one tile into a small
+              tile-local array, which is then added to a single copy of
+              the grid. The particles are only sorted again when one
+              of them has moved by more than a few cells outside of its
+              tile. The sorted order also improves the memory locality
+              of the field gathering.
+            - 'z-chunks': the particles are sorted by cell (as for
+              'sorted-tiles'), and the grid is divided into one contiguous
+              chunk along z per thread, such that the chunks contain
+              similar numbers of particles. Each thread deposits directly
+              into its own chunk of a single copy of the grid; only the
+              contributions to the few cells on each side of the chunk
+              (halos) are stored separately and added at the end.
+              Thus, the memory does not scale with the number of threads,
+              and the reduction only involves the halos.
+
+        n_radial_domains: int, optional
+            The number of domains along r, when running with MPI.
+            The MPI ranks are then divided into groups of `n_radial_domains`
+            consecutive ranks, and the simulation is decomposed along z
+            between these groups (the total number of MPI ranks should
+            thus be a multiple of `n_radial_domains`). Within each group,
+            each rank holds the particles of one band of radii and one block
+            of the radial modes in spectral space (as well as the
+            corresponding rows of the Hankel transform matrices). The
+            arrays of the interpolation grid cover all the radial cells,
+            but at each iteration, the fields are only transformed back to
+            the interpolation grid in the radial band of the rank (and a
+            few cells on each side of it) ; the full fields are only
+            obtained when needed (e.g. by the diagnostics).
+            This reduces the memory and the cost of the Hankel transforms
+            per rank for large radial grids. (Only available on CPU.)
+
+        particle_removal: str, optional
+            How the particles that leave the local domain (through the
+            open boundaries, or towards a neighboring MPI domain) are
+            removed from the particle arrays.
+
+            - 'compact' (default): the remaining particles are compacted
+              in place at each exchange of particles.
+            - 'mask': the removed particles are only marked as dead (with
+              a zero weight and a zero momentum, and skipped by the field
+              gathering and the push), so that only these particles are
+              accessed at each exchange. The particle arrays
+              are compacted in bulk once the dead particles represent more
+              than a fraction `dead_particle_fraction_threshold` (in
+              `fbpic.particles.particles`) of the particles, and before
+              ionization or Compton scattering. This is advantageous when
+              many particles leave the domain at each exchange (e.g. in
+              boosted-frame simulations). (Only available on CPU.)
+
+        fused_particle_push: bool, optional
+            Whether to gather the fields, push the momenta and push the
+            positions of the particles in a single pass over the particles
+            (with 2 azimuthal modes). The gathered fields are then not
+            stored in the arrays Ex, Ey, Ez, Bx, By, Bz of the species,
+            which reduces the memory traffic. For each species, the
+            separate gathering and push are still used at the iterations
+            where these arrays are needed (i.e. when external fields are
+            applied to this species, or when a diagnostic writes them),
+            as well as for ionizable species and for particles that are
+            ballistic before a plane.
+
+        fused_field_solve: bool, optional
+            Whether to filter the sources, correct the currents and push
+            the fields E and B in a single pass over the spectral grid
+            (see `Fields.push`), instead of calling the separate kernels.
+            This reduces the memory traffic. (Only available on CPU ; the
+            separate kernels are still used when the corrected currents
+            need to be exchanged via MPI before the push.)
+
+        gpu_kernels: str, optional
+            Which kernels gather the fields and deposit the charge and
+            current on GPU, when `Nm` is not 2 (the optimized kernels for
+            2 modes are always used when `Nm` is 2).
+
+            - 'hand-written' (default): the fields of each mode are
+              gathered, and the charge and current of each mode are
+              deposited, by a separate launch of the same kernel.
+            - 'generated': the kernels are generated for the number of
+              modes `Nm` (see `fbpic/particles/kernel_generation.py`),
+              and handle all the modes in a single launch. These kernels
+              are compiled at their first use (and cached on disk when
+              the environment variable FBPIC_CACHE_DIR is set). They have
+              only been validated by executing their source on CPU, with
+              an emulation of CUDA.
+
+            (This is ignored when running on CPU.)
         """
         # Check whether to use CUDA
         self.use_cuda = use_cuda
@@ -204,6 +363,9 @@ class Simulation(object):
                 'Cuda not available for the simulation.\n'
                 'Performing the simulation on CPU.' )
             self.use_cuda = False
+        if self.use_cuda and (n_radial_domains > 1):
+            raise ValueError(
+                'The decomposition along r is not available on GPU.')
         # CPU multi-threading
         self.use_threading = threading_enabled
         if self.use_threading:
@@ -225,11 +387,15 @@ class Simulation(object):
             self.boost = None
         # Register time step
         self.dt = dt
+        # Register the floating-point precision (and check its value)
+        get_dtypes( precision )
+        self.precision = precision
 
         # Initialize the boundary communicator
         self.comm = BoundaryCommunicator( Nz, zmin, zmax, Nr, rmax, Nm, dt,
             self.v_comoving, self.use_galilean, boundaries, n_order,
-            n_guard, n_damp, None, exchange_period, use_all_mpi_ranks )
+            n_guard, n_damp, None, exchange_period, use_all_mpi_ranks,
+            n_radial_domains )
         # Modify domain region
         zmin, zmax, Nz = self.comm.divide_into_domain()
         # Initialize the field structure
@@ -241,11 +407,22 @@ class Simulation(object):
                     use_cuda=self.use_cuda,
                     smoother=smoother,
                     # Only create threading buffers when running on CPU
-                    create_threading_buffers=(self.use_cuda is False) )
+                    create_threading_buffers=(self.use_cuda is False),
+                    precision=self.precision, cache_dir=cache_dir,
+                    transform_engine=transform_engine,
+                    dht_backend=dht_backend,
+                    cpu_deposition=cpu_deposition,
+                    radial_comm=self.comm.r_comm,
+                    n_radial_halo=self.comm.n_radial_halo )
 
         # Initialize the electrons and the ions
         self.grid_shape = self.fld.interp[0].Ez.shape
         self.particle_shape = particle_shape
+        self.cpu_deposition = cpu_deposition
+        self.particle_removal = particle_removal
+        self.gpu_kernels = gpu_kernels
+        self.fused_particle_push = fused_particle_push
+        self.fused_field_solve = fused_field_solve
         self.ptcl = []
         # - Initialize the electrons
         self.add_new_species( q=-e, m=m_e, n=n_e, dens_func=dens_func,
@@ -273,6 +450,10 @@ class Simulation(object):
         self.checkpoints = []
         # Initialize an empty list of laser antennas
         self.laser_antennas = []
+        # Initialize an inactive profiler (see `set_profiler`)
+        self.profiler = Profiler( self.comm, use_cuda=self.use_cuda )
+        # Initialize an inactive load balancer (see `set_load_balancing`)
+        self.load_balancer = None
 
         # Print simulation setup
         print_simulation_setup( self, verbose_level=verbose_level )
@@ -328,9 +509,20 @@ class Simulation(object):
                     species.injector.initialize_injection_positions(
                         self.comm, self.comm.moving_win.v, species.z, self.dt )
 
+        # With `fused_field_solve`, the filtering of the sources, the current
+        # correction and the push of the fields are performed in a single
+        # pass over the spectral grid (on CPU), except when the corrected
+        # currents need to be exchanged via MPI between the correction
+        # and the push
+        fuse_field_solve = self.fused_field_solve and (not self.use_cuda) \
+            and not (correct_currents and self.comm.size > 1)
+
         # Initialize variables to measure the time taken by the simulation
-        if show_progress and self.comm.rank==0:
+        if show_progress and self.comm.world_rank==0:
             progress_bar = ProgressBar( N )
+        # Time spent in each phase of the PIC cycle (if activated)
+        prof = self.profiler
+        prof.start_step_loop()
 
         # Send simulation data to GPU (if CUDA is used)
         if self.use_cuda:
@@ -339,11 +531,16 @@ class Simulation(object):
         # Get the E and B fields in spectral space initially
         # (In the rest of the loop, E and B will only be transformed
         # from spectal space to real space, but never the other way around)
-        self.comm.exchange_fields(fld.interp, 'E', 'replace')
-        self.comm.exchange_fields(fld.interp, 'B', 'replace')
-        self.comm.damp_EB_open_boundary( fld.interp )
-        fld.interp2spect('E')
-        fld.interp2spect('B')
+        # (The sources on the interpolation grid may have been modified
+        # outside of this function: mark them as outdated)
+        fld.invalidate_interp('J')
+        fld.invalidate_interp('rho')
+        with prof.timer('exchange_fields'):
+            self.comm.exchange_fields(fld.interp, 'E', 'replace')
+            self.comm.exchange_fields(fld.interp, 'B', 'replace')
+            self.comm.damp_EB_open_boundary( fld.interp )
+        with prof.timer('interp2spect'):
+            fld.interp2spect('EB')
 
         # Beginning of the N iterations
         # -----------------------------
@@ -352,7 +549,7 @@ class Simulation(object):
         for i_step in range(N):
 
             # Show a progression bar and calculate ETA
-            if show_progress and self.comm.rank==0:
+            if show_progress and self.comm.world_rank==0:
                 progress_bar.time( i_step )
                 progress_bar.print_progress()
 
@@ -364,13 +561,21 @@ class Simulation(object):
             # of this loop (i_step == 0) in order to ensure that all
             # particles are inside the box, and that 'rho_prev' is correct
             if self.iteration % self.comm.exchange_period == 0 or i_step == 0:
+                # Modify the boundaries of the MPI subdomains if the load
+                # is imbalanced (the particles are then redistributed
+                # by the particle exchange below)
+                if self.load_balancer is not None:
+                    with prof.timer('load_balancing'):
+                        self.load_balancer.balance( self )
                 # Particle exchange includes MPI exchange of particles, removal
                 # of out-of-box particles and (if there is a moving window)
                 # continuous injection of new particles by the moving window.
                 # (In the case of single-proc periodic simulations, particles
                 # are shifted by one box length, so they remain inside the box)
-                for species in self.ptcl:
-                    self.comm.exchange_particles(species, fld, self.time)
+                for i_species, species in enumerate(self.ptcl):
+                    with prof.timer('exchange_particles',
+                                    get_species_name(i_species)):
+                        self.comm.exchange_particles(species, fld, self.time)
                 for antenna in self.laser_antennas:
                     antenna.update_current_rank(self.comm)
 
@@ -388,130 +593,255 @@ class Simulation(object):
             # ------------------
 
             # Gather the fields from the grid at t = n dt
-            for species in ptcl:
-                species.gather( fld.interp )
+            # (E and B are brought to the interpolation grid only if they
+            # are needed, i.e. if there are charged particles in this domain ;
+            # with a decomposition along r, the inverse transform involves
+            # all the ranks of the radial group, and is thus always done,
+            # but only for the radial band of this rank and its halo)
+            if (self.comm.r_size > 1) or any(
+                (species.q != 0) and (species.Ntot > 0) for species in ptcl ):
+                with prof.timer('spect2interp'):
+                    fld.require_interp('EB', band_only=True)
+            # (For the species whose gathering is fused with the push,
+            # the fields are gathered when pushing the particles)
+            fused = [ self.use_fused_push( species, move_positions,
+                        move_momenta ) for species in ptcl ]
+            for i_species, species in enumerate(ptcl):
+                if fused[i_species]:
+                    continue
+                with prof.timer('gather', get_species_name(i_species)):
+                    species.gather( fld.interp )
             # Apply the external fields at t = n dt
-            for ext_field in self.external_fields:
-                ext_field.apply_expression( self.ptcl, self.time )
+            with prof.timer('external_fields'):
+                for ext_field in self.external_fields:
+                    ext_field.apply_expression( self.ptcl, self.time )
 
             # Run the diagnostics
             # (after gathering ; allows output of gathered fields on particles)
             # (E, B, rho, x are defined at time n ; J, p at time n-1/2)
-            for diag in self.diags:
-                # Check if the diagnostic should be written at this iteration
-                # (If needed: bring rho/J from spectral space, where they
-                # were smoothed/corrected, and copy the data from the GPU.)
-                diag.write( self.iteration )
+            with prof.timer('diagnostics'):
+                for diag in self.diags:
+                    # Check if the diagnostic should be written at this
+                    # iteration (If needed: bring rho/J from spectral space,
+                    # where they were smoothed/corrected, and copy the data
+                    # from the GPU.)
+                    diag.write( self.iteration )
 
             # Push the particles' positions and velocities to t = (n+1/2) dt
+            for i_species, species in enumerate(ptcl):
+                if fused[i_species]:
+                    with prof.timer('gather_push',
+                                    get_species_name(i_species)):
+                        species.gather_push( fld.interp, 0.5*dt )
             if move_momenta:
-                for species in ptcl:
-                    species.push_p( self.time + 0.5*self.dt )
+                for i_species, species in enumerate(ptcl):
+                    if fused[i_species]:
+                        continue
+                    with prof.timer('push_p', get_species_name(i_species)):
+                        species.push_p( self.time + 0.5*self.dt )
             if move_positions:
-                for species in ptcl:
-                    species.push_x( 0.5*dt )
+                for i_species, species in enumerate(ptcl):
+                    if fused[i_species]:
+                        continue
+                    with prof.timer('push_x', get_species_name(i_species)):
+                        species.push_x( 0.5*dt )
             # Get positions/velocities for antenna particles at t = (n+1/2) dt
-            for antenna in self.laser_antennas:
-                antenna.update_v( self.time + 0.5*dt )
-                antenna.push_x( 0.5*dt )
+            with prof.timer('push_x', 'antennas'):
+                for antenna in self.laser_antennas:
+                    antenna.update_v( self.time + 0.5*dt )
+                    antenna.push_x( 0.5*dt )
             # Shift the boundaries of the grid for the Galilean frame
             if self.use_galilean:
                 self.shift_galilean_boundaries( 0.5*dt )
 
             # Get the current at t = (n+1/2) dt
             # (Guard cell exchange done either now or after current correction)
-            self.deposit('J', exchange=(correct_currents is False))
+            # (With the fused field solve, the filtering is done in `fld.push`)
+            # (The exchange of J is only completed after the deposition of
+            # rho_next, so that the MPI communication overlaps with it)
+            self.deposit('J', exchange=(correct_currents is False),
+                         apply_filter=(not fuse_field_solve),
+                         wait_exchange=False)
             # Perform cross-deposition if needed
             if correct_currents and fld.current_correction=='cross-deposition':
-                self.cross_deposit( move_positions )
+                self.cross_deposit( move_positions,
+                                    apply_filter=(not fuse_field_solve) )
 
             # Handle elementary processes at t = (n + 1/2)dt
             # i.e. when the particles' velocity and position are synchronized
             # (e.g. ionization, Compton scattering, ...)
-            for species in ptcl:
-                species.handle_elementary_processes( self.time + 0.5*dt )
+            for i_species, species in enumerate(ptcl):
+                with prof.timer('elementary_processes',
+                                get_species_name(i_species)):
+                    species.handle_elementary_processes( self.time + 0.5*dt )
 
             # Push the particles' positions to t = (n+1) dt
             if move_positions:
-                for species in ptcl:
-                    species.push_x( 0.5*dt )
+                for i_species, species in enumerate(ptcl):
+                    with prof.timer('push_x', get_species_name(i_species)):
+                        species.push_x( 0.5*dt )
             # Get positions for antenna particles at t = (n+1) dt
-            for antenna in self.laser_antennas:
-                antenna.push_x( 0.5*dt )
+            with prof.timer('push_x', 'antennas'):
+                for antenna in self.laser_antennas:
+                    antenna.push_x( 0.5*dt )
             # Shift the boundaries of the grid for the Galilean frame
             if self.use_galilean:
                 self.shift_galilean_boundaries( 0.5*dt )
 
             # Get the charge density at t = (n+1) dt
-            self.deposit('rho_next', exchange=(use_true_rho is True))
-            # Correct the currents (requires rho at t = (n+1) dt )
-            if correct_currents:
-                fld.correct_currents( check_exchanges=(self.comm.size > 1) )
-                if self.comm.size > 1:
-                    # Exchange the guard cells of corrected J between domains
-                    # (If correct_currents is False, the exchange of J
-                    # is done in the function `deposit`)
-                    fld.spect2partial_interp('J')
-                    self.comm.exchange_fields(fld.interp, 'J', 'add')
-                    fld.partial_interp2spect('J')
-                fld.exchanged_source['J'] = True
-
-            # Push the fields E and B on the spectral grid to t = (n+1) dt
-            fld.push( use_true_rho, check_exchanges=(self.comm.size > 1) )
+            self.deposit('rho_next', exchange=(use_true_rho is True),
+                         apply_filter=(not fuse_field_solve))
+            # Complete the exchange of J, and get J on the spectral grid
+            self.finish_deposit('J', exchange=(correct_currents is False),
+                                apply_filter=(not fuse_field_solve))
+            if fuse_field_solve:
+                # Filter the sources, correct the currents (requires rho at
+                # t = (n+1) dt) and push the fields E and B on the spectral
+                # grid to t = (n+1) dt, in a single pass
+                # (The time of this fused pass is counted in `push_eb`)
+                with prof.timer('push_eb'):
+                    fld.push( use_true_rho,
+                              check_exchanges=(self.comm.size > 1),
+                              correct_currents=correct_currents,
+                              filter_sources=self.filter_currents )
+                if correct_currents:
+                    fld.exchanged_source['J'] = True
+            else:
+                # Correct the currents (requires rho at t = (n+1) dt )
+                if correct_currents:
+                    with prof.timer('correct_currents'):
+                        fld.correct_currents(
+                            check_exchanges=(self.comm.size > 1) )
+                    if self.comm.size > 1:
+                        # Exchange the guard cells of corrected J between
+                        # domains (If correct_currents is False, the exchange
+                        # of J is done in the function `deposit`)
+                        with prof.timer('spect2interp'):
+                            fld.spect2partial_interp('J')
+                        with prof.timer('exchange_fields'):
+                            self.comm.exchange_fields(fld.interp, 'J', 'add')
+                        with prof.timer('interp2spect'):
+                            fld.partial_interp2spect('J')
+                    fld.exchanged_source['J'] = True
+                # Push the fields E and B on the spectral grid to t = (n+1) dt
+                with prof.timer('push_eb'):
+                    fld.push( use_true_rho,
+                              check_exchanges=(self.comm.size > 1) )
             if correct_divE:
-                fld.correct_divE()
+                with prof.timer('correct_divE'):
+                    fld.correct_divE()
             # Move the grids if needed
             if self.comm.moving_win is not None:
                 # Shift the fields is spectral space and update positions of
                 # the interpolation grids
-                self.comm.move_grids(fld, ptcl, dt, self.time)
+                with prof.timer('moving_window'):
+                    self.comm.move_grids(fld, ptcl, dt, self.time)
 
-            # Get the MPI-exchanged and damped E and B field in both
-            # spectral space and interpolation space
+            # Get the MPI-exchanged and damped E and B field in spectral space
             # (Since exchange/damp operation is purely along z, spectral fields
             # are updated by doing an iFFT/FFT instead of a full transform)
-            fld.spect2partial_interp('E')
-            fld.spect2partial_interp('B')
-            self.comm.exchange_fields(fld.interp, 'E', 'replace')
-            self.comm.exchange_fields(fld.interp, 'B', 'replace')
-            self.comm.damp_EB_open_boundary( fld.interp )
-            fld.partial_interp2spect('E')
-            fld.partial_interp2spect('B')
-            # Get the corresponding fields in interpolation space
-            fld.spect2interp('E')
-            fld.spect2interp('B')
+            # (The exchange of E overlaps with the transform of B,
+            # and the exchange of B overlaps with the transform of E)
+            with prof.timer('spect2interp'):
+                fld.spect2partial_interp('E')
+            with prof.timer('exchange_fields'):
+                self.comm.start_exchange(fld.interp, 'E', 'replace')
+            with prof.timer('spect2interp'):
+                fld.spect2partial_interp('B')
+            with prof.timer('exchange_fields'):
+                self.comm.start_exchange(fld.interp, 'B', 'replace')
+                self.comm.finish_exchange(fld.interp, 'E', 'replace')
+                self.comm.damp_EB_open_boundary( fld.interp, 'E' )
+            with prof.timer('interp2spect'):
+                fld.partial_interp2spect('E')
+            with prof.timer('exchange_fields'):
+                self.comm.finish_exchange(fld.interp, 'B', 'replace')
+                self.comm.damp_EB_open_boundary( fld.interp, 'B' )
+            with prof.timer('interp2spect'):
+                fld.partial_interp2spect('B')
+            # (The corresponding fields in interpolation space are only
+            # obtained when needed, i.e. by the gathering or diagnostics,
+            # through `fld.require_interp`)
 
             # Increment the global time and iteration
             self.time += dt
             self.iteration += 1
 
             # Write the checkpoints if needed
-            for checkpoint in self.checkpoints:
-                checkpoint.write( self.iteration )
+            # (after the files of the diagnostics that are written in the
+            # background, so that these are complete when restarting)
+            with prof.timer('diagnostics'):
+                if any( checkpoint.is_output_iteration( self.iteration )
+                        for checkpoint in self.checkpoints ):
+                    for diag in self.diags:
+                        diag.flush()
+                for checkpoint in self.checkpoints:
+                    checkpoint.write( self.iteration )
+
+            # Get the time spent in each phase during this iteration
+            prof.end_iteration()
 
         # End of the N iterations
         # -----------------------
 
         # Finalize PIC loop
-        # Get the charge density and the current from spectral space.
-        fld.spect2interp('J')
-        if (not fld.exchanged_source['J']) and (self.comm.size > 1):
-            self.comm.exchange_fields(self.fld.interp, 'J', 'add')
-        fld.spect2interp('rho_prev')
-        if (not fld.exchanged_source['rho_prev']) and (self.comm.size > 1):
-            self.comm.exchange_fields(self.fld.interp, 'rho', 'add')
+        # Get the fields, the charge density and the current from spectral
+        # space (unless they are already up-to-date on the interpolation grid)
+        fld.require_interp('EB')
+        if fld.require_interp('J'):
+            if (not fld.exchanged_source['J']) and (self.comm.size > 1):
+                self.comm.exchange_fields(self.fld.interp, 'J', 'add')
+        if fld.require_interp('rho_prev'):
+            if (not fld.exchanged_source['rho_prev']) and (self.comm.size > 1):
+                self.comm.exchange_fields(self.fld.interp, 'rho', 'add')
 
         # Receive simulation data from GPU (if CUDA is used)
         if self.use_cuda:
             receive_data_from_gpu(self)
 
+        # Wait for the files that are written in the background
+        for diag in self.diags:
+            diag.flush()
+
         # Print the measured time taken by the PIC cycle
-        if show_progress and (self.comm.rank==0):
+        if show_progress and (self.comm.world_rank==0):
             progress_bar.print_summary()
+        # Aggregate, print and write the time spent in each phase
+        report = prof.end_step_loop( self.iteration )
+        if report is not None:
+            self.profiling_report = report
 
 
-    def deposit( self, fieldtype, exchange=False,
-                update_spectral=True, species_list=None ):
+    def use_fused_push( self, species, move_positions, move_momenta ):
+        """
+        Return whether the gathering and the push of `species` are
+        performed in a single pass at the current iteration
+        (see the argument `fused_particle_push` of the Simulation class)
+
+        Parameters
+        ----------
+        species: a Particles object
+            The species considered
+
+        move_positions, move_momenta: bool
+            Whether the positions and momenta are pushed (see `step`)
+        """
+        if not (self.fused_particle_push and move_positions and move_momenta):
+            return( False )
+        if not species.can_fuse_gather_push( self.fld.Nm ):
+            return( False )
+        # The gathered fields need to be stored if they are
+        # modified by external fields, or used by diagnostics
+        for ext_field in self.external_fields:
+            if (ext_field.species is None) or (ext_field.species is species):
+                return( False )
+        for diag in self.diags:
+            if diag.requires_gathered_fields( species, self.iteration ):
+                return( False )
+        return( True )
+
+    def deposit( self, fieldtype, exchange=False, update_spectral=True,
+                 species_list=None, apply_filter=True, wait_exchange=True ):
         """
         Deposit the charge or the currents to the interpolation grid
         and then to the spectral grid.
@@ -536,9 +866,23 @@ class Simulation(object):
         species_list: list of `Particles` objects, or None
             The species which that should deposit their charge/current.
             If this is None, all species (and antennas) deposit.
+
+        apply_filter: bool
+            Whether to filter the deposited field in spectral space
+            (only if `filter_currents` is True for this simulation).
+            This is set to False when the filtering is performed later,
+            within the fused field solve (see `Fields.push`).
+
+        wait_exchange: bool
+            Whether to complete the MPI exchange of the guard cells and
+            the transform to the spectral grid within this function.
+            If False, the exchange is only started, and `finish_deposit`
+            needs to be called later (with the same arguments), so that
+            other computations can overlap with the MPI communication.
         """
-        # Shortcut
+        # Shortcuts
         fld = self.fld
+        prof = self.profiler
         # If no species_list is provided, all species and antennas deposit
         if species_list is None:
             species_list = self.ptcl
@@ -554,46 +898,94 @@ class Simulation(object):
             fld.erase('rho')
             # Deposit the particle charge
             for species in species_list:
-                species.deposit( fld, 'rho' )
+                with prof.timer('deposit', self.get_species_name(species)):
+                    species.deposit( fld, 'rho' )
             # Deposit the charge of the virtual particles in the antenna
-            for antenna in antennas_list:
-                antenna.deposit( fld, 'rho' )
+            with prof.timer('deposit', 'antennas'):
+                for antenna in antennas_list:
+                    antenna.deposit( fld, 'rho' )
             # Sum contribution from each CPU threads (skipped on GPU)
-            fld.sum_reduce_deposition_array('rho')
+            with prof.timer('sum_reduce'):
+                fld.sum_reduce_deposition_array('rho')
             # Divide by cell volume
             fld.divide_by_volume('rho')
-            # Exchange guard cells if requested by the user
+            # Sum the sources of the radial domains (decomposition along r)
+            if self.comm.r_size > 1:
+                with prof.timer('exchange_fields'):
+                    self.comm.sum_radial_sources(fld.interp, 'rho')
+            # Start the exchange of the guard cells if requested by the user
             if exchange and self.comm.size > 1:
-                self.comm.exchange_fields(fld.interp, 'rho', 'add')
+                with prof.timer('exchange_fields'):
+                    self.comm.start_exchange(fld.interp, 'rho', 'add')
 
         # Currents
         elif fieldtype == 'J':
             fld.erase('J')
             # Deposit the particle current
             for species in species_list:
-                species.deposit( fld, 'J' )
+                with prof.timer('deposit', self.get_species_name(species)):
+                    species.deposit( fld, 'J' )
             # Deposit the current of the virtual particles in the antenna
-            for antenna in antennas_list:
-                antenna.deposit( fld, 'J' )
+            with prof.timer('deposit', 'antennas'):
+                for antenna in antennas_list:
+                    antenna.deposit( fld, 'J' )
             # Sum contribution from each CPU threads (skipped on GPU)
-            fld.sum_reduce_deposition_array('J')
+            with prof.timer('sum_reduce'):
+                fld.sum_reduce_deposition_array('J')
             # Divide by cell volume
             fld.divide_by_volume('J')
-            # Exchange guard cells if requested by the user
+            # Sum the sources of the radial domains (decomposition along r)
+            if self.comm.r_size > 1:
+                with prof.timer('exchange_fields'):
+                    self.comm.sum_radial_sources(fld.interp, 'J')
+            # Start the exchange of the guard cells if requested by the user
             if exchange and self.comm.size > 1:
-                self.comm.exchange_fields(fld.interp, 'J', 'add')
+                with prof.timer('exchange_fields'):
+                    self.comm.start_exchange(fld.interp, 'J', 'add')
         else:
             raise ValueError('Unknown fieldtype: %s' %fieldtype)
 
+        # Complete the exchange and get the fields on the spectral grid
+        if wait_exchange:
+            self.finish_deposit( fieldtype, exchange=exchange,
+                update_spectral=update_spectral, apply_filter=apply_filter )
+
+    def finish_deposit( self, fieldtype, exchange=False,
+                        update_spectral=True, apply_filter=True ):
+        """
+        Complete the deposition of the charge or the currents that was
+        started by `deposit` with `wait_exchange=False`: wait for the MPI
+        exchange of the guard cells, and get the deposited field on the
+        spectral grid.
+
+        Parameters
+        ----------
+        fieldtype, exchange, update_spectral, apply_filter:
+            The same arguments as those passed to `deposit`
+        """
+        # Shortcuts
+        fld = self.fld
+        prof = self.profiler
+
+        # Complete the exchange of the guard cells
+        if exchange and self.comm.size > 1:
+            with prof.timer('exchange_fields'):
+                if fieldtype.startswith('rho'):
+                    self.comm.finish_exchange(fld.interp, 'rho', 'add')
+                else:
+                    self.comm.finish_exchange(fld.interp, 'J', 'add')
+
         # Get the charge or currents on the spectral grid
         if update_spectral:
-            fld.interp2spect( fieldtype )
-            if self.filter_currents:
-                fld.filter_spect( fieldtype )
+            with prof.timer('interp2spect'):
+                fld.interp2spect( fieldtype )
+            if self.filter_currents and apply_filter:
+                with prof.timer('filter'):
+                    fld.filter_spect( fieldtype )
             # Set the flag to indicate whether these fields have been exchanged
             fld.exchanged_source[ fieldtype ] = exchange
 
-    def cross_deposit( self, move_positions ):
+    def cross_deposit( self, move_positions, apply_filter=True ):
         """
         Perform cross-deposition. This function should be called
         when the particles are at time n+1/2.
@@ -602,6 +994,10 @@ class Simulation(object):
         ----------
         move_positions:bool
             Whether to move the positions of regular particles
+
+        apply_filter: bool
+            Whether to filter rho_next_xy and rho_next_z in spectral space
+            (see the function `deposit`)
         """
         dt = self.dt
 
@@ -615,7 +1011,7 @@ class Simulation(object):
         if self.use_galilean:
             self.shift_galilean_boundaries( -0.5*dt )
         # Deposit rho_next_xy
-        self.deposit( 'rho_next_xy' )
+        self.deposit( 'rho_next_xy', apply_filter=apply_filter )
 
         # Push the particles: z[n], x[n+1] => z[n+1], x[n]
         if move_positions:
@@ -627,7 +1023,7 @@ class Simulation(object):
         if self.use_galilean:
             self.shift_galilean_boundaries( dt )
         # Deposit rho_next_z
-        self.deposit( 'rho_next_z' )
+        self.deposit( 'rho_next_z', apply_filter=apply_filter )
 
         # Push the particles: z[n+1], x[n] => z[n+1/2], x[n+1/2]
         if move_positions:
@@ -789,6 +1185,10 @@ class Simulation(object):
                                         with_damp=False, with_guard=False )
             p_zmin = max( zmin_local_domain, p_zmin )
             p_zmax = min( zmax_local_domain, p_zmax )
+            # (and in the local radial band, with a decomposition along r)
+            rmin_local_domain, rmax_local_domain = self.comm.get_rmin_rmax()
+            p_rmin = max( rmin_local_domain, p_rmin )
+            p_rmax = min( rmax_local_domain, p_rmax )
 
             # Modify again the input particle bounds, so that
             # they fall exactly on the grid, and infer the number of particles
@@ -825,7 +1225,10 @@ class Simulation(object):
                         ux_m=ux_m, uy_m=uy_m, uz_m=uz_m,
                         ux_th=ux_th, uy_th=uy_th, uz_th=uz_th,
                         continuous_injection=continuous_injection,
-                        dz_particles=dz_particles )
+                        dz_particles=dz_particles, precision=self.precision,
+                        cpu_deposition=self.cpu_deposition,
+                        particle_removal=self.particle_removal,
+                        gpu_kernels=self.gpu_kernels )
 
         # Add it to the list of species and return it to the user
         self.ptcl.append( new_species )
@@ -862,6 +1265,86 @@ class Simulation(object):
         # Attach the moving window to the boundary communicator
         self.comm.moving_win = MovingWindow( self.comm, self.dt, v, self.time )
 
+    def get_species_name( self, species ):
+        """
+        Return the name under which `species` appears in the profiling
+        report (see `set_profiler`), based on its index in `self.ptcl`
+        """
+        for i_species, ptcl_species in enumerate(self.ptcl):
+            if ptcl_species is species:
+                return( get_species_name(i_species) )
+        return( None )
+
+    def set_profiler( self, active=True, write_dir=None, print_report=True ):
+        """
+        Activate (or deactivate) the measurement of the time spent in
+        each phase of the PIC cycle (gather, push_p, push_x, deposit,
+        sum_reduce, interp2spect, filter, push_eb, spect2interp,
+        exchange_fields, exchange_particles, moving_window, diagnostics,
+        elementary_processes, ...), per species and per MPI rank.
+
+        At the end of each call to `step`, the timings are aggregated
+        over the MPI ranks (min/max/mean), printed as a table by the first
+        rank, and (optionally) written to JSON and CSV files. The aggregated
+        report is also stored in `self.profiling_report`.
+
+        Parameters
+        ----------
+        active: bool, optional
+            Whether to measure the time spent in each phase
+
+        write_dir: string or None, optional
+            The directory in which the reports are written, as
+            `profile_<iteration>.json` and `profile_<iteration>.csv`
+            (where <iteration> is the iteration at the end of `step`).
+            If None, the reports are not written to disk.
+
+        print_report: bool, optional
+            Whether to print the aggregated table at the end of `step`
+        """
+        self.profiler = Profiler( self.comm, use_cuda=self.use_cuda,
+            active=active, write_dir=write_dir, print_report=print_report )
+
+    def set_load_balancing( self, period, cost='particles', cell_cost=0.1,
+                            threshold=0.1, max_shift=None ):
+        """
+        Activate the dynamic load balancing of the MPI domain decomposition:
+        every `period` iterations, the boundaries of the subdomains along z
+        are moved so that each MPI rank has a similar computational cost.
+        (This has no effect when running with a single MPI rank.)
+
+        Parameters
+        ----------
+        period: int
+            Number of iterations between two balancings. (The balancing is
+            done at the first particle exchange after this number of
+            iterations; see `exchange_period`.)
+
+        cost: string, optional
+            How the cost of each rank is estimated. Either 'particles'
+            (number of macroparticles and number of cells) or 'time'
+            (time measured by the profiler, distributed along z according
+            to the number of macroparticles and cells ; this activates
+            the profiler, if it was not already active)
+
+        cell_cost: float, optional
+            The cost of one cell along z (i.e. of Nr cells of the grid),
+            in units of the cost of one macroparticle
+
+        threshold: float, optional
+            The subdomains are only modified if the maximal cost of a rank
+            exceeds the mean cost by more than this fraction
+
+        max_shift: int or None, optional
+            The maximal number of cells by which each boundary moves
+            at each balancing (at most, and by default, `n_guard`)
+        """
+        self.load_balancer = LoadBalancer( self.comm, period, cost=cost,
+            cell_cost=cell_cost, threshold=threshold, max_shift=max_shift )
+        # The cost 'time' requires the profiler
+        if cost == 'time' and not self.profiler.active:
+            self.set_profiler( active=True, print_report=False )
+
     def reverse_time(self):
         """
         Convenience method to reverse the direction of electromagnetic waves
@@ -10,11 +10,14 @@ from .boosted_field_diag import BoostedFieldDiagnostic, \
                                 BackTransformedFieldDiagnostic
 from .boosted_particle_diag import BoostedParticleDiagnostic, \
                                 BackTransformedParticleDiagnostic
+from .reduced_diag import ParticleMomentsDiagnostic, \
+    ParticleHistogramDiagnostic, FieldReductionDiagnostic
 from .checkpoint_restart import set_periodic_checkpoint, \
      restart_from_checkpoint
 
 __all__ = ['FieldDiagnostic', 'ParticleDiagnostic',
 	'BoostedFieldDiagnostic', 'BoostedParticleDiagnostic',
     'BackTransformedFieldDiagnostic', 'BackTransformedParticleDiagnostic',
-    'ParticleChargeDensityDiagnostic',
+    'ParticleChargeDensityDiagnostic', 'ParticleMomentsDiagnostic',
+    'ParticleHistogramDiagnostic', 'FieldReductionDiagnostic',
     'set_periodic_checkpoint', 'restart_from_checkpoint']
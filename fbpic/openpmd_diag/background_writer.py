@@ -0,0 +1,202 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file defines the objects that allow the diagnostics to write their
+openPMD files in a background thread (see the argument `write_in_background`
+of FieldDiagnostic and ParticleDiagnostic):
+- BackgroundWriter: a thread that executes the writing tasks in order
+- StagingArea: double-buffered arrays, into which the data is copied
+  before being handed to the BackgroundWriter
+"""
+import atexit
+import threading
+import numpy as np
+try:
+    import queue
+except ImportError: # Python 2
+    import Queue as queue
+
+# Writer that is shared by all the diagnostics of this process
+# (The files are thus written one at a time and in order, which avoids
+# conflicts when several diagnostics write into the same file)
+_background_writer = None
+
+def get_background_writer():
+    """
+    Return the BackgroundWriter of this process (created at the first call)
+    """
+    global _background_writer
+    if _background_writer is None:
+        _background_writer = BackgroundWriter()
+        # Make sure that all the files are written before exiting
+        atexit.register( _background_writer.flush )
+    return( _background_writer )
+
+def wait_for_background_writes( fullpath=None ):
+    """
+    Wait until the files that are being written in the background are
+    complete (all of them, or only `fullpath`, if it is not None).
+    This is a no-op if no diagnostic writes in the background.
+    """
+    if _background_writer is not None:
+        _background_writer.wait( fullpath )
+
+
+class BackgroundWriter(object):
+    """
+    Thread that writes the openPMD files, while the simulation continues.
+
+    The tasks (i.e. functions that write a given file) are executed in the
+    order in which they are submitted. The number of pending tasks is
+    bounded: when it is reached, `submit` blocks until a task is complete.
+    """
+
+    def __init__( self, max_pending=2 ):
+        """
+        Initialize the writer (the thread is started at the first task)
+
+        Parameters
+        ----------
+        max_pending: int
+            The maximal number of tasks that are waiting to be executed
+        """
+        self.tasks = queue.Queue( maxsize=max_pending )
+        self.thread = None
+        # Number of pending tasks for each file
+        self.pending = {}
+        self.condition = threading.Condition()
+        # Error raised by a task (re-raised in the main thread)
+        self.error = None
+
+    def submit( self, fullpath, function, *args ):
+        """
+        Execute `function(*args)` in the background thread
+
+        Parameters
+        ----------
+        fullpath: string
+            The path of the file that is written by this task
+
+        function: callable
+            The function that writes the file
+        """
+        self.raise_error()
+        # Start the thread if needed
+        if self.thread is None:
+            self.thread = threading.Thread( target=self.run )
+            self.thread.daemon = True
+            self.thread.start()
+        # Register the task, and wait if too many tasks are pending
+        with self.condition:
+            self.pending[fullpath] = self.pending.get( fullpath, 0 ) + 1
+        self.tasks.put( (fullpath, function, args) )
+
+    def run( self ):
+        """
+        Execute the tasks, as they are submitted (in the background thread)
+        """
+        while True:
+            fullpath, function, args = self.tasks.get()
+            try:
+                function( *args )
+            except Exception as error:
+                # Keep the first error, and continue with the next tasks
+                if self.error is None:
+                    self.error = error
+            with self.condition:
+                self.pending[fullpath] -= 1
+                if self.pending[fullpath] == 0:
+                    del self.pending[fullpath]
+                self.condition.notify_all()
+
+    def wait( self, fullpath=None ):
+        """
+        Wait until the pending tasks are complete (all of them, or only
+        those that write `fullpath`, if it is not None)
+        """
+        # The tasks themselves never wait (this would block the thread)
+        if threading.current_thread() is self.thread:
+            return
+        with self.condition:
+            while (fullpath is None and len(self.pending) > 0) \
+                or (fullpath in self.pending):
+                self.condition.wait()
+        self.raise_error()
+
+    def flush( self ):
+        """
+        Wait until all the files are written
+        """
+        self.wait()
+
+    def raise_error( self ):
+        """
+        Re-raise (in the main thread) an error that occured in a task
+        """
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+
+class StagingArea(object):
+    """
+    Set of `n_buffers` buffers, into which a diagnostic copies its data
+    before handing it to the BackgroundWriter.
+
+    A buffer is reused only once the task that writes its data is
+    complete, so that the simulation can fill a buffer while the
+    data of the previous output is being written from the other one.
+    """
+
+    def __init__( self, n_buffers=2 ):
+        """
+        Initialize the (empty) buffers
+
+        Parameters
+        ----------
+        n_buffers: int
+            The number of buffers (2 for double-buffering)
+        """
+        self.arrays = [ {} for i in range(n_buffers) ]
+        self.available = [ threading.Event() for i in range(n_buffers) ]
+        for event in self.available:
+            event.set()
+        self.i_next = 0
+
+    def acquire( self ):
+        """
+        Wait until the next buffer is available, and return its index
+        """
+        i_buffer = self.i_next
+        self.available[i_buffer].wait()
+        self.available[i_buffer].clear()
+        self.i_next = (i_buffer + 1) % len(self.arrays)
+        return( i_buffer )
+
+    def release( self, i_buffer ):
+        """
+        Mark the buffer `i_buffer` as available
+        (i.e. its data has been written)
+        """
+        self.available[i_buffer].set()
+
+    def get_buffer( self, i_buffer, shapes, dtype='f8' ):
+        """
+        Return a dictionary of arrays from the buffer `i_buffer`
+        (allocated only if they do not exist yet with the right shape)
+
+        Parameters
+        ----------
+        i_buffer: int
+            The index of the buffer (as returned by `acquire`)
+
+        shapes: dict
+            The keys are the names of the arrays and the values their shape
+        """
+        arrays = self.arrays[i_buffer]
+        for key, shape in shapes.items():
+            if (key not in arrays) or (arrays[key].shape != shape):
+                arrays[key] = np.empty( shape, dtype=dtype )
+        return( dict( (key, arrays[key]) for key in shapes ) )
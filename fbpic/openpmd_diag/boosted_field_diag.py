@@ -134,15 +134,19 @@ class BackTransformedFieldDiagnostic(FieldDiagnostic):
         """
         # If needed: Bring rho/J from spectral space (where they where
         # smoothed/corrected) to real space
+        # (Skipped if they are already up-to-date on the interpolation grid ;
+        # this does not depend on the local domain, and thus the exchanges
+        # are performed consistently by all the MPI ranks)
         if "rho" in self.fieldtypes or "J" in self.fieldtypes:
             # Get 'rho_prev', since it correspond to rho at time n
-            self.fld.spect2interp('rho_prev')
-            self.fld.spect2interp('J')
+            transformed_rho = self.fld.require_interp('rho_prev')
+            transformed_J = self.fld.require_interp('J')
             # Exchange rho and J if needed
             if (self.comm is not None) and (self.comm.size > 1):
-                if not self.fld.exchanged_source['J']:
+                if transformed_J and not self.fld.exchanged_source['J']:
                     self.comm.exchange_fields(self.fld.interp, 'J', 'add')
-                if not self.fld.exchanged_source['rho_prev']:
+                if transformed_rho and \
+                    not self.fld.exchanged_source['rho_prev']:
                     self.comm.exchange_fields(self.fld.interp, 'rho', 'add')
 
         # Find the limits of the local subdomain at this iteration
@@ -151,8 +155,8 @@ class BackTransformedFieldDiagnostic(FieldDiagnostic):
             zmax_boost = self.fld.interp[0].zmax
         else:
             # If a communicator is provided, remove guard and damp cells
-            zmin_boost, zmax_boost = self.comm.get_zmin_zmax(
-                local=True, with_damp=False, with_guard=False, rank=self.rank )
+            zmin_boost, zmax_boost = self.comm.get_zmin_zmax( local=True,
+                with_damp=False, with_guard=False, rank=self.comm.rank )
 
         # Extract the current time in the boosted frame
         time = iteration * self.fld.dt
@@ -179,6 +183,8 @@ class BackTransformedFieldDiagnostic(FieldDiagnostic):
                 # and store the results into snapshot.slice_array
                 # (when running on the GPU, snapshot.slice_array
                 # is a device array)
+                # (E and B are brought to real space only if needed)
+                self.fld.require_interp('EB')
                 self.slice_handler.extract_slice(
                     self.fld, self.comm, snapshot.current_z_boost,
                     zmin_boost, snapshot.slice_array )
@@ -139,6 +139,14 @@ class BackTransformedParticleDiagnostic(ParticleDiagnostic):
         if iteration % self.period == 0:
             self.flush_to_disk()
 
+    def requires_gathered_fields( self, species, iteration ):
+        """
+        Redefines the method requires_gathered_fields of the parent class
+        ParticleDiagnostic (since slices of the particles are stored
+        at each iteration)
+        """
+        return( self.uses_gathered_fields( species ) )
+
     def store_snapshot_slices( self, iteration ):
         """
         Store slices of the particles in the memory buffers of the
@@ -205,7 +213,7 @@ class BackTransformedParticleDiagnostic(ParticleDiagnostic):
                                     quantities_in_file )
 
                 # Gather the slices on the first proc
-                if self.comm is not None and self.comm.size > 1:
+                if self.comm is not None and self.comm.world_size > 1:
                     particle_dict = self.gather_particle_arrays(
                         local_particle_dict, quantities_in_file )
                 else:
@@ -238,7 +246,7 @@ class BackTransformedParticleDiagnostic(ParticleDiagnostic):
         """
         # Send the local number of particles to all procs
         n_particles_local = len( local_dict[ quantities_in_file[0] ] )
-        n_particles_list = self.comm.mpi_comm.allgather( n_particles_local )
+        n_particles_list = self.comm.world_comm.allgather( n_particles_local )
 
         # Prepare the send and receive buffers
         gathered_dict = {}
@@ -658,6 +666,11 @@ class ParticleCatcher:
                 particle_data['charge'] = species.ionizer.ionization_level
             if species.tracker is not None:
                 particle_data['id'] = species.tracker.id
+            # Exclude the dead particles (with `particle_removal='mask'`)
+            if species.n_dead > 0:
+                alive = np.logical_not( species.dead )
+                for key in particle_data.keys():
+                    particle_data[key] = particle_data[key][alive]
         # GPU
         else:
             # Check if particles are sorted, otherwise sort them
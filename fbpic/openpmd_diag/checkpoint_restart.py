@@ -288,6 +288,12 @@ def load_species( species, name, ts, iteration, comm ):
     # Get the inverse gamma
     species.inv_gamma = 1./np.sqrt(
         1 + species.ux**2 + species.uy**2 + species.uz**2 )
+    # Convert the data to the precision of the species
+    for attr in ['x', 'y', 'z']:
+        setattr( species, attr,
+            getattr( species, attr ).astype( species.position_dtype ) )
+    for attr in ['ux', 'uy', 'uz', 'w', 'inv_gamma']:
+        setattr( species, attr, getattr( species, attr ).astype( species.dtype ) )
     # Take into account the fact that the arrays are resized
     Ntot = len(species.w)
     species.Ntot = Ntot
@@ -305,27 +311,36 @@ def load_species( species, name, ts, iteration, comm ):
         q, = ts.get_particle( ['charge'], iteration=iteration, species=name)
         species.ionizer.ionization_level[:] = np.uint64( np.round( q/e ) )
         # Set the auxiliary array
-        species.ionizer.w_times_level = \
-                    species.w * species.ionizer.ionization_level
+        species.ionizer.w_times_level = ( species.w * \
+            species.ionizer.ionization_level ).astype( species.dtype )
 
     # Reset the injection positions (for continuous injection)
     if species.continuous_injection:
         species.injector.reset_injection_positions()
 
-    # As a safe-guard, check that the loaded data is in float64
-    for attr in ['x', 'y', 'z', 'ux', 'uy', 'uz', 'w', 'inv_gamma' ]:
-        assert getattr( species, attr ).dtype == np.float64
+    # As a safe-guard, check that the loaded data has the right precision
+    for attr in ['x', 'y', 'z']:
+        assert getattr( species, attr ).dtype == species.position_dtype
+    for attr in ['ux', 'uy', 'uz', 'w', 'inv_gamma' ]:
+        assert getattr( species, attr ).dtype == species.dtype
 
     # Field arrays
-    species.Ez = np.zeros( Ntot )
-    species.Ex = np.zeros( Ntot )
-    species.Ey = np.zeros( Ntot )
-    species.Bz = np.zeros( Ntot )
-    species.Bx = np.zeros( Ntot )
-    species.By = np.zeros( Ntot )
+    species.Ez = np.zeros( Ntot, dtype=species.dtype )
+    species.Ex = np.zeros( Ntot, dtype=species.dtype )
+    species.Ey = np.zeros( Ntot, dtype=species.dtype )
+    species.Bz = np.zeros( Ntot, dtype=species.dtype )
+    species.Bx = np.zeros( Ntot, dtype=species.dtype )
+    species.By = np.zeros( Ntot, dtype=species.dtype )
+    # The loaded particles are alive (with `particle_removal='mask'`)
+    if species.dead is not None:
+        species.dead = np.zeros( Ntot, dtype=np.bool_ )
+        species.n_dead = 0
     # Sorting arrays
     if species.use_cuda:
         species.cell_idx = np.empty( Ntot, dtype=np.int32)
         species.sorted_idx = np.arange( Ntot, dtype=np.uint32)
-        species.sorting_buffer = np.arange( Ntot, dtype=np.float64)
+        species.sorting_buffer = np.arange( Ntot, dtype=species.dtype )
+        if species.position_dtype != species.dtype:
+            species.position_sorting_buffer = \
+                np.arange( Ntot, dtype=species.position_dtype )
         species.sorted = False
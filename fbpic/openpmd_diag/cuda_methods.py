@@ -3,10 +3,20 @@
 # License: 3-Clause-BSD-LBNL
 """
 This files contains cuda methods that are used in the boosted-frame
-diagnostics
+diagnostics, in the selection of the particles that are written
+by the particle diagnostics, and in the reduced diagnostics
 """
+import math
 import numpy as np
+from numba import float64
 from fbpic.utils.cuda import cuda, cuda_tpb_bpg_1d
+# Import inline functions
+from .inline_functions import get_bin_index, get_moment_component, \
+    n_moments
+# Compile the inline functions for GPU
+get_bin_index = cuda.jit( get_bin_index, device=True, inline=True )
+get_moment_component = cuda.jit( get_moment_component,
+                                 device=True, inline=True )
 
 def extract_slice_from_gpu( pref_sum_curr, N_area, species ):
     """
@@ -128,3 +138,153 @@ def extract_array_from_gpu( part_idx_start, array, selected ):
 
     if i < N_part:
         selected[i] = array[part_idx_start+i]
+
+@cuda.jit()
+def initialize_selection( selected ):
+    """
+    Set the flag `selected` to 1 for all particles
+
+    Parameters
+    ----------
+    selected : 1D array of uint8
+        Whether each particle is selected (modified in place)
+    """
+    i = cuda.grid(1)
+    if i < selected.shape[0]:
+        selected[i] = 1
+
+@cuda.jit()
+def apply_selection_rule( selected, quantity, lower, upper, invert ):
+    """
+    Set the flag `selected` to 0 for the particles for which `quantity`
+    (or 1/`quantity`, if `invert` is True) is not strictly between
+    `lower` and `upper`
+
+    Parameters
+    ----------
+    selected : 1D array of uint8
+        Whether each particle is selected (modified in place)
+
+    quantity : 1D array of floats
+        The GPU particle array on which the rule applies (e.g. uz)
+
+    lower, upper : floats
+        The bounds of the rule (-inf or inf if there is no bound)
+
+    invert : bool
+        Whether the rule applies to the inverse of `quantity`
+        (e.g. for the Lorentz factor, from `inv_gamma`)
+    """
+    i = cuda.grid(1)
+    if i < selected.shape[0]:
+        value = quantity[i]
+        if invert:
+            value = 1./value
+        if not (value > lower and value < upper):
+            selected[i] = 0
+
+@cuda.jit()
+def extract_selected_from_gpu( indices, array, selected ):
+    """
+    Copy the particles of `array` whose index is in `indices`
+    into the (compact) array `selected`
+
+    Parameters
+    ----------
+    indices : 1D array of ints
+        The indices of the selected particles
+
+    array : 1D array of ints or floats
+        The GPU particle array for a given species (e.g. x, id)
+
+    selected : 1D array of ints or floats
+        A GPU array (with at least as many elements as `indices`),
+        where the selected particles are stored
+    """
+    i = cuda.grid(1)
+    if i < indices.shape[0]:
+        selected[i] = array[indices[i]]
+
+@cuda.jit()
+def get_weighted_moments_cuda( x, y, z, ux, uy, uz, inv_gamma, w,
+                    selected, use_selection, centers, moments ):
+    """
+    Add the sums of w*v[i]*v[j] over the selected particles to `moments`,
+    where v is the vector (1, x, y, z, ux, uy, uz, gamma) of each particle,
+    from which `centers` is subtracted (only the elements j >= i)
+
+    Each thread goes through several particles (grid-stride loop), and
+    adds its partial sums to `moments` at the end, with atomic operations.
+
+    Parameters
+    ----------
+    selected : 1D array of uint8
+        Whether each particle is selected (only used if `use_selection`)
+
+    moments : 2D array of floats, of shape (n_moments, n_moments)
+        The sums (modified in place ; should be initialized to zero)
+    """
+    # Partial sums of this thread
+    sums = cuda.local.array( (n_moments, n_moments), dtype=float64 )
+    v = cuda.local.array( n_moments, dtype=float64 )
+    for i in range( n_moments ):
+        for j in range( n_moments ):
+            sums[i, j] = 0.
+
+    for ip in range( cuda.grid(1), x.shape[0], cuda.gridsize(1) ):
+        if use_selection and selected[ip] == 0:
+            continue
+        for i in range( n_moments ):
+            v[i] = get_moment_component( i, x[ip], y[ip], z[ip],
+                    ux[ip], uy[ip], uz[ip], inv_gamma[ip], centers )
+        for i in range( n_moments ):
+            wv = w[ip]*v[i]
+            for j in range( i, n_moments ):
+                sums[i, j] += wv*v[j]
+
+    for i in range( n_moments ):
+        for j in range( i, n_moments ):
+            cuda.atomic.add( moments, (i, j), sums[i, j] )
+
+@cuda.jit()
+def get_histogram_cuda( quantity1, invert1, min1, max1, n1,
+                        quantity2, invert2, min2, max2, n2, w,
+                        selected, use_selection, histogram ):
+    """
+    Add the weights `w` of the selected particles to the 2D `histogram`
+    of (`quantity1`, `quantity2`), which has `n1` and `n2` regular bins
+    between the bounds `min1`/`max1` and `min2`/`max2`
+
+    Parameters
+    ----------
+    selected : 1D array of uint8
+        Whether each particle is selected (only used if `use_selection`)
+
+    histogram : 2D array of floats, of shape (n1, n2)
+        The histogram (modified in place ; should be initialized to zero)
+    """
+    ip = cuda.grid(1)
+    if ip < w.shape[0]:
+        if use_selection and selected[ip] == 0:
+            return
+        i1 = get_bin_index( quantity1[ip], invert1, min1, max1, n1 )
+        i2 = get_bin_index( quantity2[ip], invert2, min2, max2, n2 )
+        if i1 >= 0 and i2 >= 0:
+            cuda.atomic.add( histogram, (i1, i2), w[ip] )
+
+@cuda.jit()
+def get_axis_and_max_cuda( field, lineout, max_along_r ):
+    """
+    For each longitudinal position iz of the 2D array `field`, copy the
+    value in the first radial cell into `lineout[iz]`, and write the
+    maximum of the modulus of the field along r into `max_along_r[iz]`
+    """
+    iz = cuda.grid(1)
+    if iz < field.shape[0]:
+        lineout[iz] = field[iz, 0]
+        max_value = 0.
+        for ir in range( field.shape[1] ):
+            value = math.sqrt( field[iz, ir].real**2 + field[iz, ir].imag**2 )
+            if value > max_value:
+                max_value = value
+        max_along_r[iz] = max_value
@@ -15,7 +15,10 @@ class FieldDiagnostic(OpenPMDDiagnostic):
 
     def __init__(self, period=None, fldobject=None, comm=None,
                  fieldtypes=["rho", "E", "B", "J"], write_dir=None,
-                 iteration_min=0, iteration_max=np.inf, dt_period=None ) :
+                 iteration_min=0, iteration_max=np.inf, dt_period=None,
+                 write_in_background=False, parallel_write=False,
+                 chunks=None, compression=None, compression_level=None,
+                 shuffle=False ) :
         """
         Initialize the field diagnostic.
 
@@ -53,6 +56,31 @@ class FieldDiagnostic(OpenPMDDiagnostic):
         iteration_min, iteration_max: ints
             The iterations between which data should be written
             (`iteration_min` is inclusive, `iteration_max` is exclusive)
+
+        write_in_background : bool, optional
+            Whether to write the files in a background thread, while the
+            simulation continues. The fields are then first copied to a
+            (double-buffered) staging area in memory.
+
+        parallel_write : bool, optional
+            Whether each MPI rank writes its own slab of the grid (along z)
+            into the file, using parallel HDF5, instead of gathering the
+            fields on the first rank. (Requires h5py with MPI support.)
+
+        chunks : tuple of 3 ints, optional
+            The shape of the chunks of the datasets, along the modes,
+            r and z (e.g. `(1, Nr, 256)`). If None, the datasets are
+            contiguous (or chunked automatically, with compression).
+
+        compression : string, optional
+            Either None, 'gzip' or 'lzf': the compression filter used
+            for the datasets. (Not available with `parallel_write`.)
+
+        compression_level : int, optional
+            The level of the 'gzip' compression (0 to 9)
+
+        shuffle : bool, optional
+            Whether to apply the shuffle filter before the compression
         """
         # Check input
         if fldobject is None:
@@ -62,7 +90,12 @@ class FieldDiagnostic(OpenPMDDiagnostic):
         # General setup
         OpenPMDDiagnostic.__init__(self, period, comm, write_dir,
                             iteration_min, iteration_max,
-                            dt_period=dt_period, dt_sim=fldobject.dt )
+                            dt_period=dt_period, dt_sim=fldobject.dt,
+                            write_in_background=write_in_background,
+                            parallel_write=parallel_write, chunks=chunks,
+                            compression=compression,
+                            compression_level=compression_level,
+                            shuffle=shuffle )
 
         # Register the arguments
         self.fld = fldobject
@@ -78,21 +111,8 @@ class FieldDiagnostic(OpenPMDDiagnostic):
         iteration : int
              The current iteration number of the simulation.
         """
-        # If needed: Bring rho/J from spectral space (where they where
-        # smoothed/corrected) to real space
-        if "rho" in self.fieldtypes:
-            # Get 'rho_prev', since it correspond to rho at time n
-            self.fld.spect2interp('rho_prev')
-            # Exchange rho in real space if needed
-            if (self.comm is not None) and (self.comm.size > 1) \
-                and (not self.fld.exchanged_source['rho_prev']):
-                    self.comm.exchange_fields(self.fld.interp, 'rho', 'add')
-        if "J" in self.fieldtypes:
-            self.fld.spect2interp('J')
-            # Exchange J in real space if needed
-            if (self.comm is not None) and (self.comm.size > 1) \
-                and (not self.fld.exchanged_source['J']):
-                    self.comm.exchange_fields(self.fld.interp, 'J', 'add')
+        # If needed: Bring E/B/rho/J from spectral space to real space
+        require_interp_fields( self.fld, self.comm, self.fieldtypes )
 
         # If needed: Receive data from the GPU
         if self.fld.use_cuda :
@@ -112,20 +132,32 @@ class FieldDiagnostic(OpenPMDDiagnostic):
             Nz, _ = self.comm.get_Nz_and_iz(
                     local=False, with_damp=False, with_guard=False )
 
-        # Create the file with these attributes
         filename = "data%08d.h5" %iteration
         fullpath = os.path.join( self.write_dir, "hdf5", filename )
-        self.create_file_empty_meshes(
-            fullpath, iteration, time, Nz, zmin, dz, dt )
-
-        # Open the file again, and get the field path
-        f = self.open_file( fullpath )
-        # (f is None if this processor does not participate in writing data)
-        if f is not None:
-            field_path = "/data/%d/fields/" %iteration
-            field_grp = f[field_path]
+        if self.writer is None:
+            # Create the file with these attributes
+            self.create_file_empty_meshes(
+                fullpath, iteration, time, Nz, zmin, dz, dt )
+
+            # Open the file again, and get the field path
+            f = self.open_file( fullpath )
+            # (f is None if this processor does not participate in writing)
+            if f is not None:
+                field_path = "/data/%d/fields/" %iteration
+                field_grp = f[field_path]
+            else:
+                field_grp = None
         else:
-            field_grp = None
+            # Copy the data to a staging buffer instead (a dictionary of
+            # arrays with the same paths and shapes as the datasets),
+            # which is written to the file by the background thread
+            f = None
+            if self.rank == 0:
+                i_buffer = self.staging.acquire()
+                field_grp = self.staging.get_buffer( i_buffer,
+                    self.get_dataset_shapes( Nz ) )
+            else:
+                field_grp = None
 
         # Loop over the different quantities that should be written
         for fieldtype in self.fieldtypes:
@@ -144,11 +176,67 @@ class FieldDiagnostic(OpenPMDDiagnostic):
         # Close the file (only the first proc does this)
         if f is not None:
             f.close()
+        # Or hand the staging buffer to the background thread
+        elif self.writer is not None and field_grp is not None:
+            self.writer.submit( fullpath, self.write_staged_data, i_buffer,
+                field_grp, fullpath, iteration, time, Nz, zmin, dz, dt )
 
         # Send data to the GPU if needed
         if self.fld.use_cuda :
             self.fld.send_fields_to_gpu()
 
+    def write_staged_data( self, i_buffer, staged_data, fullpath,
+                            iteration, time, Nz, zmin, dz, dt ):
+        """
+        Write the data of a staging buffer to an openPMD file
+        (executed by the background thread)
+
+        Parameters
+        ----------
+        i_buffer: int
+            The index of the staging buffer (released after writing)
+
+        staged_data: dict
+            The arrays to be written, with their path as keys
+
+        fullpath, iteration, time, Nz, zmin, dz, dt:
+            See the docstring of `create_file_empty_meshes`
+        """
+        try:
+            self.create_file_empty_meshes(
+                fullpath, iteration, time, Nz, zmin, dz, dt )
+            f = self.open_file( fullpath )
+            field_grp = f["/data/%d/fields/" %iteration]
+            for path, data in staged_data.items():
+                dset = field_grp[path]
+                # Write one mode at a time (h5py holds the GIL during each
+                # write: this lets the simulation proceed in between)
+                for i_mode in range( data.shape[0] ):
+                    dset[i_mode,:,:] = data[i_mode,:,:]
+            f.close()
+        finally:
+            self.staging.release( i_buffer )
+
+    def get_dataset_shapes( self, Nz ):
+        """
+        Return a dictionary whose keys are the paths of the datasets
+        written by this diagnostic, and values their shapes
+
+        Parameter
+        ---------
+        Nz: int
+            The number of gridpoints along z in this diagnostics
+        """
+        data_shape = ( 2*self.fld.Nm - 1, self.fld.Nr, Nz )
+        shapes = {}
+        for fieldtype in self.fieldtypes:
+            if fieldtype.startswith("rho"):
+                shapes[fieldtype] = data_shape
+            else:
+                for coord in self.coords:
+                    shapes["%s/%s" %(fieldtype, coord)] = data_shape
+        return( shapes )
+
     # Writing methods
     # ---------------
     def write_dataset( self, field_grp, path, quantity ) :
@@ -173,6 +261,11 @@ class FieldDiagnostic(OpenPMDDiagnostic):
         else:
             dset = None
 
+        # In parallel mode, each proc writes its own data
+        if self.parallel_write:
+            self.write_local_dataset( dset, quantity )
+            return
+
         # Write the mode 0 : only the real part is non-zero
         mode0 = self.get_dataset( quantity, 0 )
         if self.rank == 0:
@@ -188,6 +281,35 @@ class FieldDiagnostic(OpenPMDDiagnostic):
                 dset[2*m-1,:,:] = 2*mode[:,:].real
                 dset[2*m,:,:] = 2*mode[:,:].imag
 
+    def write_local_dataset( self, dset, quantity ):
+        """
+        Write the physical region of the local grid (i.e. a slab along z)
+        into the dataset `dset`, that is shared by all procs
+
+        Parameters
+        ----------
+        dset : an h5py.Dataset object (opened with the 'mpio' driver)
+
+        quantity : string
+            Describes which field is being written.
+            (Either rho, Er, Et, Ez, Br, Bz, Bt, Jr, Jt or Jz)
+        """
+        # With a decomposition along r, the procs that have the same
+        # z domain hold the same fields: only one of them writes them
+        if self.comm.r_rank != 0:
+            return
+        for m in range(self.fld.Nm):
+            data, iz = self.comm.get_local_physical_array(
+                getattr( self.fld.interp[m], quantity ) )
+            data = data.T
+            Nz_local = data.shape[1]
+            # Same conventions as in `write_dataset`
+            if m == 0:
+                dset[0,:,iz:iz+Nz_local] = data.real
+            else:
+                dset[2*m-1,:,iz:iz+Nz_local] = 2*data.real
+                dset[2*m,:,iz:iz+Nz_local] = 2*data.imag
+
     def get_dataset( self, quantity, m ):
         """
         Get the field `quantity` in the mode `m`
@@ -272,8 +394,8 @@ class FieldDiagnostic(OpenPMDDiagnostic):
                 # the sub-class ParticleDensityDiagnostic
                 if fieldtype.startswith("rho"):
                     # Setup the dataset
-                    dset = field_grp.require_dataset(
-                        fieldtype, data_shape, dtype='f8')
+                    dset = field_grp.require_dataset( fieldtype, data_shape,
+                        dtype='f8', **self.get_dataset_options(data_shape) )
                     self.setup_openpmd_mesh_component( dset, fieldtype )
                     # Setup the record to which it belongs
                     self.setup_openpmd_mesh_record( dset, fieldtype, dz, zmin )
@@ -284,8 +406,8 @@ class FieldDiagnostic(OpenPMDDiagnostic):
                     for coord in self.coords:
                         quantity = "%s%s" %(fieldtype, coord)
                         path = "%s/%s" %(fieldtype, coord)
-                        dset = field_grp.require_dataset(
-                            path, data_shape, dtype='f8')
+                        dset = field_grp.require_dataset( path, data_shape,
+                            dtype='f8', **self.get_dataset_options(data_shape))
                         self.setup_openpmd_mesh_component( dset, quantity )
                     # Setup the record to which they belong
                     self.setup_openpmd_mesh_record(
@@ -376,3 +498,38 @@ class FieldDiagnostic(OpenPMDDiagnostic):
 
         # Field positions
         dset.attrs["position"] = np.array([0.5, 0.5])
+
+
+def require_interp_fields( fld, comm, fieldtypes ):
+    """
+    Make sure that the fields `fieldtypes` are up-to-date on the
+    interpolation grid, i.e. bring them from spectral space (where they
+    were pushed/smoothed/corrected) to real space if needed.
+    (Skipped if they are already up-to-date on the interpolation grid,
+    e.g. because they were already written by another diagnostic)
+
+    Parameters
+    ----------
+    fld : a Fields object
+
+    comm : an fbpic BoundaryCommunicator object or None
+
+    fieldtypes : a list of strings
+        Among "rho", "E", "B" and "J"
+    """
+    for fieldtype in ["E", "B"]:
+        if fieldtype in fieldtypes:
+            fld.require_interp( fieldtype )
+    if "rho" in fieldtypes:
+        # Get 'rho_prev', since it correspond to rho at time n
+        if fld.require_interp('rho_prev'):
+            # Exchange rho in real space if needed
+            if (comm is not None) and (comm.size > 1) \
+                and (not fld.exchanged_source['rho_prev']):
+                comm.exchange_fields(fld.interp, 'rho', 'add')
+    if "J" in fieldtypes:
+        if fld.require_interp('J'):
+            # Exchange J in real space if needed
+            if (comm is not None) and (comm.size > 1) \
+                and (not fld.exchanged_source['J']):
+                comm.exchange_fields(fld.interp, 'J', 'add')
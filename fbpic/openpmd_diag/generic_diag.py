@@ -8,6 +8,7 @@ This class is a common class from which both ParticleDiagnostic
 and FieldDiagnostic inherit
 """
 import os
+import warnings
 import datetime
 from dateutil.tz import tzlocal
 import numpy as np
@@ -16,16 +17,23 @@ from fbpic import __version__ as fbpic_version
 
 # Dictionaries of correspondance for openPMD
 from .data_dict import unit_dimension_dict
+# Writing of the files in a background thread
+from .background_writer import get_background_writer, StagingArea, \
+    wait_for_background_writes
 
 class OpenPMDDiagnostic(object) :
     """
     Generic class that contains methods which are common
     to both FieldDiagnostic and ParticleDiagnostic
     """
+    # Subdirectory of `write_dir` in which the files are written
+    data_dir = "hdf5"
 
     def __init__(self, period, comm, write_dir=None,
                 iteration_min=0, iteration_max=np.inf,
-                dt_period=None, dt_sim=None ):
+                dt_period=None, dt_sim=None, write_in_background=False,
+                parallel_write=False, chunks=None, compression=None,
+                compression_level=None, shuffle=False ):
         """
         General setup of the diagnostic
 
@@ -58,10 +66,43 @@ class OpenPMDDiagnostic(object) :
         dt_sim : float (in seconds), optional
             The timestep of the simulation.
             Only needed if `dt_period` is not None.
+
+        write_in_background : bool, optional
+            Whether the data is written to disk by a background thread.
+            In this case, the data is copied to a staging buffer, and
+            the simulation continues while the file is being written.
+            (The files are all written at the end of `Simulation.step`.)
+
+        parallel_write : bool, optional
+            Whether each MPI rank writes its own data into the file
+            (using parallel HDF5, i.e. h5py with the 'mpio' driver),
+            instead of gathering the data on the first rank.
+            This requires h5py to be built with MPI support.
+
+        chunks : tuple of ints, optional
+            The shape of the chunks in which the datasets are stored.
+            (It is clipped to the shape of each dataset.) If None, the
+            datasets are contiguous, unless a compression filter is used,
+            in which case h5py chooses the shape of the chunks.
+
+        compression : string, optional
+            The compression filter of the datasets: either None (no
+            compression), 'gzip' (good compression ratio, slow) or
+            'lzf' (moderate compression ratio, fast).
+
+        compression_level : int, optional
+            The level of compression with 'gzip' (between 0 and 9 ;
+            h5py uses 4 by default)
+
+        shuffle : bool, optional
+            Whether to apply the shuffle filter before the compression
+            (this groups the bytes of the floats by significance, which
+            usually improves the compression ratio)
         """
-        # Get the rank of this processor
+        # Get the rank of this processor (among all the ranks, so that
+        # only one rank writes, also with a decomposition along r)
         if comm is not None :
-            self.rank = comm.rank
+            self.rank = comm.world_rank
         else :
             self.rank = 0
 
@@ -83,6 +124,51 @@ class OpenPMDDiagnostic(object) :
         self.iteration_max = iteration_max
         self.comm = comm
 
+        # Setup the parallel writing (only useful with several ranks)
+        self.parallel_write = False
+        if parallel_write and (comm is not None) and (comm.world_size > 1):
+            if h5py.get_config().mpi:
+                self.parallel_write = True
+            else:
+                warnings.warn(
+                    "`parallel_write` requires h5py to be built with MPI "
+                    "support, which is not the case here.\nThe data will "
+                    "be gathered and written by the first MPI rank instead.")
+        if self.parallel_write and write_in_background:
+            warnings.warn(
+                "`write_in_background` cannot be used with `parallel_write`."
+                "\nThe data will be written without a background thread.")
+            write_in_background = False
+
+        # Setup the chunking and compression of the datasets
+        if compression not in [None, 'gzip', 'lzf']:
+            raise ValueError("Unknown compression filter: %s\n"
+                "Available filters: None, 'gzip', 'lzf'" %compression)
+        if (compression_level is not None) and (compression != 'gzip'):
+            raise ValueError(
+                "`compression_level` can only be used with 'gzip'.")
+        if self.parallel_write and (compression is not None or shuffle):
+            warnings.warn(
+                "The compression filters cannot be used with `parallel_write`."
+                "\nThe data will be written without compression.")
+            compression = None
+            compression_level = None
+            shuffle = False
+        if isinstance( chunks, int ):
+            chunks = ( chunks, )
+        self.chunks = chunks
+        self.compression = compression
+        self.compression_level = compression_level
+        self.shuffle = shuffle
+
+        # Setup the writing in a background thread
+        if write_in_background:
+            self.writer = get_background_writer()
+            self.staging = StagingArea()
+        else:
+            self.writer = None
+            self.staging = None
+
         # Get the directory in which to write the data
         if write_dir is None:
             self.write_dir = os.path.join( os.getcwd(), 'diags' )
@@ -91,13 +177,12 @@ class OpenPMDDiagnostic(object) :
 
         # Create a few addiditional directories within self.write_dir
         self.create_dir("")
-        self.create_dir("hdf5")
+        self.create_dir( self.data_dir )
 
     def open_file( self, fullpath ):
         """
-        Open a file on either several processors or a single processor
-        (For the moment, only single-processor is enabled, but this
-        routine is a placeholder for future multi-proc implementation)
+        Open a file on either several processors (with `parallel_write`:
+        all the MPI ranks open the file collectively) or a single processor
 
         If a processor does not participate in the opening of
         the file, this returns None, for that processor
@@ -111,8 +196,15 @@ class OpenPMDDiagnostic(object) :
         -------
         An h5py.File object, or None
         """
+        # In parallel mode, all the procs open the file, with MPI-IO
+        if self.parallel_write:
+            f = h5py.File( fullpath, mode="a",
+                           driver="mpio", comm=self.comm.world_comm )
         # In gathering mode, only the first proc opens/creates the file.
-        if self.rank == 0 :
+        elif self.rank == 0 :
+            # Wait for this file to be written, in case it is being
+            # written in the background (e.g. by another diagnostic)
+            wait_for_background_writes( fullpath )
             # Create the filename and open hdf5 file
             f = h5py.File( fullpath, mode="a" )
         else:
@@ -121,6 +213,43 @@ class OpenPMDDiagnostic(object) :
         return(f)
 
 
+    def get_dataset_options( self, shape ):
+        """
+        Return the keyword arguments that set the chunking and compression
+        of a dataset, when creating it with h5py (`create_dataset` or
+        `require_dataset`), according to the arguments of the diagnostic
+
+        Parameter
+        ---------
+        shape: tuple of ints
+            The shape of the dataset
+
+        Returns
+        -------
+        A dictionary (empty for contiguous datasets without compression)
+        """
+        options = {}
+        # HDF5 does not allow chunks for empty datasets
+        if 0 in shape:
+            return( options )
+        # Chunks (which are required by the compression filters)
+        if self.chunks is not None:
+            if len(self.chunks) != len(shape):
+                raise ValueError("The shape of the chunks %s does not match "
+                    "the shape of the dataset %s." %(self.chunks, shape) )
+            options['chunks'] = tuple( min(n_chunk, n) for n_chunk, n
+                                       in zip( self.chunks, shape ) )
+        elif (self.compression is not None) or self.shuffle:
+            options['chunks'] = True
+        # Filters
+        if self.compression is not None:
+            options['compression'] = self.compression
+            if self.compression_level is not None:
+                options['compression_opts'] = self.compression_level
+        if self.shuffle:
+            options['shuffle'] = True
+        return( options )
+
     def write( self, iteration ) :
         """
         Check if the data should be written at this iteration
@@ -132,13 +261,50 @@ class OpenPMDDiagnostic(object) :
             The current iteration number of the simulation.
         """
         # Check if the fields should be written at this iteration
-        if iteration % self.period == 0 \
-            and iteration >= self.iteration_min \
-            and iteration < self.iteration_max:
+        if self.is_output_iteration( iteration ):
 
             # Write the hdf5 file if needed
             self.write_hdf5( iteration )
 
+    def flush( self ):
+        """
+        Wait until the files that are written in the background
+        (if `write_in_background` is True) are complete
+        """
+        if self.writer is not None:
+            self.writer.flush()
+
+    def is_output_iteration( self, iteration ):
+        """
+        Return whether the data should be written at this iteration
+        (based on the period, `iteration_min` and `iteration_max`)
+
+        Parameter
+        ---------
+        iteration : int
+            The current iteration number of the simulation.
+        """
+        return( iteration % self.period == 0
+                and iteration >= self.iteration_min
+                and iteration < self.iteration_max )
+
+    def requires_gathered_fields( self, species, iteration ):
+        """
+        Return whether this diagnostic uses the fields that are gathered
+        on the particles of `species` (i.e. the arrays Ex, Ey, Ez, Bx, By,
+        Bz) at this iteration. If not, the gathering of this species may
+        be fused with its push, without storing these arrays.
+
+        Parameters
+        ----------
+        species: a Particles object
+            The species considered
+
+        iteration : int
+            The current iteration number of the simulation.
+        """
+        return( False )
+
 
     def create_dir( self, dir_path) :
         """
@@ -186,8 +352,13 @@ class OpenPMDDiagnostic(object) :
         f.attrs["openPMD"] = np.string_("1.0.0")
         f.attrs["openPMDextension"] = np.uint32(1)
         f.attrs["software"] = np.string_("fbpic " + fbpic_version)
-        f.attrs["date"] = np.string_(
-            datetime.datetime.now(tzlocal()).strftime('%Y-%m-%d %H:%M:%S %z'))
+        date = datetime.datetime.now(tzlocal()).strftime(
+                                                    '%Y-%m-%d %H:%M:%S %z')
+        if self.parallel_write:
+            # The attributes are written collectively: they need to be
+            # identical on all ranks
+            date = self.comm.world_comm.bcast( date, root=0 )
+        f.attrs["date"] = np.string_( date )
         f.attrs["meshesPath"] = np.string_("fields/")
         f.attrs["particlesPath"] = np.string_("particles/")
         f.attrs["iterationEncoding"] = np.string_("fileBased")
@@ -0,0 +1,54 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines inline functions that are compiled for both GPU and CPU, and
+used in the reduced diagnostics (moments and histograms of the particles)
+"""
+
+# Number of components of the vector (1, x, y, z, ux, uy, uz, gamma),
+# whose weighted products are summed in the moments of the particles
+n_moments = 8
+
+def get_bin_index( value, invert, vmin, vmax, n_bins ):
+    """
+    Return the index of the bin of `value` (or 1/`value`, if `invert` is
+    True), among `n_bins` regular bins between `vmin` and `vmax`,
+    or -1 if it is outside of these bins
+    """
+    if invert:
+        value = 1./value
+    if not (value >= vmin and value < vmax):
+        return( -1 )
+    # Single bin (e.g. second axis of a 1D histogram, with infinite bounds)
+    if n_bins == 1:
+        return( 0 )
+    i_bin = int( (value - vmin)/(vmax - vmin)*n_bins )
+    # Avoid round-off errors for values just below vmax
+    if i_bin >= n_bins:
+        i_bin = n_bins - 1
+    return( i_bin )
+
+def get_moment_component( k, x, y, z, ux, uy, uz, inv_gamma, centers ):
+    """
+    Return the component `k` of the vector (1, x, y, z, ux, uy, uz, gamma)
+    of a single macroparticle, from which `centers[k]` is subtracted
+    """
+    if k == 0:
+        return( 1. )
+    elif k == 1:
+        value = x
+    elif k == 2:
+        value = y
+    elif k == 3:
+        value = z
+    elif k == 4:
+        value = ux
+    elif k == 5:
+        value = uy
+    elif k == 6:
+        value = uz
+    else:
+        value = 1./inv_gamma
+    return( value - centers[k] )
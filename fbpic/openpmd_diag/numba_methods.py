@@ -0,0 +1,158 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines numba methods that are used in the particle diagnostics,
+in order to select the particles that are written: the selection is
+represented by a compact list of particle indices, which is progressively
+shortened by the rules of the selection.
+
+It also defines the numba methods of the reduced diagnostics (moments and
+histograms of the selected particles, lineouts and maxima of the fields).
+"""
+import numba
+import numpy as np
+from fbpic.utils.threading import njit_parallel, prange
+# Import inline functions
+from .inline_functions import get_bin_index, get_moment_component, \
+    n_moments
+# Compile the inline functions for CPU
+get_bin_index = numba.njit( get_bin_index )
+get_moment_component = numba.njit( get_moment_component )
+
+@numba.njit
+def get_alive_indices( Ntot, dead, indices ):
+    """
+    Write the indices of the particles that are not dead at the beginning
+    of `indices`, and return their number
+
+    Parameters
+    ----------
+    Ntot: int
+        The number of particles
+
+    dead: 1darray of bools
+        Whether each particle is dead
+        (empty array if the species does not have dead particles)
+
+    indices: 1darray of ints
+        The array where the indices are written (at least Ntot elements)
+    """
+    if dead.shape[0] == 0:
+        for i in range( Ntot ):
+            indices[i] = i
+        return( Ntot )
+    n = 0
+    for i in range( Ntot ):
+        if not dead[i]:
+            indices[n] = i
+            n += 1
+    return( n )
+
+@numba.njit
+def filter_indices( indices, n, quantity, lower, upper, invert ):
+    """
+    Among the first `n` elements of `indices`, keep only those of the
+    particles for which `quantity` (or 1/`quantity`, if `invert` is True)
+    is strictly between `lower` and `upper` (in place, in the same order),
+    and return their number
+    """
+    n_kept = 0
+    for k in range( n ):
+        i = indices[k]
+        value = quantity[i]
+        if invert:
+            value = 1./value
+        if value > lower and value < upper:
+            indices[n_kept] = i
+            n_kept += 1
+    return( n_kept )
+
+@numba.njit
+def subsample_indices( indices, n, fraction, random_draw ):
+    """
+    Among the first `n` elements of `indices`, keep only those for which
+    the corresponding element of `random_draw` (uniform in [0, 1[) is
+    below `fraction` (in place, in the same order), and return their number
+    """
+    n_kept = 0
+    for k in range( n ):
+        if random_draw[k] < fraction:
+            indices[n_kept] = indices[k]
+            n_kept += 1
+    return( n_kept )
+
+@njit_parallel
+def get_weighted_moments_numba( indices, x, y, z, ux, uy, uz, inv_gamma,
+                                w, centers, nthreads, chunk_indices ):
+    """
+    Return the sums of w*v[i]*v[j] over the particles `indices`, where v is
+    the vector (1, x, y, z, ux, uy, uz, gamma) of each particle, from which
+    `centers` is subtracted (only the elements j >= i are computed)
+
+    The particles are divided into `nthreads` chunks, bounded by
+    `chunk_indices` (see `get_chunk_indices`), and each chunk has its own
+    sums, which are added at the end.
+    """
+    moments = np.zeros( (nthreads, n_moments, n_moments) )
+    # Vector of the current particle, for each chunk
+    vectors = np.empty( (nthreads, n_moments) )
+    for nt in prange( nthreads ):
+        v = vectors[nt]
+        for k in range( chunk_indices[nt], chunk_indices[nt+1] ):
+            ip = indices[k]
+            for i in range( n_moments ):
+                v[i] = get_moment_component( i, x[ip], y[ip], z[ip],
+                    ux[ip], uy[ip], uz[ip], inv_gamma[ip], centers )
+            for i in range( n_moments ):
+                wv = w[ip]*v[i]
+                for j in range( i, n_moments ):
+                    moments[nt, i, j] += wv*v[j]
+    # Add the sums of the different chunks
+    for nt in range( 1, nthreads ):
+        moments[0] += moments[nt]
+    return( moments[0] )
+
+@njit_parallel
+def get_histogram_numba( indices, quantity1, invert1, min1, max1, n1,
+                         quantity2, invert2, min2, max2, n2, w,
+                         nthreads, chunk_indices ):
+    """
+    Return the 2D histogram of (`quantity1`, `quantity2`) for the particles
+    `indices`, weighted by `w`, with `n1` and `n2` regular bins between
+    the bounds `min1`/`max1` and `min2`/`max2` (see `get_bin_index`)
+
+    The particles are divided into `nthreads` chunks, bounded by
+    `chunk_indices` (see `get_chunk_indices`), and each chunk has its own
+    histogram, which are added at the end.
+    """
+    histogram = np.zeros( (nthreads, n1, n2) )
+    for nt in prange( nthreads ):
+        for k in range( chunk_indices[nt], chunk_indices[nt+1] ):
+            ip = indices[k]
+            i1 = get_bin_index( quantity1[ip], invert1, min1, max1, n1 )
+            i2 = get_bin_index( quantity2[ip], invert2, min2, max2, n2 )
+            if i1 >= 0 and i2 >= 0:
+                histogram[nt, i1, i2] += w[ip]
+    # Add the histograms of the different chunks
+    for nt in range( 1, nthreads ):
+        histogram[0] += histogram[nt]
+    return( histogram[0] )
+
+@njit_parallel
+def get_axis_and_max_numba( field, lineout, max_along_r ):
+    """
+    For each longitudinal position iz of the 2D array `field`, copy the
+    value in the first radial cell into `lineout[iz]`, and write the
+    maximum of the modulus of the field along r into `max_along_r[iz]`
+    """
+    Nz, Nr = field.shape
+    for iz in prange( Nz ):
+        lineout[iz] = field[iz, 0]
+        max_value = 0.
+        for ir in range( Nr ):
+            value = abs( field[iz, ir] )
+            if value > max_value:
+                max_value = value
+        max_along_r[iz] = max_value
@@ -15,7 +15,8 @@ class ParticleChargeDensityDiagnostic(FieldDiagnostic):
 
     def __init__(self, period=None, sim=None, species={},
                 write_dir=None, iteration_min=0, iteration_max=np.inf,
-                dt_period=None ):
+                dt_period=None, chunks=None, compression=None,
+                compression_level=None, shuffle=False ):
         """
         Writes the charge density of the specified species in the
         openPMD file (one dataset per species)
@@ -47,6 +48,10 @@ class ParticleChargeDensityDiagnostic(FieldDiagnostic):
         iteration_min, iteration_max: ints
             The iterations between which data should be written
             (`iteration_min` is inclusive, `iteration_max` is exclusive)
+
+        chunks, compression, compression_level, shuffle : optional
+            The chunking and compression of the datasets
+            (see `FieldDiagnostic`)
         """
         # Check the arguments
         if sim is None:
@@ -63,7 +68,9 @@ class ParticleChargeDensityDiagnostic(FieldDiagnostic):
         FieldDiagnostic.__init__(self, period, fldobject=sim.fld,
                     comm=sim.comm, fieldtypes=fieldtypes, write_dir=write_dir,
                     iteration_min=iteration_min, iteration_max=iteration_max,
-                    dt_period=dt_period )
+                    dt_period=dt_period, chunks=chunks,
+                    compression=compression,
+                    compression_level=compression_level, shuffle=shuffle )
 
         # Register the arguments
         self.sim = sim
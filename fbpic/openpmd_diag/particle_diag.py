@@ -5,11 +5,18 @@
 This file defines the class ParticleDiagnostic
 """
 import os
-import h5py
 import numpy as np
 from scipy import constants
 from .generic_diag import OpenPMDDiagnostic
 from .data_dict import macro_weighted_dict, weighting_power_dict
+from .numba_methods import get_alive_indices, filter_indices, \
+    subsample_indices
+# Check if CUDA is available, then import CUDA functions
+from fbpic.utils.cuda import cuda_installed
+if cuda_installed:
+    from fbpic.utils.cuda import cuda, cuda_tpb_bpg_1d
+    from .cuda_methods import initialize_selection, apply_selection_rule, \
+        extract_selected_from_gpu
 
 class ParticleDiagnostic(OpenPMDDiagnostic) :
     """
@@ -19,7 +26,10 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
     def __init__(self, period=None, species={}, comm=None,
         particle_data=["position", "momentum", "weighting"],
         select=None, write_dir=None, iteration_min=0, iteration_max=np.inf,
-        subsampling_fraction=None, dt_period=None ) :
+        subsampling_fraction=None, dt_period=None,
+        write_in_background=False, parallel_write=False,
+        chunks=None, compression=None, compression_level=None,
+        shuffle=False, float32_data=[] ) :
         """
         Initialize the particle diagnostics.
 
@@ -73,10 +83,45 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
         subsampling_fraction : float, optional
             If this is not None, the particle data is subsampled with
             subsampling_fraction probability
+
+        write_in_background : bool, optional
+            Whether to write the files in a background thread, while the
+            simulation continues. (The selected particle data is then
+            kept in memory until it is written.)
+
+        parallel_write : bool, optional
+            Whether each MPI rank writes its own particles into the file,
+            using parallel HDF5, instead of gathering them on the first
+            rank. (Requires h5py with MPI support.)
+
+        chunks : int, optional
+            The number of particles in each chunk of the datasets.
+            If None, the datasets are contiguous (or chunked automatically,
+            with compression).
+
+        compression : string, optional
+            Either None, 'gzip' or 'lzf': the compression filter used
+            for the datasets. (Not available with `parallel_write`.)
+
+        compression_level : int, optional
+            The level of the 'gzip' compression (0 to 9)
+
+        shuffle : bool, optional
+            Whether to apply the shuffle filter before the compression
+
+        float32_data : a list of strings, optional
+            The elements of `particle_data` that are written in single
+            precision (e.g. ["position", "momentum"]), instead of
+            double precision. This is lossy (relative precision of 6.e-8),
+            but halves the size of these datasets.
         """
         # Check input
         if len(species) == 0:
             raise ValueError("You need to pass an non-empty `species_dict`.")
+        for quantity in float32_data:
+            if quantity not in particle_data:
+                raise ValueError("The element %s of `float32_data` is not "
+                    "in `particle_data`." %quantity)
         # Build an ordered list of species. (This is needed since the order
         # of the keys is not well defined, so each MPI rank could go through
         # the species in a different order, if species_dict.keys() is used.)
@@ -88,12 +133,21 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
         # General setup (uses the above timestep)
         OpenPMDDiagnostic.__init__(self, period, comm, write_dir,
                         iteration_min, iteration_max,
-                        dt_period=dt_period, dt_sim=self.dt )
+                        dt_period=dt_period, dt_sim=self.dt,
+                        write_in_background=write_in_background,
+                        parallel_write=parallel_write, chunks=chunks,
+                        compression=compression,
+                        compression_level=compression_level,
+                        shuffle=shuffle )
 
         # Register the arguments
         self.species_dict = species
         self.select = select
         self.subsampling_fraction = subsampling_fraction
+        self.float32_data = float32_data
+        # Buffers for the selected particles, that are reused from one
+        # output to the next (see `get_buffer`)
+        self.buffers = {}
 
         # For each species, get the particle arrays to be written
         self.array_quantities_dict = {}
@@ -127,6 +181,30 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
                 self.constant_quantities_dict[species_name] += ["charge"]
 
 
+    def requires_gathered_fields( self, species, iteration ):
+        """
+        Return whether this diagnostic writes (or selects particles based
+        on) the fields gathered on the particles of `species`, at this
+        iteration (see `OpenPMDDiagnostic.requires_gathered_fields`)
+        """
+        if not self.is_output_iteration( iteration ):
+            return( False )
+        return( self.uses_gathered_fields( species ) )
+
+    def uses_gathered_fields( self, species ):
+        """
+        Return whether this diagnostic writes (or selects particles based
+        on) the fields gathered on the particles of `species`
+        """
+        for species_name in self.species_names_list:
+            if self.species_dict[species_name] is species:
+                quantities = list( self.array_quantities_dict[species_name] )
+                if self.select is not None:
+                    quantities += list( self.select.keys() )
+                return( any( quantity in ['Ex','Ey','Ez','Bx','By','Bz']
+                             for quantity in quantities ) )
+        return( False )
+
     def setup_openpmd_species_group( self, grp, species, constant_quantities ) :
         """
         Set the attributes that are specific to the particle group
@@ -217,20 +295,21 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
         iteration : int
              The current iteration number of the simulation.
         """
-        # Receive data from the GPU if needed
-        for species_name in self.species_names_list:
-            species = self.species_dict[species_name]
-            if species.use_cuda :
-                species.receive_particles_from_gpu()
-
-        # Create the file and setup the openPMD structure (only first proc)
-        if self.rank == 0:
-            filename = "data%08d.h5" %iteration
-            fullpath = os.path.join( self.write_dir, "hdf5", filename )
-            f = h5py.File( fullpath, mode="a" )
-
+        # Create the file and setup the openPMD structure
+        # (only first proc, except in parallel mode)
+        filename = "data%08d.h5" %iteration
+        fullpath = os.path.join( self.write_dir, "hdf5", filename )
+        if self.writer is None:
+            f = self.open_file( fullpath )
+        else:
+            f = None
+        # (f is None if this processor does not participate in writing data)
+        if f is not None:
             # Setup its attributes
             self.setup_openpmd_file( f, iteration, iteration*self.dt, self.dt)
+        # When writing in the background, the selected particle data
+        # is instead stored in this list (with one element per species)
+        staged_data = []
 
         # Loop over the different species and
         # particle quantities that should be written
@@ -242,8 +321,8 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
                 # If not, immediately go to the next species_name
                 continue
 
-            # Setup the species group (only first proc)
-            if self.rank==0:
+            # Setup the species group
+            if f is not None:
                 species_path = "/data/%d/particles/%s" %(
                     iteration, species_name)
                 # Create and setup the h5py.Group species_grp
@@ -254,13 +333,14 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
                 species_grp = None
 
             # Select the particles that will be written
-            select_array = self.apply_selection( species )
+            # (On GPU, only the selected particles are then copied to the CPU)
+            selected_indices = self.get_selected_indices( species )
             # Get their total number
-            n = select_array.sum()
+            n = len( selected_indices )
             if self.comm is not None:
                 # Multi-proc output
-                if self.comm.size > 1:
-                    n_rank = self.comm.mpi_comm.allgather(n)
+                if self.comm.world_size > 1:
+                    n_rank = self.comm.world_comm.allgather(n)
                 else:
                     n_rank = [n]
                 Ntot = sum(n_rank)
@@ -270,21 +350,59 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
                 Ntot = n
 
             # Write the datasets for each particle datatype
-            self.write_particles( species_grp, species, n_rank,
-                Ntot, select_array, self.array_quantities_dict[species_name] )
+            if self.writer is None:
+                self.write_particles( species_grp, species, n_rank, Ntot,
+                selected_indices, self.array_quantities_dict[species_name] )
+            else:
+                # Get the selected data (when writing in the background,
+                # `get_dataset` returns new arrays rather than buffers)
+                species_data = {}
+                for quantity in self.array_quantities_dict[species_name]:
+                    species_data[quantity] = self.get_dataset( species,
+                        quantity, selected_indices, n_rank, Ntot )
+                staged_data.append( (species_name, Ntot, species_data) )
 
         # Close the file
-        if self.rank == 0:
+        if f is not None:
             f.close()
+        # Or hand the data to the background thread
+        elif self.writer is not None and self.rank == 0:
+            self.writer.submit( fullpath, self.write_staged_data,
+                                staged_data, fullpath, iteration )
 
-        # Send data to the GPU if needed
-        for species_name in self.species_names_list:
+    def write_staged_data( self, staged_data, fullpath, iteration ):
+        """
+        Write the selected particle data to an openPMD file
+        (executed by the background thread)
+
+        Parameters
+        ----------
+        staged_data: list of tuples
+            For each species, its name, its global number of particles, and
+            a dictionary of the arrays to be written (with the quantities
+            as keys)
+
+        fullpath: string
+            The absolute path to the openPMD file
+
+        iteration : int
+             The iteration number of this diagnostic
+        """
+        f = self.open_file( fullpath )
+        self.setup_openpmd_file( f, iteration, iteration*self.dt, self.dt )
+        for species_name, Ntot, species_data in staged_data:
             species = self.species_dict[species_name]
-            if species.use_cuda :
-                species.send_particles_to_gpu()
+            species_path = "/data/%d/particles/%s" %(iteration, species_name)
+            species_grp = f.require_group( species_path )
+            self.setup_openpmd_species_group( species_grp, species,
+                            self.constant_quantities_dict[species_name] )
+            self.write_particles( species_grp, species, None, Ntot, None,
+                self.array_quantities_dict[species_name], species_data )
+        f.close()
 
     def write_particles( self, species_grp, species, n_rank,
-                         Ntot, select_array, particle_data ) :
+                         Ntot, selected_indices, particle_data,
+                         staged_data=None ) :
         """
         Write all the particle data sets for one given species
 
@@ -300,14 +418,18 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
         Ntot : int
         	Contains the global number of particles
 
-        select_array : 1darray of bool
-            An array of the same shape as that particle array
-            containing True for the particles that satify all
-            the rules of self.select
+        selected_indices : 1darray of ints
+            The indices of the particles that satisfy all the rules of
+            self.select (on the GPU, if the species is on the GPU)
 
         particle_data: list of string
             The particle quantities that should be written
             (e.g. 'x', 'uy', 'id', 'w')
+
+        staged_data: dict, optional
+            If this is not None, the arrays to be written (already selected
+            and gathered), with the quantities as keys ; `n_rank` and
+            `selected_indices` are then not used
         """
         # Loop through the quantities and write them
         for quantity in particle_data :
@@ -315,22 +437,22 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
             if quantity in ["x", "y", "z"]:
                 quantity_path = "position/%s" %(quantity)
                 self.write_dataset( species_grp, species, quantity_path,
-                        quantity, n_rank, Ntot, select_array )
+                        quantity, n_rank, Ntot, selected_indices, staged_data )
 
             elif quantity in ["ux", "uy", "uz"]:
                 quantity_path = "momentum/%s" %(quantity[-1])
                 self.write_dataset( species_grp, species, quantity_path,
-                        quantity, n_rank, Ntot, select_array )
+                        quantity, n_rank, Ntot, selected_indices, staged_data )
 
             elif quantity in ["Ex" , "Ey" , "Ez"]:
                 quantity_path = "E/%s" %(quantity[-1])
                 self.write_dataset( species_grp, species, quantity_path,
-                        quantity, n_rank, Ntot, select_array )
+                        quantity, n_rank, Ntot, selected_indices, staged_data )
 
             elif quantity in ["Bx", "By", "Bz"]:
                 quantity_path = "B/%s" %(quantity[-1])
                 self.write_dataset( species_grp, species, quantity_path,
-                        quantity, n_rank, Ntot, select_array )
+                        quantity, n_rank, Ntot, selected_indices, staged_data )
 
             elif quantity in ["w", "id", "charge", "gamma"]:
                 if quantity == "w":
@@ -338,8 +460,8 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
                 else:
                     quantity_path = quantity
                 self.write_dataset( species_grp, species, quantity_path,
-                                    quantity, n_rank, Ntot, select_array )
-                if self.rank == 0:
+                        quantity, n_rank, Ntot, selected_indices, staged_data )
+                if species_grp is not None:
                     self.setup_openpmd_species_record(
                         species_grp[quantity_path], quantity_path )
 
@@ -348,7 +470,7 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
                     				 %(quantity))
 
         # Setup the hdf5 groups for "position", "momentum", "E", "B"
-        if self.rank == 0:
+        if species_grp is not None:
             if "x" in particle_data:
                 self.setup_openpmd_species_record(
                     species_grp["position"], "position" )
@@ -363,54 +485,120 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
                     species_grp["B"], "B" )
 
 
-    def apply_selection( self, species ) :
+    def get_selected_indices( self, species ) :
         """
         Apply the rules of self.select to determine which
         particles should be written, Apply random subsampling using
         the property subsampling_fraction.
 
+        The selection is evaluated as a compact list of indices, whose
+        length decreases with each rule (so that the subsequent rules
+        and the random subsampling only apply to the selected particles)
+
         Parameters
         ----------
         species : a Species object
 
         Returns
         -------
-        A 1d array of the same shape as that particle array
-        containing True for the particles that satify all
-        the rules of self.select
+        A 1d array of ints containing the indices of the particles
+        that satisfy all the rules of self.select (on the GPU, if
+        the species is on the GPU)
         """
-        # Initialize an array filled with True
-        select_array = np.ones( species.Ntot, dtype='bool' )
-        # subsampling selector
-        if self.subsampling_fraction is not None :
-            subsampling_array = np.random.rand(species.Ntot) < \
-                self.subsampling_fraction
-            select_array = np.logical_and(subsampling_array,select_array)
+        if species.use_cuda:
+            return( self.get_selected_indices_gpu( species ) )
+
+        # Start with the particles that are not dead (with
+        # `particle_removal='mask'`)
+        indices = self.get_buffer( 'indices', species.Ntot, np.int64 )
+        if species.n_dead > 0:
+            dead = species.dead
+        else:
+            dead = np.empty( 0, dtype=np.bool_ )
+        n = get_alive_indices( species.Ntot, dead, indices )
 
         # Apply the rules successively
         if self.select is not None :
             # Go through the quantities on which a rule applies
             for quantity in self.select.keys() :
-                if quantity == "gamma":
-                    quantity_array = 1.0/getattr( species, "inv_gamma" )
-                else:
-                    quantity_array = getattr( species, quantity )
-                # Lower bound
-                if self.select[quantity][0] is not None :
-                    select_array = np.logical_and(
-                        quantity_array > self.select[quantity][0],
-                        select_array )
-                # Upper bound
-                if self.select[quantity][1] is not None :
-                    select_array = np.logical_and(
-                        quantity_array < self.select[quantity][1],
-                        select_array )
+                quantity_array, invert, lower, upper = \
+                    get_selection_rule( species, self.select, quantity )
+                n = filter_indices( indices, n,
+                        quantity_array, lower, upper, invert )
+
+        # subsampling selector
+        if self.subsampling_fraction is not None :
+            n = subsample_indices( indices, n, self.subsampling_fraction,
+                                   np.random.rand(n) )
 
-        return( select_array )
+        return( indices[:n] )
 
+    def get_selected_indices_gpu( self, species ):
+        """
+        Same as `get_selected_indices`, for a species on the GPU: the
+        rules are evaluated on the GPU (one flag per particle), and the
+        flags are copied to the CPU to build the compact list of indices,
+        which is then sent back to the GPU.
+        """
+        Ntot = species.Ntot
+        # Apply the rules successively
+        if (self.select is not None) and (Ntot > 0):
+            selected = self.get_buffer( 'selected', Ntot, np.uint8, gpu=True )
+            selected = selected[:Ntot]
+            dim_grid_1d, dim_block_1d = cuda_tpb_bpg_1d( Ntot )
+            initialize_selection[dim_grid_1d, dim_block_1d]( selected )
+            for quantity in self.select.keys() :
+                quantity_array, invert, lower, upper = \
+                    get_selection_rule( species, self.select, quantity )
+                apply_selection_rule[dim_grid_1d, dim_block_1d](
+                    selected, quantity_array, lower, upper, invert )
+            # Get the indices of the selected particles
+            indices = np.flatnonzero( selected.copy_to_host() )
+        else:
+            indices = np.arange( Ntot )
+        n = len(indices)
+        # subsampling selector
+        if self.subsampling_fraction is not None :
+            n = subsample_indices( indices, n, self.subsampling_fraction,
+                                   np.random.rand(n) )
+        # Send the indices to the GPU
+        gpu_indices = self.get_buffer( 'indices', n, np.int64, gpu=True )
+        if n > 0:
+            gpu_indices[:n].copy_to_device( indices[:n] )
+        return( gpu_indices[:n] )
+
+    def get_buffer( self, name, n, dtype, gpu=False ):
+        """
+        Return an array of at least `n` elements, that is reused from
+        one call to the next (and reallocated only if it is too small)
+
+        Parameters
+        ----------
+        name: string
+            Identifies the buffer (e.g. 'indices')
+
+        n: int
+            The required number of elements
+
+        dtype: a numpy dtype
+            The type of the elements
+
+        gpu: bool
+            Whether the buffer is on the GPU
+        """
+        key = ( name, np.dtype(dtype).str, gpu )
+        if (key not in self.buffers) or (len(self.buffers[key]) < n):
+            # Allocate a few more elements than needed, so as to avoid
+            # reallocating when the number of particles slightly increases
+            size = int( 1.1*n ) + 1
+            if gpu:
+                self.buffers[key] = cuda.device_array( size, dtype=dtype )
+            else:
+                self.buffers[key] = np.empty( size, dtype=dtype )
+        return( self.buffers[key] )
 
     def write_dataset( self, species_grp, species, path, quantity,
-                       n_rank, Ntot, select_array ) :
+                       n_rank, Ntot, selected_indices, staged_data=None ) :
         """
         Write a given dataset
 
@@ -436,16 +624,23 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
         Ntot : int
         	Contains the global number of particles
 
-        select_array : 1darray of bool
-            An array of the same shape as that particle array
-            containing True for the particles that satify all
-            the rules of self.select
+        selected_indices : 1darray of ints
+            The indices of the particles that satisfy all the rules of
+            self.select (on the GPU, if the species is on the GPU)
+
+        staged_data: dict, optional
+            If this is not None, the arrays to be written (see
+            `write_particles`)
         """
         # Create the dataset and setup its attributes
-        if self.rank==0:
+        if species_grp is not None:
             datashape = (Ntot, )
             if quantity == "id":
                 dtype = 'uint64'
+            # The record (e.g. "position" for "position/x") can be
+            # written in single precision
+            elif path.split('/')[0] in self.float32_data:
+                dtype = 'f4'
             else:
                 dtype = 'f8'
             # If the dataset already exists, remove it.
@@ -453,18 +648,30 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
             # in case the number of particles is not exactly the same.)
             if path in species_grp:
                 del species_grp[path]
-            dset = species_grp.create_dataset(path, datashape, dtype=dtype )
+            dset = species_grp.create_dataset( path, datashape, dtype=dtype,
+                                    **self.get_dataset_options(datashape) )
             self.setup_openpmd_species_component( dset, quantity )
 
         # Fill the dataset with the quantity
-        quantity_array = self.get_dataset( species, quantity, select_array,
-                                           n_rank, Ntot )
-        if self.rank==0:
+        if staged_data is None:
+            quantity_array = self.get_dataset( species, quantity,
+                                    selected_indices, n_rank, Ntot )
+        else:
+            quantity_array = staged_data[quantity]
+        if self.parallel_write:
+            # Each proc writes its own particles, after those of the
+            # procs with a lower rank (same order as `gather_ptcl_array`)
+            i_start = sum( n_rank[:self.comm.world_rank] )
+            if len(quantity_array) > 0:
+                dset[i_start:i_start+len(quantity_array)] = quantity_array
+        elif species_grp is not None:
             dset[:] = quantity_array
 
-    def get_dataset( self, species, quantity, select_array, n_rank, Ntot ) :
+    def get_dataset( self, species, quantity, selected_indices,
+                     n_rank, Ntot ) :
         """
-        Extract the array that satisfies select_array
+        Extract the selected particles of the array of `quantity`
+        (On GPU, only the selected particles are copied to the CPU)
 
         species : a Particles object
         	The species object to get the particle data from
@@ -472,31 +679,39 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
         quantity : string
             The quantity to be extracted (e.g. 'x', 'uz', 'w')
 
-        select_array : 1darray of bool
-            An array of the same shape as that particle array
-            containing True for the particles that satify all
-            the rules of self.select
+        selected_indices : 1darray of ints
+            The indices of the particles that satisfy all the rules of
+            self.select (on the GPU, if the species is on the GPU)
 
         n_rank: list of ints
         	A list containing the number of particles to send on each proc
 
         Ntot : int
             Length of the final array (selected + gathered from all proc)
+
+        In parallel mode (`parallel_write`), the array is not gathered,
+        and only contains the selected particles of this proc.
+
+        Unless the data is written in the background, the returned array
+        may be a buffer that is overwritten by the next call.
         """
         # Extract the quantity
         if quantity == "id":
-            quantity_one_proc = species.tracker.id
+            quantity_array = species.tracker.id
         elif quantity == "charge":
-            quantity_one_proc = constants.e * species.ionizer.ionization_level
-        elif quantity == "w":
-            quantity_one_proc = species.w
+            quantity_array = species.ionizer.ionization_level
         elif quantity == "gamma":
-            quantity_one_proc = 1.0/getattr( species, "inv_gamma" )
+            quantity_array = species.inv_gamma
         else:
-            quantity_one_proc = getattr( species, quantity )
+            quantity_array = getattr( species, quantity )
 
         # Apply the selection
-        quantity_one_proc = quantity_one_proc[ select_array ]
+        quantity_one_proc = self.extract_selected_particles(
+                                quantity_array, selected_indices )
+        if quantity == "charge":
+            quantity_one_proc = constants.e * quantity_one_proc
+        elif quantity == "gamma":
+            np.divide( 1., quantity_one_proc, out=quantity_one_proc )
 
         # If this is the momentum, multiply by the proper factor
         # (only for species that have a mass)
@@ -504,7 +719,7 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
             if species.m>0:
                 scale_factor = species.m * constants.c
                 quantity_one_proc *= scale_factor
-        if self.comm is not None:
+        if (self.comm is not None) and (not self.parallel_write):
             quantity_all_proc = self.comm.gather_ptcl_array(
                 quantity_one_proc, n_rank, Ntot )
         else:
@@ -512,3 +727,70 @@ class ParticleDiagnostic(OpenPMDDiagnostic) :
 
         # Return the results
         return( quantity_all_proc )
+
+    def extract_selected_particles( self, quantity_array, selected_indices ):
+        """
+        Copy the elements `selected_indices` of `quantity_array` to a
+        (compact) array on the CPU. Unless the data is written in the
+        background, this array is a reused buffer.
+
+        Parameters
+        ----------
+        quantity_array: 1darray (on the CPU or GPU)
+            A particle array (e.g. x, uz, id)
+
+        selected_indices: 1darray of ints (on the same device)
+            The indices of the selected particles
+        """
+        n = len( selected_indices )
+        dtype = quantity_array.dtype
+        # Reuse the buffers, except if the data is written later
+        reuse_buffers = (self.writer is None)
+        if reuse_buffers:
+            selected = self.get_buffer( 'data', n, dtype )[:n]
+        else:
+            selected = np.empty( n, dtype=dtype )
+        if n == 0:
+            return( selected )
+
+        if isinstance( quantity_array, np.ndarray ):
+            np.take( quantity_array, selected_indices, out=selected )
+        else:
+            # Extract the selected particles on the GPU, and copy them
+            gpu_selected = self.get_buffer( 'data', n, dtype, gpu=True )
+            dim_grid_1d, dim_block_1d = cuda_tpb_bpg_1d( n )
+            extract_selected_from_gpu[dim_grid_1d, dim_block_1d](
+                selected_indices, quantity_array, gpu_selected )
+            gpu_selected[:n].copy_to_host( selected )
+        return( selected )
+
+
+def get_selection_rule( species, select, quantity ):
+    """
+    Return the particle array on which the rule of `select` for `quantity`
+    applies, whether the rule applies to its inverse (for "gamma"),
+    and the lower and upper bounds of the rule (infinite if there is
+    no bound)
+
+    Parameters
+    ----------
+    species : a Species object
+
+    select : dict
+        The rules of the selection (see `ParticleDiagnostic`)
+
+    quantity : string
+        The quantity on which the rule applies (e.g. 'uz', 'gamma')
+    """
+    if quantity == "gamma":
+        quantity_array = species.inv_gamma
+        invert = True
+    else:
+        quantity_array = getattr( species, quantity )
+        invert = False
+    lower, upper = select[quantity]
+    if lower is None:
+        lower = -np.inf
+    if upper is None:
+        upper = np.inf
+    return( quantity_array, invert, lower, upper )
@@ -0,0 +1,742 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file defines the reduced diagnostics, which compute in-situ quantities
+that are much smaller than the raw fields and particles, and append them at
+each output to a single time-series file (one HDF5 file per diagnostic, in
+the subdirectory `reduced` of `write_dir`):
+- ParticleMomentsDiagnostic: charge, averages, spreads and emittances
+- ParticleHistogramDiagnostic: 1D/2D histograms (e.g. energy spectrum)
+- FieldReductionDiagnostic: on-axis lineouts and maxima of each mode
+
+These quantities are computed on the CPU or on the GPU (where the
+particles and fields are) and reduced over the MPI ranks, so that only
+a few numbers per output are transferred and written.
+"""
+import os
+import numpy as np
+import h5py
+from fbpic.utils.threading import nthreads, get_chunk_indices
+from .generic_diag import OpenPMDDiagnostic
+from .field_diag import require_interp_fields
+from .particle_diag import get_selection_rule
+from .inline_functions import n_moments
+from .numba_methods import get_alive_indices, filter_indices, \
+    get_weighted_moments_numba, get_histogram_numba, get_axis_and_max_numba
+# Check if CUDA is available, then import CUDA functions
+from fbpic.utils.cuda import cuda_installed
+if cuda_installed:
+    from fbpic.utils.cuda import cuda, cuda_tpb_bpg_1d
+    from .cuda_methods import initialize_selection, apply_selection_rule, \
+        get_weighted_moments_cuda, get_histogram_cuda, get_axis_and_max_cuda
+
+# Particle quantities on which the moments and histograms are computed
+# (in the order of the vector v of `get_weighted_moments_numba`)
+moment_quantities = ['x', 'y', 'z', 'ux', 'uy', 'uz', 'gamma']
+# Maximal number of blocks of the CUDA kernel for the moments (each thread
+# goes through several particles, and adds its sums with atomic operations)
+max_blocks_moments = 128
+
+class ReducedDiagnostic(OpenPMDDiagnostic):
+    """
+    Generic class that contains methods which are common to the
+    reduced diagnostics (writing of the time series)
+    """
+    data_dir = "reduced"
+
+    def __init__(self, period, comm, write_dir, filename,
+                 iteration_min, iteration_max, dt_period, dt_sim ):
+        """
+        General setup of the reduced diagnostic
+
+        Parameters
+        ----------
+        filename : string
+            The name of the file in which the time series is written
+            (in the subdirectory `reduced` of `write_dir`)
+
+        See `OpenPMDDiagnostic` for the other parameters
+        """
+        OpenPMDDiagnostic.__init__(self, period, comm, write_dir,
+                iteration_min, iteration_max,
+                dt_period=dt_period, dt_sim=dt_sim )
+        self.fullpath = os.path.join( self.write_dir, self.data_dir, filename )
+
+    def append_to_file( self, iteration, time, data ):
+        """
+        Append the data of this iteration to the time series of the file
+        (only the first proc writes)
+
+        If the file already contains this iteration or later ones (e.g. when
+        restarting from a checkpoint), they are overwritten.
+
+        Parameters
+        ----------
+        iteration : int
+            The current iteration number of the simulation
+
+        time : float (seconds)
+            The physical time at this iteration
+
+        data : dict
+            The keys are the paths of the datasets in the file, and the
+            values are the data at this iteration (floats or arrays).
+            Each dataset has the shape (number of iterations,) + data shape
+        """
+        if self.rank != 0:
+            return
+        data = dict( data, iteration=iteration, time=time )
+
+        f = h5py.File( self.fullpath, mode="a" )
+        # Get the index of this iteration in the time series
+        if "iteration" in f:
+            i = int( np.searchsorted( f["iteration"][:], iteration ) )
+        else:
+            i = 0
+        for path, value in data.items():
+            value = np.asarray( value )
+            if path not in f:
+                f.create_dataset( path, (0,) + value.shape,
+                    maxshape=(None,) + value.shape, dtype=value.dtype )
+            dset = f[path]
+            dset.resize( i+1, axis=0 )
+            dset[i] = value
+        f.close()
+
+
+class ReducedParticleDiagnostic(ReducedDiagnostic):
+    """
+    Generic class that contains methods which are common to the reduced
+    diagnostics of the particles (selection, reduction over the MPI ranks)
+    """
+
+    def __init__(self, period, species, comm, select, write_dir, filename,
+                 iteration_min, iteration_max, dt_period ):
+        """
+        General setup of the reduced particle diagnostic
+
+        Parameters
+        ----------
+        species : a dictionary of :any:`Particles` objects
+            The species for which the reduced quantities are computed
+            (e.g. {"electrons": elec })
+
+        select : dict, optional
+            Either None or a dictionary of rules to select the particles
+            (see `ParticleDiagnostic`)
+
+        See `ReducedDiagnostic` for the other parameters
+        """
+        # Check input
+        if len(species) == 0:
+            raise ValueError("You need to pass an non-empty `species_dict`.")
+        # Build an ordered list of species (same order on all MPI ranks)
+        self.species_names_list = sorted( species.keys() )
+        # Extract the timestep from the first species
+        first_species = species[self.species_names_list[0]]
+        self.dt = first_species.dt
+
+        # General setup (uses the above timestep)
+        ReducedDiagnostic.__init__(self, period, comm, write_dir, filename,
+                    iteration_min, iteration_max, dt_period, self.dt )
+
+        # Register the arguments
+        self.species_dict = species
+        self.select = select
+
+    def get_selection( self, species ):
+        """
+        Apply the rules of self.select to determine which particles
+        are taken into account
+
+        Parameters
+        ----------
+        species : a Species object
+
+        Returns
+        -------
+        On CPU: a 1d array of ints, containing the indices of the selected
+        particles (excluding the dead particles)
+        On GPU: a 1d array of uint8 on the GPU, containing a flag for
+        each particle, or None if all the particles are selected
+        """
+        if species.use_cuda:
+            if (self.select is None) or (species.Ntot == 0):
+                return( None )
+            selected = cuda.device_array( species.Ntot, dtype=np.uint8 )
+            dim_grid_1d, dim_block_1d = cuda_tpb_bpg_1d( species.Ntot )
+            initialize_selection[dim_grid_1d, dim_block_1d]( selected )
+            for quantity in self.select.keys() :
+                quantity_array, invert, lower, upper = \
+                    get_selection_rule( species, self.select, quantity )
+                apply_selection_rule[dim_grid_1d, dim_block_1d](
+                    selected, quantity_array, lower, upper, invert )
+            return( selected )
+
+        # Start with the particles that are not dead
+        indices = np.empty( species.Ntot, dtype=np.int64 )
+        n = get_alive_indices( species.Ntot, species.get_dead_flags(),
+                               indices )
+        # Apply the rules successively
+        if self.select is not None :
+            for quantity in self.select.keys() :
+                quantity_array, invert, lower, upper = \
+                    get_selection_rule( species, self.select, quantity )
+                n = filter_indices( indices, n,
+                        quantity_array, lower, upper, invert )
+        return( indices[:n] )
+
+    def get_gpu_selection_arguments( self, selection ):
+        """
+        Return the arguments `selected` and `use_selection` of the CUDA
+        kernels, from the result of `get_selection` on GPU
+        """
+        if selection is None:
+            return( cuda.device_array( 0, dtype=np.uint8 ), False )
+        else:
+            return( selection, True )
+
+    def sum_over_ranks( self, array, root=None ):
+        """
+        Sum `array` over all the MPI ranks
+
+        Parameters
+        ----------
+        array : ndarray
+            The local contribution of this rank
+
+        root : int or None
+            If None, the sum is returned on all the ranks.
+            Otherwise, it is only returned on the rank `root`
+            (and None is returned on the other ranks)
+        """
+        if (self.comm is None) or (self.comm.world_size == 1):
+            return( array )
+        if root is None:
+            return( self.comm.world_comm.allreduce( array ) )
+        else:
+            return( self.comm.world_comm.reduce( array, root=root ) )
+
+
+class ParticleMomentsDiagnostic(ReducedParticleDiagnostic):
+    """
+    Reduced diagnostic that writes the moments of the (selected) particles
+    of each species: total charge, averages and spreads of the positions,
+    momenta and Lorentz factor, and transverse emittances.
+
+    For each species, the time series contains the following datasets
+    (in the group of the species, e.g. `electrons/mean_gamma`):
+    - `charge` : the total charge (in Coulombs)
+    - `weight` : the total number of physical particles
+    - `mean_<q>` and `sigma_<q>` : the average and the standard deviation
+      of `q` (weighted by the number of physical particles), for `q` among
+      x, y, z (in meters), ux, uy, uz (dimensionless momenta) and gamma
+    - `emittance_x` and `emittance_y` : the normalized transverse emittances
+      (in meters.radians), e.g. sqrt( <x^2><ux^2> - <x.ux>^2 ) for x
+      (with centered quantities)
+    The values are NaN when there is no particle.
+    """
+
+    def __init__(self, period=None, species={}, comm=None, select=None,
+                 write_dir=None, filename="particle_moments.h5",
+                 iteration_min=0, iteration_max=np.inf, dt_period=None ):
+        """
+        Initialize the diagnostic of the moments of the particles
+
+        Parameters
+        ----------
+        period : int, optional
+            The period of the diagnostics, in number of timesteps.
+            (i.e. the diagnostics are written whenever the number
+            of iterations is divisible by `period`). Specify either this or
+            `dt_period`.
+
+        dt_period : float (in seconds), optional
+            The period of the diagnostics, in physical time of the simulation.
+            Specify either this or `period`
+
+        species : a dictionary of :any:`Particles` objects
+            The object that is written (e.g. elec)
+            is assigned to the particle name of this species.
+            (e.g. {"electrons": elec })
+
+        comm : an fbpic BoundaryCommunicator object or None
+            If this is not None, the moments are computed over the particles
+            of all the MPI ranks. Otherwise, each rank computes the moments
+            of its own particles. (Make sure to use different write_dir
+            in this case.)
+
+        select : dict, optional
+            Either None or a dictionary of rules to select the particles
+            that are taken into account, of the form
+            'uz' : [5., None]  (Particles with uz above 5 mc)
+            (see `ParticleDiagnostic`)
+
+        write_dir : string, optional
+            The POSIX path to the directory where the results are
+            to be written. If none is provided, this will be the path
+            of the current working directory.
+
+        filename : string, optional
+            The name of the file of the time series
+            (in the subdirectory `reduced` of `write_dir`)
+
+        iteration_min, iteration_max: ints
+            The iterations between which data should be written
+            (`iteration_min` is inclusive, `iteration_max` is exclusive)
+        """
+        ReducedParticleDiagnostic.__init__(self, period, species, comm,
+            select, write_dir, filename, iteration_min, iteration_max,
+            dt_period )
+
+    def write_hdf5( self, iteration ):
+        """
+        Compute the moments of each species, and append them to the file
+
+        Parameter
+        ---------
+        iteration : int
+             The current iteration number of the simulation.
+        """
+        data = {}
+        for species_name in self.species_names_list:
+            species = self.species_dict[species_name]
+            if species is None:
+                continue
+            selection = self.get_selection( species )
+
+            # First pass: total weight and averages
+            moments = self.sum_over_ranks( self.get_moments(
+                species, selection, np.zeros(n_moments) ) )
+            weight = moments[0, 0]
+            if weight > 0:
+                centers = moments[0] / weight
+            else:
+                centers = np.zeros( n_moments )
+            # Second pass: moments of the centered quantities (more
+            # accurate than <q^2> - <q>^2, e.g. for the position in z)
+            moments = self.sum_over_ranks( self.get_moments(
+                species, selection, centers ), root=0 )
+            # Total charge (for ionizable species, the charge of each
+            # macroparticle depends on its ionization level)
+            if species.ionizer is None:
+                charge = species.q * weight
+            else:
+                charge = self.sum_over_ranks( species.q * self.get_moments(
+                    species, selection, centers,
+                    w=species.ionizer.w_times_level )[0, 0], root=0 )
+
+            if self.rank == 0:
+                for key, value in self.get_derived_quantities(
+                        charge, moments, centers ).items():
+                    data["%s/%s" %(species_name, key)] = value
+
+        self.append_to_file( iteration, iteration*self.dt, data )
+
+    def get_moments( self, species, selection, centers, w=None ):
+        """
+        Return the sums of w*v[i]*v[j] over the selected particles of this
+        rank, where v is the vector (1, x, y, z, ux, uy, uz, gamma) of each
+        particle, from which `centers` is subtracted
+
+        Parameters
+        ----------
+        species : a Species object
+
+        selection : an array or None
+            The selected particles (see `get_selection`)
+
+        centers : 1darray of floats
+            The values subtracted from v (`centers[0]` is not used)
+
+        w : 1darray of floats, optional
+            The weights of the particles (`species.w` by default)
+
+        Returns
+        -------
+        A symmetric 2darray of shape (n_moments, n_moments)
+        """
+        if w is None:
+            w = species.w
+        if species.use_cuda:
+            moments = cuda.to_device( np.zeros( (n_moments, n_moments) ) )
+            if species.Ntot > 0:
+                selected, use_selection = \
+                    self.get_gpu_selection_arguments( selection )
+                dim_grid_1d, dim_block_1d = cuda_tpb_bpg_1d( species.Ntot )
+                dim_grid_1d = min( dim_grid_1d, max_blocks_moments )
+                get_weighted_moments_cuda[dim_grid_1d, dim_block_1d](
+                    species.x, species.y, species.z,
+                    species.ux, species.uy, species.uz, species.inv_gamma,
+                    w, selected, use_selection, cuda.to_device(centers),
+                    moments )
+            moments = moments.copy_to_host()
+        else:
+            n = len( selection )
+            moments = get_weighted_moments_numba( selection,
+                species.x, species.y, species.z,
+                species.ux, species.uy, species.uz, species.inv_gamma,
+                w, centers, nthreads, get_chunk_indices( n, nthreads ) )
+        # Only the upper triangle is computed by the kernels
+        return( moments + np.triu( moments, 1 ).T )
+
+    def get_derived_quantities( self, charge, moments, centers ):
+        """
+        Return a dictionary of the quantities that are written for one
+        species (see the docstring of the class)
+
+        Parameters
+        ----------
+        charge : float
+            The total charge of the selected particles
+
+        moments : 2darray
+            The sums of the centered moments (see `get_moments`)
+
+        centers : 1darray
+            The averages that were used as centers in `moments`
+        """
+        weight = moments[0, 0]
+        quantities = { 'charge': charge, 'weight': weight }
+        if weight > 0:
+            # Correct for the round-off errors in `centers`
+            offsets = moments[0] / weight
+            covariance = moments / weight - np.outer( offsets, offsets )
+            mean = centers + offsets
+        else:
+            covariance = np.full( (n_moments, n_moments), np.nan )
+            mean = np.full( n_moments, np.nan )
+        for k, quantity in enumerate( moment_quantities ):
+            quantities['mean_%s' %quantity] = mean[k+1]
+            quantities['sigma_%s' %quantity] = \
+                np.sqrt( max( covariance[k+1, k+1], 0. ) )
+        for i, coord in [ (1, 'x'), (2, 'y') ]:
+            # Indices of the position and momentum along this coordinate
+            ix, iu = i, i + 3
+            quantities['emittance_%s' %coord] = np.sqrt( max(
+                covariance[ix, ix]*covariance[iu, iu] - covariance[ix, iu]**2,
+                0. ) )
+        if weight == 0:
+            for key in quantities:
+                if key not in ['charge', 'weight']:
+                    quantities[key] = np.nan
+        return( quantities )
+
+
+class ParticleHistogramDiagnostic(ReducedParticleDiagnostic):
+    """
+    Reduced diagnostic that writes a 1D or 2D histogram of the (selected)
+    particles of each species, weighted by the number of physical particles
+    (e.g. the energy spectrum, with the Lorentz factor `gamma`)
+
+    For each species, the time series contains the dataset `histogram`
+    (in the group of the species, e.g. `electrons/histogram`), with the
+    number of physical particles in each bin. In addition, the dataset
+    `<q>_range` contains the bounds of the bins along each axis `q`,
+    at each iteration.
+    """
+
+    def __init__(self, period=None, species={}, comm=None,
+                 axes=[('gamma', 100, 1., 101.)], select=None,
+                 write_dir=None, filename="particle_histogram.h5",
+                 iteration_min=0, iteration_max=np.inf, dt_period=None ):
+        """
+        Initialize the diagnostic of the histograms of the particles
+
+        Parameters
+        ----------
+        axes : a list of 1 or 2 tuples
+            The axes of the histogram, of the form (quantity, n_bins, min,
+            max), where `quantity` is among 'x', 'y', 'z', 'ux', 'uy', 'uz'
+            or 'gamma' (e.g. [('z', 200, 0., 100.e-6), ('gamma', 100, 1.,
+            201.)] for the longitudinal phase space). The bins are regular
+            between `min` (inclusive) and `max` (exclusive).
+            For 'z', `min` and `max` can be None, in which case the bins
+            cover the global simulation box (which may move with the
+            moving window).
+
+        select : dict, optional
+            Either None or a dictionary of rules to select the particles
+            that are taken into account (see `ParticleDiagnostic`)
+
+        filename : string, optional
+            The name of the file of the time series
+            (in the subdirectory `reduced` of `write_dir`)
+
+        See `ParticleMomentsDiagnostic` for the other parameters
+        """
+        ReducedParticleDiagnostic.__init__(self, period, species, comm,
+            select, write_dir, filename, iteration_min, iteration_max,
+            dt_period )
+
+        # Check the axes
+        if len(axes) not in [1, 2]:
+            raise ValueError("`axes` should contain 1 or 2 axes.")
+        if len(axes) == 2 and axes[0][0] == axes[1][0]:
+            raise ValueError("The two axes of the histogram are identical.")
+        for quantity, n_bins, vmin, vmax in axes:
+            if quantity not in moment_quantities:
+                raise ValueError("Invalid quantity in the histogram axes: "
+                    "%s\nAvailable quantities: %s"
+                    %(quantity, moment_quantities) )
+            if n_bins < 1:
+                raise ValueError("The number of bins should be positive.")
+            if (vmin is None) or (vmax is None):
+                if quantity != 'z' or vmin is not None or vmax is not None:
+                    raise ValueError("Only the bounds of 'z' can be None "
+                        "(and they should then both be None).")
+                if comm is None:
+                    raise ValueError("The bounds of 'z' can only be None "
+                        "when passing the argument `comm`.")
+            elif not vmin < vmax:
+                raise ValueError(
+                    "Invalid bounds for %s: %s, %s" %(quantity, vmin, vmax))
+        self.axes = axes
+
+    def write_hdf5( self, iteration ):
+        """
+        Compute the histogram of each species, and append it to the file
+
+        Parameter
+        ---------
+        iteration : int
+             The current iteration number of the simulation.
+        """
+        # Get the bounds of each axis at this iteration
+        ranges = []
+        for quantity, _, vmin, vmax in self.axes:
+            if vmin is None:
+                vmin, vmax = self.comm.get_zmin_zmax(
+                    local=False, with_damp=False, with_guard=False )
+            ranges.append( (vmin, vmax) )
+
+        data = {}
+        for species_name in self.species_names_list:
+            species = self.species_dict[species_name]
+            if species is None:
+                continue
+            selection = self.get_selection( species )
+            histogram = self.sum_over_ranks(
+                self.get_histogram( species, selection, ranges ), root=0 )
+            if self.rank == 0:
+                if len(self.axes) == 1:
+                    histogram = histogram[:, 0]
+                data["%s/histogram" %species_name] = histogram
+        for (quantity, _, _, _), bounds in zip( self.axes, ranges ):
+            data["%s_range" %quantity] = np.array( bounds, dtype=np.float64 )
+
+        self.append_to_file( iteration, iteration*self.dt, data )
+
+    def get_histogram( self, species, selection, ranges ):
+        """
+        Return the 2D histogram of the selected particles of this rank
+        (with a single bin along the second axis, for 1D histograms)
+
+        Parameters
+        ----------
+        species : a Species object
+
+        selection : an array or None
+            The selected particles (see `get_selection`)
+
+        ranges : list of tuples
+            The bounds of each axis at this iteration
+        """
+        # Get the arguments of the kernels for each axis
+        arguments = []
+        for (quantity, n_bins, _, _), (vmin, vmax) in zip(self.axes, ranges):
+            if quantity == "gamma":
+                arguments += [ species.inv_gamma, True, vmin, vmax, n_bins ]
+            else:
+                arguments += [ getattr( species, quantity ), False,
+                               vmin, vmax, n_bins ]
+        if len(self.axes) == 1:
+            # Single bin with infinite bounds, along the second axis
+            arguments += [ arguments[0], False, -np.inf, np.inf, 1 ]
+        shape = ( arguments[4], arguments[9] )
+
+        if species.use_cuda:
+            histogram = cuda.to_device( np.zeros( shape ) )
+            if species.Ntot > 0:
+                selected, use_selection = \
+                    self.get_gpu_selection_arguments( selection )
+                dim_grid_1d, dim_block_1d = cuda_tpb_bpg_1d( species.Ntot )
+                get_histogram_cuda[dim_grid_1d, dim_block_1d](
+                    *( arguments + [ species.w, selected, use_selection,
+                                     histogram ] ) )
+            return( histogram.copy_to_host() )
+        else:
+            n = len( selection )
+            return( get_histogram_numba( selection, *( arguments +
+                [ species.w, nthreads, get_chunk_indices( n, nthreads ) ] ) ) )
+
+
+class FieldReductionDiagnostic(ReducedDiagnostic):
+    """
+    Reduced diagnostic that writes, for each field component and each
+    azimuthal mode, the lineout of the field on the axis (more precisely,
+    in the first radial cell, at r = dr/2) and the maximum of its modulus
+    over the global simulation box.
+
+    For each component (e.g. `E/z`), the time series contains the datasets:
+    - `lineout` : the lineout along z, with the same conventions as
+      `FieldDiagnostic` for the modes: the real part of the mode 0, then
+      the real and imaginary part of the higher modes (multiplied by 2)
+    - `max` : the maximum of the modulus of each mode (multiplied by 2 for
+      the higher modes, i.e. the amplitude of cos/sin(m theta))
+    In addition, the datasets `zmin` and `dz` give the position of the
+    first point of the lineouts and the spacing between the points.
+    """
+
+    def __init__(self, period=None, fldobject=None, comm=None,
+                 fieldtypes=["E", "B"], write_dir=None,
+                 filename="field_reduction.h5", iteration_min=0,
+                 iteration_max=np.inf, dt_period=None ):
+        """
+        Initialize the diagnostic of the lineouts and maxima of the fields
+
+        Parameters
+        ----------
+        fldobject : a Fields object
+            Points to the data that has to be written at each output
+
+        comm : an fbpic BoundaryCommunicator object or None
+            If this is not None, the lineouts are gathered over the MPI
+            ranks and the guard cells are removed. Otherwise, each rank
+            writes its own data, including guard cells.
+            (Make sure to use different write_dir in this case.)
+
+        fieldtypes : a list of strings, optional
+            The strings are either "rho", "E", "B" or "J"
+            and indicate which field should be written.
+
+        filename : string, optional
+            The name of the file of the time series
+            (in the subdirectory `reduced` of `write_dir`)
+
+        See `FieldDiagnostic` for the other parameters
+        """
+        # Check input
+        if fldobject is None:
+            raise ValueError("You need to pass the argument `fldobject` "
+                "to `FieldReductionDiagnostic`.")
+        for fieldtype in fieldtypes:
+            if fieldtype not in ["rho", "E", "B", "J"]:
+                raise ValueError("Invalid string in fieldtypes: %s" %fieldtype)
+
+        # General setup
+        ReducedDiagnostic.__init__(self, period, comm, write_dir, filename,
+            iteration_min, iteration_max, dt_period, fldobject.dt )
+
+        # Register the arguments
+        self.fld = fldobject
+        self.fieldtypes = fieldtypes
+        self.coords = ['r', 't', 'z']
+
+    def write_hdf5( self, iteration ):
+        """
+        Compute the lineouts and maxima of the fields, and append them
+        to the file
+
+        Parameter
+        ---------
+        iteration : int
+             The current iteration number of the simulation.
+        """
+        # If needed: Bring E/B/rho/J from spectral space to real space
+        require_interp_fields( self.fld, self.comm, self.fieldtypes )
+
+        data = {}
+        for fieldtype in self.fieldtypes:
+            if fieldtype == "rho":
+                components = [ ("rho", "rho") ]
+            else:
+                components = [ ("%s/%s" %(fieldtype, coord),
+                    "%s%s" %(fieldtype, coord) ) for coord in self.coords ]
+            for path, quantity in components:
+                lineout, maximum = self.get_lineout_and_max( quantity )
+                if self.rank == 0:
+                    data["%s/lineout" %path] = lineout
+                    data["%s/max" %path] = maximum
+
+        # Position of the lineouts
+        if self.comm is None:
+            data["zmin"] = self.fld.interp[0].zmin
+        else:
+            data["zmin"], _ = self.comm.get_zmin_zmax(
+                local=False, with_damp=False, with_guard=False )
+        data["dz"] = self.fld.interp[0].dz
+
+        self.append_to_file( iteration, iteration*self.fld.dt, data )
+
+    def get_lineout_and_max( self, quantity ):
+        """
+        Return the lineouts and maxima of all the modes of the field
+        `quantity` (see the docstring of the class), gathered over the
+        MPI ranks (None is returned on the other ranks than the first one)
+
+        Parameter
+        ---------
+        quantity: string
+            Describes which field is considered
+            (Either rho, Er, Et, Ez, Br, Bz, Bt, Jr, Jt or Jz)
+        """
+        lineouts = []
+        maxima = np.zeros( self.fld.Nm )
+        for m in range( self.fld.Nm ):
+            field = getattr( self.fld.interp[m], quantity )
+            Nz_local = field.shape[0]
+            # Only the values on the axis and the maxima along r
+            # are computed on the GPU and transferred to the CPU
+            if self.fld.use_cuda:
+                gpu_lineout = cuda.device_array( Nz_local, dtype=field.dtype )
+                gpu_max = cuda.device_array( Nz_local, dtype=np.float64 )
+                dim_grid_1d, dim_block_1d = cuda_tpb_bpg_1d( Nz_local )
+                get_axis_and_max_cuda[dim_grid_1d, dim_block_1d](
+                    field, gpu_lineout, gpu_max )
+                lineout = gpu_lineout.copy_to_host()
+                max_along_r = gpu_max.copy_to_host()
+            else:
+                lineout = np.empty( Nz_local, dtype=field.dtype )
+                max_along_r = np.empty( Nz_local, dtype=np.float64 )
+                get_axis_and_max_numba( field, lineout, max_along_r )
+            # Gather the physical region of the grid along z
+            lineout = self.gather_along_z( lineout )
+            max_along_r = self.gather_along_z( max_along_r )
+            if self.rank == 0:
+                lineouts.append( lineout )
+                maxima[m] = max_along_r.max()
+
+        if self.rank != 0:
+            return( None, None )
+        # Same conventions as in `FieldDiagnostic.write_dataset`
+        data = np.empty( (2*self.fld.Nm - 1, len(lineouts[0])) )
+        data[0] = lineouts[0].real
+        for m in range( 1, self.fld.Nm ):
+            data[2*m-1] = 2*lineouts[m].real
+            data[2*m] = 2*lineouts[m].imag
+            maxima[m] *= 2
+        return( data, maxima )
+
+    def gather_along_z( self, array ):
+        """
+        Select the physical region of the 1darray `array` (defined on the
+        local grid, along z), and gather it on the first proc
+
+        Returns
+        -------
+        The gathered array on the first proc (None on the other procs)
+        """
+        if self.comm is None:
+            return( array )
+        local_array, _ = self.comm.get_local_physical_array(
+            array[:, np.newaxis] )
+        local_array = local_array[:, 0]
+        if self.comm.size == 1:
+            return( local_array )
+        # The ranks that have the same radial domain gather their data
+        # (the first rank gathers the data of the first radial domain)
+        gathered = self.comm.mpi_comm.gather( local_array, root=0 )
+        if self.rank == 0:
+            return( np.concatenate( gathered ) )
@@ -5,6 +5,11 @@
 This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
 It defines the deposition methods for rho and J for linear and cubic
 order shapes on the CPU with threading.
+
+The particle-chunk kernels (e.g. `deposit_rho_numba_linear`) loop over
+the modes at runtime. `Particles.deposit` instead uses the kernels that
+are generated for the number of modes of the simulation (see
+`fbpic/particles/kernel_generation.py`), which give the same values.
 """
 import numpy as np
 import numba
@@ -78,6 +83,79 @@ def Sr_cubic(cell_position, index):
         s = flip_factor*(-1./6.)*(((ir+3)-cell_position)-2)**3
     return s
 
+# Shape factors of one particle, computed at once
+@numba.njit
+def get_linear_shape_factors( z_cell, r_cell, Nr ):
+    """
+    Return the indices of the lowest cell of `global_array` that gets
+    modified by a particle (note: `global_array` has 2 guard cells),
+    followed by its 2 linear shape factors along z and its 2 linear shape
+    factors along r. These are identical to the values of `Sz_linear`
+    and `Sr_linear`, but are obtained with a single `floor` per direction.
+
+    Parameters
+    ----------
+    z_cell, r_cell : floats
+        Positions of the particle, in the cell unit
+
+    Nr : int
+        Number of gridpoints along r
+    """
+    iz = math.floor( z_cell )
+    ir = math.floor( r_cell )
+    Sz0 = iz+1.-z_cell
+    Sz1 = z_cell - iz
+    Sr0 = ir+1.-r_cell
+    Sr1 = r_cell - ir
+    # Flip the sign of the shape factor below the axis
+    if ir < 0:
+        Sr0 = -Sr0
+    # (`min` function avoids out-of-bounds access at high r)
+    ir_cell = min( int(ir)+2, Nr+2 )
+    iz_cell = int(iz) + 2
+    return( iz_cell, ir_cell, Sz0, Sz1, Sr0, Sr1 )
+
+@numba.njit
+def get_cubic_shape_factors( z_cell, r_cell, Nr ):
+    """
+    Return the indices of the lowest cell of `global_array` that gets
+    modified by a particle (note: `global_array` has 2 guard cells),
+    followed by its 4 cubic shape factors along z and its 4 cubic shape
+    factors along r. These are identical to the values of `Sz_cubic`
+    and `Sr_cubic`, but are obtained with a single `floor` per direction.
+
+    Parameters
+    ----------
+    z_cell, r_cell : floats
+        Positions of the particle, in the cell unit
+
+    Nr : int
+        Number of gridpoints along r
+    """
+    iz = math.floor( z_cell ) - 1.
+    ir = math.floor( r_cell ) - 1.
+    Sz0 = (-1./6.)*((z_cell-iz)-2)**3
+    Sz1 = (1./6.)*(3*((z_cell-(iz+1))**3)-6*((z_cell-(iz+1))**2)+4)
+    Sz2 = (1./6.)*(3*(((iz+2)-z_cell)**3)-6*(((iz+2)-z_cell)**2)+4)
+    Sz3 = (-1./6.)*(((iz+3)-z_cell)-2)**3
+    Sr0 = (-1./6.)*((r_cell-ir)-2)**3
+    Sr1 = (1./6.)*(3*((r_cell-(ir+1))**3)-6*((r_cell-(ir+1))**2)+4)
+    Sr2 = (1./6.)*(3*(((ir+2)-r_cell)**3)-6*(((ir+2)-r_cell)**2)+4)
+    Sr3 = (-1./6.)*(((ir+3)-r_cell)-2)**3
+    # Flip the sign of the shape factors below the axis
+    if ir < 0:
+        Sr0 = -Sr0
+    if ir+1 < 0:
+        Sr1 = -Sr1
+    if ir+2 < 0:
+        Sr2 = -Sr2
+    if ir+3 < 0:
+        Sr3 = -Sr3
+    # (`min` function avoids out-of-bounds access at high r)
+    ir_cell = min( int(ir)+2, Nr )
+    iz_cell = int(iz) + 2
+    return( iz_cell, ir_cell, Sz0, Sz1, Sz2, Sz3, Sr0, Sr1, Sr2, Sr3 )
+
 # -------------------------------
 # Field deposition - linear - rho
 # -------------------------------
@@ -173,18 +251,21 @@ def deposit_rho_numba_linear(x, y, z, w, q,
             # Positions of the particles, in the cell unit
             r_cell = invdr*(rj - rmin) - 0.5
             z_cell = invdz*(zj - zmin) - 0.5
-            # Index of the lowest cell of `global_array` that gets modified
-            # by this particle (note: `global_array` has 2 guard cells)
-            # (`min` function avoids out-of-bounds access at high r)
-            ir_cell = min( int(math.floor(r_cell))+2, Nr+2 )
-            iz_cell = int(math.floor( z_cell )) + 2
+            # Shape factors, computed once per particle, and index of the
+            # lowest cell of `global_array` that gets modified by this particle
+            iz_cell, ir_cell, Sz0, Sz1, Sr0, Sr1 = \
+                get_linear_shape_factors( z_cell, r_cell, Nr )
+            # Products of the shape factors along z and r
+            S00 = Sz0*Sr0; S01 = Sz0*Sr1
+            S10 = Sz1*Sr0; S11 = Sz1*Sr1
 
             # Add contribution of this particle to the global array
             for m in range(Nm):
-                rho_global[i_thread,m,iz_cell+0,ir_cell+0] += Sz_linear(z_cell, 0)*Sr_linear(r_cell, 0) * rho_scal[m]
-                rho_global[i_thread,m,iz_cell+0,ir_cell+1] += Sz_linear(z_cell, 0)*Sr_linear(r_cell, 1) * rho_scal[m]
-                rho_global[i_thread,m,iz_cell+1,ir_cell+0] += Sz_linear(z_cell, 1)*Sr_linear(r_cell, 0) * rho_scal[m]
-                rho_global[i_thread,m,iz_cell+1,ir_cell+1] += Sz_linear(z_cell, 1)*Sr_linear(r_cell, 1) * rho_scal[m]
+                rho_global[i_thread,m,iz_cell+0,ir_cell+0] += S00*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+0,ir_cell+1] += S01*rho_scal[m]
+
+                rho_global[i_thread,m,iz_cell+1,ir_cell+0] += S10*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+1,ir_cell+1] += S11*rho_scal[m]
 
     return
 
@@ -302,29 +383,33 @@ def deposit_J_numba_linear(x, y, z, w, q,
             # Positions of the particles, in the cell unit
             r_cell = invdr*(rj - rmin) - 0.5
             z_cell = invdz*(zj - zmin) - 0.5
-            # Index of the lowest cell of `global_array` that gets modified
-            # by this particle (note: `global_array` has 2 guard cells)
-            # (`min` function avoids out-of-bounds access at high r)
-            ir_cell = min( int(math.floor(r_cell))+2, Nr+2 )
-            iz_cell = int(math.floor( z_cell )) + 2
+            # Shape factors, computed once per particle, and index of the
+            # lowest cell of `global_array` that gets modified by this particle
+            iz_cell, ir_cell, Sz0, Sz1, Sr0, Sr1 = \
+                get_linear_shape_factors( z_cell, r_cell, Nr )
+            # Products of the shape factors along z and r
+            S00 = Sz0*Sr0; S01 = Sz0*Sr1
+            S10 = Sz1*Sr0; S11 = Sz1*Sr1
 
             # Add contribution of this particle to the global array
             for m in range(Nm):
-                j_r_global[i_thread,m,iz_cell+0,ir_cell+0] += Sz_linear(z_cell, 0)*Sr_linear(r_cell, 0) * jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+0,ir_cell+1] += Sz_linear(z_cell, 0)*Sr_linear(r_cell, 1) * jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+1,ir_cell+0] += Sz_linear(z_cell, 1)*Sr_linear(r_cell, 0) * jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+1,ir_cell+1] += Sz_linear(z_cell, 1)*Sr_linear(r_cell, 1) * jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+0,ir_cell+0] += S00*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+0,ir_cell+1] += S01*jr_scal[m]
+
+                j_r_global[i_thread,m,iz_cell+1,ir_cell+0] += S10*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+1,ir_cell+1] += S11*jr_scal[m]
 
-                j_t_global[i_thread,m,iz_cell+0,ir_cell+0] += Sz_linear(z_cell, 0)*Sr_linear(r_cell, 0) * jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+0,ir_cell+1] += Sz_linear(z_cell, 0)*Sr_linear(r_cell, 1) * jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+1,ir_cell+0] += Sz_linear(z_cell, 1)*Sr_linear(r_cell, 0) * jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+1,ir_cell+1] += Sz_linear(z_cell, 1)*Sr_linear(r_cell, 1) * jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+0,ir_cell+0] += S00*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+0,ir_cell+1] += S01*jt_scal[m]
 
-                j_z_global[i_thread,m,iz_cell+0,ir_cell+0] += Sz_linear(z_cell, 0)*Sr_linear(r_cell, 0) * jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+0,ir_cell+1] += Sz_linear(z_cell, 0)*Sr_linear(r_cell, 1) * jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+1,ir_cell+0] += Sz_linear(z_cell, 1)*Sr_linear(r_cell, 0) * jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+1,ir_cell+1] += Sz_linear(z_cell, 1)*Sr_linear(r_cell, 1) * jz_scal[m]
+                j_t_global[i_thread,m,iz_cell+1,ir_cell+0] += S10*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+1,ir_cell+1] += S11*jt_scal[m]
 
+                j_z_global[i_thread,m,iz_cell+0,ir_cell+0] += S00*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+0,ir_cell+1] += S01*jz_scal[m]
+
+                j_z_global[i_thread,m,iz_cell+1,ir_cell+0] += S10*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+1,ir_cell+1] += S11*jz_scal[m]
 
     return
 
@@ -424,33 +509,37 @@ def deposit_rho_numba_cubic(x, y, z, w, q,
             # Positions of the particles, in the cell unit
             r_cell = invdr*(rj - rmin) - 0.5
             z_cell = invdz*(zj - zmin) - 0.5
-            # Index of the lowest cell of `global_array` that gets modified
-            # by this particle (note: `global_array` has 2 guard cells)
-            # (`min` function avoids out-of-bounds access at high r)
-            ir_cell = min( int(math.floor(r_cell))+1, Nr )
-            iz_cell = int(math.floor( z_cell )) + 1
+            # Shape factors, computed once per particle, and index of the
+            # lowest cell of `global_array` that gets modified by this particle
+            iz_cell, ir_cell, Sz0, Sz1, Sz2, Sz3, Sr0, Sr1, Sr2, Sr3 = \
+                get_cubic_shape_factors( z_cell, r_cell, Nr )
+            # Products of the shape factors along z and r
+            S00 = Sz0*Sr0; S01 = Sz0*Sr1; S02 = Sz0*Sr2; S03 = Sz0*Sr3
+            S10 = Sz1*Sr0; S11 = Sz1*Sr1; S12 = Sz1*Sr2; S13 = Sz1*Sr3
+            S20 = Sz2*Sr0; S21 = Sz2*Sr1; S22 = Sz2*Sr2; S23 = Sz2*Sr3
+            S30 = Sz3*Sr0; S31 = Sz3*Sr1; S32 = Sz3*Sr2; S33 = Sz3*Sr3
 
             # Add contribution of this particle to the global array
             for m in range(Nm):
-                rho_global[i_thread,m,iz_cell+0,ir_cell+0] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 0)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+0,ir_cell+1] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 1)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+0,ir_cell+2] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 2)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+0,ir_cell+3] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 3)*rho_scal[m]
-
-                rho_global[i_thread,m,iz_cell+1,ir_cell+0] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 0)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+1,ir_cell+1] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 1)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+1,ir_cell+2] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 2)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+1,ir_cell+3] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 3)*rho_scal[m]
-
-                rho_global[i_thread,m,iz_cell+2,ir_cell+0] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 0)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+2,ir_cell+1] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 1)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+2,ir_cell+2] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 2)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+2,ir_cell+3] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 3)*rho_scal[m]
-
-                rho_global[i_thread,m,iz_cell+3,ir_cell+0] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 0)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+3,ir_cell+1] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 1)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+3,ir_cell+2] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 2)*rho_scal[m]
-                rho_global[i_thread,m,iz_cell+3,ir_cell+3] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 3)*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+0,ir_cell+0] += S00*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+0,ir_cell+1] += S01*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+0,ir_cell+2] += S02*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+0,ir_cell+3] += S03*rho_scal[m]
+
+                rho_global[i_thread,m,iz_cell+1,ir_cell+0] += S10*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+1,ir_cell+1] += S11*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+1,ir_cell+2] += S12*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+1,ir_cell+3] += S13*rho_scal[m]
+
+                rho_global[i_thread,m,iz_cell+2,ir_cell+0] += S20*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+2,ir_cell+1] += S21*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+2,ir_cell+2] += S22*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+2,ir_cell+3] += S23*rho_scal[m]
+
+                rho_global[i_thread,m,iz_cell+3,ir_cell+0] += S30*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+3,ir_cell+1] += S31*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+3,ir_cell+2] += S32*rho_scal[m]
+                rho_global[i_thread,m,iz_cell+3,ir_cell+3] += S33*rho_scal[m]
 
     return
 
@@ -569,72 +658,648 @@ def deposit_J_numba_cubic(x, y, z, w, q,
             # Positions of the particles, in the cell unit
             r_cell = invdr*(rj - rmin) - 0.5
             z_cell = invdz*(zj - zmin) - 0.5
-            # Index of the lowest cell of `global_array` that gets modified
-            # by this particle (note: `global_array` has 2 guard cells)
-            # (`min` function avoids out-of-bounds access at high r)
-            ir_cell = min( int(math.floor(r_cell))+1, Nr )
-            iz_cell = int(math.floor( z_cell )) + 1
+            # Shape factors, computed once per particle, and index of the
+            # lowest cell of `global_array` that gets modified by this particle
+            iz_cell, ir_cell, Sz0, Sz1, Sz2, Sz3, Sr0, Sr1, Sr2, Sr3 = \
+                get_cubic_shape_factors( z_cell, r_cell, Nr )
+            # Products of the shape factors along z and r
+            S00 = Sz0*Sr0; S01 = Sz0*Sr1; S02 = Sz0*Sr2; S03 = Sz0*Sr3
+            S10 = Sz1*Sr0; S11 = Sz1*Sr1; S12 = Sz1*Sr2; S13 = Sz1*Sr3
+            S20 = Sz2*Sr0; S21 = Sz2*Sr1; S22 = Sz2*Sr2; S23 = Sz2*Sr3
+            S30 = Sz3*Sr0; S31 = Sz3*Sr1; S32 = Sz3*Sr2; S33 = Sz3*Sr3
 
             # Add contribution of this particle to the global array
             for m in range(Nm):
-                j_r_global[i_thread,m,iz_cell+0,ir_cell+0] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 0)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+0,ir_cell+1] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 1)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+0,ir_cell+2] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 2)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+0,ir_cell+3] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 3)*jr_scal[m]
-
-                j_r_global[i_thread,m,iz_cell+1,ir_cell+0] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 0)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+1,ir_cell+1] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 1)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+1,ir_cell+2] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 2)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+1,ir_cell+3] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 3)*jr_scal[m]
-
-                j_r_global[i_thread,m,iz_cell+2,ir_cell+0] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 0)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+2,ir_cell+1] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 1)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+2,ir_cell+2] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 2)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+2,ir_cell+3] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 3)*jr_scal[m]
-
-                j_r_global[i_thread,m,iz_cell+3,ir_cell+0] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 0)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+3,ir_cell+1] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 1)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+3,ir_cell+2] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 2)*jr_scal[m]
-                j_r_global[i_thread,m,iz_cell+3,ir_cell+3] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 3)*jr_scal[m]
-
-                j_t_global[i_thread,m,iz_cell+0,ir_cell+0] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 0)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+0,ir_cell+1] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 1)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+0,ir_cell+2] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 2)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+0,ir_cell+3] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 3)*jt_scal[m]
-
-                j_t_global[i_thread,m,iz_cell+1,ir_cell+0] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 0)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+1,ir_cell+1] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 1)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+1,ir_cell+2] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 2)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+1,ir_cell+3] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 3)*jt_scal[m]
-
-                j_t_global[i_thread,m,iz_cell+2,ir_cell+0] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 0)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+2,ir_cell+1] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 1)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+2,ir_cell+2] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 2)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+2,ir_cell+3] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 3)*jt_scal[m]
-
-                j_t_global[i_thread,m,iz_cell+3,ir_cell+0] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 0)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+3,ir_cell+1] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 1)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+3,ir_cell+2] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 2)*jt_scal[m]
-                j_t_global[i_thread,m,iz_cell+3,ir_cell+3] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 3)*jt_scal[m]
-
-                j_z_global[i_thread,m,iz_cell+0,ir_cell+0] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 0)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+0,ir_cell+1] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 1)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+0,ir_cell+2] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 2)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+0,ir_cell+3] += Sz_cubic(z_cell, 0)*Sr_cubic(r_cell, 3)*jz_scal[m]
-
-                j_z_global[i_thread,m,iz_cell+1,ir_cell+0] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 0)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+1,ir_cell+1] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 1)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+1,ir_cell+2] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 2)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+1,ir_cell+3] += Sz_cubic(z_cell, 1)*Sr_cubic(r_cell, 3)*jz_scal[m]
-
-                j_z_global[i_thread,m,iz_cell+2,ir_cell+0] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 0)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+2,ir_cell+1] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 1)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+2,ir_cell+2] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 2)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+2,ir_cell+3] += Sz_cubic(z_cell, 2)*Sr_cubic(r_cell, 3)*jz_scal[m]
-
-                j_z_global[i_thread,m,iz_cell+3,ir_cell+0] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 0)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+3,ir_cell+1] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 1)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+3,ir_cell+2] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 2)*jz_scal[m]
-                j_z_global[i_thread,m,iz_cell+3,ir_cell+3] += Sz_cubic(z_cell, 3)*Sr_cubic(r_cell, 3)*jz_scal[m]
+                j_r_global[i_thread,m,iz_cell+0,ir_cell+0] += S00*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+0,ir_cell+1] += S01*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+0,ir_cell+2] += S02*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+0,ir_cell+3] += S03*jr_scal[m]
+
+                j_r_global[i_thread,m,iz_cell+1,ir_cell+0] += S10*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+1,ir_cell+1] += S11*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+1,ir_cell+2] += S12*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+1,ir_cell+3] += S13*jr_scal[m]
+
+                j_r_global[i_thread,m,iz_cell+2,ir_cell+0] += S20*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+2,ir_cell+1] += S21*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+2,ir_cell+2] += S22*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+2,ir_cell+3] += S23*jr_scal[m]
+
+                j_r_global[i_thread,m,iz_cell+3,ir_cell+0] += S30*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+3,ir_cell+1] += S31*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+3,ir_cell+2] += S32*jr_scal[m]
+                j_r_global[i_thread,m,iz_cell+3,ir_cell+3] += S33*jr_scal[m]
+
+                j_t_global[i_thread,m,iz_cell+0,ir_cell+0] += S00*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+0,ir_cell+1] += S01*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+0,ir_cell+2] += S02*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+0,ir_cell+3] += S03*jt_scal[m]
+
+                j_t_global[i_thread,m,iz_cell+1,ir_cell+0] += S10*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+1,ir_cell+1] += S11*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+1,ir_cell+2] += S12*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+1,ir_cell+3] += S13*jt_scal[m]
+
+                j_t_global[i_thread,m,iz_cell+2,ir_cell+0] += S20*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+2,ir_cell+1] += S21*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+2,ir_cell+2] += S22*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+2,ir_cell+3] += S23*jt_scal[m]
+
+                j_t_global[i_thread,m,iz_cell+3,ir_cell+0] += S30*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+3,ir_cell+1] += S31*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+3,ir_cell+2] += S32*jt_scal[m]
+                j_t_global[i_thread,m,iz_cell+3,ir_cell+3] += S33*jt_scal[m]
+
+                j_z_global[i_thread,m,iz_cell+0,ir_cell+0] += S00*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+0,ir_cell+1] += S01*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+0,ir_cell+2] += S02*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+0,ir_cell+3] += S03*jz_scal[m]
+
+                j_z_global[i_thread,m,iz_cell+1,ir_cell+0] += S10*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+1,ir_cell+1] += S11*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+1,ir_cell+2] += S12*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+1,ir_cell+3] += S13*jz_scal[m]
+
+                j_z_global[i_thread,m,iz_cell+2,ir_cell+0] += S20*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+2,ir_cell+1] += S21*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+2,ir_cell+2] += S22*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+2,ir_cell+3] += S23*jz_scal[m]
+
+                j_z_global[i_thread,m,iz_cell+3,ir_cell+0] += S30*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+3,ir_cell+1] += S31*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+3,ir_cell+2] += S32*jz_scal[m]
+                j_z_global[i_thread,m,iz_cell+3,ir_cell+3] += S33*jz_scal[m]
+
+    return
+
+# ----------------------------------------------
+# Field deposition - sorted particles, by tiles
+# ----------------------------------------------
+
+@numba.njit
+def get_shape_factors( z_cell, r_cell, Nr, shape_order, Sz, Sr ):
+    """
+    Compute the shape factors of a particle along z and r (in the arrays
+    `Sz` and `Sr`, which are modified by this function), and return the
+    indices of the lowest cell of `global_array` that gets modified
+    by this particle (note: `global_array` has 2 guard cells)
+
+    Parameters
+    ----------
+    z_cell, r_cell : floats
+        Positions of the particle, in the cell unit
+
+    Nr : int
+        Number of gridpoints along r
+
+    shape_order : int
+        Either 1 (linear shape) or 3 (cubic shape)
+
+    Sz, Sr : 1darrays of floats, of size shape_order+1
+    """
+    if shape_order == 1:
+        iz_cell, ir_cell, Sz[0], Sz[1], Sr[0], Sr[1] = \
+            get_linear_shape_factors( z_cell, r_cell, Nr )
+    else:
+        iz_cell, ir_cell, Sz[0], Sz[1], Sz[2], Sz[3], \
+            Sr[0], Sr[1], Sr[2], Sr[3] = \
+            get_cubic_shape_factors( z_cell, r_cell, Nr )
+    return( iz_cell, ir_cell )
+
+@numba.njit
+def add_tile_buffer( buffer, global_array, iz_start ):
+    """
+    Add the tile-local array `buffer` (of shape (Nm, Nz_buffer, 2+Nr+2))
+    into the global array `global_array` (of shape (Nreduce, Nm, 2+Nz+2,
+    2+Nr+2)), starting at the index `iz_start` along z
+    """
+    Nm, Nz_buffer, Nr_global = buffer.shape
+    Nz_global = global_array.shape[2]
+    for m in range(Nm):
+        for iz in range( max(0, -iz_start),
+                         min(Nz_buffer, Nz_global-iz_start) ):
+            for ir in range(Nr_global):
+                global_array[0, m, iz_start+iz, ir] += buffer[m, iz, ir]
+
+@njit_parallel
+def deposit_rho_numba_tiled(x, y, z, w, q,
+                            invdz, zmin, Nz,
+                            invdr, rmin, Nr,
+                            rho_global, Nm, shape_order,
+                            tile_prefix_sum, tile_size, tile_margin):
+    """
+    Deposition of the charge density rho using numba prange on the CPU,
+    for particles that are sorted by tiles along z
+    (see `fbpic/particles/utilities/cpu_sorting.py`).
+
+    Each tile is deposited into a small tile-local array, which covers the
+    cells of the tile, as well as `tile_margin` cells on each side (since
+    the particles may have moved since they were sorted) and the extent
+    of the shape factors. This array is then added directly into the first
+    copy of the global array. In order to avoid race conditions, the even
+    tiles are handled first, and then the odd tiles: this requires
+    tile_size >= 2*tile_margin + 3, so that the tile-local arrays of two
+    tiles that are handled simultaneously do not overlap.
+
+    Parameters
+    ----------
+    x, y, z : 1darray of floats (in meters)
+        The position of the particles
+
+    w : 1d array of floats
+        The weights of the particles
+        (For ionizable atoms: weight times the ionization level)
+
+    q : float
+        Charge of the species
+        (For ionizable atoms: this is always the elementary charge e)
+
+    rho_global : 4darrays of complexs
+        Global helper arrays of shape (Nreduce, Nm, 2+Nz+2, 2+Nr+2) where the
+        additional 2's in z and r correspond to deposition guard cells.
+        Only the first copy (along the first axis) is modified.
+
+    Nm : int
+        The number of azimuthal modes
+
+    shape_order : int
+        Either 1 (linear shape) or 3 (cubic shape)
+
+    invdz, invdr : float (in meters^-1)
+        Inverse of the grid step along the considered direction
+
+    zmin, rmin : float (in meters)
+        Position of the edge of the simulation box,
+        along the considered direction
+
+    Nz, Nr : int
+        Number of gridpoints along the considered direction
+
+    tile_prefix_sum : 1darray of integers
+        The index of the first particle of each tile
+
+    tile_size, tile_margin : int
+        Number of cells along z in each tile, and maximal number of
+        cells by which the particles may have exited their tile
+    """
+    n_tiles = tile_prefix_sum.shape[0] - 1
+    Nz_buffer = tile_size + 2*tile_margin + 3
+
+    # Loop over the even tiles, then the odd tiles
+    for parity in range(2):
+        # Deposit the tiles in parallel
+        for i in prange( (n_tiles + 1 - parity)//2 ):
+            i_tile = 2*i + parity
+            # Index, in the global array, of the first cell of the buffer
+            iz_start = i_tile*tile_size - tile_margin - 1
+
+            # Allocate tile-local arrays
+            rho_buffer = np.zeros( (Nm, Nz_buffer, Nr+4),
+                                   dtype=rho_global.dtype )
+            rho_scal = np.zeros( Nm, dtype=np.complex128 )
+            Sz = np.zeros( shape_order+1 )
+            Sr = np.zeros( shape_order+1 )
+
+            # Loop over the particles of this tile
+            for i_ptcl in range( tile_prefix_sum[i_tile],
+                                 tile_prefix_sum[i_tile+1] ):
+                # Position
+                xj = x[i_ptcl]
+                yj = y[i_ptcl]
+                zj = z[i_ptcl]
+                # Weights
+                wj = q * w[i_ptcl]
+
+                # Cylindrical conversion
+                rj = math.sqrt(xj**2 + yj**2)
+                # Avoid division by 0.
+                if (rj != 0.):
+                    invr = 1./rj
+                    cos = xj*invr  # Cosine
+                    sin = yj*invr  # Sine
+                else:
+                    cos = 1.
+                    sin = 0.
+                # Calculate contribution from this particle to each mode
+                rho_scal[0] = wj
+                for m in range(1,Nm):
+                    rho_scal[m] = (cos + 1.j*sin)*rho_scal[m-1]
+
+                # Positions of the particles, in the cell unit
+                r_cell = invdr*(rj - rmin) - 0.5
+                z_cell = invdz*(zj - zmin) - 0.5
+                iz_cell, ir_cell = get_shape_factors(
+                    z_cell, r_cell, Nr, shape_order, Sz, Sr )
+                iz_cell -= iz_start
+
+                # Add contribution of this particle to the tile-local array
+                for m in range(Nm):
+                    for iz in range(shape_order+1):
+                        for ir in range(shape_order+1):
+                            rho_buffer[m, iz_cell+iz, ir_cell+ir] += \
+                                Sz[iz]*Sr[ir]*rho_scal[m]
+
+            # Add the tile-local array to the global array
+            add_tile_buffer( rho_buffer, rho_global, iz_start )
+
+    return
+
+@njit_parallel
+def deposit_J_numba_tiled(x, y, z, w, q,
+                          ux, uy, uz, inv_gamma,
+                          invdz, zmin, Nz,
+                          invdr, rmin, Nr,
+                          j_r_global, j_t_global, j_z_global, Nm, shape_order,
+                          tile_prefix_sum, tile_size, tile_margin):
+    """
+    Deposition of the current density J using numba prange on the CPU,
+    for particles that are sorted by tiles along z.
+
+    See the docstring of `deposit_rho_numba_tiled` for the description
+    of the tiles, and of the parameters that are not described here.
+
+    Parameters
+    ----------
+    ux, uy, uz : 1darray of floats (in meters * second^-1)
+        The velocity of the particles
+
+    inv_gamma : 1darray of floats
+        The inverse of the relativistic gamma factor
+
+    j_x_global : 4darrays of complexs
+        Global helper arrays of shape (Nreduce, Nm, 2+Nz+2, 2+Nr+2) where the
+        additional 2's in z and r correspond to deposition guard cells.
+        Only the first copy (along the first axis) is modified.
+    """
+    n_tiles = tile_prefix_sum.shape[0] - 1
+    Nz_buffer = tile_size + 2*tile_margin + 3
+
+    # Loop over the even tiles, then the odd tiles
+    for parity in range(2):
+        # Deposit the tiles in parallel
+        for i in prange( (n_tiles + 1 - parity)//2 ):
+            i_tile = 2*i + parity
+            # Index, in the global array, of the first cell of the buffer
+            iz_start = i_tile*tile_size - tile_margin - 1
+
+            # Allocate tile-local arrays
+            jr_buffer = np.zeros( (Nm, Nz_buffer, Nr+4),
+                                  dtype=j_r_global.dtype )
+            jt_buffer = np.zeros( (Nm, Nz_buffer, Nr+4),
+                                  dtype=j_t_global.dtype )
+            jz_buffer = np.zeros( (Nm, Nz_buffer, Nr+4),
+                                  dtype=j_z_global.dtype )
+            jr_scal = np.zeros( Nm, dtype=np.complex128 )
+            jt_scal = np.zeros( Nm, dtype=np.complex128 )
+            jz_scal = np.zeros( Nm, dtype=np.complex128 )
+            Sz = np.zeros( shape_order+1 )
+            Sr = np.zeros( shape_order+1 )
+
+            # Loop over the particles of this tile
+            for i_ptcl in range( tile_prefix_sum[i_tile],
+                                 tile_prefix_sum[i_tile+1] ):
+                # Position
+                xj = x[i_ptcl]
+                yj = y[i_ptcl]
+                zj = z[i_ptcl]
+                # Velocity
+                uxj = ux[i_ptcl]
+                uyj = uy[i_ptcl]
+                uzj = uz[i_ptcl]
+                # Inverse gamma
+                inv_gammaj = inv_gamma[i_ptcl]
+                # Weights
+                wj = q * w[i_ptcl]
+
+                # Cylindrical conversion
+                rj = math.sqrt(xj**2 + yj**2)
+                # Avoid division by 0.
+                if (rj != 0.):
+                    invr = 1./rj
+                    cos = xj*invr  # Cosine
+                    sin = yj*invr  # Sine
+                else:
+                    cos = 1.
+                    sin = 0.
+                # Calculate contribution from this particle to each mode
+                jr_scal[0] = wj * c * inv_gammaj * (cos*uxj + sin*uyj)
+                jt_scal[0] = wj * c * inv_gammaj * (cos*uyj - sin*uxj)
+                jz_scal[0] = wj * c * inv_gammaj * uzj
+                for m in range(1,Nm):
+                    jr_scal[m] = (cos + 1.j*sin) * jr_scal[m-1]
+                    jt_scal[m] = (cos + 1.j*sin) * jt_scal[m-1]
+                    jz_scal[m] = (cos + 1.j*sin) * jz_scal[m-1]
+
+                # Positions of the particles, in the cell unit
+                r_cell = invdr*(rj - rmin) - 0.5
+                z_cell = invdz*(zj - zmin) - 0.5
+                iz_cell, ir_cell = get_shape_factors(
+                    z_cell, r_cell, Nr, shape_order, Sz, Sr )
+                iz_cell -= iz_start
+
+                # Add contribution of this particle to the tile-local arrays
+                for m in range(Nm):
+                    for iz in range(shape_order+1):
+                        for ir in range(shape_order+1):
+                            S = Sz[iz]*Sr[ir]
+                            jr_buffer[m, iz_cell+iz, ir_cell+ir] += \
+                                S*jr_scal[m]
+                            jt_buffer[m, iz_cell+iz, ir_cell+ir] += \
+                                S*jt_scal[m]
+                            jz_buffer[m, iz_cell+iz, ir_cell+ir] += \
+                                S*jz_scal[m]
+
+            # Add the tile-local arrays to the global arrays
+            add_tile_buffer( jr_buffer, j_r_global, iz_start )
+            add_tile_buffer( jt_buffer, j_t_global, iz_start )
+            add_tile_buffer( jz_buffer, j_z_global, iz_start )
+
+    return
+
+# ---------------------------------------------------------
+# Field deposition - sorted particles, by z-chunks (halos)
+# ---------------------------------------------------------
+
+@numba.njit
+def add_to_chunk( global_array, halo_low, halo_high, m, iz, ir,
+                  iz_low, iz_high, value ):
+    """
+    Add `value` to the cell (iz, ir) of the mode m of `global_array`
+    (of shape (Nreduce, Nm, 2+Nz+2, 2+Nr+2)), if this cell is within the
+    chunk [iz_low, iz_high) of the current thread, or to the corresponding
+    cell of the halo arrays `halo_low` or `halo_high` (of shape
+    (Nm, Nhalo, 2+Nr+2)) otherwise
+    """
+    if iz < iz_low:
+        halo_low[m, iz - iz_low + halo_low.shape[1], ir] += value
+    elif iz >= iz_high:
+        halo_high[m, iz - iz_high, ir] += value
+    else:
+        global_array[0, m, iz, ir] += value
+
+@numba.njit
+def add_halos( halos, global_array, chunk_iz_bounds ):
+    """
+    Add the halo arrays of all the chunks (of shape (n_chunks, 2, Nm,
+    Nhalo, 2+Nr+2)) to the global array, for the cells that are within
+    the global array
+    """
+    n_chunks, _, Nm, Nhalo, Nr_global = halos.shape
+    Nz_global = global_array.shape[2]
+    for i_chunk in range(n_chunks):
+        for i_side in range(2):
+            # First cell of the low or high halo
+            if i_side == 0:
+                iz_start = chunk_iz_bounds[i_chunk] - Nhalo
+            else:
+                iz_start = chunk_iz_bounds[i_chunk+1]
+            for m in range(Nm):
+                for iz in range( max(0, -iz_start),
+                                 min(Nhalo, Nz_global-iz_start) ):
+                    for ir in range(Nr_global):
+                        global_array[0, m, iz_start+iz, ir] += \
+                            halos[i_chunk, i_side, m, iz, ir]
+
+@njit_parallel
+def deposit_rho_numba_zchunks(x, y, z, w, q,
+                              invdz, zmin, Nz,
+                              invdr, rmin, Nr,
+                              rho_global, Nm, shape_order,
+                              chunk_prefix_sum, chunk_iz_bounds, tile_margin):
+    """
+    Deposition of the charge density rho using numba prange on the CPU,
+    for particles that are sorted by contiguous chunks along z
+    (see `fbpic/particles/utilities/cpu_sorting.py`).
+
+    Each thread handles the particles of one chunk, and deposits them
+    directly into the cells of the first copy of the global array that
+    belong to this chunk. The contributions to the cells of the
+    neighboring chunks (i.e. from particles close to the edges of the
+    chunk, or that moved since they were sorted) are deposited into
+    small thread-local halo arrays, which are added to the global array
+    at the end. Thus only one copy of the global array is needed.
+
+    Parameters
+    ----------
+    x, y, z : 1darray of floats (in meters)
+        The position of the particles
+
+    w : 1d array of floats
+        The weights of the particles
+        (For ionizable atoms: weight times the ionization level)
+
+    q : float
+        Charge of the species
+        (For ionizable atoms: this is always the elementary charge e)
+
+    rho_global : 4darrays of complexs
+        Global helper arrays of shape (Nreduce, Nm, 2+Nz+2, 2+Nr+2) where the
+        additional 2's in z and r correspond to deposition guard cells.
+        Only the first copy (along the first axis) is modified.
+
+    Nm : int
+        The number of azimuthal modes
+
+    shape_order : int
+        Either 1 (linear shape) or 3 (cubic shape)
+
+    invdz, invdr : float (in meters^-1)
+        Inverse of the grid step along the considered direction
+
+    zmin, rmin : float (in meters)
+        Position of the edge of the simulation box,
+        along the considered direction
+
+    Nz, Nr : int
+        Number of gridpoints along the considered direction
+
+    chunk_prefix_sum : 1darray of integers
+        The index of the first particle of each chunk
+
+    chunk_iz_bounds : 1darray of integers
+        The index in z of the first cell of each chunk
+
+    tile_margin : int
+        Maximal number of cells by which the particles may have exited
+        their chunk
+    """
+    n_chunks = chunk_prefix_sum.shape[0] - 1
+    # The halos cover the particles that moved by up to `tile_margin`
+    # cells and the extent of the shape factors (up to 2 cells)
+    Nhalo = tile_margin + 2
+    halos = np.zeros( (n_chunks, 2, Nm, Nhalo, Nr+4),
+                      dtype=rho_global.dtype )
+
+    # Deposit the chunks in parallel
+    for i_chunk in prange( n_chunks ):
+        iz_low = chunk_iz_bounds[i_chunk]
+        iz_high = chunk_iz_bounds[i_chunk+1]
+        halo_low = halos[i_chunk, 0]
+        halo_high = halos[i_chunk, 1]
+
+        # Allocate thread-local arrays
+        rho_scal = np.zeros( Nm, dtype=np.complex128 )
+        Sz = np.zeros( shape_order+1 )
+        Sr = np.zeros( shape_order+1 )
+
+        # Loop over the particles of this chunk
+        for i_ptcl in range( chunk_prefix_sum[i_chunk],
+                             chunk_prefix_sum[i_chunk+1] ):
+            # Position
+            xj = x[i_ptcl]
+            yj = y[i_ptcl]
+            zj = z[i_ptcl]
+            # Weights
+            wj = q * w[i_ptcl]
+
+            # Cylindrical conversion
+            rj = math.sqrt(xj**2 + yj**2)
+            # Avoid division by 0.
+            if (rj != 0.):
+                invr = 1./rj
+                cos = xj*invr  # Cosine
+                sin = yj*invr  # Sine
+            else:
+                cos = 1.
+                sin = 0.
+            # Calculate contribution from this particle to each mode
+            rho_scal[0] = wj
+            for m in range(1,Nm):
+                rho_scal[m] = (cos + 1.j*sin)*rho_scal[m-1]
+
+            # Positions of the particles, in the cell unit
+            r_cell = invdr*(rj - rmin) - 0.5
+            z_cell = invdz*(zj - zmin) - 0.5
+            iz_cell, ir_cell = get_shape_factors(
+                z_cell, r_cell, Nr, shape_order, Sz, Sr )
+
+            # Add contribution of this particle to the global array
+            for m in range(Nm):
+                for iz in range(shape_order+1):
+                    for ir in range(shape_order+1):
+                        add_to_chunk( rho_global, halo_low, halo_high,
+                            m, iz_cell+iz, ir_cell+ir, iz_low, iz_high,
+                            Sz[iz]*Sr[ir]*rho_scal[m] )
+
+    # Add the halos to the global array
+    add_halos( halos, rho_global, chunk_iz_bounds )
+
+    return
+
+@njit_parallel
+def deposit_J_numba_zchunks(x, y, z, w, q,
+                            ux, uy, uz, inv_gamma,
+                            invdz, zmin, Nz,
+                            invdr, rmin, Nr,
+                            j_r_global, j_t_global, j_z_global,
+                            Nm, shape_order,
+                            chunk_prefix_sum, chunk_iz_bounds, tile_margin):
+    """
+    Deposition of the current density J using numba prange on the CPU,
+    for particles that are sorted by contiguous chunks along z.
+
+    See the docstring of `deposit_rho_numba_zchunks` for the description
+    of the chunks, and of the parameters that are not described here.
+
+    Parameters
+    ----------
+    ux, uy, uz : 1darray of floats (in meters * second^-1)
+        The velocity of the particles
+
+    inv_gamma : 1darray of floats
+        The inverse of the relativistic gamma factor
+
+    j_x_global : 4darrays of complexs
+        Global helper arrays of shape (Nreduce, Nm, 2+Nz+2, 2+Nr+2) where the
+        additional 2's in z and r correspond to deposition guard cells.
+        Only the first copy (along the first axis) is modified.
+    """
+    n_chunks = chunk_prefix_sum.shape[0] - 1
+    Nhalo = tile_margin + 2
+    jr_halos = np.zeros( (n_chunks, 2, Nm, Nhalo, Nr+4),
+                         dtype=j_r_global.dtype )
+    jt_halos = np.zeros( (n_chunks, 2, Nm, Nhalo, Nr+4),
+                         dtype=j_t_global.dtype )
+    jz_halos = np.zeros( (n_chunks, 2, Nm, Nhalo, Nr+4),
+                         dtype=j_z_global.dtype )
+
+    # Deposit the chunks in parallel
+    for i_chunk in prange( n_chunks ):
+        iz_low = chunk_iz_bounds[i_chunk]
+        iz_high = chunk_iz_bounds[i_chunk+1]
+        jr_halo_low = jr_halos[i_chunk, 0]
+        jr_halo_high = jr_halos[i_chunk, 1]
+        jt_halo_low = jt_halos[i_chunk, 0]
+        jt_halo_high = jt_halos[i_chunk, 1]
+        jz_halo_low = jz_halos[i_chunk, 0]
+        jz_halo_high = jz_halos[i_chunk, 1]
+
+        # Allocate thread-local arrays
+        jr_scal = np.zeros( Nm, dtype=np.complex128 )
+        jt_scal = np.zeros( Nm, dtype=np.complex128 )
+        jz_scal = np.zeros( Nm, dtype=np.complex128 )
+        Sz = np.zeros( shape_order+1 )
+        Sr = np.zeros( shape_order+1 )
+
+        # Loop over the particles of this chunk
+        for i_ptcl in range( chunk_prefix_sum[i_chunk],
+                             chunk_prefix_sum[i_chunk+1] ):
+            # Position
+            xj = x[i_ptcl]
+            yj = y[i_ptcl]
+            zj = z[i_ptcl]
+            # Velocity
+            uxj = ux[i_ptcl]
+            uyj = uy[i_ptcl]
+            uzj = uz[i_ptcl]
+            # Inverse gamma
+            inv_gammaj = inv_gamma[i_ptcl]
+            # Weights
+            wj = q * w[i_ptcl]
+
+            # Cylindrical conversion
+            rj = math.sqrt(xj**2 + yj**2)
+            # Avoid division by 0.
+            if (rj != 0.):
+                invr = 1./rj
+                cos = xj*invr  # Cosine
+                sin = yj*invr  # Sine
+            else:
+                cos = 1.
+                sin = 0.
+            # Calculate contribution from this particle to each mode
+            jr_scal[0] = wj * c * inv_gammaj * (cos*uxj + sin*uyj)
+            jt_scal[0] = wj * c * inv_gammaj * (cos*uyj - sin*uxj)
+            jz_scal[0] = wj * c * inv_gammaj * uzj
+            for m in range(1,Nm):
+                jr_scal[m] = (cos + 1.j*sin) * jr_scal[m-1]
+                jt_scal[m] = (cos + 1.j*sin) * jt_scal[m-1]
+                jz_scal[m] = (cos + 1.j*sin) * jz_scal[m-1]
+
+            # Positions of the particles, in the cell unit
+            r_cell = invdr*(rj - rmin) - 0.5
+            z_cell = invdz*(zj - zmin) - 0.5
+            iz_cell, ir_cell = get_shape_factors(
+                z_cell, r_cell, Nr, shape_order, Sz, Sr )
+
+            # Add contribution of this particle to the global arrays
+            for m in range(Nm):
+                for iz in range(shape_order+1):
+                    for ir in range(shape_order+1):
+                        S = Sz[iz]*Sr[ir]
+                        add_to_chunk( j_r_global, jr_halo_low, jr_halo_high,
+                            m, iz_cell+iz, ir_cell+ir, iz_low, iz_high,
+                            S*jr_scal[m] )
+                        add_to_chunk( j_t_global, jt_halo_low, jt_halo_high,
+                            m, iz_cell+iz, ir_cell+ir, iz_low, iz_high,
+                            S*jt_scal[m] )
+                        add_to_chunk( j_z_global, jz_halo_low, jz_halo_high,
+                            m, iz_cell+iz, ir_cell+ir, iz_low, iz_high,
+                            S*jz_scal[m] )
+
+    # Add the halos to the global arrays
+    add_halos( jr_halos, j_r_global, chunk_iz_bounds )
+    add_halos( jt_halos, j_t_global, chunk_iz_bounds )
+    add_halos( jz_halos, j_z_global, chunk_iz_bounds )
 
     return
@@ -10,8 +10,8 @@ from numba import cuda
 from scipy.constants import c, h
 from .numba_methods import get_photon_density_gaussian_numba, \
     determine_scatterings_numba, scatter_photons_electrons_numba
-from ..cuda_numba_utils import allocate_empty, reallocate_and_copy_old, \
-                                perform_cumsum, generate_new_ids
+from ..cuda_numba_utils import allocate_empty, perform_cumsum, \
+                                generate_new_ids
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 from fbpic.utils.printing import catch_gpu_memory_error
@@ -207,13 +207,13 @@ class ComptonScatterer(object):
         if cumul_nscatter_per_batch[-1] == 0:
             return
 
-        # Reallocate photons species (on CPU or GPU depending on `use_cuda`),
-        # to accomodate the photons produced by Compton scattering,
-        # and copy the old photons to the new arrays
+        # Resize the arrays of the photon species (on CPU or GPU depending
+        # on `use_cuda`), to accomodate the photons produced by Compton
+        # scattering
         photons = self.target_species
         old_Ntot = photons.Ntot
         new_Ntot = old_Ntot + cumul_nscatter_per_batch[-1]
-        reallocate_and_copy_old( photons, use_cuda, old_Ntot, new_Ntot )
+        photons.resize_particle_arrays( new_Ntot )
 
         # Create the new photons from ionization (with a random
         # scattering angle) and add recoil momentum to the electrons
@@ -7,7 +7,8 @@ It defines a number of methods that are useful for elementary processes
 (e.g. ionization, Compton scattering) on CPU and GPU
 """
 import numpy as np
-from fbpic.utils.threading import njit_parallel, prange
+from fbpic.utils.threading import njit_parallel, prange, nthreads, \
+    get_chunk_indices
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 if cuda_installed:
@@ -51,66 +52,51 @@ def perform_cumsum_2d( input_array ):
     np.cumsum( input_array, out=cumulative_array[:,1:], axis=-1 )
     return( cumulative_array )
 
-def reallocate_and_copy_old( species, use_cuda, old_Ntot, new_Ntot ):
+def reallocate_particle_array( array, N, capacity, Ntot=None ):
     """
-    Copy the particle quantities of `species` from arrays of size `old_Ntot`
-    into arrays of size `new_Ntot`. Set these arrays as attributes of `species.
+    Return a new array with `capacity` elements, of the same type as `array`
+    and on the same device (CPU or GPU). The first `N` elements of the new
+    array are copied from `array` ; the other elements are left empty
+    (set to 0 on CPU) and expected to be filled later.
 
-    (The first `old_Ntot` elements of the new arrays are copied from the old
-    arrays ; the last elements are left empty and expected to be filled later.)
+    On CPU, the new array is first written by the threads in the same
+    chunks as in the particle kernels (see `get_chunk_indices`), for
+    `Ntot` particles, so that its memory pages are placed close to the
+    thread that handles the corresponding particles (NUMA first touch).
 
-    When `use_cuda` is True, this function also reallocates
-    the sorting buffers for GPU, with a size `new_Ntot`
+    (This is used to enlarge the storage of the particle arrays, see
+    `Particles.resize_particle_arrays`)
 
     Parameters
     ----------
-    species: an fbpic Particles object
-    use_cuda: bool
-        If True, the new arrays are device arrays, and copying is done on GPU.
-        If False, the arrays are on CPU, and copying is done on CPU.
-    old_Ntot, new_Ntot: int
-        Size of the old and new arrays (with old_Ntot < new_Ntot)
+    array: 1darray (on CPU or GPU)
+        The array whose first elements are copied
+    N, capacity: int
+        Number of copied elements, and size of the new array
+        (with N <= capacity)
+    Ntot: int, optional
+        Number of particles that will be stored in the new array
+        (with Ntot <= capacity ; by default, `capacity`)
     """
     # Check if the data is on the GPU
-    data_on_gpu = (type(species.w) is not np.ndarray)
+    data_on_gpu = (type(array) is not np.ndarray)
 
-    # On GPU, use one thread per particle
+    new_array = allocate_empty( capacity, data_on_gpu, dtype=array.dtype )
     if data_on_gpu:
-        ptcl_grid_1d, ptcl_block_1d = cuda_tpb_bpg_1d( old_Ntot )
-
-    # Iterate over particle attributes and copy the old particles
-    for attr in ['x', 'y', 'z', 'ux', 'uy', 'uz', 'w', 'inv_gamma',
-                    'Ex', 'Ey', 'Ez', 'Bx', 'By', 'Bz']:
-        old_array = getattr(species, attr)
-        new_array = allocate_empty( new_Ntot, data_on_gpu, dtype=np.float64 )
-        if data_on_gpu:
+        if N > 0:
+            # On GPU, use one thread per particle
+            ptcl_grid_1d, ptcl_block_1d = cuda_tpb_bpg_1d( N )
             copy_particle_data_cuda[ ptcl_grid_1d, ptcl_block_1d ](
-                old_Ntot, old_array, new_array )
-        else:
-            copy_particle_data_numba( old_Ntot, old_array, new_array )
-        setattr( species, attr, new_array )
-    # Copy the tracking id, if needed
-    if species.tracker is not None:
-        old_array = species.tracker.id
-        new_array = allocate_empty( new_Ntot, use_cuda, dtype=np.uint64 )
-        if data_on_gpu:
-            copy_particle_data_cuda[ ptcl_grid_1d, ptcl_block_1d ](
-                old_Ntot, old_array, new_array )
-        else:
-            copy_particle_data_numba( old_Ntot, old_array, new_array )
-        species.tracker.id = new_array
-
-    # Allocate the auxiliary arrays for GPU
-    if use_cuda:
-        species.cell_idx = cuda.device_array((new_Ntot,), dtype=np.int32)
-        species.sorted_idx = cuda.device_array((new_Ntot,), dtype=np.uint32)
-        species.sorting_buffer = cuda.device_array((new_Ntot,), dtype=np.float64)
-        if species.n_integer_quantities > 0:
-            species.int_sorting_buffer = \
-                cuda.device_array( (new_Ntot,), dtype=np.uint64 )
-
-    # Modify the total number of particles
-    species.Ntot = new_Ntot
+                N, array, new_array )
+    else:
+        # On CPU, the last thread also writes the elements beyond `Ntot`
+        if Ntot is None:
+            Ntot = capacity
+        ptcl_chunk_indices = get_chunk_indices( Ntot, nthreads )
+        ptcl_chunk_indices[-1] = capacity
+        copy_particle_data_numba( N, array, new_array,
+                                  nthreads, ptcl_chunk_indices )
+    return( new_array )
 
 def generate_new_ids( species, old_Ntot, new_Ntot ):
     """
@@ -128,13 +114,21 @@ def generate_new_ids( species, old_Ntot, new_Ntot ):
 
 
 @njit_parallel
-def copy_particle_data_numba( Ntot, old_array, new_array ):
+def copy_particle_data_numba( Ntot, old_array, new_array,
+                              nthreads, ptcl_chunk_indices ):
     """
-    Copy the `Ntot` elements of `old_array` into `new_array`, on CPU
+    Copy the `Ntot` elements of `old_array` into `new_array`, on CPU,
+    and set the other elements of `new_array` to 0.
+    Each thread writes the elements of one chunk (bounded by
+    `ptcl_chunk_indices`).
     """
-    # Loop over single particles (in parallel if threading is enabled)
-    for ip in prange( Ntot ):
-        new_array[ip] = old_array[ip]
+    # Loop over the chunks (in parallel if threading is enabled)
+    for nt in prange( nthreads ):
+        for ip in range( ptcl_chunk_indices[nt], ptcl_chunk_indices[nt+1] ):
+            if ip < Ntot:
+                new_array[ip] = old_array[ip]
+            else:
+                new_array[ip] = 0
     return( new_array )
 
 if cuda_installed:
@@ -16,8 +16,9 @@ of the ionization state of each macroparticle.
 
 On the other hand, the electrons generated by ionization do need to be added to
 an existing Particles object, and this implies that the number of
-macroparticles in the object does not remain constant and that the arrays are
-reallocated.
+macroparticles in the object does not remain constant. (The new electrons are
+appended to the particle arrays, which are only reallocated when their
+capacity is exceeded ; see `Particles.resize_particle_arrays`.)
 
 In addition, at each PIC iteration, the number of new electrons need to
 be counted in order to reallocate the array and copy the electrons to
@@ -34,8 +35,8 @@ from scipy.constants import c, e, m_e, physical_constants
 from scipy.special import gamma
 from .read_atomic_data import get_ionization_energies
 from .numba_methods import ionize_ions_numba, copy_ionized_electrons_numba
-from ..cuda_numba_utils import allocate_empty, reallocate_and_copy_old, \
-                                perform_cumsum_2d, generate_new_ids
+from ..cuda_numba_utils import allocate_empty, perform_cumsum_2d, \
+                                generate_new_ids
 
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
@@ -117,7 +118,8 @@ class Ionizer(object):
         # Initialize the required arrays
         Ntot = ionizable_species.Ntot
         self.ionization_level = np.ones( Ntot, dtype=np.uint64 ) * level_start
-        self.w_times_level = ionizable_species.w * self.ionization_level
+        self.w_times_level = ( ionizable_species.w * self.ionization_level
+                                ).astype( ionizable_species.dtype )
 
         # Check if electrons from different ionization levels should
         # be stored into separate species
@@ -282,14 +284,13 @@ class Ionizer(object):
 
         # Loop over the electron species associated to each level
         # (when store_electrons_per_level is False, there is a single species)
-        # Reallocate electron species (on CPU or GPU depending on `use_cuda`),
-        # to accomodate the electrons produced by ionization,
-        # and copy the old electrons to the new arrays
+        # Resize the arrays of the electron species (on CPU or GPU depending
+        # on `use_cuda`), to accomodate the electrons produced by ionization
         assert len(self.target_species) == n_levels
         for i_level, elec in enumerate(self.target_species):
             old_Ntot = elec.Ntot
             new_Ntot = old_Ntot + cumulative_n_ionized[i_level,-1]
-            reallocate_and_copy_old( elec, use_cuda, old_Ntot, new_Ntot )
+            elec.resize_particle_arrays( new_Ntot )
             # Create the new electrons from ionization (one thread per batch)
             if use_cuda:
                 copy_ionized_electrons_cuda[ batch_grid_1d, batch_block_1d ](
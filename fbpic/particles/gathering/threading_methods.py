@@ -31,7 +31,8 @@ def gather_field_numba_linear(x, y, z,
                     Br_m0, Bt_m0, Bz_m0,
                     Br_m1, Bt_m1, Bz_m1,
                     Ex, Ey, Ez,
-                    Bx, By, Bz ):
+                    Bx, By, Bz,
+                    dead, nthreads, ptcl_chunk_indices ):
     """
     Gathering of the fields (E and B) using numba with multi-threading.
     Iterates over the particles, calculates the weighted amount
@@ -74,121 +75,140 @@ def gather_field_numba_linear(x, y, z,
     Bx, By, Bz : 1darray of floats
         The magnetic fields acting on the particles
         (is modified by this function)
+
+    dead : 1darray of bools
+        Whether each particle is dead (with `particle_removal='mask'`),
+        in which case it is skipped (empty array if no particle is dead)
+
+    nthreads : int
+        Number of CPU threads used with numba prange
+
+    ptcl_chunk_indices : array of int, of size nthreads+1
+        The indices (of the particle array) between which each thread
+        should loop. (i.e. divisions of particle array between threads)
     """
+    # Whether to skip the dead particles (with `particle_removal='mask'`)
+    skip_dead = ( dead.shape[0] != 0 )
+
     # Deposit the field per cell in parallel
-    for i in prange(x.shape[0]):
-        # Preliminary arrays for the cylindrical conversion
-        # --------------------------------------------
-        # Position
-        xj = x[i]
-        yj = y[i]
-        zj = z[i]
-
-        # Cylindrical conversion
-        rj = math.sqrt( xj**2 + yj**2 )
-        if (rj !=0. ) :
-            invr = 1./rj
-            cos = xj*invr  # Cosine
-            sin = yj*invr  # Sine
-        else :
-            cos = 1.
-            sin = 0.
-        exptheta_m0 = 1.
-        exptheta_m1 = cos - 1.j*sin
-
-        # Get linear weights for the deposition
-        # -------------------------------------
-        # Positions of the particles, in the cell unit
-        r_cell =  invdr*(rj - rmin) - 0.5
-        z_cell =  invdz*(zj - zmin) - 0.5
-        # Original index of the uppper and lower cell
-        ir_lower = int(math.floor( r_cell ))
-        ir_upper = ir_lower + 1
-        iz_lower = int(math.floor( z_cell ))
-        iz_upper = iz_lower + 1
-        # Linear weight
-        Sr_lower = ir_upper - r_cell
-        Sr_upper = r_cell - ir_lower
-        Sz_lower = iz_upper - z_cell
-        Sz_upper = z_cell - iz_lower
-        # Set guard weights to zero
-        Sr_guard = 0.
-
-        # Treat the boundary conditions
-        # -----------------------------
-        # guard cells in lower r
-        if ir_lower < 0:
-            Sr_guard = Sr_lower
-            Sr_lower = 0.
-            ir_lower = 0
-        # absorbing in upper r
-        if ir_lower > Nr-1:
-            ir_lower = Nr-1
-        if ir_upper > Nr-1:
-            ir_upper = Nr-1
-        # periodic boundaries in z
-        # lower z boundaries
-        if iz_lower < 0:
-            iz_lower += Nz
-        if iz_upper < 0:
-            iz_upper += Nz
-        # upper z boundaries
-        if iz_lower > Nz-1:
-            iz_lower -= Nz
-        if iz_upper > Nz-1:
-            iz_upper -= Nz
-
-        # Precalculate Shapes
-        S_ll = Sz_lower*Sr_lower
-        S_lu = Sz_lower*Sr_upper
-        S_ul = Sz_upper*Sr_lower
-        S_uu = Sz_upper*Sr_upper
-        S_lg = Sz_lower*Sr_guard
-        S_ug = Sz_upper*Sr_guard
-
-        # E-Field
-        # -------
-        Fr = 0.
-        Ft = 0.
-        Fz = 0.
-        # Add contribution from mode 0
-        Fr, Ft, Fz = add_linear_gather_for_mode( 0,
-            Fr, Ft, Fz, exptheta_m0, Er_m0, Et_m0, Ez_m0,
-            iz_lower, iz_upper, ir_lower, ir_upper,
-            S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
-        # Add contribution from mode 1
-        Fr, Ft, Fz = add_linear_gather_for_mode( 1,
-            Fr, Ft, Fz, exptheta_m1, Er_m1, Et_m1, Ez_m1,
-            iz_lower, iz_upper, ir_lower, ir_upper,
-            S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
-        # Convert to Cartesian coordinates
-        # and write to particle field arrays
-        Ex[i] = cos*Fr - sin*Ft
-        Ey[i] = sin*Fr + cos*Ft
-        Ez[i] = Fz
-
-        # B-Field
-        # -------
-        # Clear the placeholders for the
-        # gathered field for each coordinate
-        Fr = 0.
-        Ft = 0.
-        Fz = 0.
-        # Add contribution from mode 0
-        Fr, Ft, Fz = add_linear_gather_for_mode( 0,
-            Fr, Ft, Fz, exptheta_m0, Br_m0, Bt_m0, Bz_m0,
-            iz_lower, iz_upper, ir_lower, ir_upper,
-            S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
-        # Add contribution from mode 1
-        Fr, Ft, Fz = add_linear_gather_for_mode( 1,
-            Fr, Ft, Fz, exptheta_m1, Br_m1, Bt_m1, Bz_m1,
-            iz_lower, iz_upper, ir_lower, ir_upper,
-            S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
-        # Convert to Cartesian coordinates
-        # and write to particle field arrays
-        Bx[i] = cos*Fr - sin*Ft
-        By[i] = sin*Fr + cos*Ft
-        Bz[i] = Fz
+    for nt in prange( nthreads ):
+        # Loop over all particles in thread chunk
+        for i in range( ptcl_chunk_indices[nt],
+                        ptcl_chunk_indices[nt+1] ):
+            if skip_dead and dead[i]:
+                continue
+            # Preliminary arrays for the cylindrical conversion
+            # --------------------------------------------
+            # Position
+            xj = x[i]
+            yj = y[i]
+            zj = z[i]
+
+            # Cylindrical conversion
+            rj = math.sqrt( xj**2 + yj**2 )
+            if (rj !=0. ) :
+                invr = 1./rj
+                cos = xj*invr  # Cosine
+                sin = yj*invr  # Sine
+            else :
+                cos = 1.
+                sin = 0.
+            exptheta_m0 = 1.
+            exptheta_m1 = cos - 1.j*sin
+
+            # Get linear weights for the deposition
+            # -------------------------------------
+            # Positions of the particles, in the cell unit
+            r_cell =  invdr*(rj - rmin) - 0.5
+            z_cell =  invdz*(zj - zmin) - 0.5
+            # Original index of the uppper and lower cell
+            ir_lower = int(math.floor( r_cell ))
+            ir_upper = ir_lower + 1
+            iz_lower = int(math.floor( z_cell ))
+            iz_upper = iz_lower + 1
+            # Linear weight
+            Sr_lower = ir_upper - r_cell
+            Sr_upper = r_cell - ir_lower
+            Sz_lower = iz_upper - z_cell
+            Sz_upper = z_cell - iz_lower
+            # Set guard weights to zero
+            Sr_guard = 0.
+
+            # Treat the boundary conditions
+            # -----------------------------
+            # guard cells in lower r
+            if ir_lower < 0:
+                Sr_guard = Sr_lower
+                Sr_lower = 0.
+                ir_lower = 0
+            # absorbing in upper r
+            if ir_lower > Nr-1:
+                ir_lower = Nr-1
+            if ir_upper > Nr-1:
+                ir_upper = Nr-1
+            # periodic boundaries in z
+            # lower z boundaries
+            if iz_lower < 0:
+                iz_lower += Nz
+            if iz_upper < 0:
+                iz_upper += Nz
+            # upper z boundaries
+            if iz_lower > Nz-1:
+                iz_lower -= Nz
+            if iz_upper > Nz-1:
+                iz_upper -= Nz
+
+            # Precalculate Shapes
+            S_ll = Sz_lower*Sr_lower
+            S_lu = Sz_lower*Sr_upper
+            S_ul = Sz_upper*Sr_lower
+            S_uu = Sz_upper*Sr_upper
+            S_lg = Sz_lower*Sr_guard
+            S_ug = Sz_upper*Sr_guard
+
+            # E-Field
+            # -------
+            Fr = 0.
+            Ft = 0.
+            Fz = 0.
+            # Add contribution from mode 0
+            Fr, Ft, Fz = add_linear_gather_for_mode( 0,
+                Fr, Ft, Fz, exptheta_m0, Er_m0, Et_m0, Ez_m0,
+                iz_lower, iz_upper, ir_lower, ir_upper,
+                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+            # Add contribution from mode 1
+            Fr, Ft, Fz = add_linear_gather_for_mode( 1,
+                Fr, Ft, Fz, exptheta_m1, Er_m1, Et_m1, Ez_m1,
+                iz_lower, iz_upper, ir_lower, ir_upper,
+                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+            # Convert to Cartesian coordinates
+            # and write to particle field arrays
+            Ex[i] = cos*Fr - sin*Ft
+            Ey[i] = sin*Fr + cos*Ft
+            Ez[i] = Fz
+
+            # B-Field
+            # -------
+            # Clear the placeholders for the
+            # gathered field for each coordinate
+            Fr = 0.
+            Ft = 0.
+            Fz = 0.
+            # Add contribution from mode 0
+            Fr, Ft, Fz = add_linear_gather_for_mode( 0,
+                Fr, Ft, Fz, exptheta_m0, Br_m0, Bt_m0, Bz_m0,
+                iz_lower, iz_upper, ir_lower, ir_upper,
+                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+            # Add contribution from mode 1
+            Fr, Ft, Fz = add_linear_gather_for_mode( 1,
+                Fr, Ft, Fz, exptheta_m1, Br_m1, Bt_m1, Bz_m1,
+                iz_lower, iz_upper, ir_lower, ir_upper,
+                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+            # Convert to Cartesian coordinates
+            # and write to particle field arrays
+            Bx[i] = cos*Fr - sin*Ft
+            By[i] = sin*Fr + cos*Ft
+            Bz[i] = Fz
 
     return Ex, Ey, Ez, Bx, By, Bz
 
@@ -206,7 +226,7 @@ def gather_field_numba_cubic(x, y, z,
                     Br_m1, Bt_m1, Bz_m1,
                     Ex, Ey, Ez,
                     Bx, By, Bz,
-                    nthreads, ptcl_chunk_indices):
+                    dead, nthreads, ptcl_chunk_indices ):
     """
     Gathering of the fields (E and B) using numba with multi-threading.
     Iterates over the particles, calculates the weighted amount
@@ -250,6 +270,10 @@ def gather_field_numba_cubic(x, y, z,
         The magnetic fields acting on the particles
         (is modified by this function)
 
+    dead : 1darray of bools
+        Whether each particle is dead (with `particle_removal='mask'`),
+        in which case it is skipped (empty array if no particle is dead)
+
     nthreads : int
         Number of CPU threads used with numba prange
 
@@ -257,6 +281,9 @@ def gather_field_numba_cubic(x, y, z,
         The indices (of the particle array) between which each thread
         should loop. (i.e. divisions of particle array between threads)
     """
+    # Whether to skip the dead particles (with `particle_removal='mask'`)
+    skip_dead = ( dead.shape[0] != 0 )
+
     # Gather the field per cell in parallel
     for nt in prange( nthreads ):
 
@@ -268,6 +295,8 @@ def gather_field_numba_cubic(x, y, z,
         # Loop over all particles in thread chunk
         for i in range( ptcl_chunk_indices[nt],
                             ptcl_chunk_indices[nt+1] ):
+            if skip_dead and dead[i]:
+                continue
 
             # Preliminary arrays for the cylindrical conversion
             # --------------------------------------------
@@ -349,3 +378,253 @@ def gather_field_numba_cubic(x, y, z,
             Bz[i] = Fz
 
     return Ex, Ey, Ez, Bx, By, Bz
+
+# ------------------------------------------
+# Field gathering for an arbitrary number of modes
+# ------------------------------------------
+
+@njit_parallel
+def gather_field_numba_linear_all_modes(x, y, z,
+                    invdz, zmin, Nz,
+                    invdr, rmin, Nr,
+                    Er, Et, Ez_grid,
+                    Br, Bt, Bz_grid,
+                    Ex, Ey, Ez,
+                    Bx, By, Bz,
+                    dead, nthreads, ptcl_chunk_indices ):
+    """
+    Gathering of the fields (E and B) using numba with multi-threading,
+    for an arbitrary number of azimuthal modes, in a single pass over the
+    particles (linear shape).
+
+    Parameters
+    ----------
+    x, y, z, invdz, zmin, Nz, invdr, rmin, Nr, Ex, Ey, Ez, Bx, By, Bz :
+        See the docstring of `gather_field_numba_linear`
+
+    Er, Et, Ez_grid, Br, Bt, Bz_grid : tuples of 2darrays of complexs
+        The fields on the interpolation grid (one array per mode)
+
+    dead : 1darray of bools
+        Whether each particle is dead (with `particle_removal='mask'`),
+        in which case it is skipped (empty array if no particle is dead)
+
+    nthreads : int
+        Number of CPU threads used with numba prange
+
+    ptcl_chunk_indices : array of int, of size nthreads+1
+        The indices (of the particle array) between which each thread
+        should loop. (i.e. divisions of particle array between threads)
+    """
+    Nm = len(Er)
+    # Whether to skip the dead particles (with `particle_removal='mask'`)
+    skip_dead = ( dead.shape[0] != 0 )
+
+    # Gather the field per cell in parallel
+    for nt in prange( nthreads ):
+
+        # Loop over all particles in thread chunk
+        for i in range( ptcl_chunk_indices[nt],
+                            ptcl_chunk_indices[nt+1] ):
+            if skip_dead and dead[i]:
+                continue
+            # Preliminary arrays for the cylindrical conversion
+            # --------------------------------------------
+            # Position
+            xj = x[i]
+            yj = y[i]
+            zj = z[i]
+
+            # Cylindrical conversion
+            rj = math.sqrt( xj**2 + yj**2 )
+            if (rj !=0. ) :
+                invr = 1./rj
+                cos = xj*invr  # Cosine
+                sin = yj*invr  # Sine
+            else :
+                cos = 1.
+                sin = 0.
+            exptheta_m1 = cos - 1.j*sin
+
+            # Get linear weights for the deposition
+            # -------------------------------------
+            # Positions of the particles, in the cell unit
+            r_cell =  invdr*(rj - rmin) - 0.5
+            z_cell =  invdz*(zj - zmin) - 0.5
+            # Original index of the uppper and lower cell
+            ir_lower = int(math.floor( r_cell ))
+            ir_upper = ir_lower + 1
+            iz_lower = int(math.floor( z_cell ))
+            iz_upper = iz_lower + 1
+            # Linear weight
+            Sr_lower = ir_upper - r_cell
+            Sr_upper = r_cell - ir_lower
+            Sz_lower = iz_upper - z_cell
+            Sz_upper = z_cell - iz_lower
+            # Set guard weights to zero
+            Sr_guard = 0.
+
+            # Treat the boundary conditions
+            # -----------------------------
+            # guard cells in lower r
+            if ir_lower < 0:
+                Sr_guard = Sr_lower
+                Sr_lower = 0.
+                ir_lower = 0
+            # absorbing in upper r
+            if ir_lower > Nr-1:
+                ir_lower = Nr-1
+            if ir_upper > Nr-1:
+                ir_upper = Nr-1
+            # periodic boundaries in z
+            # lower z boundaries
+            if iz_lower < 0:
+                iz_lower += Nz
+            if iz_upper < 0:
+                iz_upper += Nz
+            # upper z boundaries
+            if iz_lower > Nz-1:
+                iz_lower -= Nz
+            if iz_upper > Nz-1:
+                iz_upper -= Nz
+
+            # Precalculate Shapes
+            S_ll = Sz_lower*Sr_lower
+            S_lu = Sz_lower*Sr_upper
+            S_ul = Sz_upper*Sr_lower
+            S_uu = Sz_upper*Sr_upper
+            S_lg = Sz_lower*Sr_guard
+            S_ug = Sz_upper*Sr_guard
+
+            # Add the contribution from each mode to E and B
+            # (the azimuthal factor $e^{-i m \theta}$ is obtained recursively)
+            exptheta_m = 1.+0.j
+            Fr_E = 0.
+            Ft_E = 0.
+            Fz_E = 0.
+            Fr_B = 0.
+            Ft_B = 0.
+            Fz_B = 0.
+            for m in range(Nm):
+                Fr_E, Ft_E, Fz_E = add_linear_gather_for_mode( m,
+                    Fr_E, Ft_E, Fz_E, exptheta_m, Er[m], Et[m], Ez_grid[m],
+                    iz_lower, iz_upper, ir_lower, ir_upper,
+                    S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+                Fr_B, Ft_B, Fz_B = add_linear_gather_for_mode( m,
+                    Fr_B, Ft_B, Fz_B, exptheta_m, Br[m], Bt[m], Bz_grid[m],
+                    iz_lower, iz_upper, ir_lower, ir_upper,
+                    S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+                exptheta_m *= exptheta_m1
+
+            # Convert to Cartesian coordinates
+            # and write to particle field arrays
+            Ex[i] = cos*Fr_E - sin*Ft_E
+            Ey[i] = sin*Fr_E + cos*Ft_E
+            Ez[i] = Fz_E
+            Bx[i] = cos*Fr_B - sin*Ft_B
+            By[i] = sin*Fr_B + cos*Ft_B
+            Bz[i] = Fz_B
+
+    return Ex, Ey, Ez, Bx, By, Bz
+
+@njit_parallel
+def gather_field_numba_cubic_all_modes(x, y, z,
+                    invdz, zmin, Nz,
+                    invdr, rmin, Nr,
+                    Er, Et, Ez_grid,
+                    Br, Bt, Bz_grid,
+                    Ex, Ey, Ez,
+                    Bx, By, Bz,
+                    dead, nthreads, ptcl_chunk_indices ):
+    """
+    Gathering of the fields (E and B) using numba with multi-threading,
+    for an arbitrary number of azimuthal modes, in a single pass over the
+    particles (cubic shape).
+
+    Parameters
+    ----------
+    See the docstring of `gather_field_numba_linear_all_modes`
+    """
+    Nm = len(Er)
+    # Whether to skip the dead particles (with `particle_removal='mask'`)
+    skip_dead = ( dead.shape[0] != 0 )
+
+    # Gather the field per cell in parallel
+    for nt in prange( nthreads ):
+
+        # Create private arrays for each thread
+        # to store the particle index and shape
+        Sr = np.empty( 4 )
+        Sz = np.empty( 4 )
+
+        # Loop over all particles in thread chunk
+        for i in range( ptcl_chunk_indices[nt],
+                            ptcl_chunk_indices[nt+1] ):
+            if skip_dead and dead[i]:
+                continue
+            # Preliminary arrays for the cylindrical conversion
+            # --------------------------------------------
+            # Position
+            xj = x[i]
+            yj = y[i]
+            zj = z[i]
+
+            # Cylindrical conversion
+            rj = math.sqrt(xj**2 + yj**2)
+            if (rj != 0.):
+                invr = 1./rj
+                cos = xj*invr  # Cosine
+                sin = yj*invr  # Sine
+            else:
+                cos = 1.
+                sin = 0.
+            exptheta_m1 = cos - 1.j*sin
+
+            # Get weights for the deposition
+            # --------------------------------------------
+            # Positions of the particle, in the cell unit
+            r_cell = invdr*(rj - rmin) - 0.5
+            z_cell = invdz*(zj - zmin) - 0.5
+
+            # Calculate the shape factors
+            ir_lowest = int64(math.floor(r_cell)) - 1
+            r_local = r_cell-ir_lowest
+            Sr[0] = -1./6. * (r_local-2.)**3
+            Sr[1] = 1./6. * (3.*(r_local-1.)**3 - 6.*(r_local-1.)**2 + 4.)
+            Sr[2] = 1./6. * (3.*(2.-r_local)**3 - 6.*(2.-r_local)**2 + 4.)
+            Sr[3] = -1./6. * (1.-r_local)**3
+            iz_lowest = int64(math.floor(z_cell)) - 1
+            z_local = z_cell-iz_lowest
+            Sz[0] = -1./6. * (z_local-2.)**3
+            Sz[1] = 1./6. * (3.*(z_local-1.)**3 - 6.*(z_local-1.)**2 + 4.)
+            Sz[2] = 1./6. * (3.*(2.-z_local)**3 - 6.*(2.-z_local)**2 + 4.)
+            Sz[3] = -1./6. * (1.-z_local)**3
+
+            # Add the contribution from each mode to E and B
+            # (the azimuthal factor $e^{-i m \theta}$ is obtained recursively)
+            exptheta_m = 1.+0.j
+            Fr_E = 0.
+            Ft_E = 0.
+            Fz_E = 0.
+            Fr_B = 0.
+            Ft_B = 0.
+            Fz_B = 0.
+            for m in range(Nm):
+                Fr_E, Ft_E, Fz_E = add_cubic_gather_for_mode( m,
+                    Fr_E, Ft_E, Fz_E, exptheta_m, Er[m], Et[m], Ez_grid[m],
+                    ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+                Fr_B, Ft_B, Fz_B = add_cubic_gather_for_mode( m,
+                    Fr_B, Ft_B, Fz_B, exptheta_m, Br[m], Bt[m], Bz_grid[m],
+                    ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+                exptheta_m *= exptheta_m1
+
+            # Convert to Cartesian coordinates
+            # and write to particle field arrays
+            Ex[i] = cos*Fr_E - sin*Ft_E
+            Ey[i] = sin*Fr_E + cos*Ft_E
+            Ez[i] = Fz_E
+            Bx[i] = cos*Fr_B - sin*Ft_B
+            By[i] = sin*Fr_B + cos*Ft_B
+            Bz[i] = Fz_B
+
+    return Ex, Ey, Ez, Bx, By, Bz
@@ -0,0 +1,600 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It generates the gathering and deposition kernels for an arbitrary number
+of azimuthal modes, on CPU (numba) or on GPU (CUDA).
+
+The source code of each kernel is produced from a single template, in
+which the loops over the azimuthal modes and over the shape factors are
+unrolled for the requested number of modes and shape order. The kernels
+thus handle all the modes in a single pass over the particles (like the
+hand-written kernels for 2 modes). They are compiled at first use and
+then cached (see `get_gather_kernel` and `get_deposit_kernel`).
+
+On CPU, `Particles.deposit` uses the generated deposition kernels for
+any number of modes, while the fields of more than 2 modes are gathered
+by the kernels `gather_field_numba_*_all_modes`. On GPU, the generated
+kernels are only used with `gpu_kernels='generated'` (see `Simulation`);
+by default, the hand-written kernels are launched once per mode.
+
+When the environment variable FBPIC_CACHE_DIR is set, the generated
+source is written to a file in the subdirectory `kernels` of this
+directory, so that numba caches the compiled kernel on disk and reuses
+it in subsequent runs. Otherwise, the kernels are compiled again in
+each Python process (numba cannot cache functions that are not defined
+in a file).
+"""
+import os
+import sys
+import math
+import inspect
+import hashlib
+import tempfile
+import numba
+from numba import int64, float64
+import numpy as np
+from scipy.constants import c
+from fbpic import __version__
+from fbpic.utils.threading import threading_enabled, prange
+from .gathering import inline_functions
+from .gathering.inline_functions import \
+    add_linear_gather_for_mode, add_cubic_gather_for_mode
+try:
+    from importlib.util import spec_from_file_location, module_from_spec
+    importlib_util_installed = True
+except ImportError:
+    # Python 2
+    importlib_util_installed = False
+
+# Check if CUDA is available, then import CUDA functions
+from fbpic.utils.cuda import cuda_installed
+if cuda_installed:
+    from fbpic.utils.cuda import cuda
+
+# Compiled kernels, indexed by (kernel type, Nm, particle shape, use_cuda)
+_compiled_kernels = {}
+
+# Number of shape factors per direction, for each particle shape
+n_shape_factors = { 'linear': 2, 'cubic': 4 }
+
+# -------------------------
+# Access to compiled kernels
+# -------------------------
+
+def get_gather_kernel( Nm, particle_shape, use_cuda=False ):
+    """
+    Return the kernel that gathers the fields (E and B) of `Nm` azimuthal
+    modes onto the particles, in a single pass over the particles.
+    The kernel is generated and compiled at the first call, and then cached.
+
+    The arguments of the returned kernel are:
+    `x, y, z, invdz, zmin, Nz, invdr, rmin, Nr,`
+    `Er_m0, Et_m0, Ez_m0, ..., Er_m<Nm-1>, Et_m<Nm-1>, Ez_m<Nm-1>,`
+    `Br_m0, Bt_m0, Bz_m0, ..., Br_m<Nm-1>, Bt_m<Nm-1>, Bz_m<Nm-1>,`
+    `Ex, Ey, Ez, Bx, By, Bz`, followed by `dead, nthreads,
+    ptcl_chunk_indices` on CPU (see `gather_field_numba_linear`
+    for their meaning)
+
+    Parameters
+    ----------
+    Nm: int
+        The number of azimuthal modes
+
+    particle_shape: str
+        Either 'linear' or 'cubic'
+
+    use_cuda: bool
+        Whether to return a CUDA kernel (one thread per particle)
+        or a numba kernel (one thread per chunk of particles)
+    """
+    key = ( 'gather', Nm, particle_shape, use_cuda )
+    if key not in _compiled_kernels:
+        name, source = generate_gather_source( Nm, particle_shape, use_cuda )
+        _compiled_kernels[key] = compile_kernel( name, source, use_cuda )
+    return( _compiled_kernels[key] )
+
+def get_deposit_kernel( fieldtype, Nm, particle_shape, use_cuda=False ):
+    """
+    Return the kernel that deposits the charge or current of the particles
+    onto `Nm` azimuthal modes, in a single pass over the particles.
+    The kernel is generated and compiled at the first call, and then cached.
+
+    The arguments of the returned kernel are:
+    - on GPU: `x, y, z, w, q, (ux, uy, uz, inv_gamma,)`
+      `invdz, zmin, Nz, invdr, rmin, Nr,` followed by `rho_m0, ...,
+      rho_m<Nm-1>` (for rho) or `j_r_m0, ..., j_r_m<Nm-1>, j_t_m0, ...,
+      j_t_m<Nm-1>, j_z_m0, ..., j_z_m<Nm-1>` (for J), and by
+      `cell_idx, prefix_sum` (see `deposit_rho_gpu_linear`)
+    - on CPU: `x, y, z, w, q, (ux, uy, uz, inv_gamma,)`
+      `invdz, zmin, Nz, invdr, rmin, Nr,` followed by `rho_global`
+      (for rho) or `j_r_global, j_t_global, j_z_global` (for J), and by
+      `nthreads, ptcl_chunk_indices` (see `deposit_rho_numba_linear`)
+
+    Parameters
+    ----------
+    fieldtype: str
+        Either 'rho' or 'J'
+
+    Nm: int
+        The number of azimuthal modes
+
+    particle_shape: str
+        Either 'linear' or 'cubic'
+
+    use_cuda: bool
+        Whether to return a CUDA kernel (one thread per cell, with the
+        particles sorted by cell) or a numba kernel (one thread per chunk
+        of particles, with one copy of the global arrays per thread)
+    """
+    key = ( fieldtype, Nm, particle_shape, use_cuda )
+    if key not in _compiled_kernels:
+        name, source = generate_deposit_source(
+                            fieldtype, Nm, particle_shape, use_cuda )
+        _compiled_kernels[key] = compile_kernel( name, source, use_cuda )
+    return( _compiled_kernels[key] )
+
+def compile_kernel( name, source, use_cuda ):
+    """
+    Execute the generated `source` and compile the function `name`
+    that it defines, either with numba (CPU) or with CUDA (GPU)
+
+    The compiled kernel is cached on disk if the source could be written
+    to a file (see `get_source_file`).
+    """
+    namespace = { 'math': math, 'np': np, 'c': c,
+                  'int64': int64, 'float64': float64, 'prange': prange }
+    if use_cuda:
+        namespace['cuda'] = cuda
+        namespace['add_linear_gather_for_mode'] = cuda.jit(
+            add_linear_gather_for_mode, device=True, inline=True )
+        namespace['add_cubic_gather_for_mode'] = cuda.jit(
+            add_cubic_gather_for_mode, device=True, inline=True )
+    else:
+        namespace['add_linear_gather_for_mode'] = \
+            numba.njit( add_linear_gather_for_mode )
+        namespace['add_cubic_gather_for_mode'] = \
+            numba.njit( add_cubic_gather_for_mode )
+    source_file = get_source_file( name, source )
+    if source_file is None:
+        # The source is not in a file: numba cannot cache the kernel
+        exec( compile( source, '<%s>' %name, 'exec' ), namespace )
+        function = namespace[name]
+        if use_cuda:
+            return( cuda.jit( function ) )
+        else:
+            return( numba.njit( parallel=threading_enabled )( function ) )
+    else:
+        # Import the file as a module, in which the names of `namespace`
+        # are defined (the module is registered in `sys.modules`, where
+        # numba looks for it when loading the kernel from the cache)
+        module_name = os.path.basename( source_file )[:-3]
+        spec = spec_from_file_location( module_name, source_file )
+        module = module_from_spec( spec )
+        module.__dict__.update( namespace )
+        sys.modules[ module_name ] = module
+        spec.loader.exec_module( module )
+        function = getattr( module, name )
+        if use_cuda:
+            return( cuda.jit( function, cache=True ) )
+        else:
+            return( numba.njit( parallel=threading_enabled,
+                                cache=True )( function ) )
+
+def get_source_file( name, source ):
+    """
+    Write the generated `source` of the function `name` to a file in the
+    subdirectory `kernels` of the directory FBPIC_CACHE_DIR, and return
+    the path of this file (or None if FBPIC_CACHE_DIR is not set).
+
+    The name of the file contains a hash of the source, of the inline
+    functions that it calls and of the version of FBPIC, so that a kernel
+    is never loaded from a stale cache. The file is first written under
+    a temporary name and then renamed, so that other processes (e.g. MPI
+    ranks) never import an incomplete file.
+    """
+    cache_dir = os.environ.get('FBPIC_CACHE_DIR')
+    if (cache_dir is None) or (not importlib_util_installed):
+        return( None )
+    kernel_dir = os.path.join( os.path.abspath( cache_dir ), 'kernels' )
+    if not os.path.exists( kernel_dir ):
+        try:
+            os.makedirs( kernel_dir )
+        except OSError:
+            # The directory may have been created by another process
+            if not os.path.isdir( kernel_dir ):
+                raise
+
+    h = hashlib.sha1()
+    h.update( __version__.encode() )
+    h.update( inspect.getsource( inline_functions ).encode() )
+    h.update( source.encode() )
+    source_file = os.path.join( kernel_dir,
+                                '%s_%s.py' %(name, h.hexdigest()[:16]) )
+    if not os.path.exists( source_file ):
+        fd, tmp_file = tempfile.mkstemp( dir=kernel_dir, suffix='.tmp' )
+        with os.fdopen( fd, 'w' ) as f:
+            f.write( source )
+        os.rename( tmp_file, source_file )
+    return( source_file )
+
+# -------------------
+# Generation: helpers
+# -------------------
+
+def indent( lines, n_levels ):
+    """Indent each line of the list of strings `lines` by `n_levels`"""
+    return( [ 4*n_levels*' ' + line if line else '' for line in lines ] )
+
+def get_exptheta_lines( Nm, sign ):
+    """
+    Return the lines that calculate the azimuthal factors `exptheta_m<m>`
+    of all modes, from the cosine and sine of the particle: `sign` is '+'
+    for the deposition (e^{i m theta}) and '-' for the gathering
+    (e^{-i m theta})
+    """
+    lines = [ 'exptheta_m0 = 1.' ]
+    if Nm > 1:
+        lines.append( 'exptheta_m1 = cos %s 1.j*sin' %sign )
+    for m in range( 2, Nm ):
+        lines.append( 'exptheta_m%d = exptheta_m%d*exptheta_m1' %(m, m-1) )
+    return( lines )
+
+def get_offset( k ):
+    """Return the string that adds the integer `k` to an index"""
+    if k == 0:
+        return( '' )
+    return( ' %s %d' %('+' if k > 0 else '-', abs(k)) )
+
+def get_cylindrical_lines():
+    """
+    Return the lines that calculate the radius, cosine and sine
+    of the particle `i_ptcl`
+    """
+    return [
+        '# Position',
+        'xj = x[i_ptcl]',
+        'yj = y[i_ptcl]',
+        'zj = z[i_ptcl]',
+        '# Cylindrical conversion',
+        'rj = math.sqrt( xj**2 + yj**2 )',
+        'if (rj != 0.):',
+        '    invr = 1./rj',
+        '    cos = xj*invr  # Cosine',
+        '    sin = yj*invr  # Sine',
+        'else:',
+        '    cos = 1.',
+        '    sin = 0.' ]
+
+def get_cell_position_lines():
+    """Return the lines that calculate the position in the cell unit"""
+    return [
+        '# Positions of the particle, in the cell unit',
+        'r_cell = invdr*(rj - rmin) - 0.5',
+        'z_cell = invdz*(zj - zmin) - 0.5' ]
+
+def get_kernel_lines( name, args, docstring, body, use_cuda,
+                      thread_setup=[] ):
+    """
+    Return the lines of a kernel called `name`, which executes `body`
+    (a list of lines) for each particle `i_ptcl`: on CPU, each thread
+    loops over a chunk of particles (after executing `thread_setup`);
+    on GPU, each thread handles one particle.
+    """
+    lines = [ 'def %s( %s ):' %(name, ', '.join(args)),
+              '    """', ] + indent( docstring, 1 ) + [ '    """' ]
+    if use_cuda:
+        lines += [ '    i_ptcl = cuda.grid(1)',
+                   '    if i_ptcl < x.shape[0]:' ]
+        lines += indent( body, 2 )
+    else:
+        lines += [ '    for nt in prange( nthreads ):' ]
+        lines += indent( thread_setup, 2 )
+        lines += [ '        for i_ptcl in range( ptcl_chunk_indices[nt],',
+                   '                             ptcl_chunk_indices[nt+1] ):' ]
+        lines += indent( body, 3 )
+    return( lines )
+
+# ---------------------
+# Generation: gathering
+# ---------------------
+
+def generate_gather_source( Nm, particle_shape, use_cuda ):
+    """
+    Return the name and the source code of the gathering kernel,
+    for `Nm` modes, the shape `particle_shape` ('linear' or 'cubic')
+    and the backend given by `use_cuda` (see `get_gather_kernel`)
+    """
+    if particle_shape not in n_shape_factors:
+        raise ValueError("`particle_shape` should be either 'linear' or "
+                         "'cubic' but is `%s`" % particle_shape)
+    backend = 'gpu' if use_cuda else 'numba'
+    name = 'gather_field_%s_%s_%d_modes' %(backend, particle_shape, Nm)
+    args = [ 'x', 'y', 'z', 'invdz', 'zmin', 'Nz', 'invdr', 'rmin', 'Nr' ]
+    for field in [ 'E', 'B' ]:
+        for m in range(Nm):
+            args += [ '%s%s_m%d' %(field, comp, m) for comp in 'rtz' ]
+    args += [ 'Ex', 'Ey', 'Ez', 'Bx', 'By', 'Bz' ]
+    if not use_cuda:
+        args += [ 'dead', 'nthreads', 'ptcl_chunk_indices' ]
+    docstring = [
+        'Gather the fields (E and B) of %d azimuthal modes onto the' %Nm,
+        'particles with a %s shape (generated kernel).' %particle_shape ]
+
+    # On CPU, skip the dead particles (with `particle_removal='mask'`)
+    body = []
+    thread_setup = []
+    if not use_cuda:
+        thread_setup = [ 'skip_dead = ( dead.shape[0] != 0 )' ]
+        body = [ 'if skip_dead and dead[i_ptcl]:', '    continue' ]
+    # Cylindrical conversion and azimuthal factors
+    body += get_cylindrical_lines() + get_exptheta_lines( Nm, '-' ) \
+        + get_cell_position_lines()
+    # Shape factors
+    if particle_shape == 'linear':
+        body += [
+            '# Original index of the uppper and lower cell',
+            'ir_lower = int(math.floor( r_cell ))',
+            'ir_upper = ir_lower + 1',
+            'iz_lower = int(math.floor( z_cell ))',
+            'iz_upper = iz_lower + 1',
+            '# Linear weights (guard weights used below the axis)',
+            'Sr_lower = ir_upper - r_cell',
+            'Sr_upper = r_cell - ir_lower',
+            'Sz_lower = iz_upper - z_cell',
+            'Sz_upper = z_cell - iz_lower',
+            'Sr_guard = 0.',
+            'if ir_lower < 0:',
+            '    Sr_guard = Sr_lower',
+            '    Sr_lower = 0.',
+            '    ir_lower = 0',
+            '# Absorbing in upper r, periodic in z',
+            'if ir_lower > Nr-1:',
+            '    ir_lower = Nr-1',
+            'if ir_upper > Nr-1:',
+            '    ir_upper = Nr-1',
+            'if iz_lower < 0:',
+            '    iz_lower += Nz',
+            'if iz_upper < 0:',
+            '    iz_upper += Nz',
+            'if iz_lower > Nz-1:',
+            '    iz_lower -= Nz',
+            'if iz_upper > Nz-1:',
+            '    iz_upper -= Nz',
+            'S_ll = Sz_lower*Sr_lower',
+            'S_lu = Sz_lower*Sr_upper',
+            'S_ul = Sz_upper*Sr_lower',
+            'S_uu = Sz_upper*Sr_upper',
+            'S_lg = Sz_lower*Sr_guard',
+            'S_ug = Sz_upper*Sr_guard' ]
+        add_function = 'add_linear_gather_for_mode'
+        shape_args = 'iz_lower, iz_upper, ir_lower, ir_upper, ' + \
+                     'S_ll, S_lu, S_lg, S_ul, S_uu, S_ug'
+    else:
+        if use_cuda:
+            body += [ 'Sr = cuda.local.array((4,), dtype=float64)',
+                      'Sz = cuda.local.array((4,), dtype=float64)' ]
+        else:
+            thread_setup += [ 'Sr = np.empty( 4 )', 'Sz = np.empty( 4 )' ]
+        for coord in 'rz':
+            body += [
+                'i%s_lowest = int64(math.floor(%s_cell)) - 1' %(coord,coord),
+                '%s_local = %s_cell - i%s_lowest' %(coord, coord, coord),
+                'S%s[0] = -1./6. * (%s_local-2.)**3' %(coord, coord),
+                'S%s[1] = 1./6. * (3.*(%s_local-1.)**3 '
+                    '- 6.*(%s_local-1.)**2 + 4.)' %(coord, coord, coord),
+                'S%s[2] = 1./6. * (3.*(2.-%s_local)**3 '
+                    '- 6.*(2.-%s_local)**2 + 4.)' %(coord, coord, coord),
+                'S%s[3] = -1./6. * (1.-%s_local)**3' %(coord, coord) ]
+        add_function = 'add_cubic_gather_for_mode'
+        shape_args = 'ir_lowest, iz_lowest, Sr, Sz, Nr, Nz'
+
+    # Add the contribution of each mode, and convert to Cartesian coordinates
+    for field in [ 'E', 'B' ]:
+        body += [ '# %s field' %field, 'Fr = 0.', 'Ft = 0.', 'Fz = 0.' ]
+        for m in range(Nm):
+            body += [
+                'Fr, Ft, Fz = %s( %d, Fr, Ft, Fz, exptheta_m%d,' \
+                    %(add_function, m, m),
+                '    %sr_m%d, %st_m%d, %sz_m%d, %s )' \
+                    %(field, m, field, m, field, m, shape_args) ]
+        body += [ '%sx[i_ptcl] = cos*Fr - sin*Ft' %field,
+                  '%sy[i_ptcl] = sin*Fr + cos*Ft' %field,
+                  '%sz[i_ptcl] = Fz' %field ]
+
+    lines = get_kernel_lines( name, args, docstring, body,
+                              use_cuda, thread_setup )
+    return( name, '\n'.join(lines) + '\n' )
+
+# ----------------------
+# Generation: deposition
+# ----------------------
+
+def generate_deposit_source( fieldtype, Nm, particle_shape, use_cuda ):
+    """
+    Return the name and the source code of the deposition kernel for
+    `fieldtype` ('rho' or 'J'), for `Nm` modes, the shape `particle_shape`
+    ('linear' or 'cubic') and the backend given by `use_cuda`
+    (see `get_deposit_kernel`)
+    """
+    if particle_shape not in n_shape_factors:
+        raise ValueError("`particle_shape` should be either 'linear' or "
+                         "'cubic' but is `%s`" % particle_shape)
+    if fieldtype not in [ 'rho', 'J' ]:
+        raise ValueError("`fieldtype` should be either 'rho' or 'J' "
+                         "but is `%s`" % fieldtype)
+    n_shape = n_shape_factors[ particle_shape ]
+    backend = 'gpu' if use_cuda else 'numba'
+    name = 'deposit_%s_%s_%s_%d_modes' \
+                %(fieldtype, backend, particle_shape, Nm)
+    if fieldtype == 'rho':
+        components = [ 'R' ]
+        grid_names = { 'R': 'rho' }
+    else:
+        components = [ 'J_r', 'J_t', 'J_z' ]
+        grid_names = { 'J_r': 'j_r', 'J_t': 'j_t', 'J_z': 'j_z' }
+
+    # Arguments of the kernel
+    args = [ 'x', 'y', 'z', 'w', 'q' ]
+    if fieldtype == 'J':
+        args += [ 'ux', 'uy', 'uz', 'inv_gamma' ]
+    args += [ 'invdz', 'zmin', 'Nz', 'invdr', 'rmin', 'Nr' ]
+    if use_cuda:
+        for comp in components:
+            args += [ '%s_m%d' %(grid_names[comp], m) for m in range(Nm) ]
+        args += [ 'cell_idx', 'prefix_sum' ]
+    else:
+        args += [ '%s_global' %grid_names[comp] for comp in components ]
+        args += [ 'nthreads', 'ptcl_chunk_indices' ]
+    docstring = [
+        'Deposit %s onto %d azimuthal modes, with a %s shape' \
+            %(fieldtype, Nm, particle_shape),
+        '(generated kernel).' ]
+
+    # Cylindrical conversion and azimuthal factors
+    body = get_cylindrical_lines()
+    if fieldtype == 'J':
+        body += [ '# Velocity',
+                  'uxj = ux[i_ptcl]',
+                  'uyj = uy[i_ptcl]',
+                  'uzj = uz[i_ptcl]',
+                  'inv_gammaj = inv_gamma[i_ptcl]' ]
+    body += [ '# Weights', 'wj = q * w[i_ptcl]' ]
+    body += get_exptheta_lines( Nm, '+' ) + get_cell_position_lines()
+
+    # Contribution of the particle to each mode
+    body += [ '# Contribution of the particle to each mode' ]
+    if fieldtype == 'rho':
+        body += [ 'R_m0_scal = wj' ]
+    else:
+        body += [
+            'J_r_m0_scal = wj * c * inv_gammaj * (cos*uxj + sin*uyj)',
+            'J_t_m0_scal = wj * c * inv_gammaj * (cos*uyj - sin*uxj)',
+            'J_z_m0_scal = wj * c * inv_gammaj * uzj' ]
+    for m in range(1, Nm):
+        body += [ '%s_m%d_scal = %s_m0_scal * exptheta_m%d' %(comp, m, comp, m)
+                  for comp in components ]
+
+    # Shape factors, computed once per particle. On GPU, the indices of
+    # the cells are those of the cell of the particle (obtained with
+    # `ceil` when sorting); on CPU, they are obtained with `floor`.
+    body += [ '# Shape factors' ]
+    for coord in 'zr':
+        if use_cuda:
+            lowest = 'math.ceil( %s_cell )%s' \
+                        %(coord, get_offset(-n_shape//2))
+        else:
+            lowest = 'math.floor( %s_cell )%s' \
+                        %(coord, get_offset(1-n_shape//2))
+        body += [ 'i%s = %s' %(coord, lowest) ]
+        if particle_shape == 'linear':
+            body += [
+                'S%s0 = i%s+1.-%s_cell' %(coord, coord, coord),
+                'S%s1 = %s_cell - i%s' %(coord, coord, coord) ]
+        else:
+            body += [
+                'S%s0 = (-1./6.)*((%s_cell-i%s)-2)**3' %(coord, coord, coord),
+                'S%s1 = (1./6.)*(3*((%s_cell-(i%s+1))**3)'
+                    '-6*((%s_cell-(i%s+1))**2)+4)' %((coord,)+4*(coord,)),
+                'S%s2 = (1./6.)*(3*(((i%s+2)-%s_cell)**3)'
+                    '-6*(((i%s+2)-%s_cell)**2)+4)' %((coord,)+4*(coord,)),
+                'S%s3 = (-1./6.)*(((i%s+3)-%s_cell)-2)**3' \
+                    %(coord, coord, coord) ]
+    body += [ '# Flip the sign of the shape factors below the axis' ]
+    for b in range(n_shape):
+        body += [ 'if ir%s < 0:' %get_offset(b), '    Sr%d = -Sr%d' %(b, b) ]
+    body += [ 'S%d%d = Sz%d*Sr%d' %(a, b, a, b)
+              for a in range(n_shape) for b in range(n_shape) ]
+
+    if use_cuda:
+        # Accumulate the contributions of the particles of one cell in
+        # registers, and add them atomically to the global arrays
+        accumulation = []
+        for comp in components:
+            for m in range(Nm):
+                accumulation += [
+                    '%s_m%d_%d%d += S%d%d*%s_m%d_scal' \
+                        %(comp, m, a, b, a, b, comp, m)
+                    for a in range(n_shape) for b in range(n_shape) ]
+        lines = get_deposit_gpu_lines( name, args, docstring,
+            body + accumulation, components, grid_names, Nm, n_shape )
+    else:
+        # Add the contributions to the thread-local copies
+        # of the global arrays (which have 2 guard cells)
+        body += [ 'iz_cell = int(iz) + 2' ]
+        if particle_shape == 'linear':
+            body += [ 'ir_cell = min( int(ir)+2, Nr+2 )' ]
+        else:
+            body += [ 'ir_cell = min( int(ir)+2, Nr )' ]
+        for comp in components:
+            for m in range(Nm):
+                body += [
+                    '%s_global[nt,%d,iz_cell+%d,ir_cell+%d] += '
+                    'S%d%d*%s_m%d_scal' \
+                    %(grid_names[comp], m, a, b, a, b, comp, m)
+                    for a in range(n_shape) for b in range(n_shape) ]
+        lines = get_kernel_lines( name, args, docstring, body, use_cuda )
+
+    return( name, '\n'.join(lines) + '\n' )
+
+def get_deposit_gpu_lines( name, args, docstring, particle_body,
+                           components, grid_names, Nm, n_shape ):
+    """
+    Return the lines of a GPU deposition kernel called `name`, in which
+    each thread handles one cell (the particles being sorted by cell):
+    `particle_body` is executed for each particle of the cell.
+    """
+    lines = [ 'def %s( %s ):' %(name, ', '.join(args)),
+              '    """', ] + indent( docstring, 1 ) + [ '    """' ]
+    body = [
+        'i = cuda.grid(1)',
+        'if i < prefix_sum.shape[0]:',
+        '    # Index of the upper grid point (in z and r) of the cell',
+        '    iz_upper = int( i / (Nr+1) )',
+        '    ir_upper = int( i - iz_upper * (Nr+1) )',
+        '    # Number of particles in this cell',
+        '    incl_offset = np.int32(prefix_sum[i])',
+        '    if i > 0:',
+        '        frequency_per_cell = np.int32(incl_offset - prefix_sum[i-1])',
+        '    if i == 0:',
+        '        frequency_per_cell = np.int32(incl_offset)',
+        '    # Registers for the contributions of the particles' ]
+    for comp in components:
+        for m in range(Nm):
+            zero = '0.' if m == 0 else '0. + 0.j'
+            body += [ '    %s_m%d_%d%d = %s' %(comp, m, a, b, zero)
+                      for a in range(n_shape) for b in range(n_shape) ]
+    body += [ '    for j in range(frequency_per_cell):',
+              '        i_ptcl = incl_offset-1-j' ]
+    body += indent( particle_body, 2 )
+
+    # Indices at which to add the registers
+    body += [ '    # Longitudinal indices (periodic in z)' ]
+    for a in range(n_shape):
+        body += [ '    iz%d = iz_upper%s' %(a, get_offset(a-n_shape//2)) ]
+        if a < n_shape//2:
+            body += [ '    if iz%d < 0:' %a, '        iz%d += Nz' %a ]
+        elif a > n_shape//2:
+            body += [ '    if iz%d > Nz-1:' %a, '        iz%d -= Nz' %a ]
+    body += [ '    # Radial indices (folded below the axis)' ]
+    for b in range(n_shape):
+        if b == 0:
+            body += [ '    ir0 = ir_upper%s' %get_offset(-n_shape//2) ]
+        else:
+            body += [ '    ir%d = min( ir_upper%s, Nr-1 )'
+                      %(b, get_offset(b-n_shape//2)) ]
+        if b < n_shape//2:
+            body += [ '    if ir%d < 0:' %b,
+                      '        ir%d = -(1 + ir%d)' %(b, b) ]
+    body += [ '    # Atomically add the registers to global memory',
+              '    if frequency_per_cell > 0:' ]
+    for comp in components:
+        for m in range(Nm):
+            for part in ( ['real'] if m == 0 else ['real', 'imag'] ):
+                body += [
+                    '        cuda.atomic.add(%s_m%d.%s, (iz%d, ir%d), '
+                    '%s_m%d_%d%d.%s)' %(grid_names[comp], m, part,
+                                        a, b, comp, m, a, b, part)
+                    for a in range(n_shape) for b in range(n_shape) ]
+    return( lines + indent( body, 1 ) )
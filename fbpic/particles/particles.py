@@ -11,22 +11,45 @@ from scipy.constants import e
 from .tracking import ParticleTracker
 from .elementary_process.ionization import Ionizer
 from .elementary_process.compton import ComptonScatterer
+from .elementary_process.cuda_numba_utils import reallocate_particle_array
 from .injection import BallisticBeforePlane, ContinuousInjector, \
                         generate_evenly_spaced
 
 # Load the numba methods
 from .push.numba_methods import push_p_numba, push_p_ioniz_numba, \
                                 push_p_after_plane_numba, push_x_numba
+from .push.fused_numba_methods import gather_push_numba_linear, \
+                                gather_push_numba_cubic
 from .gathering.threading_methods import gather_field_numba_linear, \
-        gather_field_numba_cubic
-from .gathering.threading_methods_one_mode import erase_eb_numba, \
-    gather_field_numba_linear_one_mode, gather_field_numba_cubic_one_mode
+        gather_field_numba_cubic, gather_field_numba_linear_all_modes, \
+        gather_field_numba_cubic_all_modes
 from .deposition.threading_methods import \
-        deposit_rho_numba_linear, deposit_rho_numba_cubic, \
-        deposit_J_numba_linear, deposit_J_numba_cubic
+        deposit_rho_numba_tiled, deposit_J_numba_tiled, \
+        deposit_rho_numba_zchunks, deposit_J_numba_zchunks
+from .kernel_generation import get_gather_kernel, get_deposit_kernel
+from .utilities.cpu_sorting import get_cell_idx_per_particle_cpu, \
+        counting_sort_per_cell, write_sorting_buffer_cpu, \
+        count_particles_outside_tiles, get_tile_prefix_sum, \
+        get_tile_iz_bounds, get_balanced_iz_bounds
+from .utilities.dead_particles import mark_dead_particles, \
+        park_dead_particles, compact_particle_array
 
 # Check if threading is enabled
 from fbpic.utils.threading import nthreads, get_chunk_indices
+from fbpic.utils.precision import get_dtypes
+
+# Size of the tiles (number of cells along z) for the tiled deposition on CPU,
+# and maximal distance (in cells) that the particles may travel outside of
+# their tile (or z-chunk) between two sortings
+# (the tiled deposition requires cpu_tile_size >= 2*cpu_tile_margin+3)
+cpu_tile_size = 16
+cpu_tile_margin = 4
+# Factor by which the capacity of the particle arrays is multiplied, when
+# they need to store more particles (see `resize_particle_arrays`)
+particle_capacity_growth = 1.5
+# Fraction of dead particles above which the particle arrays are compacted,
+# when the removed particles are only masked (`particle_removal='mask'`)
+dead_particle_fraction_threshold = 0.25
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 if cuda_installed:
@@ -34,6 +57,8 @@ if cuda_installed:
     from fbpic.utils.cuda import cuda, cuda_tpb_bpg_1d
     from .push.cuda_methods import push_p_gpu, push_p_ioniz_gpu, \
                                 push_p_after_plane_gpu, push_x_gpu
+    from .push.fused_cuda_methods import gather_push_gpu_linear, \
+                                gather_push_gpu_cubic
     from .deposition.cuda_methods import deposit_rho_gpu_linear, \
         deposit_J_gpu_linear, deposit_rho_gpu_cubic, deposit_J_gpu_cubic
     from .deposition.cuda_methods_one_mode import \
@@ -66,7 +91,9 @@ class Particles(object) :
                     ux_th=0., uy_th=0., uz_th=0.,
                     dens_func=None, continuous_injection=True,
                     grid_shape=None, particle_shape='linear',
-                    use_cuda=False, dz_particles=None ):
+                    use_cuda=False, dz_particles=None, precision='double',
+                    cpu_deposition='particle-chunks',
+                    particle_removal='compact', gpu_kernels='hand-written' ):
         """
         Initialize a uniform set of particles
 
@@ -136,6 +163,45 @@ class Particles(object) :
             from the arguments `zmin`, `zmax` and `Npz`. However, when
             there are no particles in the initial box (`Npz = 0`),
             `dz_particles` needs to be explicitly passed.
+
+        precision: str, optional
+            The floating-point precision of the particle arrays.
+            Either 'double', 'single' or 'mixed' (in which case the
+            positions are in double precision, and the other quantities
+            are in single precision).
+
+        cpu_deposition: str, optional
+            How the charge and current are deposited when running on CPU.
+            Either 'particle-chunks' (each thread deposits a contiguous
+            chunk of the particle arrays into its own copy of the grid)
+            or 'sorted-tiles' (the particles are sorted by cell, and each
+            thread deposits tiles of cells into a small tile-local array,
+            which is then added to a single copy of the grid)
+            or 'z-chunks' (the particles are sorted by cell, and each
+            thread deposits directly into its own chunk of cells along z,
+            of a single copy of the grid, except in the halos of the chunk).
+            (See the corresponding argument of the `Simulation` class.)
+            This is ignored when running on GPU.
+
+        particle_removal: str, optional
+            How the particles that leave the local domain are removed.
+            Either 'compact' (the remaining particles are compacted at
+            each removal) or 'mask' (the removed particles are only marked
+            as dead, with a zero weight, and the particle arrays are
+            compacted once the fraction of dead particles exceeds
+            `dead_particle_fraction_threshold`).
+            (See the corresponding argument of the `Simulation` class.)
+            Only 'compact' is available on GPU.
+
+        gpu_kernels: str, optional
+            Which kernels gather the fields and deposit the charge and
+            current on GPU, when the number of modes is not 2.
+            Either 'hand-written' (one kernel launch per mode) or
+            'generated' (kernels generated for the number of modes, which
+            handle all the modes in a single launch; see
+            `fbpic/particles/kernel_generation.py`).
+            (See the corresponding argument of the `Simulation` class.)
+            This is ignored when running on CPU.
         """
         # Define whether or not to use the GPU
         self.use_cuda = use_cuda
@@ -157,23 +223,32 @@ class Particles(object) :
         self.m = m
         self.dt = dt
 
+        # Register the precision of the particle arrays
+        self.precision = precision
+        dtypes = get_dtypes( precision )
+        self.dtype = dtypes['particle']
+        self.position_dtype = dtypes['position']
+
         # Register the particle arrarys
-        self.x = x
-        self.y = y
-        self.z = z
-        self.ux = ux
-        self.uy = uy
-        self.uz = uz
-        self.inv_gamma = inv_gamma
-        self.w = w
+        self.x = x.astype( self.position_dtype )
+        self.y = y.astype( self.position_dtype )
+        self.z = z.astype( self.position_dtype )
+        self.ux = ux.astype( self.dtype )
+        self.uy = uy.astype( self.dtype )
+        self.uz = uz.astype( self.dtype )
+        self.inv_gamma = inv_gamma.astype( self.dtype )
+        self.w = w.astype( self.dtype )
 
         # Initialize the fields array (at the positions of the particles)
-        self.Ez = np.zeros( Ntot )
-        self.Ex = np.zeros( Ntot )
-        self.Ey = np.zeros( Ntot )
-        self.Bz = np.zeros( Ntot )
-        self.Bx = np.zeros( Ntot )
-        self.By = np.zeros( Ntot )
+        self.Ez = np.zeros( Ntot, dtype=self.dtype )
+        self.Ex = np.zeros( Ntot, dtype=self.dtype )
+        self.Ey = np.zeros( Ntot, dtype=self.dtype )
+        self.Bz = np.zeros( Ntot, dtype=self.dtype )
+        self.Bx = np.zeros( Ntot, dtype=self.dtype )
+        self.By = np.zeros( Ntot, dtype=self.dtype )
+        # Storage arrays, of which the particle arrays are views
+        # (see `resize_particle_arrays`)
+        self.particle_storage = {}
 
         # The particle injector stores information that is useful in order
         # continuously inject particles in the simulation, with moving window
@@ -200,6 +275,53 @@ class Particles(object) :
         # Register particle shape
         self.particle_shape = particle_shape
 
+        # Register how the particles are removed ; in 'mask' mode, the
+        # array `dead` flags the particles that were removed
+        if particle_removal not in ['compact', 'mask']:
+            raise ValueError('Unknown `particle_removal`: %s'
+                             %particle_removal)
+        if particle_removal == 'mask' and self.use_cuda:
+            warnings.warn(
+                "`particle_removal='mask'` is not available on GPU.\n"
+                "The particle arrays are compacted at each removal.")
+            particle_removal = 'compact'
+        self.particle_removal = particle_removal
+        if particle_removal == 'mask':
+            self.dead = np.zeros( Ntot, dtype=np.bool_ )
+        else:
+            self.dead = None
+        self.n_dead = 0
+
+        # Register the kernels used on GPU for a number of modes other than 2
+        if gpu_kernels not in ['hand-written', 'generated']:
+            raise ValueError('Unknown `gpu_kernels`: %s' %gpu_kernels)
+        self.gpu_kernels = gpu_kernels
+
+        # Register the deposition method on CPU
+        if cpu_deposition not in ['particle-chunks', 'sorted-tiles',
+                                  'z-chunks']:
+            raise ValueError('Unknown `cpu_deposition`: %s' %cpu_deposition)
+        self.cpu_deposition = cpu_deposition
+        # For the sorted deposition: the particles are sorted only when
+        # needed (i.e. when one particle moved too far from its tile)
+        if cpu_deposition in ['sorted-tiles', 'z-chunks']:
+            self.tile_size = cpu_tile_size
+            self.tile_margin = cpu_tile_margin
+            # Number of z-chunks (one per thread)
+            self.n_zchunks = nthreads
+            # Index in z of the first cell of each tile, and index of
+            # the first particle of each tile (None: unsorted)
+            self.tile_iz_bounds = None
+            self.tile_prefix_sum = None
+
+        # On CPU with several threads, copy the particle arrays so that
+        # their memory is first touched by the threads that later handle
+        # the corresponding particles (see `reallocate_particle_array`)
+        if (not self.use_cuda) and (nthreads > 1):
+            for obj, name in self.get_particle_attributes():
+                setattr( obj, name, reallocate_particle_array(
+                            getattr( obj, name ), Ntot, Ntot ) )
+
         # Allocate arrays and register variables when using CUDA
         if self.use_cuda:
             if grid_shape is None:
@@ -210,7 +332,11 @@ class Particles(object) :
             # Allocate arrays for the particles sorting when using CUDA
             self.cell_idx = np.empty( Ntot, dtype=np.int32)
             self.sorted_idx = np.empty( Ntot, dtype=np.uint32)
-            self.sorting_buffer = np.empty( Ntot, dtype=np.float64 )
+            self.sorting_buffer = np.empty( Ntot, dtype=self.dtype )
+            # (In mixed precision, the positions need a separate buffer)
+            if self.position_dtype != self.dtype:
+                self.position_sorting_buffer = \
+                    np.empty( Ntot, dtype=self.position_dtype )
             Nz, Nr = grid_shape
             self.prefix_sum = np.empty( Nz*(Nr+1), dtype=np.int32 )
             # Register integer thta records shift in the indices,
@@ -251,6 +377,9 @@ class Particles(object) :
             self.sorted_idx = cuda.to_device(self.sorted_idx)
             self.prefix_sum = cuda.to_device(self.prefix_sum)
             self.sorting_buffer = cuda.to_device(self.sorting_buffer)
+            if self.position_dtype != self.dtype:
+                self.position_sorting_buffer = \
+                    cuda.to_device(self.position_sorting_buffer)
             if self.n_integer_quantities > 0:
                 self.int_sorting_buffer = cuda.to_device(self.int_sorting_buffer)
 
@@ -293,6 +422,9 @@ class Particles(object) :
             self.sorted_idx = self.sorted_idx.copy_to_host()
             self.prefix_sum = self.prefix_sum.copy_to_host()
             self.sorting_buffer = self.sorting_buffer.copy_to_host()
+            if self.position_dtype != self.dtype:
+                self.position_sorting_buffer = \
+                    self.position_sorting_buffer.copy_to_host()
             if self.n_integer_quantities > 0:
                 self.int_sorting_buffer = self.int_sorting_buffer.copy_to_host()
 
@@ -303,6 +435,179 @@ class Particles(object) :
             if self.ionizer is not None:
                 self.ionizer.receive_from_gpu()
 
+    def resize_grid_arrays( self, grid_shape ):
+        """
+        Reallocate the arrays whose size depends on the shape of the local
+        grid, and mark the particles as unsorted. This is called when the
+        local grid is resized (e.g. by the dynamic load balancing), while
+        the particle arrays are on the CPU.
+
+        Parameters
+        ----------
+        grid_shape: tuple
+            The new shape of the local grid (Nz, Nr)
+        """
+        if self.use_cuda:
+            self.grid_shape = grid_shape
+            Nz, Nr = grid_shape
+            self.prefix_sum = np.empty( Nz*(Nr+1), dtype=np.int32 )
+            self.prefix_sum_shift = 0
+            self.sorted = False
+        elif self.cpu_deposition in ['sorted-tiles', 'z-chunks']:
+            self.tile_iz_bounds = None
+            self.tile_prefix_sum = None
+
+    def get_particle_attributes( self ):
+        """
+        Return a list of (object, attribute name), for all the arrays
+        that have one element per macroparticle: the particle quantities,
+        the fields on the particles, the tracking id and the ionization data
+        (if any), the flags of the dead particles (with
+        `particle_removal='mask'`), and the auxiliary sorting arrays
+        (when using the GPU)
+        """
+        attr_list = [ (self,'x'), (self,'y'), (self,'z'),
+                      (self,'ux'), (self,'uy'), (self,'uz'),
+                      (self,'w'), (self,'inv_gamma'),
+                      (self,'Ex'), (self,'Ey'), (self,'Ez'),
+                      (self,'Bx'), (self,'By'), (self,'Bz') ]
+        if self.tracker is not None:
+            attr_list += [ (self.tracker,'id') ]
+        if self.ionizer is not None:
+            attr_list += [ (self.ionizer,'w_times_level'),
+                           (self.ionizer,'ionization_level') ]
+        if self.dead is not None:
+            attr_list += [ (self,'dead') ]
+        if self.use_cuda:
+            attr_list += [ (self,'cell_idx'), (self,'sorted_idx'),
+                           (self,'sorting_buffer') ]
+            if self.position_dtype != self.dtype:
+                attr_list += [ (self,'position_sorting_buffer') ]
+            if self.n_integer_quantities > 0:
+                attr_list += [ (self,'int_sorting_buffer') ]
+        return( attr_list )
+
+    def resize_particle_arrays( self, new_Ntot ):
+        """
+        Change the number of macroparticles to `new_Ntot`, by resizing all
+        the arrays that have one element per macroparticle (on CPU or GPU).
+        The first particles (up to the smaller of `Ntot` and `new_Ntot`) are
+        unchanged ; the elements of the new particles are left empty and
+        are expected to be filled later.
+
+        The particle arrays are views of the first `Ntot` elements of larger
+        storage arrays. Thus, removing particles (after compacting the
+        particle arrays) does not reallocate any array, and adding particles
+        only reallocates the storage arrays when their capacity is exceeded
+        (in which case the capacity grows by `particle_capacity_growth`).
+
+        Parameters
+        ----------
+        new_Ntot: int
+            The new number of macroparticles
+        """
+        old_Ntot = self.Ntot
+        for obj, name in self.get_particle_attributes():
+            array = getattr( obj, name )
+            storage, view = self.particle_storage.get(
+                                    (obj, name), (None, None) )
+            # If the array was replaced since the last resizing (e.g. by
+            # sorting, or by a transfer to/from the GPU), use it as storage
+            if array is not view:
+                storage = array
+            # Enlarge the storage if needed
+            if new_Ntot > storage.shape[0]:
+                capacity = max( new_Ntot,
+                    int( particle_capacity_growth*storage.shape[0] ) )
+                storage = reallocate_particle_array( array,
+                    min( self.Ntot, array.shape[0] ), capacity, new_Ntot )
+            view = storage[:new_Ntot]
+            setattr( obj, name, view )
+            self.particle_storage[ (obj, name) ] = (storage, view)
+        self.Ntot = new_Ntot
+        # The new particles are alive
+        if (self.dead is not None) and (new_Ntot > old_Ntot):
+            self.dead[old_Ntot:] = False
+
+    def swap_particle_arrays( self, obj1, name1, obj2, name2 ):
+        """
+        Swap the particle arrays `name1` of `obj1` and `name2` of `obj2`
+        (e.g. a particle array and a sorting buffer), along with their
+        storage arrays (see `resize_particle_arrays`)
+        """
+        array1 = getattr( obj1, name1 )
+        setattr( obj1, name1, getattr( obj2, name2 ) )
+        setattr( obj2, name2, array1 )
+        storage1 = self.particle_storage.pop( (obj1, name1), None )
+        storage2 = self.particle_storage.pop( (obj2, name2), None )
+        if storage2 is not None:
+            self.particle_storage[ (obj1, name1) ] = storage2
+        if storage1 is not None:
+            self.particle_storage[ (obj2, name2) ] = storage1
+
+    def kill_particles( self, indices, zbox_min=None, zbox_max=None ):
+        """
+        Mark the particles `indices` as dead (with `particle_removal='mask'`,
+        on CPU), and compact the particle arrays if the fraction of dead
+        particles exceeds `dead_particle_fraction_threshold`.
+
+        The dead particles keep their slot in the particle arrays, but have
+        a zero weight and a zero momentum, and are moved to the axis. If
+        `zbox_min` and `zbox_max` are given, the dead particles that are
+        outside of these bounds (including the ones that were killed
+        earlier, which may be outside of the box after the moving window
+        moved) are moved to the middle of the box.
+
+        Parameters
+        ----------
+        indices: 1darray of ints
+            The indices of the particles that are removed
+
+        zbox_min, zbox_max: floats (in meters), optional
+            The bounds of the local physical domain along z
+        """
+        if self.ionizer is not None:
+            w_times_level = self.ionizer.w_times_level
+        else:
+            w_times_level = np.empty( 0, dtype=self.dtype )
+        mark_dead_particles( indices, self.dead, self.x, self.y,
+            self.ux, self.uy, self.uz, self.inv_gamma, self.w, w_times_level )
+        self.n_dead += len(indices)
+
+        # Compact the particle arrays when they are too fragmented
+        if self.n_dead > dead_particle_fraction_threshold*self.Ntot:
+            self.compact_particle_arrays()
+        elif (self.n_dead > 0) and (zbox_min is not None):
+            park_dead_particles( self.z, self.dead,
+                        zbox_min, zbox_max, 0.5*(zbox_min + zbox_max) )
+
+    def get_dead_flags( self ):
+        """
+        Return the array that flags the dead particles (with
+        `particle_removal='mask'`), which are skipped by the gathering and
+        the push on CPU, or an empty array if no particle is dead
+        """
+        if self.n_dead > 0:
+            return( self.dead )
+        else:
+            return( np.empty( 0, dtype=np.bool_ ) )
+
+    def compact_particle_arrays( self ):
+        """
+        Remove the dead particles (with `particle_removal='mask'`), by moving
+        the other particles to the beginning of the particle arrays
+        (in the same order) and resizing the arrays, without reallocation.
+        """
+        if self.n_dead == 0:
+            return
+        for obj, name in self.get_particle_attributes():
+            if name != 'dead':
+                N_alive = compact_particle_array(
+                            getattr( obj, name ), self.dead )
+        self.dead[:N_alive] = False
+        self.n_dead = 0
+        self.resize_particle_arrays( N_alive )
+
     def generate_continuously_injected_particles( self, time ):
         """
         Generate particles at the right end of the simulation boundary.
@@ -319,7 +624,7 @@ class Particles(object) :
                             self.injector.generate_particles( time )
 
         # Convert them to a particle buffer
-        # - Float buffer
+        # - Float buffer (in double precision, since it contains positions)
         float_buffer = np.empty((self.n_float_quantities,Ntot),dtype=np.float64)
         float_buffer[0,:] = x
         float_buffer[1,:] = y
@@ -356,7 +661,8 @@ class Particles(object) :
         comm: an fbpic.BoundaryCommunicator object
             Contains information about the number of processors
         """
-        self.tracker = ParticleTracker( comm.size, comm.rank, self.Ntot )
+        self.tracker = ParticleTracker( comm.world_size, comm.world_rank,
+                                        self.Ntot )
         # Update the number of integer quantities
         self.n_integer_quantities += 1
         # Allocate the integer sorting buffer if needed
@@ -474,6 +780,11 @@ class Particles(object) :
         Handle elementary processes for this species (e.g. ionization,
         Compton scattering) at simulation time t.
         """
+        # Remove the dead particles first (with `particle_removal='mask'`),
+        # since the elementary processes create particles from all
+        # the particles of the species
+        if (self.ionizer is not None) or (self.compton_scatterer is not None):
+            self.compact_particle_arrays()
         # Ionization
         if self.ionizer is not None:
             self.ionizer.handle_ionization( self )
@@ -500,14 +811,19 @@ class Particles(object) :
         for attr in attr_list:
             # Get particle GPU array
             particle_array = getattr( attr[0], attr[1] )
+            # Select the buffer that has the same precision
+            # (In mixed precision, the positions have their own buffer)
+            if particle_array.dtype == self.sorting_buffer.dtype:
+                buffer_name = 'sorting_buffer'
+            else:
+                buffer_name = 'position_sorting_buffer'
+            sorting_buffer = getattr( self, buffer_name )
             # Write particle data to particle buffer array while rearranging
             write_sorting_buffer[dim_grid_1d, dim_block_1d](
-                self.sorted_idx, particle_array, self.sorting_buffer)
-            # Assign the particle buffer to
-            # the initial particle data array
-            setattr( attr[0], attr[1], self.sorting_buffer)
-            # Assign the old particle data array to the particle buffer
-            self.sorting_buffer = particle_array
+                self.sorted_idx, particle_array, sorting_buffer)
+            # Assign the particle buffer to the initial particle data
+            # array, and the old particle data array to the particle buffer
+            self.swap_particle_arrays( attr[0], attr[1], self, buffer_name )
         # Iterate over (integer) particle attributes
         attr_list = [ ]
         if self.tracker is not None:
@@ -520,11 +836,10 @@ class Particles(object) :
             # Write particle data to particle buffer array while rearranging
             write_sorting_buffer[dim_grid_1d, dim_block_1d](
                 self.sorted_idx, particle_array, self.int_sorting_buffer)
-            # Assign the particle buffer to
-            # the initial particle data array
-            setattr( attr[0], attr[1], self.int_sorting_buffer)
-            # Assign the old particle data array to the particle buffer
-            self.int_sorting_buffer = particle_array
+            # Assign the particle buffer to the initial particle data
+            # array, and the old particle data array to the particle buffer
+            self.swap_particle_arrays( attr[0], attr[1],
+                                       self, 'int_sorting_buffer' )
 
     def push_p( self, t ) :
         """
@@ -586,12 +901,16 @@ class Particles(object) :
 
         # CPU version
         else:
+            # Divide particles into chunks (each chunk is handled by a
+            # different thread) and return the indices that bound chunks
+            ptcl_chunk_indices = get_chunk_indices(self.Ntot, nthreads)
             if self.ionizer is not None:
                 # Ionizable species can have a charge that depends on the
                 # macroparticle, and hence require a different function
                 push_p_ioniz_numba(self.ux, self.uy, self.uz, self.inv_gamma,
                     self.Ex, self.Ey, self.Ez, self.Bx, self.By, self.Bz,
-                    self.m, self.Ntot, self.dt, self.ionizer.ionization_level )
+                    self.m, self.Ntot, self.dt, self.ionizer.ionization_level,
+                    self.get_dead_flags(), nthreads, ptcl_chunk_indices )
             elif z_plane is not None:
                 # Particles that are ballistic before a plane also
                 # require a different pusher
@@ -600,12 +919,14 @@ class Particles(object) :
                     self.ux, self.uy, self.uz, self.inv_gamma,
                     self.Ex, self.Ey, self.Ez,
                     self.Bx, self.By, self.Bz,
-                    self.q, self.m, self.Ntot, self.dt )
+                    self.q, self.m, self.Ntot, self.dt,
+                    self.get_dead_flags(), nthreads, ptcl_chunk_indices )
             else:
                 # Standard pusher
                 push_p_numba(self.ux, self.uy, self.uz, self.inv_gamma,
                     self.Ex, self.Ey, self.Ez, self.Bx, self.By, self.Bz,
-                    self.q, self.m, self.Ntot, self.dt )
+                    self.q, self.m, self.Ntot, self.dt,
+                    self.get_dead_flags(), nthreads, ptcl_chunk_indices )
 
 
     def push_x( self, dt, x_push=1., y_push=1., z_push=1. ) :
@@ -637,10 +958,14 @@ class Particles(object) :
             self.sorted = False
         # CPU version
         else:
+            # Divide particles into chunks (each chunk is handled by a
+            # different thread) and return the indices that bound chunks
+            ptcl_chunk_indices = get_chunk_indices(self.Ntot, nthreads)
             push_x_numba( self.x, self.y, self.z,
                 self.ux, self.uy, self.uz,
                 self.inv_gamma, self.Ntot,
-                dt, x_push, y_push, z_push )
+                dt, x_push, y_push, z_push,
+                self.get_dead_flags(), nthreads, ptcl_chunk_indices )
 
     def gather( self, grid ) :
         """
@@ -662,135 +987,194 @@ class Particles(object) :
         # Number of modes
         Nm = len(grid)
 
+        if self.particle_shape not in ['linear', 'cubic']:
+            raise ValueError("`particle_shape` should be either \
+                              'linear' or 'cubic' \
+                               but is `%s`" % self.particle_shape)
+
         # GPU (CUDA) version
         if self.use_cuda:
             # Get the threads per block and the blocks per grid
             dim_grid_1d, dim_block_1d = cuda_tpb_bpg_1d( self.Ntot, TPB=64 )
             # Call the CUDA Kernel for the gathering of E and B Fields
-            if self.particle_shape == 'linear':
-                if Nm == 2:
-                    # Optimized version for 2 modes
-                    gather_field_gpu_linear[dim_grid_1d, dim_block_1d](
-                         self.x, self.y, self.z,
-                         grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                         grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                         grid[0].Er, grid[0].Et, grid[0].Ez,
-                         grid[1].Er, grid[1].Et, grid[1].Ez,
-                         grid[0].Br, grid[0].Bt, grid[0].Bz,
-                         grid[1].Br, grid[1].Bt, grid[1].Bz,
-                         self.Ex, self.Ey, self.Ez,
-                         self.Bx, self.By, self.Bz)
-                else:
-                    # Generic version for arbitrary number of modes
-                    erase_eb_cuda[dim_grid_1d, dim_block_1d](
-                                    self.Ex, self.Ey, self.Ez,
-                                    self.Bx, self.By, self.Bz, self.Ntot )
-                    for m in range(Nm):
-                        gather_field_gpu_linear_one_mode[
-                            dim_grid_1d, dim_block_1d](
-                            self.x, self.y, self.z,
-                            grid[m].invdz, grid[m].zmin, grid[m].Nz,
-                            grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                            grid[m].Er, grid[m].Et, grid[m].Ez,
-                            grid[m].Br, grid[m].Bt, grid[m].Bz, m,
-                            self.Ex, self.Ey, self.Ez,
-                            self.Bx, self.By, self.Bz)
-            elif self.particle_shape == 'cubic':
-                if Nm == 2:
-                    # Optimized version for 2 modes
-                    gather_field_gpu_cubic[dim_grid_1d, dim_block_1d](
-                         self.x, self.y, self.z,
-                         grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                         grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                         grid[0].Er, grid[0].Et, grid[0].Ez,
-                         grid[1].Er, grid[1].Et, grid[1].Ez,
-                         grid[0].Br, grid[0].Bt, grid[0].Bz,
-                         grid[1].Br, grid[1].Bt, grid[1].Bz,
-                         self.Ex, self.Ey, self.Ez,
-                         self.Bx, self.By, self.Bz)
+            if Nm == 2:
+                # Optimized version for 2 modes
+                if self.particle_shape == 'linear':
+                    gather_kernel = gather_field_gpu_linear
                 else:
-                    # Generic version for arbitrary number of modes
-                    erase_eb_cuda[dim_grid_1d, dim_block_1d](
-                                    self.Ex, self.Ey, self.Ez,
-                                    self.Bx, self.By, self.Bz, self.Ntot )
-                    for m in range(Nm):
-                        gather_field_gpu_cubic_one_mode[
-                            dim_grid_1d, dim_block_1d](
-                            self.x, self.y, self.z,
-                            grid[m].invdz, grid[m].zmin, grid[m].Nz,
-                            grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                            grid[m].Er, grid[m].Et, grid[m].Ez,
-                            grid[m].Br, grid[m].Bt, grid[m].Bz, m,
-                            self.Ex, self.Ey, self.Ez,
-                            self.Bx, self.By, self.Bz)
+                    gather_kernel = gather_field_gpu_cubic
+                gather_kernel[dim_grid_1d, dim_block_1d](
+                     self.x, self.y, self.z,
+                     grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                     grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                     grid[0].Er, grid[0].Et, grid[0].Ez,
+                     grid[1].Er, grid[1].Et, grid[1].Ez,
+                     grid[0].Br, grid[0].Bt, grid[0].Bz,
+                     grid[1].Br, grid[1].Bt, grid[1].Bz,
+                     self.Ex, self.Ey, self.Ez,
+                     self.Bx, self.By, self.Bz)
+            elif self.gpu_kernels == 'generated':
+                # Kernel generated for `Nm` modes (single pass over the
+                # particles)
+                gather_kernel = get_gather_kernel(
+                    Nm, self.particle_shape, use_cuda=True )
+                gather_kernel[dim_grid_1d, dim_block_1d](
+                    self.x, self.y, self.z,
+                    grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                    grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                    *[ getattr( grid[m], field + coord )
+                       for field in ['E', 'B'] for m in range(Nm)
+                       for coord in ['r', 't', 'z'] ],
+                    self.Ex, self.Ey, self.Ez,
+                    self.Bx, self.By, self.Bz)
             else:
-                raise ValueError("`particle_shape` should be either \
-                                  'linear' or 'cubic' \
-                                   but is `%s`" % self.particle_shape)
-        # CPU version
-        else:
-            if self.particle_shape == 'linear':
-                if Nm == 2:
-                    # Optimized version for 2 modes
-                    gather_field_numba_linear(
+                # Generic version for arbitrary number of modes
+                if self.particle_shape == 'linear':
+                    gather_kernel = gather_field_gpu_linear_one_mode
+                else:
+                    gather_kernel = gather_field_gpu_cubic_one_mode
+                erase_eb_cuda[dim_grid_1d, dim_block_1d](
+                                self.Ex, self.Ey, self.Ez,
+                                self.Bx, self.By, self.Bz, self.Ntot )
+                for m in range(Nm):
+                    gather_kernel[dim_grid_1d, dim_block_1d](
                         self.x, self.y, self.z,
-                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                        grid[0].Er, grid[0].Et, grid[0].Ez,
-                        grid[1].Er, grid[1].Et, grid[1].Ez,
-                        grid[0].Br, grid[0].Bt, grid[0].Bz,
-                        grid[1].Br, grid[1].Bt, grid[1].Bz,
+                        grid[m].invdz, grid[m].zmin, grid[m].Nz,
+                        grid[m].invdr, grid[m].rmin, grid[m].Nr,
+                        grid[m].Er, grid[m].Et, grid[m].Ez,
+                        grid[m].Br, grid[m].Bt, grid[m].Bz, m,
                         self.Ex, self.Ey, self.Ez,
                         self.Bx, self.By, self.Bz)
+        # CPU version
+        else:
+            # Divide particles into chunks (each chunk is handled by a
+            # different thread) and return the indices that bound chunks
+            ptcl_chunk_indices = get_chunk_indices(self.Ntot, nthreads)
+            if Nm == 2:
+                # Optimized version for 2 modes
+                if self.particle_shape == 'linear':
+                    gather_kernel = gather_field_numba_linear
                 else:
-                    # Generic version for arbitrary number of modes
-                    erase_eb_numba( self.Ex, self.Ey, self.Ez,
-                                    self.Bx, self.By, self.Bz, self.Ntot )
-                    for m in range(Nm):
-                        gather_field_numba_linear_one_mode(
-                            self.x, self.y, self.z,
-                            grid[m].invdz, grid[m].zmin, grid[m].Nz,
-                            grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                            grid[m].Er, grid[m].Et, grid[m].Ez,
-                            grid[m].Br, grid[m].Bt, grid[m].Bz, m,
-                            self.Ex, self.Ey, self.Ez,
-                            self.Bx, self.By, self.Bz
-                        )
-            elif self.particle_shape == 'cubic':
-                # Divide particles into chunks (each chunk is handled by a
-                # different thread) and return the indices that bound chunks
-                ptcl_chunk_indices = get_chunk_indices(self.Ntot, nthreads)
-                if Nm == 2:
-                    # Optimized version for 2 modes
-                    gather_field_numba_cubic(
-                        self.x, self.y, self.z,
-                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                        grid[0].Er, grid[0].Et, grid[0].Ez,
-                        grid[1].Er, grid[1].Et, grid[1].Ez,
-                        grid[0].Br, grid[0].Bt, grid[0].Bz,
-                        grid[1].Br, grid[1].Bt, grid[1].Bz,
-                        self.Ex, self.Ey, self.Ez,
-                        self.Bx, self.By, self.Bz,
-                        nthreads, ptcl_chunk_indices )
+                    gather_kernel = gather_field_numba_cubic
+                gather_kernel(
+                    self.x, self.y, self.z,
+                    grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                    grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                    grid[0].Er, grid[0].Et, grid[0].Ez,
+                    grid[1].Er, grid[1].Et, grid[1].Ez,
+                    grid[0].Br, grid[0].Bt, grid[0].Bz,
+                    grid[1].Br, grid[1].Bt, grid[1].Bz,
+                    self.Ex, self.Ey, self.Ez,
+                    self.Bx, self.By, self.Bz,
+                    self.get_dead_flags(), nthreads, ptcl_chunk_indices )
+            else:
+                # Generic version for arbitrary number of modes, in a
+                # single pass (the fields of the different modes are
+                # passed as tuples of arrays)
+                if self.particle_shape == 'linear':
+                    gather_kernel = gather_field_numba_linear_all_modes
                 else:
-                    # Generic version for arbitrary number of modes
-                    erase_eb_numba( self.Ex, self.Ey, self.Ez,
-                                    self.Bx, self.By, self.Bz, self.Ntot )
-                    for m in range(Nm):
-                        gather_field_numba_cubic_one_mode(
-                            self.x, self.y, self.z,
-                            grid[m].invdz, grid[m].zmin, grid[m].Nz,
-                            grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                            grid[m].Er, grid[m].Et, grid[m].Ez,
-                            grid[m].Br, grid[m].Bt, grid[m].Bz, m,
-                            self.Ex, self.Ey, self.Ez,
-                            self.Bx, self.By, self.Bz,
-                            nthreads, ptcl_chunk_indices )
+                    gather_kernel = gather_field_numba_cubic_all_modes
+                gather_kernel(
+                    self.x, self.y, self.z,
+                    grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                    grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                    tuple( grid[m].Er for m in range(Nm) ),
+                    tuple( grid[m].Et for m in range(Nm) ),
+                    tuple( grid[m].Ez for m in range(Nm) ),
+                    tuple( grid[m].Br for m in range(Nm) ),
+                    tuple( grid[m].Bt for m in range(Nm) ),
+                    tuple( grid[m].Bz for m in range(Nm) ),
+                    self.Ex, self.Ey, self.Ez,
+                    self.Bx, self.By, self.Bz,
+                    self.get_dead_flags(), nthreads, ptcl_chunk_indices )
+
+    def can_fuse_gather_push( self, Nm ):
+        """
+        Return whether the gathering, the momentum push and the position
+        push of this species can be done in a single kernel
+        (see `gather_push`), with `Nm` azimuthal modes.
+
+        This is not the case for neutral particles, for ionizable particles
+        (whose charge depends on the macroparticle, and whose ionization
+        uses the fields on the particles), for particles that are ballistic
+        before a plane, and when the number of modes is not 2.
+        """
+        return( (self.q != 0) and (Nm == 2) and (self.ionizer is None)
+                and not isinstance( self.injector, BallisticBeforePlane ) )
+
+    def gather_push( self, grid, dt_x ):
+        """
+        Gather the fields onto the macroparticles, advance their momenta
+        over one timestep (using the Vay pusher, as in `push_p`) and
+        advance their positions over `dt_x` (as in `push_x`), in a single
+        pass over the particles.
+
+        The gathered fields are only kept in registers: the arrays
+        Ex, Ey, Ez, Bx, By, Bz of the species are not modified. This
+        should thus only be used when these arrays are not needed
+        (e.g. by external fields or by diagnostics, see
+        `Simulation.step`), and when `can_fuse_gather_push` is True.
+
+        Parameters
+        ----------
+        grid : a list of InterpolationGrid objects
+             (one InterpolationGrid object per azimuthal mode)
+             Contains the field values on the interpolation grid
+
+        dt_x: float, seconds
+            The timestep that is used for the push of the positions
+            (typically half of the simulation timestep)
+        """
+        # GPU (CUDA) version
+        if self.use_cuda:
+            # Get the threads per block and the blocks per grid
+            dim_grid_1d, dim_block_1d = cuda_tpb_bpg_1d( self.Ntot, TPB=64 )
+            if self.particle_shape == 'linear':
+                gather_push_kernel = gather_push_gpu_linear
             else:
-                raise ValueError("`particle_shape` should be either \
-                                  'linear' or 'cubic' \
-                                   but is `%s`" % self.particle_shape)
+                gather_push_kernel = gather_push_gpu_cubic
+            gather_push_kernel[dim_grid_1d, dim_block_1d](
+                self.x, self.y, self.z,
+                self.ux, self.uy, self.uz, self.inv_gamma,
+                grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                grid[0].Er, grid[0].Et, grid[0].Ez,
+                grid[1].Er, grid[1].Et, grid[1].Ez,
+                grid[0].Br, grid[0].Bt, grid[0].Bz,
+                grid[1].Br, grid[1].Bt, grid[1].Bz,
+                self.q, self.m, self.dt, dt_x )
+            # The particle array is unsorted after the push in x
+            self.sorted = False
+        # CPU version
+        else:
+            # Divide particles into chunks (each chunk is handled by a
+            # different thread) and return the indices that bound chunks
+            ptcl_chunk_indices = get_chunk_indices(self.Ntot, nthreads)
+            if self.particle_shape == 'linear':
+                gather_push_numba_linear(
+                    self.x, self.y, self.z,
+                    self.ux, self.uy, self.uz, self.inv_gamma,
+                    grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                    grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                    grid[0].Er, grid[0].Et, grid[0].Ez,
+                    grid[1].Er, grid[1].Et, grid[1].Ez,
+                    grid[0].Br, grid[0].Bt, grid[0].Bz,
+                    grid[1].Br, grid[1].Bt, grid[1].Bz,
+                    self.q, self.m, self.dt, dt_x,
+                    self.get_dead_flags(), nthreads, ptcl_chunk_indices )
+            else:
+                gather_push_numba_cubic(
+                    self.x, self.y, self.z,
+                    self.ux, self.uy, self.uz, self.inv_gamma,
+                    grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                    grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                    grid[0].Er, grid[0].Et, grid[0].Ez,
+                    grid[1].Er, grid[1].Et, grid[1].Ez,
+                    grid[0].Br, grid[0].Bt, grid[0].Bz,
+                    grid[1].Br, grid[1].Bt, grid[1].Bz,
+                    self.q, self.m, self.dt, dt_x,
+                    self.get_dead_flags(), nthreads, ptcl_chunk_indices )
 
     def deposit( self, fld, fieldtype ) :
         """
@@ -825,6 +1209,11 @@ class Particles(object) :
                 self.sort_particles(fld=fld)
                 # The particles are now sorted and rearranged
                 self.sorted = True
+        # On CPU, with the sorted deposition: sort the particles by cell,
+        # only if they are not correctly sorted by tiles anymore
+        elif self.cpu_deposition in ['sorted-tiles', 'z-chunks']:
+            if not self.is_sorted_by_tiles( fld ):
+                self.sort_particles_cpu( fld )
 
         # For ionizable atoms: set the effective weight to the weight
         # times the ionization level (on GPU, this needs to be done *after*
@@ -842,136 +1231,219 @@ class Particles(object) :
 
             # Call the CUDA Kernel for the deposition of rho or J
             Nm = len( grid )
+            if (Nm != 2) and (self.gpu_kernels == 'generated'):
+                # Kernel generated for `Nm` modes (single pass over the cells)
+                deposit_kernel = get_deposit_kernel(
+                    fieldtype, Nm, self.particle_shape, use_cuda=True )
+                args = [ self.x, self.y, self.z, weight, self.q ]
+                if fieldtype == 'rho':
+                    fields = [ grid[m].rho for m in range(Nm) ]
+                else:
+                    args += [ self.ux, self.uy, self.uz, self.inv_gamma ]
+                    fields = [ getattr( grid[m], 'J' + coord )
+                               for coord in ['r', 't', 'z']
+                               for m in range(Nm) ]
+                args += [ grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                          grid[0].invdr, grid[0].rmin, grid[0].Nr ] + \
+                        fields + [ self.cell_idx, self.prefix_sum ]
+                deposit_kernel[ dim_grid_2d_flat, dim_block_2d_flat ]( *args )
             # Rho
-            if fieldtype == 'rho':
-                if self.particle_shape == 'linear':
-                    if Nm == 2:
-                        deposit_rho_gpu_linear[
-                            dim_grid_2d_flat, dim_block_2d_flat](
-                            self.x, self.y, self.z, weight, self.q,
-                            grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                            grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                            grid[0].rho, grid[1].rho,
-                            self.cell_idx, self.prefix_sum)
-                    else:
-                        for m in range(Nm):
-                            deposit_rho_gpu_linear_one_mode[
-                                dim_grid_2d_flat, dim_block_2d_flat](
-                                self.x, self.y, self.z, weight, self.q,
-                                grid[m].invdz, grid[m].zmin, grid[m].Nz,
-                                grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                                grid[m].rho, m,
-                                self.cell_idx, self.prefix_sum)
-                elif self.particle_shape == 'cubic':
-                    if Nm == 2:
-                        deposit_rho_gpu_cubic[
-                            dim_grid_2d_flat, dim_block_2d_flat](
+            elif fieldtype == 'rho':
+                if Nm == 2:
+                    # Optimized version for 2 modes
+                    if self.particle_shape == 'linear':
+                        deposit_kernel = deposit_rho_gpu_linear
+                    elif self.particle_shape == 'cubic':
+                        deposit_kernel = deposit_rho_gpu_cubic
+                    deposit_kernel[ dim_grid_2d_flat, dim_block_2d_flat ](
+                        self.x, self.y, self.z, weight, self.q,
+                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                        grid[0].rho, grid[1].rho,
+                        self.cell_idx, self.prefix_sum)
+                else:
+                    # Generic version for arbitrary number of modes
+                    if self.particle_shape == 'linear':
+                        deposit_kernel = deposit_rho_gpu_linear_one_mode
+                    elif self.particle_shape == 'cubic':
+                        deposit_kernel = deposit_rho_gpu_cubic_one_mode
+                    for m in range(Nm):
+                        deposit_kernel[ dim_grid_2d_flat, dim_block_2d_flat ](
                             self.x, self.y, self.z, weight, self.q,
-                            grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                            grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                            grid[0].rho, grid[1].rho,
+                            grid[m].invdz, grid[m].zmin, grid[m].Nz,
+                            grid[m].invdr, grid[m].rmin, grid[m].Nr,
+                            grid[m].rho, m,
                             self.cell_idx, self.prefix_sum)
-                    else:
-                        for m in range(Nm):
-                            deposit_rho_gpu_cubic_one_mode[
-                                dim_grid_2d_flat, dim_block_2d_flat](
-                                self.x, self.y, self.z, weight, self.q,
-                                grid[m].invdz, grid[m].zmin, grid[m].Nz,
-                                grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                                grid[m].rho, m,
-                                self.cell_idx, self.prefix_sum)
             # J
             elif fieldtype == 'J':
                 # Deposit J in each of four directions
-                if self.particle_shape == 'linear':
-                    if Nm == 2:
-                        deposit_J_gpu_linear[
-                            dim_grid_2d_flat, dim_block_2d_flat](
-                            self.x, self.y, self.z, weight, self.q,
-                            self.ux, self.uy, self.uz, self.inv_gamma,
-                            grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                            grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                            grid[0].Jr, grid[1].Jr,
-                            grid[0].Jt, grid[1].Jt,
-                            grid[0].Jz, grid[1].Jz,
-                            self.cell_idx, self.prefix_sum)
-                    else:
-                        for m in range(Nm):
-                            deposit_J_gpu_linear_one_mode[
-                                dim_grid_2d_flat, dim_block_2d_flat](
-                                self.x, self.y, self.z, weight, self.q,
-                                self.ux, self.uy, self.uz, self.inv_gamma,
-                                grid[m].invdz, grid[m].zmin, grid[m].Nz,
-                                grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                                grid[m].Jr, grid[m].Jt, grid[m].Jz, m,
-                                self.cell_idx, self.prefix_sum)
-                elif self.particle_shape == 'cubic':
-                    if Nm == 2:
-                        deposit_J_gpu_cubic[
-                            dim_grid_2d_flat, dim_block_2d_flat](
+                if Nm == 2:
+                    # Optimized version for 2 modes
+                    if self.particle_shape == 'linear':
+                        deposit_kernel = deposit_J_gpu_linear
+                    elif self.particle_shape == 'cubic':
+                        deposit_kernel = deposit_J_gpu_cubic
+                    deposit_kernel[ dim_grid_2d_flat, dim_block_2d_flat ](
+                        self.x, self.y, self.z, weight, self.q,
+                        self.ux, self.uy, self.uz, self.inv_gamma,
+                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                        grid[0].Jr, grid[1].Jr,
+                        grid[0].Jt, grid[1].Jt,
+                        grid[0].Jz, grid[1].Jz,
+                        self.cell_idx, self.prefix_sum)
+                else:
+                    # Generic version for arbitrary number of modes
+                    if self.particle_shape == 'linear':
+                        deposit_kernel = deposit_J_gpu_linear_one_mode
+                    elif self.particle_shape == 'cubic':
+                        deposit_kernel = deposit_J_gpu_cubic_one_mode
+                    for m in range(Nm):
+                        deposit_kernel[ dim_grid_2d_flat, dim_block_2d_flat ](
                             self.x, self.y, self.z, weight, self.q,
                             self.ux, self.uy, self.uz, self.inv_gamma,
-                            grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                            grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                            grid[0].Jr, grid[1].Jr,
-                            grid[0].Jt, grid[1].Jt,
-                            grid[0].Jz, grid[1].Jz,
+                            grid[m].invdz, grid[m].zmin, grid[m].Nz,
+                            grid[m].invdr, grid[m].rmin, grid[m].Nr,
+                            grid[m].Jr, grid[m].Jt, grid[m].Jz, m,
                             self.cell_idx, self.prefix_sum)
-                    else:
-                        for m in range(Nm):
-                            deposit_J_gpu_cubic_one_mode[
-                                dim_grid_2d_flat, dim_block_2d_flat](
-                                self.x, self.y, self.z, weight, self.q,
-                                self.ux, self.uy, self.uz, self.inv_gamma,
-                                grid[m].invdz, grid[m].zmin, grid[m].Nz,
-                                grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                                grid[m].Jr, grid[m].Jt, grid[m].Jz, m,
-                                self.cell_idx, self.prefix_sum)
+
+        # CPU version, with particles sorted by tiles
+        elif self.cpu_deposition == 'sorted-tiles':
+            shape_order = {'linear': 1, 'cubic': 3}[ self.particle_shape ]
+            if fieldtype == 'rho':
+                deposit_rho_numba_tiled(
+                    self.x, self.y, self.z, weight, self.q,
+                    grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                    grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                    fld.rho_global, fld.Nm, shape_order,
+                    self.tile_prefix_sum, self.tile_size, self.tile_margin )
+            elif fieldtype == 'J':
+                deposit_J_numba_tiled(
+                    self.x, self.y, self.z, weight, self.q,
+                    self.ux, self.uy, self.uz, self.inv_gamma,
+                    grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                    grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                    fld.Jr_global, fld.Jt_global, fld.Jz_global,
+                    fld.Nm, shape_order,
+                    self.tile_prefix_sum, self.tile_size, self.tile_margin )
+
+        # CPU version, with particles sorted by z-chunks
+        elif self.cpu_deposition == 'z-chunks':
+            shape_order = {'linear': 1, 'cubic': 3}[ self.particle_shape ]
+            if fieldtype == 'rho':
+                deposit_rho_numba_zchunks(
+                    self.x, self.y, self.z, weight, self.q,
+                    grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                    grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                    fld.rho_global, fld.Nm, shape_order,
+                    self.tile_prefix_sum, self.tile_iz_bounds,
+                    self.tile_margin )
+            elif fieldtype == 'J':
+                deposit_J_numba_zchunks(
+                    self.x, self.y, self.z, weight, self.q,
+                    self.ux, self.uy, self.uz, self.inv_gamma,
+                    grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                    grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                    fld.Jr_global, fld.Jt_global, fld.Jz_global,
+                    fld.Nm, shape_order,
+                    self.tile_prefix_sum, self.tile_iz_bounds,
+                    self.tile_margin )
 
         # CPU version
         else:
             # Divide particles in chunks (each chunk is handled by a different
             # thread) and register the indices that bound each chunks
-            ptcl_chunk_indices = get_chunk_indices(self.Ntot, nthreads)
-
-            # Multithreading functions for the deposition of rho or J
-            # for Mode 0 and 1 only.
+            # (one chunk per copy of the global deposition arrays)
+            n_chunks = fld.rho_global.shape[0]
+            ptcl_chunk_indices = get_chunk_indices(self.Ntot, n_chunks)
+
+            # The kernel is generated for the number of modes `Nm` (the
+            # loops over the modes and over the shape factors are unrolled)
+            deposit_kernel = get_deposit_kernel(
+                fieldtype, fld.Nm, self.particle_shape, use_cuda=False )
+            args = [ self.x, self.y, self.z, weight, self.q ]
             if fieldtype == 'rho':
-                # Deposit rho using CPU threading
-                if self.particle_shape == 'linear':
-                    deposit_rho_numba_linear(
-                        self.x, self.y, self.z, weight, self.q,
-                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                        fld.rho_global, fld.Nm,
-                        nthreads, ptcl_chunk_indices )
-                elif self.particle_shape == 'cubic':
-                    deposit_rho_numba_cubic(
-                        self.x, self.y, self.z, weight, self.q,
-                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                        fld.rho_global, fld.Nm,
-                        nthreads, ptcl_chunk_indices )
+                fields = [ fld.rho_global ]
+            else:
+                args += [ self.ux, self.uy, self.uz, self.inv_gamma ]
+                fields = [ fld.Jr_global, fld.Jt_global, fld.Jz_global ]
+            args += [ grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                      grid[0].invdr, grid[0].rmin, grid[0].Nr ] + \
+                    fields + [ n_chunks, ptcl_chunk_indices ]
+            deposit_kernel( *args )
 
-            elif fieldtype == 'J':
-                # Deposit J using CPU threading
-                if self.particle_shape == 'linear':
-                    deposit_J_numba_linear(
-                        self.x, self.y, self.z, weight, self.q,
-                        self.ux, self.uy, self.uz, self.inv_gamma,
-                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                        fld.Jr_global, fld.Jt_global, fld.Jz_global, fld.Nm,
-                        nthreads, ptcl_chunk_indices )
-                elif self.particle_shape == 'cubic':
-                    deposit_J_numba_cubic(
-                        self.x, self.y, self.z, weight, self.q,
-                        self.ux, self.uy, self.uz, self.inv_gamma,
-                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
-                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                        fld.Jr_global, fld.Jt_global, fld.Jz_global, fld.Nm,
-                        nthreads, ptcl_chunk_indices )
 
+    def is_sorted_by_tiles( self, fld ):
+        """
+        Return whether the particles are sorted by tiles, i.e. whether
+        each particle is within `tile_margin` cells of its tile
+        (for the sorted deposition on CPU)
+
+        Parameter
+        ----------
+        fld : a Field object
+             Contains the list of InterpolationGrid objects
+        """
+        # Check that the particles were sorted, for the current number
+        # of particles and the current size of the grid
+        if self.tile_prefix_sum is None:
+            return False
+        if self.tile_prefix_sum[-1] != self.Ntot:
+            return False
+        Nz = fld.interp[0].Nz
+        if self.tile_iz_bounds[-1] != Nz+4:
+            return False
+        # Check that the particles did not move too far from their tile
+        # (this also detects particles that were rearranged since sorting)
+        n_outside = count_particles_outside_tiles( self.z,
+            self.tile_prefix_sum, self.tile_iz_bounds,
+            fld.interp[0].invdz, fld.interp[0].zmin, Nz, self.tile_margin )
+        return( n_outside == 0 )
+
+    def sort_particles_cpu( self, fld ):
+        """
+        Sort the particles by cell on CPU (with a counting sort), rearrange
+        the particle arrays accordingly, and register the index of the
+        first particle of each tile (for the sorted deposition on CPU)
+
+        Parameter
+        ----------
+        fld : a Field object
+             Contains the list of InterpolationGrid objects
+        """
+        grid = fld.interp
+        Nz = grid[0].Nz
+        Nr = grid[0].Nr
+        n_cells = (Nz+4)*(Nr+4)
+
+        # Get the cell index of each particle and sort them
+        cell_idx = np.empty( self.Ntot, dtype=np.int64 )
+        get_cell_idx_per_particle_cpu( cell_idx, self.x, self.y, self.z,
+            grid[0].invdz, grid[0].zmin, Nz, grid[0].invdr, grid[0].rmin, Nr )
+        sorted_idx = np.empty( self.Ntot, dtype=np.int64 )
+        cell_prefix_sum = np.empty( n_cells+1, dtype=np.int64 )
+        counting_sort_per_cell( cell_idx, n_cells, sorted_idx, cell_prefix_sum )
+        # Divide the cells in tiles of fixed size, or in chunks
+        # that contain similar numbers of particles (one per thread)
+        if self.cpu_deposition == 'sorted-tiles':
+            self.tile_iz_bounds = get_tile_iz_bounds( Nz, self.tile_size )
+        else:
+            self.tile_iz_bounds = get_balanced_iz_bounds(
+                cell_prefix_sum, Nz, Nr, self.n_zchunks )
+        self.tile_prefix_sum = get_tile_prefix_sum(
+            cell_prefix_sum, self.tile_iz_bounds, Nr )
+
+        # Rearrange the particle arrays in place (through a sorting buffer
+        # for each type), so that they remain views of their storage arrays
+        sorting_buffers = {}
+        for obj, name in self.get_particle_attributes():
+            particle_array = getattr( obj, name )
+            dtype = particle_array.dtype
+            if dtype not in sorting_buffers:
+                sorting_buffers[dtype] = np.empty( self.Ntot, dtype=dtype )
+            sorted_array = sorting_buffers[dtype]
+            write_sorting_buffer_cpu( sorted_idx, particle_array, sorted_array )
+            particle_array[:] = sorted_array
 
     def sort_particles(self, fld):
         """
@@ -0,0 +1,281 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the fused gathering and push methods on the GPU using CUDA
+(see `fused_numba_methods.py` for the corresponding CPU methods).
+"""
+import math
+from numba import cuda, float64, int64
+from scipy.constants import c
+# Import inline functions
+from fbpic.particles.gathering.inline_functions import \
+    add_linear_gather_for_mode, add_cubic_gather_for_mode
+from .inline_functions import push_p_vay
+# Compile the inline functions for GPU
+add_linear_gather_for_mode = cuda.jit( add_linear_gather_for_mode,
+                                        device=True, inline=True )
+add_cubic_gather_for_mode = cuda.jit( add_cubic_gather_for_mode,
+                                        device=True, inline=True )
+push_p_vay = cuda.jit( push_p_vay, device=True, inline=True )
+
+# ------------------------------
+# Fused gathering + push linear
+# ------------------------------
+
+@cuda.jit
+def gather_push_gpu_linear( x, y, z, ux, uy, uz, inv_gamma,
+                    invdz, zmin, Nz, invdr, rmin, Nr,
+                    Er_m0, Et_m0, Ez_m0,
+                    Er_m1, Et_m1, Ez_m1,
+                    Br_m0, Bt_m0, Bz_m0,
+                    Br_m1, Bt_m1, Bz_m1,
+                    q, m, dt, dt_x ):
+    """
+    Gather the fields (E and B) onto the particles with a linear shape
+    (supports only mode 0 and 1), advance the momenta of the particles
+    over `dt` with the Vay pusher, and advance their positions over `dt_x`,
+    using one thread per particle on the GPU.
+
+    See the docstring of `gather_push_numba_linear` for the parameters.
+    """
+    # Set a few constants
+    econst = q*dt/(m*c)
+    bconst = 0.5*q*dt/m
+    chdt = c*dt_x
+
+    # Get the 1D CUDA grid
+    i = cuda.grid(1)
+    # (for threads < number of particles)
+    if i < x.shape[0]:
+        # Preliminary arrays for the cylindrical conversion
+        # --------------------------------------------
+        # Position
+        xj = x[i]
+        yj = y[i]
+        zj = z[i]
+
+        # Cylindrical conversion
+        rj = math.sqrt( xj**2 + yj**2 )
+        if (rj !=0. ) :
+            invr = 1./rj
+            cos = xj*invr  # Cosine
+            sin = yj*invr  # Sine
+        else :
+            cos = 1.
+            sin = 0.
+        exptheta_m0 = 1.
+        exptheta_m1 = cos - 1.j*sin
+
+        # Get linear weights for the gathering
+        # --------------------------------------------
+        # Positions of the particles, in the cell unit
+        r_cell =  invdr*(rj - rmin) - 0.5
+        z_cell =  invdz*(zj - zmin) - 0.5
+        # Original index of the uppper and lower cell
+        ir_lower = int(math.floor( r_cell ))
+        ir_upper = ir_lower + 1
+        iz_lower = int(math.floor( z_cell ))
+        iz_upper = iz_lower + 1
+        # Linear weight
+        Sr_lower = ir_upper - r_cell
+        Sr_upper = r_cell - ir_lower
+        Sz_lower = iz_upper - z_cell
+        Sz_upper = z_cell - iz_lower
+        # Set guard weights to zero
+        Sr_guard = 0.
+
+        # Treat the boundary conditions
+        # --------------------------------------------
+        # guard cells in lower r
+        if ir_lower < 0:
+            Sr_guard = Sr_lower
+            Sr_lower = 0.
+            ir_lower = 0
+        # absorbing in upper r
+        if ir_lower > Nr-1:
+            ir_lower = Nr-1
+        if ir_upper > Nr-1:
+            ir_upper = Nr-1
+        # periodic boundaries in z
+        # lower z boundaries
+        if iz_lower < 0:
+            iz_lower += Nz
+        if iz_upper < 0:
+            iz_upper += Nz
+        # upper z boundaries
+        if iz_lower > Nz-1:
+            iz_lower -= Nz
+        if iz_upper > Nz-1:
+            iz_upper -= Nz
+
+        # Precalculate Shapes
+        S_ll = Sz_lower*Sr_lower
+        S_lu = Sz_lower*Sr_upper
+        S_ul = Sz_upper*Sr_lower
+        S_uu = Sz_upper*Sr_upper
+        S_lg = Sz_lower*Sr_guard
+        S_ug = Sz_upper*Sr_guard
+
+        # E-Field
+        # -------
+        Fr = 0.
+        Ft = 0.
+        Fz = 0.
+        # Add contribution from mode 0 and 1
+        Fr, Ft, Fz = add_linear_gather_for_mode( 0,
+            Fr, Ft, Fz, exptheta_m0, Er_m0, Et_m0, Ez_m0,
+            iz_lower, iz_upper, ir_lower, ir_upper,
+            S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+        Fr, Ft, Fz = add_linear_gather_for_mode( 1,
+            Fr, Ft, Fz, exptheta_m1, Er_m1, Et_m1, Ez_m1,
+            iz_lower, iz_upper, ir_lower, ir_upper,
+            S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+        # Convert to Cartesian coordinates
+        Exj = cos*Fr - sin*Ft
+        Eyj = sin*Fr + cos*Ft
+        Ezj = Fz
+
+        # B-Field
+        # -------
+        Fr = 0.
+        Ft = 0.
+        Fz = 0.
+        # Add contribution from mode 0 and 1
+        Fr, Ft, Fz = add_linear_gather_for_mode( 0,
+            Fr, Ft, Fz, exptheta_m0, Br_m0, Bt_m0, Bz_m0,
+            iz_lower, iz_upper, ir_lower, ir_upper,
+            S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+        Fr, Ft, Fz = add_linear_gather_for_mode( 1,
+            Fr, Ft, Fz, exptheta_m1, Br_m1, Bt_m1, Bz_m1,
+            iz_lower, iz_upper, ir_lower, ir_upper,
+            S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+        # Convert to Cartesian coordinates
+        Bxj = cos*Fr - sin*Ft
+        Byj = sin*Fr + cos*Ft
+        Bzj = Fz
+
+        # Push the momentum and then the position
+        # ---------------------------------------
+        ux[i], uy[i], uz[i], inv_gamma[i] = push_p_vay(
+            ux[i], uy[i], uz[i], inv_gamma[i],
+            Exj, Eyj, Ezj, Bxj, Byj, Bzj, econst, bconst )
+        inv_g = inv_gamma[i]
+        x[i] += chdt*inv_g*ux[i]
+        y[i] += chdt*inv_g*uy[i]
+        z[i] += chdt*inv_g*uz[i]
+
+# ------------------------------
+# Fused gathering + push cubic
+# ------------------------------
+
+@cuda.jit
+def gather_push_gpu_cubic( x, y, z, ux, uy, uz, inv_gamma,
+                    invdz, zmin, Nz, invdr, rmin, Nr,
+                    Er_m0, Et_m0, Ez_m0,
+                    Er_m1, Et_m1, Ez_m1,
+                    Br_m0, Bt_m0, Bz_m0,
+                    Br_m1, Bt_m1, Bz_m1,
+                    q, m, dt, dt_x ):
+    """
+    Gather the fields (E and B) onto the particles with a cubic shape
+    (supports only mode 0 and 1), advance the momenta of the particles
+    over `dt` with the Vay pusher, and advance their positions over `dt_x`,
+    using one thread per particle on the GPU.
+
+    See the docstring of `gather_push_numba_linear` for the parameters.
+    """
+    # Set a few constants
+    econst = q*dt/(m*c)
+    bconst = 0.5*q*dt/m
+    chdt = c*dt_x
+
+    # Get the 1D CUDA grid
+    i = cuda.grid(1)
+    # (for threads < number of particles)
+    if i < x.shape[0]:
+        # Preliminary arrays for the cylindrical conversion
+        # --------------------------------------------
+        # Position
+        xj = x[i]
+        yj = y[i]
+        zj = z[i]
+
+        # Cylindrical conversion
+        rj = math.sqrt(xj**2 + yj**2)
+        if (rj != 0.):
+            invr = 1./rj
+            cos = xj*invr  # Cosine
+            sin = yj*invr  # Sine
+        else:
+            cos = 1.
+            sin = 0.
+        exptheta_m0 = 1.
+        exptheta_m1 = cos - 1.j*sin
+
+        # Get weights for the gathering
+        # --------------------------------------------
+        # Positions of the particle, in the cell unit
+        r_cell = invdr*(rj - rmin) - 0.5
+        z_cell = invdz*(zj - zmin) - 0.5
+
+        # Calculate the shape factors
+        Sr = cuda.local.array((4,), dtype=float64)
+        ir_lowest = int64(math.floor(r_cell)) - 1
+        r_local = r_cell-ir_lowest
+        Sr[0] = -1./6. * (r_local-2.)**3
+        Sr[1] = 1./6. * (3.*(r_local-1.)**3 - 6.*(r_local-1.)**2 + 4.)
+        Sr[2] = 1./6. * (3.*(2.-r_local)**3 - 6.*(2.-r_local)**2 + 4.)
+        Sr[3] = -1./6. * (1.-r_local)**3
+        Sz = cuda.local.array((4,), dtype=float64)
+        iz_lowest = int64(math.floor(z_cell)) - 1
+        z_local = z_cell-iz_lowest
+        Sz[0] = -1./6. * (z_local-2.)**3
+        Sz[1] = 1./6. * (3.*(z_local-1.)**3 - 6.*(z_local-1.)**2 + 4.)
+        Sz[2] = 1./6. * (3.*(2.-z_local)**3 - 6.*(2.-z_local)**2 + 4.)
+        Sz[3] = -1./6. * (1.-z_local)**3
+
+        # E-Field
+        # -------
+        Fr = 0.
+        Ft = 0.
+        Fz = 0.
+        # Add contribution from mode 0 and 1
+        Fr, Ft, Fz = add_cubic_gather_for_mode( 0,
+            Fr, Ft, Fz, exptheta_m0, Er_m0, Et_m0, Ez_m0,
+            ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+        Fr, Ft, Fz = add_cubic_gather_for_mode( 1,
+            Fr, Ft, Fz, exptheta_m1, Er_m1, Et_m1, Ez_m1,
+            ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+        # Convert to Cartesian coordinates
+        Exj = cos*Fr - sin*Ft
+        Eyj = sin*Fr + cos*Ft
+        Ezj = Fz
+
+        # B-Field
+        # -------
+        Fr = 0.
+        Ft = 0.
+        Fz = 0.
+        # Add contribution from mode 0 and 1
+        Fr, Ft, Fz =  add_cubic_gather_for_mode( 0,
+            Fr, Ft, Fz, exptheta_m0, Br_m0, Bt_m0, Bz_m0,
+            ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+        Fr, Ft, Fz =  add_cubic_gather_for_mode( 1,
+            Fr, Ft, Fz, exptheta_m1, Br_m1, Bt_m1, Bz_m1,
+            ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+        # Convert to Cartesian coordinates
+        Bxj = cos*Fr - sin*Ft
+        Byj = sin*Fr + cos*Ft
+        Bzj = Fz
+
+        # Push the momentum and then the position
+        # ---------------------------------------
+        ux[i], uy[i], uz[i], inv_gamma[i] = push_p_vay(
+            ux[i], uy[i], uz[i], inv_gamma[i],
+            Exj, Eyj, Ezj, Bxj, Byj, Bzj, econst, bconst )
+        inv_g = inv_gamma[i]
+        x[i] += chdt*inv_g*ux[i]
+        y[i] += chdt*inv_g*uy[i]
+        z[i] += chdt*inv_g*uz[i]
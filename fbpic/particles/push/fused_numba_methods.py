@@ -0,0 +1,361 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the fused gathering and push methods on the CPU with numba:
+the fields are gathered onto each particle and kept in registers, the
+momentum of the particle is advanced with the Vay pusher, and its position
+is advanced over half a timestep, in a single loop over the particles.
+(The fields on the particles are thus not stored in memory.)
+"""
+import math
+import numba
+import numpy as np
+from numba import int64
+from scipy.constants import c
+from fbpic.utils.threading import njit_parallel, prange
+# Import inline functions
+from fbpic.particles.gathering.inline_functions import \
+    add_linear_gather_for_mode, add_cubic_gather_for_mode
+from .inline_functions import push_p_vay
+# Compile the inline functions for CPU
+add_linear_gather_for_mode = numba.njit( add_linear_gather_for_mode )
+add_cubic_gather_for_mode = numba.njit( add_cubic_gather_for_mode )
+push_p_vay = numba.njit( push_p_vay )
+
+# ------------------------------
+# Fused gathering + push linear
+# ------------------------------
+
+@njit_parallel
+def gather_push_numba_linear( x, y, z, ux, uy, uz, inv_gamma,
+                    invdz, zmin, Nz, invdr, rmin, Nr,
+                    Er_m0, Et_m0, Ez_m0,
+                    Er_m1, Et_m1, Ez_m1,
+                    Br_m0, Bt_m0, Bz_m0,
+                    Br_m1, Bt_m1, Bz_m1,
+                    q, m, dt, dt_x, dead, nthreads, ptcl_chunk_indices ):
+    """
+    Gather the fields (E and B) onto the particles with a linear shape
+    (supports only mode 0 and 1), advance the momenta of the particles
+    over `dt` with the Vay pusher, and advance their positions over `dt_x`,
+    using numba with multi-threading.
+
+    Parameters
+    ----------
+    x, y, z : 1darray of floats (in meters)
+        The position of the particles
+        (is modified by this function)
+
+    ux, uy, uz, inv_gamma : 1darray of floats
+        The momenta and inverse Lorentz factor of the particles
+        (is modified by this function)
+
+    invdz, invdr : float (in meters^-1)
+        Inverse of the grid step along the considered direction
+
+    zmin, rmin : float (in meters)
+        Position of the edge of the simulation box along the
+        direction considered
+
+    Nz, Nr : int
+        Number of gridpoints along the considered direction
+
+    Er_m0, Et_m0, Ez_m0, Er_m1, Et_m1, Ez_m1 : 2darray of complexs
+        The electric fields on the interpolation grid for the mode 0 and 1
+
+    Br_m0, Bt_m0, Bz_m0, Br_m1, Bt_m1, Bz_m1 : 2darray of complexs
+        The magnetic fields on the interpolation grid for the mode 0 and 1
+
+    q, m : floats
+        The charge and mass of the particle species
+
+    dt, dt_x : floats (in seconds)
+        The timesteps of the momentum push and of the position push
+
+    dead : 1darray of bools
+        Whether each particle is dead (with `particle_removal='mask'`),
+        in which case it is skipped (empty array if no particle is dead)
+
+    nthreads : int
+        Number of CPU threads used with numba prange
+
+    ptcl_chunk_indices : array of int, of size nthreads+1
+        The indices (of the particle array) between which each thread
+        should loop. (i.e. divisions of particle array between threads)
+    """
+    # Set a few constants
+    econst = q*dt/(m*c)
+    bconst = 0.5*q*dt/m
+    chdt = c*dt_x
+
+    # Whether to skip the dead particles (with `particle_removal='mask'`)
+    skip_dead = ( dead.shape[0] != 0 )
+
+    # Gather the fields and push each particle in parallel
+    for nt in prange( nthreads ):
+        # Loop over all particles in thread chunk
+        for i in range( ptcl_chunk_indices[nt],
+                        ptcl_chunk_indices[nt+1] ):
+            if skip_dead and dead[i]:
+                continue
+            # Preliminary arrays for the cylindrical conversion
+            # --------------------------------------------
+            # Position
+            xj = x[i]
+            yj = y[i]
+            zj = z[i]
+
+            # Cylindrical conversion
+            rj = math.sqrt( xj**2 + yj**2 )
+            if (rj !=0. ) :
+                invr = 1./rj
+                cos = xj*invr  # Cosine
+                sin = yj*invr  # Sine
+            else :
+                cos = 1.
+                sin = 0.
+            exptheta_m0 = 1.
+            exptheta_m1 = cos - 1.j*sin
+
+            # Get linear weights for the gathering
+            # ------------------------------------
+            # Positions of the particles, in the cell unit
+            r_cell =  invdr*(rj - rmin) - 0.5
+            z_cell =  invdz*(zj - zmin) - 0.5
+            # Original index of the uppper and lower cell
+            ir_lower = int(math.floor( r_cell ))
+            ir_upper = ir_lower + 1
+            iz_lower = int(math.floor( z_cell ))
+            iz_upper = iz_lower + 1
+            # Linear weight
+            Sr_lower = ir_upper - r_cell
+            Sr_upper = r_cell - ir_lower
+            Sz_lower = iz_upper - z_cell
+            Sz_upper = z_cell - iz_lower
+            # Set guard weights to zero
+            Sr_guard = 0.
+
+            # Treat the boundary conditions
+            # -----------------------------
+            # guard cells in lower r
+            if ir_lower < 0:
+                Sr_guard = Sr_lower
+                Sr_lower = 0.
+                ir_lower = 0
+            # absorbing in upper r
+            if ir_lower > Nr-1:
+                ir_lower = Nr-1
+            if ir_upper > Nr-1:
+                ir_upper = Nr-1
+            # periodic boundaries in z
+            # lower z boundaries
+            if iz_lower < 0:
+                iz_lower += Nz
+            if iz_upper < 0:
+                iz_upper += Nz
+            # upper z boundaries
+            if iz_lower > Nz-1:
+                iz_lower -= Nz
+            if iz_upper > Nz-1:
+                iz_upper -= Nz
+
+            # Precalculate Shapes
+            S_ll = Sz_lower*Sr_lower
+            S_lu = Sz_lower*Sr_upper
+            S_ul = Sz_upper*Sr_lower
+            S_uu = Sz_upper*Sr_upper
+            S_lg = Sz_lower*Sr_guard
+            S_ug = Sz_upper*Sr_guard
+
+            # E-Field
+            # -------
+            Fr = 0.
+            Ft = 0.
+            Fz = 0.
+            # Add contribution from mode 0 and 1
+            Fr, Ft, Fz = add_linear_gather_for_mode( 0,
+                Fr, Ft, Fz, exptheta_m0, Er_m0, Et_m0, Ez_m0,
+                iz_lower, iz_upper, ir_lower, ir_upper,
+                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+            Fr, Ft, Fz = add_linear_gather_for_mode( 1,
+                Fr, Ft, Fz, exptheta_m1, Er_m1, Et_m1, Ez_m1,
+                iz_lower, iz_upper, ir_lower, ir_upper,
+                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+            # Convert to Cartesian coordinates
+            Exj = cos*Fr - sin*Ft
+            Eyj = sin*Fr + cos*Ft
+            Ezj = Fz
+
+            # B-Field
+            # -------
+            Fr = 0.
+            Ft = 0.
+            Fz = 0.
+            # Add contribution from mode 0 and 1
+            Fr, Ft, Fz = add_linear_gather_for_mode( 0,
+                Fr, Ft, Fz, exptheta_m0, Br_m0, Bt_m0, Bz_m0,
+                iz_lower, iz_upper, ir_lower, ir_upper,
+                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+            Fr, Ft, Fz = add_linear_gather_for_mode( 1,
+                Fr, Ft, Fz, exptheta_m1, Br_m1, Bt_m1, Bz_m1,
+                iz_lower, iz_upper, ir_lower, ir_upper,
+                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+            # Convert to Cartesian coordinates
+            Bxj = cos*Fr - sin*Ft
+            Byj = sin*Fr + cos*Ft
+            Bzj = Fz
+
+            # Push the momentum and then the position
+            # ---------------------------------------
+            ux[i], uy[i], uz[i], inv_gamma[i] = push_p_vay(
+                ux[i], uy[i], uz[i], inv_gamma[i],
+                Exj, Eyj, Ezj, Bxj, Byj, Bzj, econst, bconst )
+            x[i] += chdt * inv_gamma[i] * ux[i]
+            y[i] += chdt * inv_gamma[i] * uy[i]
+            z[i] += chdt * inv_gamma[i] * uz[i]
+
+    return x, y, z, ux, uy, uz, inv_gamma
+
+# ------------------------------
+# Fused gathering + push cubic
+# ------------------------------
+
+@njit_parallel
+def gather_push_numba_cubic( x, y, z, ux, uy, uz, inv_gamma,
+                    invdz, zmin, Nz, invdr, rmin, Nr,
+                    Er_m0, Et_m0, Ez_m0,
+                    Er_m1, Et_m1, Ez_m1,
+                    Br_m0, Bt_m0, Bz_m0,
+                    Br_m1, Bt_m1, Bz_m1,
+                    q, m, dt, dt_x, dead, nthreads, ptcl_chunk_indices ):
+    """
+    Gather the fields (E and B) onto the particles with a cubic shape
+    (supports only mode 0 and 1), advance the momenta of the particles
+    over `dt` with the Vay pusher, and advance their positions over `dt_x`,
+    using numba with multi-threading.
+
+    Parameters
+    ----------
+    x, y, z, ux, uy, uz, inv_gamma, invdz, zmin, Nz, invdr, rmin, Nr,
+    Er_m0, Et_m0, Ez_m0, Er_m1, Et_m1, Ez_m1,
+    Br_m0, Bt_m0, Bz_m0, Br_m1, Bt_m1, Bz_m1, q, m, dt, dt_x :
+        See the docstring of `gather_push_numba_linear`
+
+    dead : 1darray of bools
+        Whether each particle is dead (with `particle_removal='mask'`),
+        in which case it is skipped (empty array if no particle is dead)
+
+    nthreads : int
+        Number of CPU threads used with numba prange
+
+    ptcl_chunk_indices : array of int, of size nthreads+1
+        The indices (of the particle array) between which each thread
+        should loop. (i.e. divisions of particle array between threads)
+    """
+    # Set a few constants
+    econst = q*dt/(m*c)
+    bconst = 0.5*q*dt/m
+    chdt = c*dt_x
+
+    # Whether to skip the dead particles (with `particle_removal='mask'`)
+    skip_dead = ( dead.shape[0] != 0 )
+
+    # Gather the fields and push the particles in parallel
+    for nt in prange( nthreads ):
+
+        # Create private arrays for each thread
+        # to store the particle index and shape
+        Sr = np.empty( 4 )
+        Sz = np.empty( 4 )
+
+        # Loop over all particles in thread chunk
+        for i in range( ptcl_chunk_indices[nt],
+                            ptcl_chunk_indices[nt+1] ):
+            if skip_dead and dead[i]:
+                continue
+
+            # Preliminary arrays for the cylindrical conversion
+            # --------------------------------------------
+            # Position
+            xj = x[i]
+            yj = y[i]
+            zj = z[i]
+
+            # Cylindrical conversion
+            rj = math.sqrt(xj**2 + yj**2)
+            if (rj != 0.):
+                invr = 1./rj
+                cos = xj*invr  # Cosine
+                sin = yj*invr  # Sine
+            else:
+                cos = 1.
+                sin = 0.
+            exptheta_m0 = 1.
+            exptheta_m1 = cos - 1.j*sin
+
+            # Get weights for the gathering
+            # --------------------------------------------
+            # Positions of the particle, in the cell unit
+            r_cell = invdr*(rj - rmin) - 0.5
+            z_cell = invdz*(zj - zmin) - 0.5
+
+            # Calculate the shape factors
+            ir_lowest = int64(math.floor(r_cell)) - 1
+            r_local = r_cell-ir_lowest
+            Sr[0] = -1./6. * (r_local-2.)**3
+            Sr[1] = 1./6. * (3.*(r_local-1.)**3 - 6.*(r_local-1.)**2 + 4.)
+            Sr[2] = 1./6. * (3.*(2.-r_local)**3 - 6.*(2.-r_local)**2 + 4.)
+            Sr[3] = -1./6. * (1.-r_local)**3
+            iz_lowest = int64(math.floor(z_cell)) - 1
+            z_local = z_cell-iz_lowest
+            Sz[0] = -1./6. * (z_local-2.)**3
+            Sz[1] = 1./6. * (3.*(z_local-1.)**3 - 6.*(z_local-1.)**2 + 4.)
+            Sz[2] = 1./6. * (3.*(2.-z_local)**3 - 6.*(2.-z_local)**2 + 4.)
+            Sz[3] = -1./6. * (1.-z_local)**3
+
+            # E-Field
+            # -------
+            Fr = 0.
+            Ft = 0.
+            Fz = 0.
+            # Add contribution from mode 0 and 1
+            Fr, Ft, Fz = add_cubic_gather_for_mode( 0,
+                Fr, Ft, Fz, exptheta_m0, Er_m0, Et_m0, Ez_m0,
+                ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+            Fr, Ft, Fz = add_cubic_gather_for_mode( 1,
+                Fr, Ft, Fz, exptheta_m1, Er_m1, Et_m1, Ez_m1,
+                ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+            # Convert to Cartesian coordinates
+            Exj = cos*Fr - sin*Ft
+            Eyj = sin*Fr + cos*Ft
+            Ezj = Fz
+
+            # B-Field
+            # -------
+            Fr = 0.
+            Ft = 0.
+            Fz = 0.
+            # Add contribution from mode 0 and 1
+            Fr, Ft, Fz =  add_cubic_gather_for_mode( 0,
+                Fr, Ft, Fz, exptheta_m0, Br_m0, Bt_m0, Bz_m0,
+                ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+            Fr, Ft, Fz =  add_cubic_gather_for_mode( 1,
+                Fr, Ft, Fz, exptheta_m1, Br_m1, Bt_m1, Bz_m1,
+                ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+            # Convert to Cartesian coordinates
+            Bxj = cos*Fr - sin*Ft
+            Byj = sin*Fr + cos*Ft
+            Bzj = Fz
+
+            # Push the momentum and then the position
+            # ---------------------------------------
+            ux[i], uy[i], uz[i], inv_gamma[i] = push_p_vay(
+                ux[i], uy[i], uz[i], inv_gamma[i],
+                Exj, Eyj, Ezj, Bxj, Byj, Bzj, econst, bconst )
+            x[i] += chdt * inv_gamma[i] * ux[i]
+            y[i] += chdt * inv_gamma[i] * uy[i]
+            z[i] += chdt * inv_gamma[i] * uz[i]
+
+    return x, y, z, ux, uy, uz, inv_gamma
@@ -120,15 +120,15 @@ class ParticleTracker(object):
             local_id_max = pid.max()
         else:
             local_id_max = 0
-        if comm.mpi_comm is None:
+        if comm.world_comm is None:
             global_id_max = local_id_max
         else:
-            local_id_max_list = comm.mpi_comm.allgather( local_id_max )
+            local_id_max_list = comm.world_comm.allgather( local_id_max )
             global_id_max = max( local_id_max_list )
         # Find the next_attibuted_id: has to be of the form
-        # comm.rank + n*self.id_step
-        n = int( (global_id_max - comm.rank)/self.id_step ) + 1
-        self.next_attibuted_id = comm.rank + n*self.id_step
+        # comm.world_rank + n*self.id_step
+        n = int( (global_id_max - comm.world_rank)/self.id_step ) + 1
+        self.next_attibuted_id = comm.world_rank + n*self.id_step
 
 if cuda_installed:
 
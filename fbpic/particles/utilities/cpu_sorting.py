@@ -0,0 +1,220 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the particle sorting methods on the CPU, which are used
+by the sorted deposition methods (`cpu_deposition='sorted-tiles'` or
+`cpu_deposition='z-chunks'`).
+
+The particles are sorted by cell with a counting sort. The cells are
+grouped in tiles of contiguous cells along z (with all the cells along r):
+`tile_iz_bounds` records the index in z of the first cell of each tile
+and `tile_prefix_sum` records the index of the first particle of each tile.
+(With 'sorted-tiles', the tiles have a fixed size; with 'z-chunks', there
+is one tile per thread and the tiles contain similar numbers of particles.)
+Since the particles move by less than a cell per iteration, they do not
+need to be sorted at each iteration: they only need to be sorted again
+once one of them has moved by more than `tile_margin` cells outside of
+its tile (see `count_particles_outside_tiles`).
+"""
+import math
+import numpy as np
+import numba
+from fbpic.utils.threading import njit_parallel, prange
+
+# -----------------------------------------------------
+# Sorting utilities - cell index / counting sort
+# -----------------------------------------------------
+
+@njit_parallel
+def get_cell_idx_per_particle_cpu( cell_idx, x, y, z,
+                                   invdz, zmin, Nz, invdr, rmin, Nr ):
+    """
+    Get the cell index of each particle.
+
+    The cell index is 1d and calculated by:
+    (index in z) * (Nr+4) + (index in r), where the indices in z and r are
+    those of the deposition arrays `rho_global`, `Jr_global`, etc. (i.e.
+    including 2 deposition guard cells on each side, in z and r)
+
+    Parameters
+    ----------
+    cell_idx : 1darray of integers
+        The cell index of the particle (modified by this function)
+
+    x, y, z : 1darray of floats (in meters)
+        The position of the particles
+
+    invdz, invdr : float (in meters^-1)
+        Inverse of the grid step along the considered direction
+
+    zmin, rmin : float (in meters)
+        Position of the edge of the simulation box, in each direction
+
+    Nz, Nr : int
+        Number of gridpoints along the considered direction
+    """
+    for i in prange( cell_idx.shape[0] ):
+        iz = get_iz_global( z[i], invdz, zmin, Nz )
+        # Radial index
+        rj = math.sqrt( x[i]**2 + y[i]**2 )
+        r_cell = invdr*(rj - rmin) - 0.5
+        ir = min( max( int(math.floor(r_cell)) + 2, 0 ), Nr+3 )
+        cell_idx[i] = iz*(Nr+4) + ir
+
+@numba.njit
+def get_iz_global( zj, invdz, zmin, Nz ):
+    """
+    Return the index in z of the cell of a particle, in the deposition
+    arrays (i.e. including the 2 deposition guard cells)
+    """
+    z_cell = invdz*(zj - zmin) - 0.5
+    return( min( max( int(math.floor(z_cell)) + 2, 0 ), Nz+3 ) )
+
+@numba.njit
+def counting_sort_per_cell( cell_idx, n_cells, sorted_idx, cell_prefix_sum ):
+    """
+    Sort the particles by cell index, with a counting sort.
+
+    Parameters
+    ----------
+    cell_idx : 1darray of integers
+        The cell index of each particle
+
+    n_cells : int
+        The total number of cells
+
+    sorted_idx : 1darray of integers
+        The index (in the unsorted arrays) of the particle that is at
+        each position of the sorted arrays (modified by this function)
+
+    cell_prefix_sum : 1darray of integers, of size n_cells+1
+        The index of the first particle of each cell, in the sorted arrays
+        (modified by this function)
+    """
+    # Count the number of particles per cell
+    cell_prefix_sum[:] = 0
+    for i in range( cell_idx.shape[0] ):
+        cell_prefix_sum[ cell_idx[i]+1 ] += 1
+    # Exclusive prefix sum
+    for i_cell in range( n_cells ):
+        cell_prefix_sum[i_cell+1] += cell_prefix_sum[i_cell]
+    # Place the particles (using the prefix sum as a running offset,
+    # which is restored afterwards)
+    for i in range( cell_idx.shape[0] ):
+        i_cell = cell_idx[i]
+        sorted_idx[ cell_prefix_sum[i_cell] ] = i
+        cell_prefix_sum[i_cell] += 1
+    for i_cell in range( n_cells, 0, -1 ):
+        cell_prefix_sum[i_cell] = cell_prefix_sum[i_cell-1]
+    cell_prefix_sum[0] = 0
+
+@njit_parallel
+def write_sorting_buffer_cpu( sorted_idx, val, buf ):
+    """
+    Rearrange the particle array `val` into the array `buf`,
+    following the sorted index array
+    """
+    for i in prange( sorted_idx.shape[0] ):
+        buf[i] = val[ sorted_idx[i] ]
+
+# -----------------------------------------------------
+# Tiles
+# -----------------------------------------------------
+
+@njit_parallel
+def count_particles_outside_tiles( z, tile_prefix_sum, tile_iz_bounds,
+                                   invdz, zmin, Nz, tile_margin ):
+    """
+    Return the number of particles that are further than `tile_margin`
+    cells from the tile in which they were sorted.
+
+    Parameters
+    ----------
+    z : 1darray of floats (in meters)
+        The longitudinal position of the particles
+
+    tile_prefix_sum : 1darray of integers, of size n_tiles+1
+        The index of the first particle of each tile
+
+    tile_iz_bounds : 1darray of integers, of size n_tiles+1
+        The index in z of the first cell of each tile
+        (in the deposition arrays, i.e. including the guard cells)
+
+    invdz : float (in meters^-1)
+        Inverse of the grid step along z
+
+    zmin : float (in meters)
+        Position of the left edge of the simulation box
+
+    Nz : int
+        Number of gridpoints along z
+
+    tile_margin : int
+        Maximal number of cells by which the particles may exit their tile
+    """
+    n_tiles = tile_prefix_sum.shape[0] - 1
+    n_outside = 0
+    for i_tile in prange( n_tiles ):
+        iz_min = tile_iz_bounds[i_tile] - tile_margin
+        iz_max = tile_iz_bounds[i_tile+1] + tile_margin
+        for i in range( tile_prefix_sum[i_tile], tile_prefix_sum[i_tile+1] ):
+            iz = get_iz_global( z[i], invdz, zmin, Nz )
+            if (iz < iz_min) or (iz >= iz_max):
+                n_outside += 1
+    return( n_outside )
+
+def get_tile_iz_bounds( Nz, tile_size ):
+    """
+    Return the index in z of the first cell of each tile (and the total
+    number of cells along z, as last element), for tiles of `tile_size`
+    cells that cover the deposition arrays (of Nz+4 cells along z)
+    """
+    n_tiles = -( -(Nz+4) // tile_size )
+    return( np.minimum( np.arange(n_tiles+1)*tile_size, Nz+4 ) )
+
+def get_balanced_iz_bounds( cell_prefix_sum, Nz, Nr, n_chunks ):
+    """
+    Return the index in z of the first cell of each of the `n_chunks`
+    contiguous chunks of the deposition arrays (and the total number of
+    cells along z, as last element), such that the chunks contain
+    approximately the same number of particles
+
+    Parameters
+    ----------
+    cell_prefix_sum : 1darray of integers, of size (Nz+4)*(Nr+4)+1
+        The index of the first particle of each cell
+
+    Nz, Nr : int
+        Number of gridpoints along z and r
+
+    n_chunks : int
+        Number of chunks
+    """
+    # Index of the first particle of each row of cells (along z)
+    row_prefix_sum = cell_prefix_sum[ ::(Nr+4) ]
+    N = row_prefix_sum[-1]
+    targets = ( np.arange(n_chunks+1)*N ) // n_chunks
+    iz_bounds = np.searchsorted( row_prefix_sum, targets, side='left' )
+    iz_bounds[0] = 0
+    iz_bounds[-1] = Nz+4
+    return( np.minimum( iz_bounds, Nz+4 ) )
+
+def get_tile_prefix_sum( cell_prefix_sum, tile_iz_bounds, Nr ):
+    """
+    Return the index of the first particle of each tile, from the index
+    of the first particle of each cell
+
+    Parameters
+    ----------
+    cell_prefix_sum : 1darray of integers, of size (Nz+4)*(Nr+4)+1
+        The index of the first particle of each cell
+
+    tile_iz_bounds : 1darray of integers
+        The index in z of the first cell of each tile
+
+    Nr : int
+        Number of gridpoints along r
+    """
+    return( cell_prefix_sum[ tile_iz_bounds*(Nr+4) ] )
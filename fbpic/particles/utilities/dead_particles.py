@@ -0,0 +1,76 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the numba methods that handle the dead particles on CPU, when
+the removed particles are only masked (`particle_removal='mask'`):
+- The dead particles are kept in the particle arrays, with a zero weight
+  and a zero momentum, and at a position that is inside the local grid
+  (see `park_dead_particles`), so that they do not contribute to the
+  deposition.
+- They are skipped by the field gathering and the push (which receive
+  the array `dead`), so that they keep a zero momentum and do not move.
+- They are removed in bulk (by compacting the particle arrays) once they
+  represent a large enough fraction of the particles.
+"""
+import numba
+
+@numba.njit
+def mark_dead_particles( indices, dead, x, y, ux, uy, uz, inv_gamma, w,
+                         w_times_level ):
+    """
+    Mark the particles `indices` as dead: set their weight and momenta
+    to 0, and move them to the axis (the position along z is set
+    separately, see `park_dead_particles`)
+
+    Parameters
+    ----------
+    indices: 1darray of ints
+        The indices of the particles that are removed
+
+    dead: 1darray of bools
+        Whether each particle is dead (modified in place)
+
+    x, y, ux, uy, uz, inv_gamma, w: 1darrays of floats
+        The particle quantities (modified in place)
+
+    w_times_level: 1darray of floats
+        The effective weight of ionizable particles
+        (empty array if the species is not ionizable)
+    """
+    for k in range( indices.shape[0] ):
+        i = indices[k]
+        dead[i] = True
+        x[i] = 0.
+        y[i] = 0.
+        ux[i] = 0.
+        uy[i] = 0.
+        uz[i] = 0.
+        inv_gamma[i] = 1.
+        w[i] = 0.
+        if w_times_level.shape[0] != 0:
+            w_times_level[i] = 0.
+
+@numba.njit
+def park_dead_particles( z, dead, zbox_min, zbox_max, z_park ):
+    """
+    Move the dead particles that are below `zbox_min` or above `zbox_max`
+    (e.g. because the moving window moved the box) to `z_park`
+    """
+    for i in range( z.shape[0] ):
+        if dead[i] and ( z[i] < zbox_min or z[i] > zbox_max ):
+            z[i] = z_park
+
+@numba.njit
+def compact_particle_array( particle_array, dead ):
+    """
+    Move the particles that are not dead to the beginning of
+    `particle_array` (in the same order), and return their number
+    """
+    n_alive = 0
+    for i in range( dead.shape[0] ):
+        if not dead[i]:
+            particle_array[n_alive] = particle_array[i]
+            n_alive += 1
+    return( n_alive )
@@ -0,0 +1,80 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the correspondance between the `precision` argument of the
+Simulation and the data types of the field and particle arrays.
+"""
+import numpy as np
+
+# Data types used for each category of array, for each precision mode:
+# - 'interp_field': E and B on the interpolation grid
+# - 'interp_source': rho and J on the interpolation grid
+#   (and the corresponding threading buffers for the deposition)
+# - 'spectral': complex fields on the spectral grid, and transform buffers
+# - 'spectral_real': real spectral data (DHT matrices, PSATD coefficients)
+# - 'particle': momenta, weights and gathered fields of the macroparticles
+# - 'position': positions of the macroparticles
+precision_dtypes = {
+    'double': { 'interp_field': np.complex128,
+                'interp_source': np.complex128,
+                'spectral': np.complex128,
+                'spectral_real': np.float64,
+                'particle': np.float64,
+                'position': np.float64 },
+    'single': { 'interp_field': np.complex64,
+                'interp_source': np.complex64,
+                'spectral': np.complex64,
+                'spectral_real': np.float32,
+                'particle': np.float32,
+                'position': np.float32 },
+    # In mixed precision, the quantities that are accumulated over
+    # many particles or many timesteps (deposited sources, spectral
+    # fields, positions) are kept in double precision
+    'mixed': {  'interp_field': np.complex64,
+                'interp_source': np.complex128,
+                'spectral': np.complex128,
+                'spectral_real': np.float64,
+                'particle': np.float32,
+                'position': np.float64 } }
+
+def get_dtypes( precision ):
+    """
+    Return the data types that correspond to the precision mode `precision`
+
+    Parameters
+    ----------
+    precision: string
+        Either 'double', 'single' or 'mixed'
+
+    Returns
+    -------
+    A dictionary whose keys are 'interp_field', 'interp_source', 'spectral',
+    'spectral_real', 'particle' and 'position', and whose values are
+    numpy data types
+    """
+    if precision not in precision_dtypes:
+        raise ValueError("Unknown precision: %s\n`precision` should be "
+            "either 'double', 'single' or 'mixed'." %precision )
+    return( precision_dtypes[precision] )
+
+def real_dtype( dtype ):
+    """
+    Return the real data type that has the same precision
+    as the complex data type `dtype`
+    """
+    if np.dtype(dtype) == np.complex64:
+        return( np.float32 )
+    else:
+        return( np.float64 )
+
+def complex_dtype( dtype ):
+    """
+    Return the complex data type that has the same precision
+    as the real data type `dtype`
+    """
+    if np.dtype(dtype) == np.float32:
+        return( np.complex64 )
+    else:
+        return( np.complex128 )
@@ -164,8 +164,8 @@ def print_simulation_setup( sim, verbose_level=1 ):
                 message += "\nRunning on GPU "
             else:
                 message += "\nRunning on CPU "
-            if sim.comm.size > 1:
-                message += "with %d MPI processes " %sim.comm.size
+            if sim.comm.world_size > 1:
+                message += "with %d MPI processes " %sim.comm.world_size
             if sim.use_threading and not sim.use_cuda:
                 message += "(%d threads per process) " %sim.cpu_threads
         # Detailed information
@@ -173,7 +173,7 @@ def print_simulation_setup( sim, verbose_level=1 ):
             # Information on MPI
             if mpi_installed:
                 message += '\nMPI available: Yes'
-                message += '\nMPI processes used: %d' %sim.comm.size
+                message += '\nMPI processes used: %d' %sim.comm.world_size
                 message += '\nMPI Library Information: \n%s' \
                     %MPI.Get_library_version()
             else:
@@ -205,9 +205,9 @@ def print_simulation_setup( sim, verbose_level=1 ):
                     message += '\nFFT library: pyFFTW'
                 node_message = get_cpu_message()
             # Gather the information about where each node runs
-            if sim.comm.size > 1:
-                node_messages = sim.comm.mpi_comm.gather( node_message )
-                if sim.comm.rank == 0:
+            if sim.comm.world_size > 1:
+                node_messages = sim.comm.world_comm.gather( node_message )
+                if sim.comm.world_rank == 0:
                     node_message = ''.join( node_messages )
             message += node_message
 
@@ -217,6 +217,11 @@ def print_simulation_setup( sim, verbose_level=1 ):
                 message += '\nPSATD stencil order: infinite'
             else:
                 message += '\nPSATD stencil order: %d' %sim.fld.n_order
+            if sim.fld.coef_cache is not None:
+                stats = sim.fld.coef_cache.get_statistics()
+                message += '\nCoefficient cache: %s (%d hits, %d misses)' \
+                    %(sim.fld.coef_cache.cache_dir,
+                      stats['hits'], stats['misses'])
             message += '\nParticle shape: %s' %sim.particle_shape
             message += '\nLongitudinal boundaries: %s' %sim.comm.boundaries
             message += '\nTransverse boundaries: reflective'
@@ -237,7 +242,7 @@ def print_simulation_setup( sim, verbose_level=1 ):
         message += '\n'
 
         # Only processor 0 prints the message:
-        if sim.comm.rank == 0:
+        if sim.comm.world_rank == 0:
             print( message )
 
 def print_available_gpus():
@@ -0,0 +1,313 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the Profiler class, which measures the wall-clock time spent
+in each phase of the PIC cycle (per species and per MPI rank).
+"""
+import os
+import json
+from fbpic.utils.cuda import cuda, cuda_installed
+try:
+    from time import perf_counter as wall_clock
+except ImportError: # Python 2
+    from time import time as wall_clock
+
+class Profiler(object):
+    """
+    Class that measures the time spent in the different phases of the PIC
+    cycle (e.g. gather, push_p, deposit, push_eb, exchange_fields, ...).
+
+    The phases are timed by wrapping the corresponding code in
+    `with profiler.timer( phase, species ):`. On CPU, the timers use the
+    host clock. On GPU, the timers record CUDA events in the default
+    stream, so that the measured time is the time spent by the GPU on this
+    phase (and not the time spent by the host to launch the kernels).
+
+    At the end of a call to `Simulation.step`, the accumulated times are
+    aggregated over the MPI ranks (min/max/mean), printed as a table
+    and written as JSON and CSV files.
+
+    When the profiler is not active, `timer` returns a context manager
+    which does nothing, so that the overhead is negligible.
+    """
+
+    def __init__( self, comm, use_cuda=False, active=False,
+                    write_dir=None, print_report=True ):
+        """
+        Initialize the profiler.
+
+        Parameters
+        ----------
+        comm: a BoundaryCommunicator object
+            Used to aggregate the timings over the MPI ranks
+
+        use_cuda: bool, optional
+            Whether to time the phases with CUDA events
+
+        active: bool, optional
+            Whether to measure the time spent in each phase
+
+        write_dir: string or None, optional
+            The directory in which the reports are written
+            (as `profile_<iteration>.json` and `profile_<iteration>.csv`).
+            If None, the reports are not written to disk.
+
+        print_report: bool, optional
+            Whether to print the aggregated table at the end of `step`
+        """
+        self.comm = comm
+        self.use_cuda = use_cuda and cuda_installed
+        self.active = active
+        self.write_dir = write_dir
+        self.print_report = print_report
+
+        # Accumulated time (in seconds) and number of calls, per phase
+        self.reset()
+        # Context manager returned when the profiler is inactive
+        self.null_timer = NullTimer()
+
+    def reset( self ):
+        """
+        Reset the accumulated timings.
+        """
+        # Dictionaries whose keys are (phase, species) tuples
+        self.times = {}
+        self.calls = {}
+        # List of pending CUDA events (key, start_event, stop_event)
+        self.pending_events = []
+        # Total wall-clock time and number of steps
+        self.total_time = 0.
+        self.n_steps = 0
+        self.start_time = None
+
+    def timer( self, phase, species=None ):
+        """
+        Return a context manager that times the code that it wraps.
+
+        Parameters
+        ----------
+        phase: string
+            The name of the phase (e.g. 'gather', 'deposit', ...)
+
+        species: string or None, optional
+            The name of the species concerned by this phase
+            (None for the phases that do not depend on a species)
+        """
+        if not self.active:
+            return self.null_timer
+        if self.use_cuda:
+            return CudaPhaseTimer( self, (phase, species) )
+        else:
+            return PhaseTimer( self, (phase, species) )
+
+    def add_time( self, key, duration ):
+        """
+        Add the time `duration` (in seconds) to the phase `key`
+        """
+        self.times[key] = self.times.get(key, 0.) + duration
+        self.calls[key] = self.calls.get(key, 0) + 1
+
+    def start_step_loop( self ):
+        """
+        Mark the beginning of the loop of `Simulation.step`
+        """
+        if not self.active:
+            return
+        self.reset()
+        if self.use_cuda:
+            cuda.synchronize()
+        self.start_time = wall_clock()
+
+    def end_iteration( self ):
+        """
+        Mark the end of one PIC iteration, and convert the CUDA events
+        of this iteration into elapsed times.
+        """
+        if not self.active:
+            return
+        self.n_steps += 1
+        if self.use_cuda:
+            for key, start, stop in self.pending_events:
+                stop.synchronize()
+                self.add_time( key, 1.e-3*cuda.event_elapsed_time(start, stop) )
+            self.pending_events = []
+
+    def end_step_loop( self, iteration ):
+        """
+        Mark the end of the loop of `Simulation.step`: aggregate the
+        timings over the MPI ranks, print and write the report.
+
+        Parameters
+        ----------
+        iteration: int
+            The current iteration of the simulation (used in the file names)
+
+        Returns
+        -------
+        A dictionary containing the aggregated report (on all ranks),
+        or None if the profiler is not active
+        """
+        if not self.active:
+            return None
+        if self.use_cuda:
+            cuda.synchronize()
+        self.total_time = wall_clock() - self.start_time
+
+        report = self.get_report( iteration )
+        if self.comm.world_rank == 0:
+            if self.print_report:
+                print_profiling_report( report )
+            if self.write_dir is not None:
+                write_profiling_report( report, self.write_dir )
+        return report
+
+    def get_report( self, iteration ):
+        """
+        Aggregate the timings over the MPI ranks.
+
+        Parameters
+        ----------
+        iteration: int
+            The current iteration of the simulation
+
+        Returns
+        -------
+        A dictionary with the keys 'iteration', 'n_steps', 'n_ranks',
+        'total_time' and 'phases'. 'phases' is a list of dictionaries
+        (one per phase and species) with the keys 'phase', 'species',
+        'calls', 'min', 'max', 'mean' and 'per_rank'.
+        """
+        local_data = ( self.times, self.calls, self.total_time )
+        if self.comm.world_size > 1:
+            all_data = self.comm.world_comm.allgather( local_data )
+        else:
+            all_data = [ local_data ]
+        n_ranks = len(all_data)
+
+        # Get the union of the phases measured on the different ranks,
+        # in the order in which they were first encountered
+        keys = []
+        for times, _, _ in all_data:
+            for key in times.keys():
+                if key not in keys:
+                    keys.append( key )
+
+        phases = []
+        for key in keys:
+            per_rank = [ times.get(key, 0.) for times, _, _ in all_data ]
+            calls = max( calls.get(key, 0) for _, calls, _ in all_data )
+            phases.append({ 'phase': key[0], 'species': key[1],
+                'calls': calls, 'min': min(per_rank), 'max': max(per_rank),
+                'mean': sum(per_rank)/n_ranks, 'per_rank': per_rank })
+
+        total_per_rank = [ total_time for _, _, total_time in all_data ]
+        return({ 'iteration': iteration, 'n_steps': self.n_steps,
+            'n_ranks': n_ranks, 'total_time': max(total_per_rank),
+            'phases': phases })
+
+
+class PhaseTimer(object):
+    """
+    Context manager that measures the time spent in a phase, on CPU
+    """
+    def __init__( self, profiler, key ):
+        self.profiler = profiler
+        self.key = key
+
+    def __enter__( self ):
+        self.start = wall_clock()
+
+    def __exit__( self, *args ):
+        self.profiler.add_time( self.key, wall_clock() - self.start )
+
+
+class CudaPhaseTimer(object):
+    """
+    Context manager that records CUDA events at the beginning and end
+    of a phase. (The elapsed time is obtained at the end of the iteration,
+    in `Profiler.end_iteration`, to avoid synchronizing after each phase.)
+    """
+    def __init__( self, profiler, key ):
+        self.profiler = profiler
+        self.key = key
+
+    def __enter__( self ):
+        self.start = cuda.event()
+        self.start.record()
+
+    def __exit__( self, *args ):
+        stop = cuda.event()
+        stop.record()
+        self.profiler.pending_events.append( (self.key, self.start, stop) )
+
+
+class NullTimer(object):
+    """
+    Context manager that does nothing (used when the profiler is inactive)
+    """
+    def __enter__( self ):
+        pass
+
+    def __exit__( self, *args ):
+        pass
+
+def get_species_name( i_species ):
+    """
+    Return the name under which the species of index `i_species`
+    (in the list `Simulation.ptcl`) appears in the profiling report
+    """
+    return( 'species_%d' %i_species )
+
+# -----------------------------------------------------
+# Output utilities
+# -----------------------------------------------------
+
+def print_profiling_report( report ):
+    """
+    Print the aggregated report as a table
+
+    Parameters
+    ----------
+    report: dict
+        The report returned by `Profiler.get_report`
+    """
+    total_time = report['total_time']
+    print('\nProfiling report (%d steps, %d MPI ranks, total time %.3f s)'
+          %(report['n_steps'], report['n_ranks'], total_time) )
+    print('%-20s %-16s %8s %11s %11s %11s %7s' %('phase', 'species',
+            'calls', 'min [s]', 'mean [s]', 'max [s]', 'mean %') )
+    for p in report['phases']:
+        species = p['species'] if p['species'] is not None else '-'
+        fraction = 100*p['mean']/total_time if total_time > 0 else 0.
+        print('%-20s %-16s %8d %11.4f %11.4f %11.4f %6.1f%%' %(p['phase'],
+            species, p['calls'], p['min'], p['mean'], p['max'], fraction) )
+    print('')
+
+def write_profiling_report( report, write_dir ):
+    """
+    Write the aggregated report as a JSON file and a CSV file
+
+    Parameters
+    ----------
+    report: dict
+        The report returned by `Profiler.get_report`
+
+    write_dir: string
+        The directory in which the files are written
+    """
+    if not os.path.exists( write_dir ):
+        os.makedirs( write_dir )
+    file_name = os.path.join( write_dir,
+                              'profile_%08d' %report['iteration'] )
+    # JSON file (full report, including the timings of each rank)
+    with open( file_name + '.json', 'w' ) as f:
+        json.dump( report, f, indent=2 )
+    # CSV file (aggregated timings)
+    with open( file_name + '.csv', 'w' ) as f:
+        f.write('phase,species,calls,min,mean,max\n')
+        for p in report['phases']:
+            species = p['species'] if p['species'] is not None else ''
+            f.write('%s,%s,%d,%.9e,%.9e,%.9e\n' %(p['phase'], species,
+                    p['calls'], p['min'], p['mean'], p['max']) )
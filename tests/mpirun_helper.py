@@ -0,0 +1,61 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the test suite of FB-PIC (Fourier-Bessel
+Particle-In-Cell).
+
+It defines the function that the tests of the MPI features use in order
+to launch a script of `unautomated/` on several MPI ranks with mpirun.
+The test is skipped when mpirun or mpi4py is not available, and the output
+of the script is shown when it fails.
+"""
+import os
+import sys
+import subprocess
+import pytest
+try:
+    from shutil import which
+except ImportError: # Python 2
+    from distutils.spawn import find_executable as which
+try:
+    from importlib.util import find_spec
+    def is_installed( module_name ):
+        return( find_spec( module_name ) is not None )
+except ImportError: # Python 2
+    import imp
+    def is_installed( module_name ):
+        try:
+            imp.find_module( module_name )
+            return( True )
+        except ImportError:
+            return( False )
+
+def run_with_mpirun( script_file, n_procs=2 ):
+    """
+    Run the Python script `script_file` on `n_procs` MPI ranks with mpirun,
+    and make the current test fail (with the output of the script) if the
+    script returns an error
+
+    The test is skipped if mpirun or mpi4py is not available.
+    (mpi4py is not imported here, so as not to initialize MPI.)
+    """
+    if which( 'mpirun' ) is None:
+        pytest.skip( 'mpirun is not available' )
+    if not is_installed( 'mpi4py' ):
+        pytest.skip( 'mpi4py is not installed' )
+
+    # The script is run with `python -m mpi4py`, so that an exception on
+    # one rank aborts all the ranks (instead of leaving them waiting for it)
+    command = [ 'mpirun', '-np', str(n_procs),
+                sys.executable, '-m', 'mpi4py', script_file ]
+    # Pass `os.environ` explicitly: it does not contain the variables that
+    # MPI adds to the environment of the current process when it is
+    # initialized (e.g. when another test module imported fbpic), and
+    # with which mpirun would fail without any output
+    process = subprocess.Popen( command, env=dict( os.environ ),
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT )
+    output = process.communicate()[0].decode( 'utf-8', 'replace' )
+    if process.returncode != 0:
+        pytest.fail( '`%s` failed with exit code %d:\n%s'
+            %(' '.join(command), process.returncode, output), pytrace=False )
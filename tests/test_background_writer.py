@@ -0,0 +1,98 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the writing of the openPMD files in a background thread
+(argument `write_in_background` of FieldDiagnostic and ParticleDiagnostic):
+the same simulation writes its diagnostics both directly and in the
+background (in two different directories), and the content of the
+files is compared.
+
+Usage:
+------
+$ py.test -q tests/test_background_writer.py
+"""
+import os, shutil, tempfile
+import h5py
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+from fbpic.openpmd_diag import FieldDiagnostic, ParticleDiagnostic
+
+# Parameters
+# ----------
+Nz = 32
+zmax = 20.e-6
+Nr = 16
+rmax = 20.e-6
+Nm = 2
+dt = zmax/Nz/c
+n_e = 1.e24
+N_step = 12
+diag_period = 2
+
+def test_background_writer():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=0.5*rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, verbose_level=0 )
+    # Give a random momentum to the particles
+    np.random.seed(0)
+    species = sim.ptcl[0]
+    species.uz[:] = 0.1*np.random.randn( species.Ntot )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.uz**2 )
+
+    # Write the same diagnostics directly and in the background
+    # (in a temporary directory, which is removed even if the test fails)
+    temp_dir = tempfile.mkdtemp()
+    direct_dir = os.path.join( temp_dir, 'direct_diags' )
+    background_dir = os.path.join( temp_dir, 'background_diags' )
+    try:
+        for write_dir, write_in_background in [ (direct_dir, False),
+                                                (background_dir, True) ]:
+            sim.diags += [
+                FieldDiagnostic( diag_period, sim.fld, comm=sim.comm,
+                    write_dir=write_dir,
+                    write_in_background=write_in_background ),
+                ParticleDiagnostic( diag_period, {"electrons": species},
+                    select={"uz": [0., None]}, comm=sim.comm,
+                    particle_data=["position", "momentum", "weighting", "E"],
+                    write_dir=write_dir,
+                    write_in_background=write_in_background ) ]
+        sim.step( N_step, show_progress=False )
+
+        # Compare the files
+        for iteration in range( 0, N_step, diag_period ):
+            filename = os.path.join( 'hdf5', 'data%08d.h5' %iteration )
+            f_direct = h5py.File( os.path.join(direct_dir, filename), 'r' )
+            f_background = h5py.File(
+                os.path.join(background_dir, filename), 'r' )
+            compare_groups( f_direct, f_background )
+            f_direct.close()
+            f_background.close()
+    finally:
+        # Wait for the background writes before removing the files
+        for diag in sim.diags:
+            diag.flush()
+        shutil.rmtree( temp_dir )
+
+def compare_groups( grp_direct, grp_background ):
+    """
+    Check that two h5py.Group objects have the same datasets (recursively)
+    """
+    assert sorted( grp_direct.keys() ) == sorted( grp_background.keys() )
+    for key in grp_direct.keys():
+        if isinstance( grp_direct[key], h5py.Group ):
+            compare_groups( grp_direct[key], grp_background[key] )
+        else:
+            assert np.array_equal( grp_direct[key][...],
+                                   grp_background[key][...] )
+        for attr in grp_direct[key].attrs.keys():
+            if attr != 'date':
+                assert np.all( grp_direct[key].attrs[attr]
+                               == grp_background[key].attrs[attr] )
+
+if __name__ == '__main__':
+    test_background_writer()
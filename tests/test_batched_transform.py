@@ -0,0 +1,81 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the batched transform engine of the Fields object, by checking
+that it gives the same result as the per-component transform engine,
+when transforming random fields E, B and J back and forth between the
+interpolation grid and the spectral grid.
+
+Usage:
+------
+$ py.test -q tests/test_batched_transform.py
+"""
+import numpy as np
+from scipy.constants import c
+from fbpic.fields import Fields
+
+# Parameters
+# ----------
+Nz = 64
+zmax = 20.e-6
+Nr = 32
+rmax = 20.e-6
+Nm = 3
+dt = zmax/Nz/c
+
+def test_batched_transform_double():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    compare_engines( 'double', 1.e-12 )
+
+def test_batched_transform_mixed():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    compare_engines( 'mixed', 1.e-6 )
+
+def compare_engines( precision, tolerance ):
+    """
+    Transform random fields with the per-component and batched engines,
+    and check that the results agree within the relative `tolerance`
+    """
+    ref = Fields( Nz, zmax, Nr, rmax, Nm, dt, precision=precision )
+    fld = Fields( Nz, zmax, Nr, rmax, Nm, dt, precision=precision,
+                    transform_engine='batched' )
+
+    # Initialize identical random fields on the interpolation grid
+    np.random.seed(0)
+    for m in range(Nm):
+        for field in ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz', 'Jr', 'Jt', 'Jz']:
+            shape = (Nz, Nr)
+            values = np.random.rand(*shape) + 1.j*np.random.rand(*shape)
+            getattr( ref.interp[m], field )[:,:] = values
+            getattr( fld.interp[m], field )[:,:] = values
+
+    # Transform to spectral space and compare
+    for fieldtype in ['EB', 'J']:
+        ref.interp2spect( fieldtype )
+        fld.interp2spect( fieldtype )
+    for m in range(Nm):
+        for field in ['Ep', 'Em', 'Ez', 'Bp', 'Bm', 'Bz', 'Jp', 'Jm', 'Jz']:
+            check_close( getattr( ref.spect[m], field ),
+                         getattr( fld.spect[m], field ), tolerance )
+
+    # Transform back to the interpolation grid and compare
+    for fieldtype in ['E', 'B', 'J']:
+        ref.spect2interp( fieldtype )
+        fld.spect2interp( fieldtype )
+    for m in range(Nm):
+        for field in ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz', 'Jr', 'Jt', 'Jz']:
+            check_close( getattr( ref.interp[m], field ),
+                         getattr( fld.interp[m], field ), tolerance )
+
+def check_close( array_ref, array, tolerance ):
+    """Check that the two arrays agree within the relative `tolerance`"""
+    assert array.dtype == array_ref.dtype
+    error = abs( array - array_ref ).max() / abs( array_ref ).max()
+    assert error < tolerance
+
+if __name__ == '__main__' :
+    test_batched_transform_double()
+    test_batched_transform_mixed()
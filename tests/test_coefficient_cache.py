@@ -0,0 +1,89 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the on-disk cache of the DHT matrices and PSATD coefficients,
+by checking that:
+- the first Fields object created with a given cache directory computes
+  the arrays (cache misses), and the following ones load them (cache hits)
+- the arrays loaded from the cache are identical to the arrays computed
+  without cache
+- a change in the parameters (here, the timestep) results in new entries
+
+Usage:
+------
+$ py.test -q tests/test_coefficient_cache.py
+"""
+import shutil
+import tempfile
+import numpy as np
+from scipy.constants import c
+from fbpic.fields import Fields
+
+# Parameters
+# ----------
+Nz = 64
+zmax = 20.e-6
+Nr = 32
+rmax = 20.e-6
+Nm = 2
+dt = zmax/Nz/c
+
+def test_coefficient_cache():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    cache_dir = tempfile.mkdtemp()
+    try:
+        # Reference, without cache
+        ref = Fields( Nz, zmax, Nr, rmax, Nm, dt, v_comoving=0.9*c )
+
+        # First creation: all the arrays are computed
+        # (3 DHTs and 1 set of PSATD coefficients per mode)
+        fld = Fields( Nz, zmax, Nr, rmax, Nm, dt, v_comoving=0.9*c,
+                        cache_dir=cache_dir )
+        assert fld.coef_cache.get_statistics() == \
+            {'hits': 0, 'misses': 4*Nm}
+
+        # Second creation: all the arrays are loaded from the cache
+        fld = Fields( Nz, zmax, Nr, rmax, Nm, dt, v_comoving=0.9*c,
+                        cache_dir=cache_dir )
+        assert fld.coef_cache.get_statistics() == \
+            {'hits': 4*Nm, 'misses': 0}
+        compare_arrays( ref, fld )
+        # The DHT matrices (in double precision) are not copied into memory
+        for m in range(Nm):
+            assert not fld.trans[m].dht0.M.flags.writeable
+            assert not fld.trans[m].dht0.invM.flags.writeable
+
+        # Different timestep: the DHT matrices are loaded,
+        # but the PSATD coefficients are recomputed
+        fld = Fields( Nz, zmax, Nr, rmax, Nm, 0.5*dt, v_comoving=0.9*c,
+                        cache_dir=cache_dir )
+        assert fld.coef_cache.get_statistics() == \
+            {'hits': 3*Nm, 'misses': Nm}
+    finally:
+        shutil.rmtree( cache_dir )
+
+def compare_arrays( ref, fld ):
+    """
+    Check that the DHT matrices and PSATD coefficients of the
+    Fields objects `ref` and `fld` are identical
+    """
+    for m in range(Nm):
+        for dht_name in ['dht0', 'dhtp', 'dhtm']:
+            ref_dht = getattr( ref.trans[m], dht_name )
+            fld_dht = getattr( fld.trans[m], dht_name )
+            assert np.array_equal( ref_dht.M, fld_dht.M )
+            assert np.array_equal( ref_dht.invM, fld_dht.invM )
+            assert np.array_equal( ref_dht.nu, fld_dht.nu )
+        for coef_name in ['C', 'S_w', 'j_coef', 'rho_prev_coef',
+                          'rho_next_coef', 'T_eb', 'T_cc', 'T_rho',
+                          'j_corr_coef']:
+            ref_coef = getattr( ref.psatd[m], coef_name )
+            fld_coef = getattr( fld.psatd[m], coef_name )
+            assert fld_coef.dtype == ref_coef.dtype
+            assert np.array_equal( ref_coef, fld_coef )
+
+if __name__ == '__main__' :
+    test_coefficient_cache()
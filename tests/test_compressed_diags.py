@@ -0,0 +1,114 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the chunking and compression of the openPMD datasets
+(arguments `chunks`, `compression`, `compression_level`, `shuffle`
+and `float32_data` of FieldDiagnostic and ParticleDiagnostic):
+the same simulation writes its diagnostics without and with compression
+(in two different directories), and the content of the files is compared.
+- The compressed datasets should be identical to the uncompressed ones,
+  and should have the requested chunks and filters.
+- The datasets in `float32_data` should be equal to the uncompressed
+  ones, within single precision.
+
+Usage:
+------
+$ py.test -q tests/test_compressed_diags.py
+"""
+import os, shutil, tempfile
+import h5py
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+from fbpic.openpmd_diag import FieldDiagnostic, ParticleDiagnostic
+
+# Parameters
+# ----------
+Nz = 32
+zmax = 20.e-6
+Nr = 16
+rmax = 20.e-6
+Nm = 2
+dt = zmax/Nz/c
+n_e = 1.e24
+N_step = 4
+diag_period = 2
+
+def test_compressed_diags():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=0.5*rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, verbose_level=0 )
+    # Give a random momentum to the particles
+    np.random.seed(0)
+    species = sim.ptcl[0]
+    species.uz[:] = 0.1*np.random.randn( species.Ntot )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.uz**2 )
+
+    # Write the same diagnostics without and with compression
+    # (in a temporary directory, which is removed even if the test fails)
+    temp_dir = tempfile.mkdtemp()
+    uncompressed_dir = os.path.join( temp_dir, 'uncompressed_diags' )
+    compressed_dir = os.path.join( temp_dir, 'compressed_diags' )
+    try:
+        sim.diags = [
+            FieldDiagnostic( diag_period, sim.fld, comm=sim.comm,
+                             write_dir=uncompressed_dir ),
+            ParticleDiagnostic( diag_period, {"electrons": species},
+                                comm=sim.comm, write_dir=uncompressed_dir ),
+            FieldDiagnostic( diag_period, sim.fld, comm=sim.comm,
+                             write_dir=compressed_dir, chunks=(1, Nr, 16),
+                             compression='gzip', compression_level=1,
+                             shuffle=True ),
+            ParticleDiagnostic( diag_period, {"electrons": species},
+                                comm=sim.comm, write_dir=compressed_dir,
+                                compression='lzf', shuffle=True,
+                                float32_data=["momentum"] ) ]
+        sim.step( N_step, show_progress=False )
+        compare_files( uncompressed_dir, compressed_dir )
+    finally:
+        shutil.rmtree( temp_dir )
+
+def compare_files( uncompressed_dir, compressed_dir ):
+    """
+    Check that the files written in `compressed_dir` have the requested
+    chunks and filters, and the same content as those in `uncompressed_dir`
+    """
+    for iteration in range( 0, N_step, diag_period ):
+        filename = os.path.join( 'hdf5', 'data%08d.h5' %iteration )
+        f = h5py.File( os.path.join( uncompressed_dir, filename ), 'r' )
+        f_compressed = h5py.File(
+            os.path.join( compressed_dir, filename ), 'r' )
+        # Fields
+        fields = f['/data/%d/fields' %iteration]
+        compressed_fields = f_compressed['/data/%d/fields' %iteration]
+        for path in [ 'rho', 'E/r', 'B/t', 'J/z' ]:
+            dset = compressed_fields[path]
+            assert dset.chunks == (1, Nr, 16)
+            assert dset.compression == 'gzip'
+            assert dset.compression_opts == 1
+            assert dset.shuffle
+            assert fields[path].chunks is None
+            assert np.array_equal( dset[...], fields[path][...] )
+        # Particles
+        ptcl = f['/data/%d/particles/electrons' %iteration]
+        compressed_ptcl = f_compressed[
+            '/data/%d/particles/electrons' %iteration]
+        for path in [ 'position/x', 'position/z', 'weighting' ]:
+            dset = compressed_ptcl[path]
+            assert dset.compression == 'lzf'
+            assert dset.dtype == np.float64
+            assert np.array_equal( dset[...], ptcl[path][...] )
+        for path in [ 'momentum/x', 'momentum/z' ]:
+            dset = compressed_ptcl[path]
+            assert dset.dtype == np.float32
+            assert np.allclose( dset[...], ptcl[path][...],
+                rtol=1.e-7, atol=1.e-7*abs(ptcl[path][...]).max() )
+        f.close()
+        f_compressed.close()
+
+if __name__ == '__main__':
+    test_compressed_diags()
@@ -0,0 +1,127 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the fused field solve on CPU (filter + current correction
++ push of E, B and rho in a single pass), by checking that it gives the same
+result as the successive calls to the separate kernels, for random fields,
+with the standard and Galilean algorithms, and for the different types
+of current correction. It also checks that a simulation gives the same
+fields with and without `fused_field_solve=True`.
+
+Usage:
+------
+$ py.test -q tests/test_fused_field_solve.py
+"""
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+from fbpic.fields import Fields
+
+# Parameters
+# ----------
+Nz = 64
+zmax = 20.e-6
+Nr = 32
+rmax = 20.e-6
+Nm = 2
+dt = zmax/Nz/c
+
+spectral_fields = [ 'Ep', 'Em', 'Ez', 'Bp', 'Bm', 'Bz', 'Jp', 'Jm', 'Jz',
+                    'rho_prev', 'rho_next' ]
+
+def test_fused_field_solve_standard():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for current_correction in ['curl-free', 'cross-deposition']:
+        for correct_currents in [True, False]:
+            for use_true_rho in [True, False]:
+                compare_field_solves( None, current_correction,
+                        correct_currents, True, use_true_rho )
+
+def test_fused_field_solve_galilean():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for current_correction in ['curl-free', 'cross-deposition']:
+        for filter_sources in [True, False]:
+            for use_true_rho in [True, False]:
+                compare_field_solves( -0.999*c, current_correction,
+                        True, filter_sources, use_true_rho )
+
+def compare_field_solves( v_comoving, current_correction, correct_currents,
+                          filter_sources, use_true_rho ):
+    """
+    Perform one field solve with the separate kernels and with the fused
+    kernel, starting from the same random fields, and check that the
+    results agree
+    """
+    ref = Fields( Nz, zmax, Nr, rmax, Nm, dt, v_comoving=v_comoving,
+                  current_correction=current_correction )
+    fld = Fields( Nz, zmax, Nr, rmax, Nm, dt, v_comoving=v_comoving,
+                  current_correction=current_correction )
+
+    # Initialize identical random fields on the spectral grid
+    np.random.seed(0)
+    fields = spectral_fields
+    if current_correction == 'cross-deposition':
+        fields = fields + [ 'rho_next_z', 'rho_next_xy' ]
+    for m in range(Nm):
+        for field in fields:
+            values = np.random.rand(Nz, Nr) + 1.j*np.random.rand(Nz, Nr)
+            getattr( ref.spect[m], field )[:,:] = values
+            getattr( fld.spect[m], field )[:,:] = values
+
+    # Separate kernels
+    if filter_sources:
+        sources = ['J', 'rho_next']
+        if current_correction == 'cross-deposition':
+            sources += ['rho_next_z', 'rho_next_xy']
+        for fieldtype in sources:
+            ref.filter_spect( fieldtype )
+    if correct_currents:
+        ref.correct_currents()
+    ref.push( use_true_rho )
+
+    # Fused kernel
+    fld.push( use_true_rho, correct_currents=correct_currents,
+              filter_sources=filter_sources )
+
+    for m in range(Nm):
+        for field in spectral_fields:
+            array_ref = getattr( ref.spect[m], field )
+            array = getattr( fld.spect[m], field )
+            assert np.allclose( array, array_ref, rtol=1.e-12,
+                                atol=1.e-12*abs(array_ref).max() )
+
+def test_fused_field_solve_simulation():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for current_correction in ['curl-free', 'cross-deposition']:
+        sims = {}
+        for fused_field_solve in [False, True]:
+            # Same (random) azimuthal positions of the particles
+            np.random.seed(0)
+            sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt,
+                p_zmin=0., p_zmax=zmax, p_rmin=0., p_rmax=0.5*rmax,
+                p_nz=2, p_nr=2, p_nt=4, n_e=1.e24, initialize_ions=True,
+                current_correction=current_correction, verbose_level=0,
+                fused_field_solve=fused_field_solve )
+            # Perturb the momenta of the electrons
+            electrons = sim.ptcl[0]
+            kz = 2*np.pi/zmax
+            electrons.uz[:] = 0.05 * np.cos( kz*electrons.z )
+            electrons.inv_gamma[:] = 1./np.sqrt( 1 + electrons.uz**2 )
+            sim.step( 20, show_progress=False )
+            sims[ fused_field_solve ] = sim
+
+        # The fields should be identical
+        for m in range(Nm):
+            for field in ['Er', 'Ez', 'Bt', 'rho', 'Jz']:
+                ref_field = getattr( sims[False].fld.interp[m], field )
+                fused_field = getattr( sims[True].fld.interp[m], field )
+                assert np.allclose( fused_field, ref_field, rtol=0,
+                                    atol=1.e-10*abs(ref_field).max() )
+
+if __name__ == '__main__' :
+    test_fused_field_solve_standard()
+    test_fused_field_solve_galilean()
+    test_fused_field_solve_simulation()
@@ -0,0 +1,102 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the fused gathering and push of the particles
+(`fused_particle_push=True` in the Simulation class):
+- A plasma with a momentum perturbation gives the same particles and fields
+  as with the separate gathering and push, for linear and cubic shapes,
+  and the fields on the particles are then not stored.
+- The separate gathering and push are used when the fields on the
+  particles are needed (by external fields or by diagnostics).
+
+Usage:
+------
+$ py.test -q tests/test_fused_particle_push.py
+"""
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+from fbpic.lpa_utils.external_fields import ExternalField
+from fbpic.openpmd_diag import ParticleDiagnostic
+
+# Parameters
+# ----------
+Nz = 64
+zmax = 20.e-6
+Nr = 32
+rmax = 20.e-6
+Nm = 2
+dt = zmax/Nz/c
+n_e = 1.e24
+N_step = 20
+# Amplitude of the momentum perturbation
+u0 = 0.05
+
+def test_fused_particle_push():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for particle_shape in ['linear', 'cubic']:
+        sims = {}
+        for fused_particle_push in [False, True]:
+            # Same (random) azimuthal positions of the particles
+            np.random.seed(0)
+            sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt,
+                p_zmin=0., p_zmax=zmax, p_rmin=0., p_rmax=0.5*rmax,
+                p_nz=2, p_nr=2, p_nt=4, n_e=n_e, initialize_ions=True,
+                particle_shape=particle_shape, verbose_level=0,
+                fused_particle_push=fused_particle_push )
+            # Perturb the momenta of the electrons
+            electrons = sim.ptcl[0]
+            kz = 2*np.pi/zmax
+            electrons.ux[:] = u0 * np.sin( kz*electrons.z )
+            electrons.uz[:] = u0 * np.cos( kz*electrons.z )
+            electrons.inv_gamma[:] = 1./np.sqrt( 1 + electrons.ux**2
+                                  + electrons.uy**2 + electrons.uz**2 )
+            sim.step( N_step, show_progress=False )
+            sims[ fused_particle_push ] = sim
+
+        # The particles and fields should be identical
+        for ref_species, species in zip( sims[False].ptcl, sims[True].ptcl ):
+            for name in ['x', 'y', 'z', 'ux', 'uy', 'uz', 'inv_gamma']:
+                ref_array = getattr( ref_species, name )
+                array = getattr( species, name )
+                assert np.allclose( array, ref_array, rtol=1.e-12,
+                                    atol=1.e-12*abs(ref_array).max() )
+            # The fields on the particles were not stored
+            assert np.all( species.Ez == 0 )
+            assert not np.all( ref_species.Ez == 0 )
+        for m in range(Nm):
+            for field in ['Er', 'Ez', 'Bt', 'rho', 'Jz']:
+                ref_field = getattr( sims[False].fld.interp[m], field )
+                fused_field = getattr( sims[True].fld.interp[m], field )
+                assert np.allclose( fused_field, ref_field, rtol=0,
+                                    atol=1.e-10*abs(ref_field).max() )
+
+def test_fused_particle_push_fallback():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=0.5*rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, verbose_level=0, fused_particle_push=True )
+    electrons = sim.ptcl[0]
+    assert sim.use_fused_push( electrons, True, True )
+    assert not sim.use_fused_push( electrons, False, True )
+
+    # Diagnostic of the fields on the particles, every 2 iterations
+    sim.diags = [ ParticleDiagnostic( 2, {'electrons': electrons},
+                                      particle_data=['position', 'E'] ) ]
+    sim.iteration = 2
+    assert not sim.use_fused_push( electrons, True, True )
+    sim.iteration = 3
+    assert sim.use_fused_push( electrons, True, True )
+
+    # External field on the electrons
+    def field_func( F, x, y, z, t, amplitude, length_scale ):
+        return( F + amplitude )
+    sim.external_fields = [
+        ExternalField( field_func, 'Ex', 1.e6, 0., species=electrons ) ]
+    assert not sim.use_fused_push( electrons, True, True )
+    # The gathered fields are then stored and modified by the external field
+    sim.step( 1, show_progress=False )
+    assert np.all( electrons.Ex != 0 )
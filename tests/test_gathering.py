@@ -0,0 +1,121 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the gathering of the fields on CPU for an arbitrary number of
+azimuthal modes (which is done in a single pass over the particles, by
+the kernels `gather_field_numba_*_all_modes`):
+- For 2 modes, it gives the same fields as the optimized kernels (as does
+  the kernel of `kernel_generation.py` generated for 2 modes).
+- When the higher modes of the fields are zero, it gives the same fields
+  as with fewer modes.
+
+Usage:
+------
+$ py.test -q tests/test_gathering.py
+"""
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+from fbpic.utils.threading import nthreads, get_chunk_indices
+from fbpic.particles.gathering.threading_methods import \
+    gather_field_numba_linear_all_modes, gather_field_numba_cubic_all_modes
+from fbpic.particles.kernel_generation import get_gather_kernel
+
+# Parameters
+# ----------
+Nz = 64
+zmax = 20.e-6
+Nr = 32
+rmax = 20.e-6
+dt = zmax/Nz/c
+n_e = 1.e24
+
+field_names = [ 'Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz' ]
+particle_fields = [ 'Ex', 'Ey', 'Ez', 'Bx', 'By', 'Bz' ]
+
+def test_gather_two_modes():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for particle_shape in [ 'linear', 'cubic' ]:
+        sim = create_simulation( 2, particle_shape )
+        species = sim.ptcl[0]
+        grid = sim.fld.interp
+        # Gather with the optimized kernel for 2 modes
+        species.gather( grid )
+        ref_fields = [ getattr( species, name ).copy()
+                       for name in particle_fields ]
+        # Gather with the kernel for an arbitrary number of modes
+        if particle_shape == 'linear':
+            gather_kernel = gather_field_numba_linear_all_modes
+        else:
+            gather_kernel = gather_field_numba_cubic_all_modes
+        gather_kernel( species.x, species.y, species.z,
+            grid[0].invdz, grid[0].zmin, grid[0].Nz,
+            grid[0].invdr, grid[0].rmin, grid[0].Nr,
+            *[ tuple( getattr( grid[m], name ) for m in range(2) )
+               for name in field_names ],
+            species.Ex, species.Ey, species.Ez,
+            species.Bx, species.By, species.Bz, species.get_dead_flags(),
+            nthreads, get_chunk_indices( species.Ntot, nthreads ) )
+        for name, ref_field in zip( particle_fields, ref_fields ):
+            assert np.allclose( getattr( species, name ), ref_field,
+                                rtol=0, atol=1.e-12*abs(ref_field).max() )
+        # Gather with the kernel generated for 2 modes
+        gather_kernel = get_gather_kernel( 2, particle_shape )
+        gather_kernel( species.x, species.y, species.z,
+            grid[0].invdz, grid[0].zmin, grid[0].Nz,
+            grid[0].invdr, grid[0].rmin, grid[0].Nr,
+            *[ getattr( grid[m], field + coord ) for field in ['E', 'B']
+               for m in range(2) for coord in ['r', 't', 'z'] ] +
+            [ species.Ex, species.Ey, species.Ez,
+              species.Bx, species.By, species.Bz, species.get_dead_flags(),
+              nthreads, get_chunk_indices( species.Ntot, nthreads ) ] )
+        for name, ref_field in zip( particle_fields, ref_fields ):
+            assert np.allclose( getattr( species, name ), ref_field,
+                                rtol=0, atol=1.e-12*abs(ref_field).max() )
+
+def test_gather_zero_higher_modes():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for particle_shape in [ 'linear', 'cubic' ]:
+        gathered_fields = {}
+        for Nm in [ 1, 3, 4 ]:
+            sim = create_simulation( Nm, particle_shape )
+            species = sim.ptcl[0]
+            # Only the mode 0 is non-zero, except with 4 modes
+            # (where the mode 2 is also non-zero)
+            for m in range( 1, Nm ):
+                if not (Nm == 4 and m == 2):
+                    for name in field_names:
+                        getattr( sim.fld.interp[m], name )[:,:] = 0
+            species.gather( sim.fld.interp )
+            gathered_fields[ Nm ] = [ getattr( species, name ).copy()
+                                      for name in particle_fields ]
+        for Nm in [ 3, 4 ]:
+            for field, ref_field in zip( gathered_fields[Nm],
+                                         gathered_fields[1] ):
+                if Nm == 3:
+                    assert np.allclose( field, ref_field, rtol=0,
+                                        atol=1.e-12*abs(ref_field).max() )
+                else:
+                    # The mode 2 contributes to the gathered fields
+                    assert not np.allclose( field, ref_field )
+
+def create_simulation( Nm, particle_shape ):
+    """
+    Return a simulation with `Nm` modes, with random fields on the
+    interpolation grid (identical for the modes that are common between
+    simulations) and the same particles in all simulations
+    """
+    np.random.seed(0)
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, particle_shape=particle_shape,
+                      verbose_level=0 )
+    for m in range(Nm):
+        for name in field_names:
+            np.random.seed( 10*m + field_names.index(name) )
+            getattr( sim.fld.interp[m], name )[:,:] = \
+                np.random.rand( Nz, Nr ) + 1.j*np.random.rand( Nz, Nr )
+    return( sim )
@@ -0,0 +1,295 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the kernels that are generated for an arbitrary number of
+azimuthal modes (see `fbpic/particles/kernel_generation.py`):
+- On CPU, the generated deposition kernels give the same rho and J as the
+  hand-written kernels, and the generated gathering kernels give the same
+  fields as the kernels `gather_field_numba_*_all_modes`, for several
+  numbers of modes.
+- When FBPIC_CACHE_DIR is set, the generated source is written in this
+  directory and the compiled kernel is cached on disk by numba.
+- The generated GPU kernels (gathering and deposition) give the same
+  fields as the CPU kernels. Since this test may run without
+  a GPU, the GPU kernels are executed as plain Python functions, with
+  a minimal emulation of the CUDA thread index, local arrays and
+  atomic additions.
+
+Usage:
+------
+$ py.test -q tests/test_kernel_generation.py
+"""
+import os
+import math
+import shutil
+import tempfile
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+from fbpic.utils.threading import nthreads, get_chunk_indices
+from fbpic.particles.kernel_generation import get_deposit_kernel, \
+    get_gather_kernel, generate_gather_source, generate_deposit_source, \
+    compile_kernel
+from fbpic.particles.gathering.inline_functions import \
+    add_linear_gather_for_mode, add_cubic_gather_for_mode
+from fbpic.particles.deposition.threading_methods import \
+    deposit_rho_numba_linear, deposit_rho_numba_cubic, \
+    deposit_J_numba_linear, deposit_J_numba_cubic
+
+# Parameters
+# ----------
+Nz = 16
+zmax = 20.e-6
+Nr = 8
+rmax = 20.e-6
+dt = zmax/Nz/c
+n_e = 1.e24
+
+def test_generated_deposition_cpu():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for particle_shape in [ 'linear', 'cubic' ]:
+        for Nm in [ 1, 2, 3, 4 ]:
+            sim = create_simulation( Nm, particle_shape, p_nt=4 )
+            species = sim.ptcl[0]
+            grid = sim.fld.interp
+            n_chunks = sim.fld.rho_global.shape[0]
+            ptcl_chunk_indices = get_chunk_indices( species.Ntot, n_chunks )
+            args = [ species.x, species.y, species.z, species.w, species.q ]
+            J_args = [ species.ux, species.uy, species.uz, species.inv_gamma ]
+            grid_args = [ grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                          grid[0].invdr, grid[0].rmin, grid[0].Nr ]
+            for fieldtype in [ 'rho', 'J' ]:
+                if fieldtype == 'rho':
+                    shape = sim.fld.rho_global.shape
+                    n_arrays = 1
+                    if particle_shape == 'linear':
+                        ref_kernel = deposit_rho_numba_linear
+                    else:
+                        ref_kernel = deposit_rho_numba_cubic
+                    kernel_args = args + grid_args
+                else:
+                    shape = sim.fld.Jr_global.shape
+                    n_arrays = 3
+                    if particle_shape == 'linear':
+                        ref_kernel = deposit_J_numba_linear
+                    else:
+                        ref_kernel = deposit_J_numba_cubic
+                    kernel_args = args + J_args + grid_args
+                # Hand-written kernel (with a loop over the modes)
+                ref_arrays = [ np.zeros( shape, dtype=np.complex128 )
+                               for i in range(n_arrays) ]
+                ref_kernel( *(kernel_args + ref_arrays +
+                              [ Nm, n_chunks, ptcl_chunk_indices ]) )
+                # Generated kernel
+                arrays = [ np.zeros( shape, dtype=np.complex128 )
+                           for i in range(n_arrays) ]
+                kernel = get_deposit_kernel( fieldtype, Nm, particle_shape )
+                kernel( *(kernel_args + arrays +
+                          [ n_chunks, ptcl_chunk_indices ]) )
+                for array, ref_array in zip( arrays, ref_arrays ):
+                    assert np.allclose( array, ref_array, rtol=0,
+                                        atol=1.e-12*abs(ref_array).max() )
+
+def test_generated_gathering_cpu():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for particle_shape in [ 'linear', 'cubic' ]:
+        for Nm in [ 1, 3, 4 ]:
+            sim = create_simulation( Nm, particle_shape, p_nt=4 )
+            species = sim.ptcl[0]
+            grid = sim.fld.interp
+            # Kernel `gather_field_numba_*_all_modes`
+            species.gather( grid )
+            ref_fields = [ species.Ex.copy(), species.Ey.copy(),
+                           species.Ez.copy(), species.Bx.copy(),
+                           species.By.copy(), species.Bz.copy() ]
+            # Generated kernel
+            fields = [ np.zeros( species.Ntot ) for i in range(6) ]
+            kernel = get_gather_kernel( Nm, particle_shape )
+            kernel( species.x, species.y, species.z,
+                grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                *([ getattr( grid[m], field + coord )
+                    for field in ['E', 'B'] for m in range(Nm)
+                    for coord in ['r', 't', 'z'] ] + fields +
+                  [ species.get_dead_flags(), nthreads,
+                    get_chunk_indices( species.Ntot, nthreads ) ]) )
+            for field, ref_field in zip( fields, ref_fields ):
+                assert np.allclose( field, ref_field, rtol=0,
+                                    atol=1.e-12*abs(ref_field).max() )
+
+def test_kernel_disk_cache():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    Nm = 5
+    sim = create_simulation( Nm, 'linear', p_nt=4 )
+    species = sim.ptcl[0]
+    grid = sim.fld.interp
+    n_chunks = sim.fld.rho_global.shape[0]
+    args = [ species.x, species.y, species.z, species.w, species.q,
+             grid[0].invdz, grid[0].zmin, grid[0].Nz,
+             grid[0].invdr, grid[0].rmin, grid[0].Nr ]
+    # Kernel compiled without cache
+    ref_rho = np.zeros( sim.fld.rho_global.shape, dtype=np.complex128 )
+    get_deposit_kernel( 'rho', Nm, 'linear' )( *(args + [ ref_rho,
+        n_chunks, get_chunk_indices( species.Ntot, n_chunks ) ]) )
+
+    cache_dir = tempfile.mkdtemp()
+    initial_cache_dir = os.environ.get('FBPIC_CACHE_DIR')
+    os.environ['FBPIC_CACHE_DIR'] = cache_dir
+    try:
+        name, source = generate_deposit_source( 'rho', Nm, 'linear', False )
+        kernel = compile_kernel( name, source, False )
+        rho = np.zeros( sim.fld.rho_global.shape, dtype=np.complex128 )
+        kernel( *(args + [ rho,
+            n_chunks, get_chunk_indices( species.Ntot, n_chunks ) ]) )
+        assert np.allclose( rho, ref_rho, rtol=0,
+                            atol=1.e-12*abs(ref_rho).max() )
+        # The source was written in the cache directory,
+        # and numba cached the compiled kernel next to it
+        kernel_dir = os.path.join( cache_dir, 'kernels' )
+        source_files = [ filename for filename in os.listdir( kernel_dir )
+                         if filename.endswith('.py') ]
+        assert len( source_files ) == 1
+        assert source_files[0].startswith( name )
+        cached_files = os.listdir( os.path.join( kernel_dir, '__pycache__' ) )
+        assert any( filename.endswith('.nbi') for filename in cached_files )
+    finally:
+        if initial_cache_dir is None:
+            del os.environ['FBPIC_CACHE_DIR']
+        else:
+            os.environ['FBPIC_CACHE_DIR'] = initial_cache_dir
+        shutil.rmtree( cache_dir )
+
+def test_generated_gpu_kernels():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for particle_shape in [ 'linear', 'cubic' ]:
+        Nm = 3
+        sim = create_simulation( Nm, particle_shape, p_nt=2 )
+        species = sim.ptcl[0]
+        grid = sim.fld.interp
+
+        # Gathering: compare with the CPU kernel
+        species.gather( grid )
+        ref_fields = [ species.Ex.copy(), species.Ey.copy(),
+                       species.Ez.copy(), species.Bx.copy(),
+                       species.By.copy(), species.Bz.copy() ]
+        fields = [ np.zeros( species.Ntot ) for i in range(6) ]
+        name, source = generate_gather_source( Nm, particle_shape, True )
+        run_emulated_gpu_kernel( name, source, species.Ntot,
+            species.x, species.y, species.z,
+            grid[0].invdz, grid[0].zmin, grid[0].Nz,
+            grid[0].invdr, grid[0].rmin, grid[0].Nr,
+            *([ getattr( grid[m], field + coord ) for field in ['E', 'B']
+                for m in range(Nm) for coord in ['r', 't', 'z'] ] + fields) )
+        for field, ref_field in zip( fields, ref_fields ):
+            assert np.allclose( field, ref_field, rtol=0,
+                                atol=1.e-12*abs(ref_field).max() )
+
+        # Deposition: compare with the CPU kernel
+        cell_idx, prefix_sum, particle_arrays = \
+            sort_particles( species, grid[0] )
+        x, y, z, w, ux, uy, uz, inv_gamma = particle_arrays
+        for fieldtype in [ 'rho', 'J' ]:
+            sim.fld.erase( fieldtype )
+            species.deposit( sim.fld, fieldtype )
+            sim.fld.sum_reduce_deposition_array( fieldtype )
+            if fieldtype == 'rho':
+                ref_arrays = [ grid[m].rho.copy() for m in range(Nm) ]
+                args = [ x, y, z, w, species.q ]
+            else:
+                ref_arrays = [ getattr( grid[m], 'J' + coord ).copy()
+                    for coord in ['r', 't', 'z'] for m in range(Nm) ]
+                args = [ x, y, z, w, species.q, ux, uy, uz, inv_gamma ]
+            arrays = [ np.zeros( (Nz, Nr), dtype=np.complex128 )
+                       for ref_array in ref_arrays ]
+            name, source = generate_deposit_source(
+                                fieldtype, Nm, particle_shape, True )
+            run_emulated_gpu_kernel( name, source, len(prefix_sum),
+                *(args + [ grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                           grid[0].invdr, grid[0].rmin, grid[0].Nr ]
+                  + arrays + [ cell_idx, prefix_sum ]) )
+            for array, ref_array in zip( arrays, ref_arrays ):
+                assert np.allclose( array, ref_array, rtol=0,
+                                    atol=1.e-12*abs(ref_array).max() )
+
+def create_simulation( Nm, particle_shape, p_nt ):
+    """
+    Return a simulation with `Nm` modes, with random fields on the
+    interpolation grid, and random azimuthal positions and momenta
+    for the particles (so that the higher modes of rho and J do not
+    cancel out)
+    """
+    np.random.seed(0)
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=2, p_nr=2, p_nt=p_nt,
+                      n_e=n_e, particle_shape=particle_shape,
+                      verbose_level=0 )
+    species = sim.ptcl[0]
+    r = np.sqrt( species.x**2 + species.y**2 )
+    theta = 2*np.pi*np.random.rand( species.Ntot )
+    species.x[:] = r*np.cos( theta )
+    species.y[:] = r*np.sin( theta )
+    for name in [ 'ux', 'uy', 'uz' ]:
+        getattr( species, name )[:] = np.random.randn( species.Ntot )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.ux**2
+                                      + species.uy**2 + species.uz**2 )
+    for m in range(Nm):
+        for name in [ 'Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz' ]:
+            getattr( sim.fld.interp[m], name )[:,:] = \
+                np.random.rand( Nz, Nr ) + 1.j*np.random.rand( Nz, Nr )
+    return( sim )
+
+def sort_particles( species, grid ):
+    """
+    Sort the particles by cell of `grid`, as is done on GPU before the
+    deposition, and return the cell index, the prefix sum and the
+    sorted particle arrays
+    """
+    rj = np.sqrt( species.x**2 + species.y**2 )
+    r_cell = grid.invdr*(rj - grid.rmin) - 0.5
+    z_cell = grid.invdz*(species.z - grid.zmin) - 0.5
+    ir_upper = np.minimum( np.ceil( r_cell ).astype(np.int64), Nr )
+    iz_upper = np.ceil( z_cell ).astype(np.int64) % Nz
+    cell_idx = ir_upper + iz_upper * (Nr+1)
+    sorted_idx = np.argsort( cell_idx, kind='mergesort' )
+    prefix_sum = np.cumsum( np.bincount( cell_idx, minlength=Nz*(Nr+1) ) )
+    particle_arrays = [ getattr( species, name )[sorted_idx] for name in
+        [ 'x', 'y', 'z', 'w', 'ux', 'uy', 'uz', 'inv_gamma' ] ]
+    return( cell_idx[sorted_idx], prefix_sum, particle_arrays )
+
+class EmulatedCuda(object):
+    """
+    Minimal emulation of the CUDA functions used by the generated kernels,
+    in which the kernel is called once per thread (`thread_index`)
+    """
+    def __init__(self):
+        self.thread_index = 0
+        self.local = self
+        self.atomic = self
+
+    def grid(self, ndim):
+        return( self.thread_index )
+
+    def array(self, shape, dtype):
+        return( np.empty( shape ) )
+
+    def add(self, array, index, value):
+        array[index] += value
+
+def run_emulated_gpu_kernel( name, source, n_threads, *args ):
+    """
+    Execute the source of a generated GPU kernel as plain Python,
+    for `n_threads` threads
+    """
+    cuda = EmulatedCuda()
+    namespace = { 'math': math, 'np': np, 'c': c, 'cuda': cuda,
+                  'int64': int, 'float64': np.float64,
+                  'add_linear_gather_for_mode': add_linear_gather_for_mode,
+                  'add_cubic_gather_for_mode': add_cubic_gather_for_mode }
+    exec( compile( source, '<%s>' %name, 'exec' ), namespace )
+    kernel = namespace[name]
+    for i in range( n_threads ):
+        cuda.thread_index = i
+        kernel( *args )
@@ -0,0 +1,110 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the tracking of the fields that are up-to-date on the
+interpolation grid, which allows to skip the unneeded transforms
+from the spectral grid to the interpolation grid:
+- at the level of the Fields object, by checking that `require_interp`
+  only performs a transform when the fields are outdated
+- at the level of the Simulation object, by checking that a simulation
+  without particles does not transform E and B at every iteration,
+  but still returns up-to-date fields at the end of `step`
+
+Usage:
+------
+$ py.test -q tests/test_lazy_transforms.py
+"""
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+from fbpic.fields import Fields
+from fbpic.lpa_utils.laser import add_laser
+
+# Parameters
+# ----------
+Nz = 64
+zmax = 20.e-6
+Nr = 32
+rmax = 20.e-6
+Nm = 2
+dt = zmax/Nz/c
+N_step = 10
+
+def test_require_interp():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    fld = Fields( Nz, zmax, Nr, rmax, Nm, dt )
+
+    # Initialize random fields on the spectral grid
+    np.random.seed(0)
+    for m in range(Nm):
+        for field in ['Ep', 'Em', 'Ez', 'Bp', 'Bm', 'Bz', 'Jp', 'Jm', 'Jz']:
+            values = np.random.rand(Nz, Nr) + 1.j*np.random.rand(Nz, Nr)
+            getattr( fld.spect[m], field )[:,:] = values
+
+    # The fields are transformed only once
+    assert fld.require_interp('EB') == True
+    assert fld.require_interp('E') == False
+    assert fld.require_interp('J') == True
+    assert fld.require_interp('J') == False
+    # The array rho is shared by rho_prev and rho_next
+    assert fld.require_interp('rho_prev') == True
+    assert fld.require_interp('rho_next') == True
+    assert fld.require_interp('rho_next') == False
+
+    # Modifying the spectral fields (or overwriting the interpolation
+    # arrays) makes the fields outdated
+    fld.push()
+    fld.correct_currents()
+    fld.spect2partial_interp('B')
+    assert fld.require_interp('E') == True
+    assert fld.require_interp('J') == True
+    assert fld.require_interp('B') == True
+    fld.erase('E')
+    assert fld.require_interp('E') == True
+
+    # After `require_interp`, the fields are the same as after `spect2interp`
+    Er = [ fld.interp[m].Er.copy() for m in range(Nm) ]
+    Jz = [ fld.interp[m].Jz.copy() for m in range(Nm) ]
+    fld.spect2interp('E')
+    fld.spect2interp('J')
+    for m in range(Nm):
+        assert np.array_equal( Er[m], fld.interp[m].Er )
+        assert np.array_equal( Jz[m], fld.interp[m].Jz )
+
+def test_no_transform_without_particles():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, zmin=-zmax,
+                      boundaries='open' )
+    sim.ptcl = []
+    add_laser( sim, a0=1., w0=5.e-6, ctau=5.e-6, z0=-zmax/2 )
+    sim.set_moving_window( v=c )
+
+    # Count the transforms from the spectral to the interpolation grid
+    transformed_fields = []
+    spect2interp = sim.fld.spect2interp
+    def counting_spect2interp( fieldtype, *args ):
+        transformed_fields.append( fieldtype )
+        spect2interp( fieldtype, *args )
+    sim.fld.spect2interp = counting_spect2interp
+
+    sim.step( N_step, show_progress=False )
+    # Only the final transforms of `step` should have been performed
+    # (instead of one transform of E and B per iteration)
+    for fieldtype in ['EB', 'J', 'rho_prev']:
+        assert transformed_fields.count( fieldtype ) == 1
+
+    # Check that the fields on the interpolation grid are up-to-date
+    Er = [ sim.fld.interp[m].Er.copy() for m in range(Nm) ]
+    Bt = [ sim.fld.interp[m].Bt.copy() for m in range(Nm) ]
+    spect2interp('EB')
+    for m in range(Nm):
+        assert np.array_equal( Er[m], sim.fld.interp[m].Er )
+        assert np.array_equal( Bt[m], sim.fld.interp[m].Bt )
+    assert abs( Er[1] ).max() > 0
+
+if __name__ == '__main__' :
+    test_require_interp()
+    test_no_transform_without_particles()
@@ -0,0 +1,101 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the dynamic load balancing of the MPI domain decomposition:
+- A periodic plasma wave, with plasma in only part of the box, is run on
+  2 MPI ranks with and without load balancing (by launching the script
+  `unautomated/test_load_balancing_parallel.py` with mpirun)
+- The computation of the new boundaries of the subdomains is checked
+  for given cost profiles (shift limited to `max_shift` cells, minimal
+  size of the subdomains).
+
+Usage:
+------
+$ py.test -q tests/test_load_balancing.py
+"""
+import os
+import numpy as np
+from mpirun_helper import run_with_mpirun
+
+script_file = os.path.join( os.path.dirname(os.path.abspath(__file__)),
+                            'unautomated', 'test_load_balancing_parallel.py' )
+
+class FakeCommunicator(object):
+    "Minimal communicator, for the initialization of a LoadBalancer"
+    n_guard = 10
+
+def test_load_balancing_parallel():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Launch the script on 2 MPI ranks
+    run_with_mpirun( script_file )
+
+def test_load_balancing_bounds():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # (Imported here, since launching mpirun from a process in which
+    # MPI is already initialized fails with some MPI implementations)
+    from fbpic.boundaries import LoadBalancer
+
+    balancer = LoadBalancer( FakeCommunicator(), period=10 )
+    assert balancer.min_cells == 20
+    old_bounds = np.array([ 0, 50, 100, 150, 200 ])
+
+    # Cost concentrated at the beginning of the box: the boundaries
+    # move towards the left, by at most `max_shift` cells
+    global_cost = np.ones( 200 )
+    global_cost[:40] = 100.
+    new_bounds = balancer.get_new_bounds( global_cost, old_bounds )
+    assert np.all( new_bounds == np.array([ 0, 40, 90, 140, 200 ]) )
+
+    # Balanced cost: the boundaries do not move
+    global_cost = np.ones( 200 )
+    new_bounds = balancer.get_new_bounds( global_cost, old_bounds )
+    assert np.all( new_bounds == old_bounds )
+
+    # The subdomains keep at least `min_cells` cells
+    old_bounds = np.array([ 0, 25, 50, 150, 200 ])
+    global_cost = np.ones( 200 )
+    global_cost[:30] = 100.
+    new_bounds = balancer.get_new_bounds( global_cost, old_bounds )
+    assert np.all( new_bounds[1:] - new_bounds[:-1] >= 20 )
+    assert np.all( abs( new_bounds - old_bounds ) <= 10 )
+
+    # The shift of the boundaries cannot exceed `n_guard`
+    try:
+        LoadBalancer( FakeCommunicator(), period=10, max_shift=20 )
+        raise AssertionError('No error for `max_shift` > `n_guard`')
+    except ValueError:
+        pass
+
+def test_load_balancing_dead_particles():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    from scipy.constants import c
+    from fbpic.main import Simulation
+    from fbpic.boundaries import LoadBalancer
+
+    # Uniform plasma (2x1x4 macroparticles per cell, i.e. 64 per cell along
+    # z), whose particles are removed by masking them as dead
+    Nz = 50
+    zmax = 20.e-6
+    sim = Simulation( Nz, zmax, 8, 10.e-6, 1, zmax/Nz/c, p_zmin=0.,
+                      p_zmax=zmax, p_rmin=0., p_rmax=10.e-6, p_nz=2,
+                      p_nr=1, p_nt=4, n_e=1.e24, particle_removal='mask',
+                      verbose_level=0 )
+    species = sim.ptcl[0]
+    balancer = LoadBalancer( sim.comm, period=10, cell_cost=0. )
+    assert np.all( balancer.get_local_cost( sim ) == 64 )
+
+    # The dead particles (in the first 10 cells, i.e. below the fraction
+    # that triggers the compaction) are not counted in the cost
+    species.kill_particles( np.where( species.z < 0.2*zmax )[0] )
+    assert species.n_dead == 64*10
+    cost = balancer.get_local_cost( sim )
+    assert np.all( cost[:10] == 0 )
+    assert np.all( cost[10:] == 64 )
+
+if __name__ == '__main__':
+    test_load_balancing_parallel()
+    test_load_balancing_bounds()
+    test_load_balancing_dead_particles()
@@ -0,0 +1,88 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the low-memory Hankel transform backend, by checking
+that it gives the same result as the dense matrix transform, when
+transforming random fields E, B and J back and forth between the
+interpolation grid and the spectral grid.
+
+Usage:
+------
+$ py.test -q tests/test_lowmem_dht.py
+"""
+import numpy as np
+from scipy.constants import c
+from fbpic.fields import Fields
+
+# Parameters
+# ----------
+Nz = 32
+zmax = 20.e-6
+Nr = 200
+rmax = 20.e-6
+Nm = 3
+dt = zmax/Nz/c
+
+def test_lowmem_dht_double():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    compare_backends( 'double', 1.e-5 )
+
+def test_lowmem_dht_single():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    compare_backends( 'single', 1.e-5 )
+
+def compare_backends( precision, tolerance ):
+    """
+    Transform random fields with the matrix and low-memory Hankel transforms,
+    and check that the results agree within the relative `tolerance`
+    """
+    ref = Fields( Nz, zmax, Nr, rmax, Nm, dt, precision=precision )
+    fld = Fields( Nz, zmax, Nr, rmax, Nm, dt, precision=precision,
+                    dht_backend='low-memory' )
+
+    # Initialize identical random fields on the interpolation grid
+    np.random.seed(0)
+    for m in range(Nm):
+        for field in ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz', 'Jr', 'Jt', 'Jz']:
+            shape = (Nz, Nr)
+            values = np.random.rand(*shape) + 1.j*np.random.rand(*shape)
+            getattr( ref.interp[m], field )[:,:] = values
+            getattr( fld.interp[m], field )[:,:] = values
+
+    # Transform to spectral space and compare
+    for fieldtype in ['E', 'B', 'J']:
+        ref.interp2spect( fieldtype )
+        fld.interp2spect( fieldtype )
+    for m in range(Nm):
+        for field in ['Ep', 'Em', 'Ez', 'Bp', 'Bm', 'Bz', 'Jp', 'Jm', 'Jz']:
+            check_close( getattr( ref.spect[m], field ),
+                         getattr( fld.spect[m], field ), tolerance )
+
+    # Transform back to the interpolation grid and compare
+    # (Start from the same spectral fields: for m > 0, the random fields
+    # cannot be exactly represented with the Bessel modes, and the round
+    # trip amplifies the differences between the backends)
+    for m in range(Nm):
+        for field in ['Ep', 'Em', 'Ez', 'Bp', 'Bm', 'Bz', 'Jp', 'Jm', 'Jz']:
+            getattr( fld.spect[m], field )[:,:] = \
+                getattr( ref.spect[m], field )
+    for fieldtype in ['E', 'B', 'J']:
+        ref.spect2interp( fieldtype )
+        fld.spect2interp( fieldtype )
+    for m in range(Nm):
+        for field in ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz', 'Jr', 'Jt', 'Jz']:
+            check_close( getattr( ref.interp[m], field ),
+                         getattr( fld.interp[m], field ), tolerance )
+
+def check_close( array_ref, array, tolerance ):
+    """Check that the two arrays agree within the relative `tolerance`"""
+    assert array.dtype == array_ref.dtype
+    error = abs( array - array_ref ).max() / abs( array_ref ).max()
+    assert error < tolerance
+
+if __name__ == '__main__' :
+    test_lowmem_dht_double()
+    test_lowmem_dht_single()
@@ -0,0 +1,46 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the parallel writing of the openPMD files on 2 MPI ranks
+(by launching the script `unautomated/test_parallel_write_parallel.py`
+with mpirun): the files written with and without `parallel_write`
+should contain the same fields and particles.
+
+`test_parallel_write_mpio` is run when h5py is built with MPI support
+(parallel HDF5), and `test_parallel_write_fallback` otherwise (the data is
+then gathered and written by the first rank).
+
+Usage:
+------
+$ py.test -q tests/test_parallel_write.py
+"""
+import os
+import h5py
+import pytest
+from mpirun_helper import run_with_mpirun
+
+script_file = os.path.join( os.path.dirname(os.path.abspath(__file__)),
+                    'unautomated', 'test_parallel_write_parallel.py' )
+
+@pytest.mark.skipif( not h5py.get_config().mpi,
+                     reason='h5py is not built with MPI support' )
+def test_parallel_write_mpio():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Launch the script on 2 MPI ranks
+    run_with_mpirun( script_file )
+
+@pytest.mark.skipif( h5py.get_config().mpi,
+                     reason='h5py is built with MPI support' )
+def test_parallel_write_fallback():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Launch the script on 2 MPI ranks
+    run_with_mpirun( script_file )
+
+if __name__ == '__main__':
+    if h5py.get_config().mpi:
+        test_parallel_write_mpio()
+    else:
+        test_parallel_write_fallback()
@@ -0,0 +1,119 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the selection of the particles that are written by the
+ParticleDiagnostic (arguments `select` and `subsampling_fraction`):
+- The written particles should be exactly those that satisfy the rules
+  of `select` (including for the Lorentz factor), excluding the dead
+  particles (with `particle_removal='mask'`), and in the same order
+  as in the particle arrays.
+- With `subsampling_fraction`, the written particles should be a subset
+  of these particles, of the expected size.
+
+Usage:
+------
+$ py.test -q tests/test_particle_diag_selection.py
+"""
+import os
+import shutil
+import tempfile
+import h5py
+import numpy as np
+from scipy.constants import c, m_e
+from fbpic.main import Simulation
+from fbpic.openpmd_diag import ParticleDiagnostic
+
+# Parameters
+# ----------
+Nz = 32
+zmax = 20.e-6
+Nr = 16
+rmax = 20.e-6
+Nm = 1
+dt = zmax/Nz/c
+n_e = 1.e24
+select = { 'uz': [ -0.5, None ], 'gamma': [ None, 1.4 ],
+           'z': [ 2.e-6, None ] }
+
+def test_selection():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    sim, species = create_simulation()
+    write_dir = tempfile.mkdtemp()
+    try:
+        sim.diags = [ ParticleDiagnostic( 1, {"electrons": species},
+            select=select, particle_data=["position", "momentum", "gamma"],
+            write_dir=write_dir ) ]
+        sim.diags[0].write( 0 )
+        f = h5py.File( os.path.join( write_dir, 'hdf5',
+                                     'data00000000.h5' ), 'r' )
+        grp = f['/data/0/particles/electrons']
+        x = grp['position/x'][:]
+        z = grp['position/z'][:]
+        uz = grp['momentum/z'][:]
+        gamma_file = grp['gamma'][:]
+        f.close()
+    finally:
+        shutil.rmtree( write_dir )
+
+    # Reference selection
+    gamma = 1./species.inv_gamma
+    selected = np.logical_not( species.dead ) & (species.uz > -0.5) \
+        & (gamma < 1.4) & (species.z > 2.e-6)
+    assert 0 < selected.sum() < species.Ntot - species.n_dead
+
+    # Check the file
+    assert np.array_equal( x, species.x[selected] )
+    assert np.array_equal( z, species.z[selected] )
+    assert np.allclose( uz, m_e*c*species.uz[selected], rtol=1.e-15, atol=0 )
+    assert np.allclose( gamma_file, gamma[selected], rtol=1.e-15 )
+
+def test_subsampling():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    sim, species = create_simulation()
+    fraction = 0.3
+    write_dir = tempfile.mkdtemp()
+    try:
+        sim.diags = [ ParticleDiagnostic( 1, {"electrons": species},
+            select=select, subsampling_fraction=fraction,
+            write_dir=write_dir ) ]
+        sim.diags[0].write( 0 )
+        f = h5py.File( os.path.join( write_dir, 'hdf5',
+                                     'data00000000.h5' ), 'r' )
+        x = f['/data/0/particles/electrons/position/x'][:]
+        f.close()
+    finally:
+        shutil.rmtree( write_dir )
+
+    # Reference selection (without subsampling)
+    selected = np.logical_not( species.dead ) & (species.uz > -0.5) \
+        & (1./species.inv_gamma < 1.4) & (species.z > 2.e-6)
+    n_selected = selected.sum()
+
+    # Check the file
+    assert np.all( np.isin( x, species.x[selected] ) )
+    assert abs( len(x) - fraction*n_selected ) \
+        < 5*np.sqrt( fraction*(1-fraction)*n_selected )
+
+def create_simulation():
+    """
+    Return a simulation whose electrons have random momenta,
+    and some of which are dead (`particle_removal='mask'`)
+    """
+    np.random.seed(0)
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, particle_removal='mask', verbose_level=0 )
+    species = sim.ptcl[0]
+    species.uz[:] = np.random.randn( species.Ntot )
+    species.ux[:] = np.random.randn( species.Ntot )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.ux**2 + species.uz**2 )
+    # Remove some of the particles
+    species.kill_particles( np.arange( 0, species.Ntot, 7 ) )
+    return( sim, species )
+
+if __name__ == '__main__':
+    test_selection()
+    test_subsampling()
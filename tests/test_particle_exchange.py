@@ -0,0 +1,30 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the exchange of particles between 2 MPI ranks, with persistent
+MPI requests and preallocated buffers (by launching the script
+`unautomated/test_particle_exchange_parallel.py` with mpirun):
+- The particles received by each rank should be those sent by its
+  neighbors, including when the buffers need to be enlarged.
+- The tracked particles of a periodic plasma should keep their id.
+
+Usage:
+------
+$ py.test -q tests/test_particle_exchange.py
+"""
+import os
+from mpirun_helper import run_with_mpirun
+
+script_file = os.path.join( os.path.dirname(os.path.abspath(__file__)),
+                        'unautomated', 'test_particle_exchange_parallel.py' )
+
+def test_particle_exchange_parallel():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Launch the script on 2 MPI ranks
+    run_with_mpirun( script_file )
+
+if __name__ == '__main__':
+    test_particle_exchange_parallel()
@@ -0,0 +1,165 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the storage of the particle arrays, whose capacity can be larger
+than the number of macroparticles (see `Particles.resize_particle_arrays`):
+- When particles are added or removed, the existing particles are kept,
+  and the storage arrays are only reallocated when the capacity is exceeded
+  (with a capacity that grows geometrically)
+- The particles that leave an open box are removed in place, and the
+  particles created by ionization are appended in place.
+- When the removed particles are only masked (`particle_removal='mask'`),
+  the simulation gives the same results as when the particles are
+  compacted at each removal, and the dead particles are regularly
+  compacted.
+
+Usage:
+------
+$ py.test -q tests/test_particle_storage.py
+"""
+import numpy as np
+from scipy.constants import c, m_p
+from fbpic.main import Simulation
+import fbpic.particles.particles as particles_module
+from fbpic.particles.particles import particle_capacity_growth
+
+# Parameters
+# ----------
+Nz = 100
+zmax = 20.e-6
+Nr = 32
+rmax = 10.e-6
+Nm = 2
+dt = zmax/Nz/c
+n_e = 1.e24
+
+def get_storage( species, name='x' ):
+    "Return the storage array of the particle array `name` of `species`"
+    return( species.particle_storage[ (species, name) ][0] )
+
+def test_resize_particle_arrays():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, verbose_level=0 )
+    species = sim.ptcl[0]
+    species.track( sim.comm )
+    Ntot = species.Ntot
+    z = species.z.copy()
+    ids = species.tracker.id.copy()
+
+    # Add particles beyond the capacity: the storage grows geometrically
+    species.resize_particle_arrays( Ntot + 10 )
+    storage = get_storage( species )
+    assert len(storage) == int( particle_capacity_growth*Ntot )
+    for array in [ species.x, species.Ez, species.tracker.id ]:
+        assert len(array) == Ntot + 10
+    assert np.array_equal( species.z[:Ntot], z )
+    assert np.array_equal( species.tracker.id[:Ntot], ids )
+
+    # Remove and add particles within the capacity: no reallocation
+    species.resize_particle_arrays( Ntot//2 )
+    species.resize_particle_arrays( len(storage) )
+    assert get_storage( species ) is storage
+    assert np.array_equal( species.z[:Ntot//2], z[:Ntot//2] )
+
+    # An array that was replaced (e.g. by the user) is used as storage
+    species.z = z.copy()
+    species.resize_particle_arrays( Ntot )
+    assert get_storage( species, 'z' ).base is None
+    assert np.array_equal( species.z, z )
+
+def test_open_boundaries_and_ionization():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Particles with large momenta, which leave the open box, and ions
+    # that are ionized by a laser
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, boundaries='open', verbose_level=0 )
+    elec = sim.ptcl[0]
+    np.random.seed(0)
+    elec.uz[:] = 2.*np.random.normal( size=elec.Ntot )
+    elec.inv_gamma[:] = 1./np.sqrt( 1 + elec.uz**2 )
+    elec.track( sim.comm )
+    ions = sim.add_new_species( q=0, m=14*m_p, n=n_e/100, p_nz=1, p_nr=1,
+        p_nt=4, p_zmin=0.25*zmax, p_zmax=0.75*zmax, p_rmax=rmax )
+    ions.make_ionizable( 'N', target_species=elec, level_start=0 )
+    # Give the ions a field that ionizes them: the new electrons
+    # are appended to the existing electrons
+    sim.step( 1, show_progress=False )
+    Ntot = elec.Ntot
+    z = elec.z.copy()
+    ions.Ez[:] = 1.e13
+    ions.ionizer.handle_ionization( ions )
+    assert elec.Ntot > Ntot
+    assert np.array_equal( elec.z[:Ntot], z )
+
+    # The tracked electrons remain unique while particles leave the box,
+    # and the particle arrays are views of the storage arrays
+    sim.step( 20, show_progress=False )
+    assert len( np.unique( elec.tracker.id ) ) == elec.Ntot
+    for name in ['x', 'z', 'ux', 'w', 'Ez']:
+        assert getattr( elec, name ).base is get_storage( elec, name )
+        assert len( getattr( elec, name ) ) == elec.Ntot
+
+def test_dead_particle_mask():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Use a low threshold, so that the dead particles are compacted
+    # several times during the simulation
+    threshold = particles_module.dead_particle_fraction_threshold
+    particles_module.dead_particle_fraction_threshold = 0.05
+
+    # Particles that leave the open box, with a moving window
+    sims = {}
+    n_dead = {}
+    for particle_removal in ['compact', 'mask']:
+        np.random.seed(0)
+        sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, boundaries='open', n_guard=16, n_damp=16,
+                      particle_removal=particle_removal, verbose_level=0 )
+        sim.set_moving_window( v=c )
+        elec = sim.ptcl[0]
+        elec.uz[:] = 5.*np.random.normal( size=elec.Ntot )
+        elec.inv_gamma[:] = 1./np.sqrt( 1 + elec.uz**2 )
+        elec.track( sim.comm )
+        n_dead[ particle_removal ] = []
+        for i_step in range(40):
+            sim.step( 1, show_progress=False )
+            n_dead[ particle_removal ].append( elec.n_dead )
+        sims[ particle_removal ] = sim
+    particles_module.dead_particle_fraction_threshold = threshold
+
+    # The dead particles were compacted when they exceeded the threshold
+    n_dead = np.array( n_dead['mask'] )
+    assert np.all( n_dead <= 0.05*sims['mask'].ptcl[0].Ntot )
+    assert np.any( n_dead[1:] < n_dead[:-1] )
+    assert n_dead.max() > 0
+
+    # The particles that are alive and the fields are the same
+    # as when compacting the particles at each removal
+    elec = sims['compact'].ptcl[0]
+    masked_elec = sims['mask'].ptcl[0]
+    alive = np.logical_not( masked_elec.dead )
+    assert np.array_equal( masked_elec.tracker.id[alive], elec.tracker.id )
+    for name in ['x', 'z', 'uz', 'w']:
+        assert np.allclose( getattr( masked_elec, name )[alive],
+                            getattr( elec, name ) )
+    # The dead particles are skipped by the gathering and the push:
+    # they keep a zero weight and momentum, and stay parked inside the box
+    dead = masked_elec.dead
+    assert masked_elec.n_dead > 0
+    assert np.all( masked_elec.w[ dead ] == 0 )
+    for name in ['x', 'y', 'ux', 'uy', 'uz']:
+        assert np.all( getattr( masked_elec, name )[ dead ] == 0 )
+    interp = sims['mask'].fld.interp[0]
+    assert np.all( masked_elec.z[ dead ] >= interp.zmin )
+    assert np.all( masked_elec.z[ dead ] <= interp.zmax )
+    for field in ['Ez', 'Er', 'rho', 'Jz']:
+        field_array = getattr( sims['compact'].fld.interp[0], field )
+        masked_field_array = getattr( sims['mask'].fld.interp[0], field )
+        assert np.allclose( masked_field_array, field_array,
+                            rtol=0, atol=1.e-10*abs(field_array).max() )
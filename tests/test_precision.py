@@ -0,0 +1,141 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the `precision` argument of the Simulation class, by launching
+a linear periodic plasma wave in double, single and mixed precision,
+and checking that:
+- the field and particle arrays have the expected type
+- the fields obtained in single/mixed precision agree with the fields
+  obtained in double precision, up to the precision of float32
+
+Usage:
+------
+In order to show the images of the fields, and manually check the
+agreement between the different precisions:
+$ python tests/test_precision.py
+
+In order to let Python check the agreement without looking at the plots
+$ py.test -q tests/test_precision.py
+"""
+import numpy as np
+from scipy.constants import c, e, m_e, epsilon_0
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+
+# Parameters
+# ----------
+use_cuda = True
+
+# The simulation box
+Nz = 100         # Number of gridpoints along z
+zmax = 20.e-6    # Length of the box along z (meters)
+Nr = 32          # Number of gridpoints along r
+rmax = 10.e-6    # Length of the box along r (meters)
+Nm = 2           # Number of modes used
+dt = zmax/Nz/c   # Timestep (seconds)
+
+# The particles
+p_zmin = 0.e-6
+p_zmax = 21.e-6
+p_rmin = 0.
+p_rmax = 9.e-6
+n_e = 2.e24
+p_nz = 2
+p_nr = 2
+p_nt = 4
+
+# The plasma wave
+epsilon = 0.001
+w0 = 3.e-6
+k0 = 2*np.pi/zmax*2
+wp = np.sqrt( n_e*e**2/(m_e*epsilon_0) )
+N_step = int( 2*np.pi/(wp*dt)*0.25 )
+
+# Expected types for each precision
+expected_types = {
+    'double': ( np.complex128, np.complex128, np.float64, np.float64 ),
+    'single': ( np.complex64, np.complex64, np.float32, np.float32 ),
+    'mixed': ( np.complex64, np.complex128, np.float32, np.float64 ) }
+
+# -------------
+# Test function
+# -------------
+
+def test_single_precision( show=False ):
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # (In single precision, the deposited charge density is affected by
+    # round-off errors of the order of 1e-7 of the background density,
+    # which is large compared to the amplitude of the plasma wave)
+    compare_with_double_precision( 'single', 1.e-2, show )
+
+def test_mixed_precision( show=False ):
+    "Function that is run by py.test, when doing `python setup.py test`"
+    compare_with_double_precision( 'mixed', 1.e-5, show )
+
+def compare_with_double_precision( precision, tolerance, show ):
+    """
+    Run the plasma wave in double precision and in `precision`,
+    and check that the resulting longitudinal fields agree
+    within the relative tolerance `tolerance`
+    """
+    Ez_double = run_plasma_wave( 'double' )
+    Ez_other = run_plasma_wave( precision )
+
+    if show:
+        import matplotlib.pyplot as plt
+        plt.subplot(211)
+        plt.imshow( Ez_double.T, aspect='auto', origin='lower' )
+        plt.colorbar()
+        plt.title('Ez (double precision)')
+        plt.subplot(212)
+        plt.imshow( (Ez_other - Ez_double).T, aspect='auto', origin='lower')
+        plt.colorbar()
+        plt.title('Ez (%s precision) - Ez (double precision)' %precision)
+        plt.show()
+
+    # Compare the fields
+    relative_error = abs( Ez_other - Ez_double ).max() / abs( Ez_double ).max()
+    print( 'Relative error (%s precision): %.2e' %(precision, relative_error) )
+    assert relative_error < tolerance
+
+def run_plasma_wave( precision ):
+    """
+    Run a periodic plasma wave with the floating-point precision
+    `precision`, check the types of the arrays and return Ez (mode 0)
+    """
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt,
+                  p_zmin, p_zmax, p_rmin, p_rmax, p_nz, p_nr,
+                  p_nt, n_e, n_order=-1, use_cuda=use_cuda,
+                  precision=precision, verbose_level=0 )
+
+    # Impart a sinusoidal longitudinal momentum to the electrons
+    elec = sim.ptcl[0]
+    r = np.sqrt( elec.x**2 + elec.y**2 )
+    elec.uz[:] = - epsilon * c/wp * k0 * np.exp( -r**2/w0**2 ) \
+        * np.cos( k0*elec.z )
+    elec.inv_gamma[:] = 1./np.sqrt( 1 + elec.uz**2 )
+
+    # Run the simulation
+    sim.step( N_step, show_progress=False )
+
+    # Check the type of the arrays
+    field_type, source_type, ptcl_type, position_type = \
+        expected_types[precision]
+    if sim.use_cuda:
+        sim.fld.receive_fields_from_gpu()
+        elec.receive_particles_from_gpu()
+    assert sim.fld.interp[0].Ez.dtype == field_type
+    assert sim.fld.interp[0].Jz.dtype == source_type
+    assert sim.fld.spect[0].Ez.dtype == source_type
+    assert elec.uz.dtype == ptcl_type
+    assert elec.Ez.dtype == ptcl_type
+    assert elec.z.dtype == position_type
+
+    return( sim.fld.interp[0].Ez.real.astype(np.float64) )
+
+if __name__ == '__main__' :
+    test_single_precision( show=True )
+    test_mixed_precision( show=True )
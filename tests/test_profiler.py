@@ -0,0 +1,87 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the profiler of the PIC cycle (`Simulation.set_profiler`), by
+running a simulation with a plasma and a moving window, and checking that:
+- the report contains the expected phases, for each species
+- the JSON and CSV files are written, and are consistent with the report
+- no report is produced when the profiler is deactivated
+
+Usage:
+------
+$ py.test -q tests/test_profiler.py
+"""
+import os
+import json
+import shutil
+from scipy.constants import c
+from fbpic.main import Simulation
+
+# Parameters
+# ----------
+Nz = 64
+zmax = 20.e-6
+Nr = 32
+rmax = 20.e-6
+Nm = 2
+dt = zmax/Nz/c
+N_step = 5
+write_dir = './tests/tmp_test_dir/profiling'
+
+def test_profiler():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    if os.path.exists( write_dir ):
+        shutil.rmtree( write_dir )
+
+    # Simulation with electrons and ions
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt,
+                      p_zmin=0.e-6, p_zmax=15.e-6, p_rmin=0., p_rmax=15.e-6,
+                      p_nz=1, p_nr=1, p_nt=4, n_e=1.e24,
+                      initialize_ions=True, boundaries='open' )
+    sim.set_moving_window( v=c )
+    sim.set_profiler( write_dir=write_dir, print_report=False )
+    sim.step( N_step, show_progress=False )
+
+    # Check the content of the report
+    report = sim.profiling_report
+    assert report['iteration'] == N_step
+    assert report['n_steps'] == N_step
+    assert report['n_ranks'] == 1
+    phases = { (p['phase'], p['species']): p for p in report['phases'] }
+    for species in ['species_0', 'species_1']:
+        for phase in [ 'gather', 'push_p', 'push_x', 'deposit',
+                       'elementary_processes', 'exchange_particles' ]:
+            assert (phase, species) in phases
+        assert phases[('push_p', species)]['calls'] == N_step
+    for phase in [ 'sum_reduce', 'interp2spect', 'spect2interp', 'push_eb',
+                   'exchange_fields', 'moving_window', 'diagnostics' ]:
+        assert (phase, None) in phases
+    assert phases[('push_eb', None)]['calls'] == N_step
+    # The phases are included in the total time
+    total_time = sum( p['mean'] for p in report['phases'] )
+    assert 0 < total_time <= report['total_time']
+    for p in report['phases']:
+        assert p['min'] == p['max'] == p['mean'] == p['per_rank'][0]
+
+    # Check the files
+    file_name = os.path.join( write_dir, 'profile_%08d' %N_step )
+    with open( file_name + '.json' ) as f:
+        assert json.load(f) == report
+    with open( file_name + '.csv' ) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == 'phase,species,calls,min,mean,max'
+    assert len(lines) == len(report['phases']) + 1
+
+    # Deactivate the profiler: no new report is produced
+    sim.set_profiler( active=False, write_dir=write_dir )
+    sim.step( N_step, show_progress=False )
+    assert sim.profiling_report['iteration'] == N_step
+    assert not os.path.exists(
+        os.path.join( write_dir, 'profile_%08d.json' %(2*N_step) ) )
+    shutil.rmtree( write_dir )
+
+if __name__ == '__main__' :
+    test_profiler()
@@ -0,0 +1,55 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the decomposition of the simulation along r, on 2 MPI ranks
+(by launching the script
+`unautomated/test_radial_decomposition_parallel.py` with mpirun):
+- The distributed Hankel transform should give the same result as
+  the serial Hankel transform (also when only the local radial band and
+  its halo are obtained by the inverse transform).
+- A plasma simulation with one radial domain per rank should give the
+  same fields as the same simulation without MPI, and the particles
+  should be exchanged between the radial domains without being lost.
+It also checks (without MPI) that the rows of the Hankel transform
+matrices, which are calculated by each rank without the full matrices,
+are the rows of the full matrices.
+
+Usage:
+------
+$ py.test -q tests/test_radial_decomposition.py
+"""
+import os
+import numpy as np
+from mpirun_helper import run_with_mpirun
+from fbpic.fields.spectral_transform.hankel import compute_dht_matrices, \
+    compute_dht_matrix_rows
+
+script_file = os.path.join( os.path.dirname(os.path.abspath(__file__)),
+                    'unautomated', 'test_radial_decomposition_parallel.py' )
+
+def test_radial_decomposition_parallel():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Launch the script on 2 MPI ranks
+    run_with_mpirun( script_file )
+
+def test_dht_matrix_rows():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    Nr = 33
+    rmax = 20.e-6
+    for p, m in [ (0, 0), (1, 0), (-1, 0), (0, 1), (1, 1), (2, 1), (3, 2) ]:
+        matrices = compute_dht_matrices( p, m, Nr, rmax )
+        for ir_min, ir_max in [ (0, 11), (11, 22), (22, Nr) ]:
+            rows = compute_dht_matrix_rows( p, m, Nr, rmax, ir_min, ir_max )
+            assert np.array_equal( rows['nu'],
+                                   matrices['nu'][ir_min:ir_max] )
+            assert np.array_equal( rows['invM'],
+                                   matrices['invM'][ir_min:ir_max] )
+            assert np.allclose( rows['M'], matrices['M'][ir_min:ir_max],
+                        rtol=0, atol=1.e-12*abs(matrices['M']).max() )
+
+if __name__ == '__main__':
+    test_dht_matrix_rows()
+    test_radial_decomposition_parallel()
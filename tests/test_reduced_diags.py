@@ -0,0 +1,187 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the reduced diagnostics (ParticleMomentsDiagnostic,
+ParticleHistogramDiagnostic and FieldReductionDiagnostic), by comparing
+their time series with the quantities computed from the files of the
+regular diagnostics (ParticleDiagnostic and FieldDiagnostic), which are
+written at the same iterations (see `test_reduced_diags_mpi.py` for
+the same test on 2 MPI ranks).
+It also checks that the iterations that are written again (e.g. after a
+restart from a checkpoint) replace the previous ones in the time series.
+The same test is run on GPU (where the reductions use the CUDA kernels),
+when CUDA is available.
+
+Usage:
+------
+$ py.test -q tests/test_reduced_diags.py
+"""
+import os, shutil, tempfile
+import h5py
+import pytest
+import numpy as np
+from scipy.constants import c, e, m_e
+from fbpic.main import Simulation
+from fbpic.utils.cuda import cuda_installed
+from fbpic.openpmd_diag import FieldDiagnostic, ParticleDiagnostic, \
+    ParticleMomentsDiagnostic, ParticleHistogramDiagnostic, \
+    FieldReductionDiagnostic
+
+# Parameters
+# ----------
+Nz = 64
+zmax = 20.e-6
+Nr = 16
+rmax = 20.e-6
+Nm = 2
+dt = zmax/Nz/c
+n_e = 1.e24
+N_step = 5
+diag_period = 2
+select = { 'uz': [ -0.5, None ] }
+gamma_axis = ( 'gamma', 20, 1., 3. )
+uz_axis = ( 'uz', 10, -1., 1. )
+
+def test_reduced_diags():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    run_reduced_diags( use_cuda=False )
+
+@pytest.mark.skipif( not cuda_installed, reason='CUDA is not available' )
+def test_reduced_diags_gpu():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    run_reduced_diags( use_cuda=True )
+
+def run_reduced_diags( use_cuda ):
+    """
+    Run a simulation with the reduced and regular diagnostics (in a
+    temporary directory), and check the reduced diagnostics
+    """
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=0.5*rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, particle_removal='mask', use_cuda=use_cuda,
+                      verbose_level=0 )
+    # Give a random momentum to the particles, and remove some of them
+    # (`particle_removal='mask'` is only available on CPU)
+    np.random.seed(0)
+    species = sim.ptcl[0]
+    species.ux[:] = 0.3*np.random.randn( species.Ntot )
+    species.uz[:] = np.random.randn( species.Ntot )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.ux**2 + species.uz**2 )
+    if not use_cuda:
+        species.kill_particles( np.arange( 0, species.Ntot, 7 ) )
+
+    write_dir = tempfile.mkdtemp()
+    try:
+        sim.diags = [
+            FieldDiagnostic( diag_period, sim.fld, comm=sim.comm,
+                             fieldtypes=["E", "rho"], write_dir=write_dir ),
+            ParticleDiagnostic( diag_period, {"electrons": species},
+                comm=sim.comm, select=select, write_dir=write_dir,
+                particle_data=["position", "momentum", "weighting", "gamma"] ),
+            ParticleMomentsDiagnostic( diag_period, {"electrons": species},
+                comm=sim.comm, select=select, write_dir=write_dir ),
+            ParticleHistogramDiagnostic( diag_period, {"electrons": species},
+                comm=sim.comm, axes=[ gamma_axis ], select=select,
+                write_dir=write_dir, filename='spectrum.h5' ),
+            ParticleHistogramDiagnostic( diag_period, {"electrons": species},
+                comm=sim.comm, axes=[ ('z', 16, None, None), uz_axis ],
+                select=select, write_dir=write_dir,
+                filename='phase_space.h5' ),
+            FieldReductionDiagnostic( diag_period, sim.fld, comm=sim.comm,
+                fieldtypes=["E", "rho"], write_dir=write_dir ) ]
+        sim.step( N_step, show_progress=False )
+
+        check_reduced_diags( write_dir, range( 0, N_step, diag_period ) )
+
+        # Write the last iteration again: it should replace the previous
+        # one, and the subsequent iterations should be removed from the
+        # time series
+        sim.diags[2].write( 2 )
+        f = h5py.File( os.path.join( write_dir, 'reduced',
+                                     'particle_moments.h5' ), 'r' )
+        assert list( f['iteration'][:] ) == [ 0, 2 ]
+        assert f['electrons/mean_uz'].shape == (2,)
+        f.close()
+    finally:
+        shutil.rmtree( write_dir )
+
+def check_reduced_diags( write_dir, iterations ):
+    """
+    Check the time series of the reduced diagnostics, against the
+    files of the regular diagnostics, for each iteration
+    """
+    moments = h5py.File(
+        os.path.join( write_dir, 'reduced', 'particle_moments.h5' ), 'r' )
+    spectrum = h5py.File(
+        os.path.join( write_dir, 'reduced', 'spectrum.h5' ), 'r' )
+    phase_space = h5py.File(
+        os.path.join( write_dir, 'reduced', 'phase_space.h5' ), 'r' )
+    fields = h5py.File(
+        os.path.join( write_dir, 'reduced', 'field_reduction.h5' ), 'r' )
+    assert list( moments['iteration'][:] ) == list( iterations )
+    assert list( fields['iteration'][:] ) == list( iterations )
+
+    for i, iteration in enumerate( iterations ):
+        f = h5py.File( os.path.join( write_dir, 'hdf5',
+                                     'data%08d.h5' %iteration ), 'r' )
+        assert np.isclose( moments['time'][i],
+                           f['data/%d' %iteration].attrs['time'] )
+
+        # Moments of the particles
+        grp = f['data/%d/particles/electrons' %iteration]
+        w = grp['weighting'][:]
+        q = { 'x': grp['position/x'][:], 'z': grp['position/z'][:],
+              'ux': grp['momentum/x'][:]/(m_e*c),
+              'uz': grp['momentum/z'][:]/(m_e*c), 'gamma': grp['gamma'][:] }
+        assert np.isclose( moments['electrons/weight'][i], w.sum() )
+        assert np.isclose( moments['electrons/charge'][i], -e*w.sum() )
+        for key, value in q.items():
+            mean = np.average( value, weights=w )
+            sigma = np.sqrt( np.average( (value-mean)**2, weights=w ) )
+            assert np.isclose( moments['electrons/mean_%s' %key][i], mean,
+                               rtol=1.e-10, atol=1.e-10*sigma )
+            assert np.isclose( moments['electrons/sigma_%s' %key][i], sigma,
+                               rtol=1.e-10 )
+        dx = q['x'] - np.average( q['x'], weights=w )
+        dux = q['ux'] - np.average( q['ux'], weights=w )
+        emittance = np.sqrt( np.average( dx**2, weights=w )
+            * np.average( dux**2, weights=w )
+            - np.average( dx*dux, weights=w )**2 )
+        assert np.isclose( moments['electrons/emittance_x'][i], emittance,
+                           rtol=1.e-8 )
+
+        # Histograms
+        hist, _ = np.histogram( q['gamma'], bins=gamma_axis[1],
+                                range=gamma_axis[2:], weights=w )
+        assert np.allclose( spectrum['electrons/histogram'][i], hist )
+        assert np.array_equal( spectrum['gamma_range'][i], gamma_axis[2:] )
+        # (The bins along z cover the simulation box)
+        zmin = f['data/%d/fields/E' %iteration].attrs['gridGlobalOffset'][1]
+        assert np.allclose( phase_space['z_range'][i], [zmin, zmin+zmax] )
+        hist, _, _ = np.histogram2d( q['z'], q['uz'], bins=(16, uz_axis[1]),
+            range=( phase_space['z_range'][i], uz_axis[2:] ), weights=w )
+        assert np.allclose( phase_space['electrons/histogram'][i], hist )
+
+        # Lineouts and maxima of the fields
+        for path in [ 'E/r', 'E/z', 'rho' ]:
+            field = f['data/%d/fields/%s' %(iteration, path)][...]
+            assert np.allclose( fields['%s/lineout' %path][i],
+                                field[:, 0, :], rtol=1.e-12, atol=0 )
+            amplitude = np.sqrt( field[1]**2 + field[2]**2 )
+            assert np.isclose( fields['%s/max' %path][i][0],
+                               abs( field[0] ).max(), rtol=1.e-12 )
+            assert np.isclose( fields['%s/max' %path][i][1],
+                               amplitude.max(), rtol=1.e-12 )
+        assert np.isclose( fields['zmin'][i], zmin )
+        f.close()
+
+    for f in [ moments, spectrum, phase_space, fields ]:
+        f.close()
+
+if __name__ == '__main__':
+    test_reduced_diags()
+    if cuda_installed:
+        test_reduced_diags_gpu()
@@ -0,0 +1,28 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the reduced diagnostics on 2 MPI ranks (by launching the script
+`unautomated/test_reduced_diags_parallel.py` with mpirun): their time
+series should match the quantities computed from the files of the regular
+diagnostics, as in `test_reduced_diags.py`.
+
+Usage:
+------
+$ py.test -q tests/test_reduced_diags_mpi.py
+"""
+import os
+from mpirun_helper import run_with_mpirun
+
+script_file = os.path.join( os.path.dirname(os.path.abspath(__file__)),
+                    'unautomated', 'test_reduced_diags_parallel.py' )
+
+def test_reduced_diags_parallel():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Launch the script on 2 MPI ranks
+    run_with_mpirun( script_file )
+
+if __name__ == '__main__':
+    test_reduced_diags_parallel()
@@ -0,0 +1,126 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the sorted deposition methods on CPU (`cpu_deposition=
+'sorted-tiles'` and `cpu_deposition='z-chunks'`), by checking that they
+give the same charge and current density as the default deposition
+(`cpu_deposition='particle-chunks'`), for linear and
+cubic shapes and several azimuthal modes, including after the particles
+have moved far enough to be sorted again (also in single precision).
+It also checks that a few PIC iterations give the same fields with all
+methods.
+
+Usage:
+------
+$ py.test -q tests/test_sorted_deposition.py
+"""
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+
+# Parameters
+# ----------
+Nz = 100
+zmax = 20.e-6
+Nr = 32
+rmax = 10.e-6
+dt = zmax/Nz/c
+n_e = 1.e24
+
+def test_sorted_deposition_linear():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for Nm in [1, 2, 3]:
+        compare_deposition( 'linear', Nm )
+
+def test_sorted_deposition_cubic():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for Nm in [1, 2, 3]:
+        compare_deposition( 'cubic', Nm )
+
+def test_sorted_deposition_single_precision():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    compare_deposition( 'cubic', 2, precision='single' )
+
+def test_sorted_deposition_pic_loop():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    fields = {}
+    for cpu_deposition in ['particle-chunks', 'sorted-tiles', 'z-chunks']:
+        sim = create_simulation( 'cubic', 2, cpu_deposition )
+        sim.step( 20, show_progress=False )
+        fields[cpu_deposition] = [ [ getattr(sim.fld.interp[m], field).copy()
+            for field in ['Er', 'Ez', 'Bt'] ] for m in range(2) ]
+
+    for cpu_deposition in ['sorted-tiles', 'z-chunks']:
+        for m in range(2):
+            for ref, sorted_field in zip( fields['particle-chunks'][m],
+                                          fields[cpu_deposition][m] ):
+                assert np.allclose( ref, sorted_field, rtol=0,
+                                    atol=1.e-9*abs(ref).max() )
+
+def create_simulation( particle_shape, Nm, cpu_deposition,
+                       precision='double' ):
+    """
+    Return a periodic simulation with a uniform plasma, whose particles
+    have random momenta (generated with the same seed for each call)
+    """
+    np.random.seed(0)
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, particle_shape=particle_shape,
+                      cpu_deposition=cpu_deposition, precision=precision,
+                      verbose_level=0 )
+    species = sim.ptcl[0]
+    species.ux[:] = 0.1*np.random.normal( size=species.Ntot )
+    species.uy[:] = 0.1*np.random.normal( size=species.Ntot )
+    species.uz[:] = 0.1*np.random.normal( size=species.Ntot )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.ux**2 + species.uy**2 \
+                                         + species.uz**2 )
+    return( sim )
+
+def compare_deposition( particle_shape, Nm, precision='double' ):
+    """
+    Deposit rho and J with both methods, move the particles by a few
+    cells (so that the tiled deposition needs to sort them again),
+    and check that the deposited arrays agree
+    """
+    tolerance = { 'double': 1.e-12, 'single': 1.e-5 }[ precision ]
+    deposited = {}
+    for cpu_deposition in ['particle-chunks', 'sorted-tiles', 'z-chunks']:
+        sim = create_simulation( particle_shape, Nm, cpu_deposition,
+                                 precision )
+        species = sim.ptcl[0]
+        fld = sim.fld
+        # Use several z-chunks, even when running with a single thread
+        if cpu_deposition == 'z-chunks':
+            species.n_zchunks = 5
+        deposited[cpu_deposition] = []
+        for i_move in range(3):
+            for fieldtype in ['rho', 'J']:
+                fld.erase( fieldtype )
+                species.deposit( fld, fieldtype )
+                fld.sum_reduce_deposition_array( fieldtype )
+            deposited[cpu_deposition].append(
+                [ getattr( fld.interp[m], field ).copy() for m in range(Nm)
+                  for field in ['rho', 'Jr', 'Jt', 'Jz'] ] )
+            # Move the particles along z, by an amount which only depends
+            # on the particle (and not on the order of the particle arrays)
+            dz = 3*fld.interp[0].dz*abs( np.sin( 1.e6*species.x ) )
+            species.z[:] = (species.z + dz) % zmax
+
+        # Check that the particles were sorted
+        if cpu_deposition != 'particle-chunks':
+            assert species.tile_prefix_sum[-1] == species.Ntot
+
+    for cpu_deposition in ['sorted-tiles', 'z-chunks']:
+        for ref_arrays, sorted_arrays in zip( deposited['particle-chunks'],
+                                              deposited[cpu_deposition] ):
+            for i, (ref, sorted_array) in enumerate(
+                                    zip(ref_arrays, sorted_arrays) ):
+                # Compare to the amplitude of the mode 0 of the same field
+                amplitude = abs( ref_arrays[i%4] ).max()
+                assert sorted_array.dtype == ref.dtype
+                assert np.allclose( ref, sorted_array, rtol=0,
+                                    atol=tolerance*amplitude )
@@ -0,0 +1,58 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the split-phase exchange of the guard cells, where the MPI
+communication overlaps with the deposition and the transforms:
+- On 2 MPI ranks (by launching the script
+  `unautomated/test_split_exchange_parallel.py` with mpirun), the fields
+  should be the same as with the blocking exchanges.
+- On a single rank with open boundaries (where no MPI request is posted,
+  and which should also run when mpi4py is not installed), a plasma in a
+  moving window should run without leaving any pending exchange.
+
+Usage:
+------
+$ py.test -q tests/test_split_exchange.py
+"""
+import os
+import numpy as np
+from scipy.constants import c
+from fbpic.main import Simulation
+from mpirun_helper import run_with_mpirun
+
+script_file = os.path.join( os.path.dirname(os.path.abspath(__file__)),
+                        'unautomated', 'test_split_exchange_parallel.py' )
+
+def test_split_exchange_parallel():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Launch the script on 2 MPI ranks
+    run_with_mpirun( script_file )
+
+def test_split_exchange_serial_open_boundaries():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # The simulation box
+    Nz = 100
+    zmax = 20.e-6
+    Nr = 16
+    rmax = 10.e-6
+    Nm = 2
+    dt = zmax/Nz/c
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=0.5*rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=1.e24, boundaries='open', use_cuda=False,
+                      verbose_level=0 )
+    sim.set_moving_window( v=c )
+    sim.step( 20, show_progress=False )
+
+    assert sim.comm.pending_exchanges == {}
+    for fieldtype in ['Er', 'Ez', 'Bt', 'Jz', 'rho']:
+        field = getattr( sim.fld.interp[0], fieldtype )
+        assert np.all( np.isfinite( field ) )
+    assert abs( sim.fld.interp[0].rho ).max() > 0
+
+if __name__ == '__main__':
+    test_split_exchange_serial_open_boundaries()
+    test_split_exchange_parallel()
@@ -14,11 +14,13 @@ $ python tests/test_hankel_dt.py
 import numpy as np
 import matplotlib.pyplot as plt
 from fbpic.fields.spectral_transform.hankel import DHT
+from fbpic.fields.spectral_transform.lowmem_hankel import LowMemoryDHT
 from scipy.special import jn, jn_zeros
 from scipy.special import eval_genlaguerre
 import time
 
-available_methods = [ 'QDHT', 'MDHT(m+1,m)', 'MDHT(m-1,m)', 'MDHT(m,m)']
+available_methods = [ 'QDHT', 'MDHT(m+1,m)', 'MDHT(m-1,m)', 'MDHT(m,m)',
+                      'LowMemoryDHT(m+1,m)', 'LowMemoryDHT(m-1,m)', 'LowMemoryDHT(m,m)' ]
 
 # Define a class for calculating the Hankel transform with the QDHT method
 # This method is never used in FBPIC, but is useful for comparison
@@ -131,6 +133,12 @@ def compare_Hankel_methods( f_analytic, g_analytic, p, Nz, Nr,
             dht = DHT( p, p+1, Nr, Nz, rmax )
         elif method == 'MDHT(m+1,m)':
             dht = DHT( p, p-1, Nr, Nz, rmax )
+        elif method == 'LowMemoryDHT(m,m)':
+            dht = LowMemoryDHT( p, p, Nr, Nz, rmax )
+        elif method == 'LowMemoryDHT(m-1,m)':
+            dht = LowMemoryDHT( p, p+1, Nr, Nz, rmax )
+        elif method == 'LowMemoryDHT(m+1,m)':
+            dht = LowMemoryDHT( p, p-1, Nr, Nz, rmax )
 
         # Calculate f and g on the natural grid
         f = np.empty((Nz,Nr), dtype=np.complex128)
@@ -255,6 +263,39 @@ def compare_bessel( p, m, n, N, rmax, Nz=1) :
 
     compare_Hankel_methods( bessel_n_p, delta, p, Nz, N, rmax)
 
+def compare_lowmem_matrix( p, m, Nr, rmax, Nz=10 ) :
+    """
+    Compare the low-memory Hankel transform (LowMemoryDHT) with the dense matrix
+    transform (DHT), for random arrays on the natural grids.
+    """
+    print('')
+    print('-----------------------------------------------------')
+    print('Comparing LowMemoryDHT and DHT for p=%d, m=%d, Nr=%d' %(p,m,Nr) )
+    print('-----------------------------------------------------')
+
+    t1 = time.time()
+    dht = DHT( p, m, Nr, Nz, rmax )
+    t2 = time.time()
+    lowmem_dht = LowMemoryDHT( p, m, Nr, Nz, rmax )
+    t3 = time.time()
+    print('  - Initialization : matrix %.3f s, low-memory %.3f s' %(t2-t1, t3-t2))
+
+    # Random input arrays
+    f = np.random.rand(Nz,Nr) + 1.j*np.random.rand(Nz,Nr)
+    g = np.random.rand(Nz,Nr) + 1.j*np.random.rand(Nz,Nr)
+    for method, array_in in [ ('transform', f), ('inverse_transform', g) ]:
+        result_matrix = np.empty((Nz, Nr), dtype=np.complex128)
+        result_lowmem = np.empty((Nz, Nr), dtype=np.complex128)
+        t1 = time.time()
+        getattr( dht, method )( array_in, result_matrix )
+        t2 = time.time()
+        getattr( lowmem_dht, method )( array_in, result_lowmem )
+        t3 = time.time()
+        error = abs( result_lowmem - result_matrix ).max() \
+                / abs( result_matrix ).max()
+        print('  - %s : matrix %.3f ms, low-memory %.3f ms, relative error %.3e'
+              %(method, (t2-t1)*1.e3, (t3-t2)*1.e3, error) )
+
 if __name__ == '__main__' :
 
     Nr = 200
@@ -266,7 +307,8 @@ if __name__ == '__main__' :
     # For p==0, the method MDHT(m+1,m) corresponds to m=-1; never used in FBPIC
     methods = [ available_methods for p in range(pmax+1) ]
     methods[0] = \
-      [ method for method in available_methods if method != 'MDHT(m+1,m)']
+      [ method for method in available_methods if not \
+        method in ['MDHT(m+1,m)', 'LowMemoryDHT(m+1,m)'] ]
 
     for p in range(pmax+1) :
         compare_power_p( p, 1, Nr, rmax, Nz=Nz, methods=methods[p])
@@ -286,3 +328,8 @@ if __name__ == '__main__' :
                         methods=methods[p], Nz=Nz)
         compare_bessel( p, p+1, int(Nr*0.9), Nr, rmax,
                         methods=methods[p], Nz=Nz)
+
+    for Nr_lowmem in [ 200, 1000, 4000 ]:
+        for m in range(pmax+1) :
+            for p in [ m-1, m, m+1 ] :
+                compare_lowmem_matrix( p, m, Nr_lowmem, rmax )
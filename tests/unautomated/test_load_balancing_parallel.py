@@ -0,0 +1,70 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file tests the dynamic load balancing of the MPI domain decomposition,
+by running a periodic plasma wave (with plasma in only part of the box)
+with and without load balancing: the boundary between the subdomains
+should move towards the plasma, and the fields should be the same as
+without load balancing.
+
+This file is used by the automated test `test_load_balancing.py`
+
+Usage:
+------
+$ mpirun -np 2 python tests/unautomated/test_load_balancing_parallel.py
+"""
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+from fbpic.utils.mpi import comm as mpi_comm
+
+# The simulation box
+Nz = 200         # Number of gridpoints along z
+zmax = 40.e-6    # Length of the box along z (meters)
+Nr = 32          # Number of gridpoints along r
+rmax = 20.e-6    # Length of the box along r (meters)
+Nm = 1           # Number of modes used
+n_order = 16     # Order of the stencil
+dt = zmax/Nz/c   # Timestep (seconds)
+N_step = 40      # Number of iterations
+
+# The plasma (only in the first part of the box)
+n_e = 1.e24
+p_zmax = 0.3*zmax
+# Initial longitudinal momentum of the plasma wave
+uz_0 = 1.e-3
+k0 = 2*np.pi/p_zmax
+
+def run_plasma_wave( load_balancing ):
+    """
+    Run a periodic plasma wave on the available MPI ranks, and return
+    the global Ez field and the boundaries of the subdomains
+    """
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=p_zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, n_order=n_order, use_cuda=False,
+                      verbose_level=0 )
+    species = sim.ptcl[0]
+    species.uz[:] = uz_0*np.sin( k0*species.z )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.uz**2 )
+    if load_balancing:
+        sim.set_load_balancing( period=sim.comm.exchange_period )
+
+    sim.step( N_step, show_progress=False )
+    sim.fld.spect2interp('E')
+    Ez = sim.comm.gather_grid_array( sim.fld.interp[0].Ez )
+    return( Ez, sim.comm.get_domain_bounds() )
+
+Ez_ref, bounds_ref = run_plasma_wave( load_balancing=False )
+Ez, bounds = run_plasma_wave( load_balancing=True )
+if mpi_comm.rank == 0:
+    print( 'Boundaries of the subdomains: %s' %bounds )
+    # The boundary moved towards the plasma
+    assert bounds[1] < bounds_ref[1]
+    # The fields are the same (up to the small differences that are due
+    # to the finite size of the guard cells, and thus depend on the
+    # position of the boundaries)
+    assert abs( Ez_ref ).max() > 0
+    assert np.allclose( Ez, Ez_ref, rtol=0, atol=1.e-3*abs(Ez_ref).max() )
@@ -0,0 +1,106 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file tests the parallel writing of the openPMD files (argument
+`parallel_write` of FieldDiagnostic and ParticleDiagnostic), by running
+a plasma simulation on 2 MPI ranks, which writes the same diagnostics
+both with and without `parallel_write`, in two different directories:
+the files should contain the same fields and particles.
+(If h5py is not built with MPI support, the diagnostics with
+`parallel_write` fall back to gathering the data on the first rank, and
+the script checks that they do so.)
+The files are written in a temporary directory, which is removed at the end.
+
+This file is used by the automated test `test_parallel_write.py`
+
+Usage:
+------
+$ mpirun -np 2 python tests/unautomated/test_parallel_write_parallel.py
+"""
+import os, shutil, tempfile
+import h5py
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+from fbpic.openpmd_diag import FieldDiagnostic, ParticleDiagnostic
+from fbpic.utils.mpi import comm as mpi_comm
+
+# The simulation box
+Nz = 200         # Number of gridpoints along z
+zmax = 40.e-6    # Length of the box along z (meters)
+Nr = 16          # Number of gridpoints along r
+rmax = 20.e-6    # Length of the box along r (meters)
+Nm = 2           # Number of modes used
+n_order = 16     # Order of the stencil
+dt = zmax/Nz/c   # Timestep (seconds)
+N_step = 10      # Number of iterations
+diag_period = 5  # Period of the diagnostics
+
+# The plasma
+n_e = 1.e24
+uz_0 = 1.e-3
+k0 = 2*np.pi/zmax
+
+sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                  p_rmin=0., p_rmax=0.5*rmax, p_nz=2, p_nr=2, p_nt=4,
+                  n_e=n_e, n_order=n_order, use_cuda=False,
+                  verbose_level=0 )
+species = sim.ptcl[0]
+species.uz[:] = uz_0*np.sin( k0*species.z )
+species.inv_gamma[:] = 1./np.sqrt( 1 + species.uz**2 )
+
+def compare_groups( grp_gathered, grp_parallel ):
+    """
+    Check that two h5py.Group objects have the same datasets (recursively)
+    """
+    assert sorted( grp_gathered.keys() ) == sorted( grp_parallel.keys() )
+    for key in grp_gathered.keys():
+        if isinstance( grp_gathered[key], h5py.Group ):
+            compare_groups( grp_gathered[key], grp_parallel[key] )
+        else:
+            assert np.array_equal( grp_gathered[key][...],
+                                   grp_parallel[key][...] )
+
+# Write the diagnostics in a temporary directory (created by the first rank)
+if mpi_comm.rank == 0:
+    tmp_dir = tempfile.mkdtemp()
+else:
+    tmp_dir = None
+tmp_dir = mpi_comm.bcast( tmp_dir, root=0 )
+gathered_dir = os.path.join( tmp_dir, 'gathered_diags' )
+parallel_dir = os.path.join( tmp_dir, 'parallel_diags' )
+
+try:
+    # Write the same diagnostics with and without parallel HDF5
+    for write_dir, parallel_write in [ (gathered_dir, False),
+                                       (parallel_dir, True) ]:
+        diags = [
+            FieldDiagnostic( diag_period, sim.fld, comm=sim.comm,
+                write_dir=write_dir, parallel_write=parallel_write ),
+            ParticleDiagnostic( diag_period, {"electrons": species},
+                select={"uz": [0., None]}, comm=sim.comm,
+                write_dir=write_dir, parallel_write=parallel_write ) ]
+        # Parallel HDF5 is only used when h5py is built with MPI support
+        for diag in diags:
+            assert diag.parallel_write == \
+                (parallel_write and h5py.get_config().mpi)
+        sim.diags += diags
+    sim.step( N_step, show_progress=False )
+
+    # Compare the files on the first rank
+    if mpi_comm.rank == 0:
+        for iteration in range( 0, N_step, diag_period ):
+            filename = os.path.join( 'hdf5', 'data%08d.h5' %iteration )
+            f_gathered = h5py.File(
+                os.path.join( gathered_dir, filename ), 'r' )
+            f_parallel = h5py.File(
+                os.path.join( parallel_dir, filename ), 'r' )
+            compare_groups( f_gathered, f_parallel )
+            f_gathered.close()
+            f_parallel.close()
+finally:
+    mpi_comm.barrier()
+    if mpi_comm.rank == 0:
+        shutil.rmtree( tmp_dir )
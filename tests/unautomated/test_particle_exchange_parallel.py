@@ -0,0 +1,131 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file tests the exchange of particles between MPI domains:
+- The buffers of the ParticleBufferHandler are used directly, with numbers
+  of particles below and above the capacity of the preallocated buffers
+  (which are then enlarged): the received particles should be exactly
+  the particles that were sent by the neighbors.
+- A periodic plasma with random momenta and tracked particles is run:
+  no particle should be lost or duplicated by the exchanges, and the
+  particles should keep their id.
+
+This file is used by the automated test `test_particle_exchange.py`
+
+Usage:
+------
+$ mpirun -np 2 python tests/unautomated/test_particle_exchange_parallel.py
+"""
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+from fbpic.utils.mpi import comm as mpi_comm
+from fbpic.boundaries.particle_buffer_handling import ParticleBufferHandler, \
+    initial_exchange_capacity
+
+# Number of float and integer quantities of the exchanged particles
+n_float = 9
+n_int = 2
+
+# The simulation box
+Nz = 200         # Number of gridpoints along z
+zmax = 40.e-6    # Length of the box along z (meters)
+Nr = 16          # Number of gridpoints along r
+rmax = 10.e-6    # Length of the box along r (meters)
+Nm = 2           # Number of modes used
+n_order = 16     # Order of the stencil
+dt = zmax/Nz/c   # Timestep (seconds)
+N_step = 30      # Number of iterations
+
+def get_particles( rank, side, N, i_exchange ):
+    """
+    Return the float and integer quantities of the `N` particles that
+    `rank` sends to its neighbor `side` at the exchange `i_exchange`
+    """
+    i_side = {'left': 0, 'right': 1}[side]
+    offset = 1000000*rank + 100000*i_side + 10000*i_exchange
+    float_array = offset + 0.5 + np.arange( n_float*N ).reshape((n_float, N))
+    uint_array = ( offset + np.arange( n_int*N ).reshape((n_int, N)) \
+                   ).astype( np.uint64 )
+    return( float_array, uint_array )
+
+def test_buffer_handler():
+    """
+    Exchange particles with the neighbors (which is the same rank on both
+    sides, with 2 periodic MPI ranks), below and above the capacity
+    """
+    rank = mpi_comm.rank
+    neighbor = (rank + 1) % mpi_comm.size
+    handler = ParticleBufferHandler( mpi_comm, n_float, n_int,
+                                     neighbor, neighbor, tag=100 )
+    # Numbers of particles sent to the left and to the right
+    capacity = initial_exchange_capacity
+    N_sent = [ (10, 0), (capacity+1, 5), (3*capacity, capacity+2),
+                (7, 2*capacity), (0, 0) ]
+    for i_exchange, (N_left, N_right) in enumerate( N_sent ):
+        for side, N in zip( ['left', 'right'], [N_left, N_right] ):
+            float_send, uint_send = handler.get_send_arrays( side, N )
+            float_send[:], uint_send[:] = \
+                get_particles( rank, side, N, i_exchange )
+        float_recv_left, float_recv_right, uint_recv_left, uint_recv_right \
+            = handler.exchange()
+        # The particles from the left were sent to the right, and vice-versa
+        for side, float_recv, uint_recv, N in [
+                ('right', float_recv_left, uint_recv_left, N_right),
+                ('left', float_recv_right, uint_recv_right, N_left) ]:
+            float_ref, uint_ref = get_particles(
+                                    neighbor, side, N, i_exchange )
+            assert np.array_equal( float_recv, float_ref )
+            assert np.array_equal( uint_recv, uint_ref )
+    # The buffers were enlarged for the largest messages
+    assert handler.send_capacity['left'] >= 3*capacity
+    assert handler.recv_capacity['right'] >= 3*capacity
+    handler.free()
+
+def test_tracked_particles():
+    """
+    Run a periodic plasma with random momenta, and check that the
+    exchanges do not lose, duplicate or modify the tracked particles
+    """
+    np.random.seed(0)
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=1.e24, n_order=n_order, use_cuda=False,
+                      verbose_level=0 )
+    species = sim.ptcl[0]
+    species.ux[:] = 0.5*np.random.normal( size=species.Ntot )
+    species.uz[:] = 2.*np.random.normal( size=species.Ntot )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.ux**2 + species.uz**2 )
+    species.track( sim.comm )
+    # Store the initial radius of each particle
+    initial_r = get_radius_by_id( species )
+
+    sim.step( N_step, show_progress=False )
+
+    # The particles were exchanged, and their radius only changed by
+    # the motion within N_step iterations
+    final_r = get_radius_by_id( species )
+    if mpi_comm.rank == 0:
+        assert np.array_equal( np.sort( list(initial_r.keys()) ),
+                               np.sort( list(final_r.keys()) ) )
+        max_dr = N_step*c*dt
+        for pid in initial_r.keys():
+            assert abs( final_r[pid] - initial_r[pid] ) <= max_dr
+
+def get_radius_by_id( species ):
+    """
+    Return a dictionary with the id of all the particles (on all ranks)
+    as keys, and their radius as values (on rank 0)
+    """
+    ids = mpi_comm.gather( species.tracker.id[:species.Ntot] )
+    r = mpi_comm.gather( np.sqrt( species.x[:species.Ntot]**2
+                                + species.y[:species.Ntot]**2 ) )
+    if mpi_comm.rank == 0:
+        ids = np.concatenate( ids )
+        assert len( np.unique(ids) ) == len( ids )
+        return( dict( zip( ids, np.concatenate(r) ) ) )
+
+test_buffer_handler()
+test_tracked_particles()
@@ -0,0 +1,155 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file tests the decomposition of the simulation along r
+(`n_radial_domains` in the Simulation class):
+- The Hankel transforms of the DistributedDHT, whose matrices and spectral
+  arrays are shared between the ranks, should be identical (up to roundoff
+  errors) to those of the serial DHT. With `band_only=True`, the inverse
+  transform should only modify the local radial band and its halo.
+- A plasma with a radial and longitudinal momentum perturbation is
+  run once on each rank without MPI, and once with one radial domain per
+  rank: the fields should be identical (up to roundoff errors), and the
+  particles should be exchanged between the radial domains without being
+  lost or duplicated.
+
+This file is used by the automated test `test_radial_decomposition.py`
+
+Usage:
+------
+$ mpirun -np 2 python tests/unautomated/test_radial_decomposition_parallel.py
+"""
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+from fbpic.utils.mpi import comm as mpi_comm
+from fbpic.fields.utility_methods import get_radial_domain_bounds
+from fbpic.fields.spectral_transform.hankel import DHT
+from fbpic.fields.spectral_transform.distributed_hankel import DistributedDHT
+
+# The simulation box
+Nz = 64          # Number of gridpoints along z
+zmax = 20.e-6    # Length of the box along z (meters)
+Nr = 32          # Number of gridpoints along r
+rmax = 20.e-6    # Length of the box along r (meters)
+Nm = 2           # Number of modes used
+dt = zmax/Nz/c   # Timestep (seconds)
+N_step = 40      # Number of iterations
+n_e = 1.e24      # Density of the plasma
+# Amplitude of the momentum perturbation
+u0 = 0.05
+
+def test_distributed_dht():
+    """
+    Compare the forward and inverse transforms of the DistributedDHT
+    with those of the DHT, for the different orders of the transform
+    """
+    assert np.array_equal( get_radial_domain_bounds( 10, 3 ), [0, 3, 6, 10] )
+    bounds = get_radial_domain_bounds( Nr, mpi_comm.size )
+    block = slice( bounds[mpi_comm.rank], bounds[mpi_comm.rank+1] )
+    n_halo = 3
+    band = slice( max( block.start-n_halo, 0 ), min( block.stop+n_halo, Nr ) )
+    np.random.seed(0)
+    for p, m in [ (0, 0), (1, 0), (0, 1), (1, 1), (2, 1) ]:
+        dht = DHT( p, m, Nr, Nz, rmax )
+        distributed_dht = DistributedDHT( p, m, Nr, Nz, rmax,
+                                    radial_comm=mpi_comm, n_halo=n_halo )
+        assert np.array_equal( distributed_dht.get_nu(), dht.get_nu()[block] )
+        # Same random array on all ranks
+        F = np.random.normal( size=(Nz, Nr) ) \
+            + 1.j*np.random.normal( size=(Nz, Nr) )
+        G = np.empty_like( F )
+        G_local = np.empty( (Nz, block.stop-block.start), dtype=complex )
+        # Forward transform
+        dht.transform( F, G )
+        distributed_dht.transform( F, G_local )
+        assert np.allclose( G_local, G[:, block],
+                            rtol=0, atol=1.e-12*abs(G).max() )
+        # Inverse transform
+        F_serial = np.empty_like( F )
+        F_distributed = np.empty_like( F )
+        dht.inverse_transform( G, F_serial )
+        distributed_dht.inverse_transform( G[:, block].copy(), F_distributed )
+        assert np.allclose( F_distributed, F_serial,
+                            rtol=0, atol=1.e-12*abs(F_serial).max() )
+        # Inverse transform of the local radial band and its halo only
+        F_band = np.full_like( F, np.nan )
+        distributed_dht.inverse_transform( G[:, block].copy(), F_band,
+                                           band_only=True )
+        assert np.allclose( F_band[:, band], F_serial[:, band],
+                            rtol=0, atol=1.e-12*abs(F_serial).max() )
+        F_band[:, band] = np.nan
+        assert np.all( np.isnan( F_band ) )
+
+def test_radial_decomposition():
+    """
+    Run a plasma with one radial domain per rank, and compare
+    the fields with those of a simulation without MPI
+    """
+    sims = {}
+    for n_radial_domains in [ 1, mpi_comm.size ]:
+        sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                          p_rmin=0., p_rmax=0.5*rmax, p_nz=2, p_nr=2, p_nt=4,
+                          n_e=n_e, use_cuda=False, verbose_level=0,
+                          use_all_mpi_ranks=(n_radial_domains > 1),
+                          n_radial_domains=n_radial_domains )
+        sims[ n_radial_domains ] = sim
+    serial_sim = sims[1]
+    radial_sim = sims[ mpi_comm.size ]
+
+    # Use the same particles in both simulations (the angles of the
+    # particles are random): each radial domain gets the particles
+    # of the serial simulation that are in its radial band
+    serial_species = serial_sim.ptcl[0]
+    serial_species.x[:] = mpi_comm.bcast( serial_species.x )
+    serial_species.y[:] = mpi_comm.bcast( serial_species.y )
+    radial_species = radial_sim.ptcl[0]
+    r = np.sqrt( serial_species.x**2 + serial_species.y**2 )
+    rmin, rmax_local = radial_sim.comm.get_rmin_rmax()
+    selected = (r >= rmin) & (r < rmax_local)
+    N_local = selected.sum()
+    assert N_local == radial_species.Ntot
+    radial_species.resize_particle_arrays( N_local )
+    for name in [ 'x', 'y', 'z', 'w' ]:
+        getattr( radial_species, name )[:] = \
+            getattr( serial_species, name )[selected]
+
+    # Perturb the momenta (as a function of the position of the
+    # particles, so that the perturbation is the same in both cases)
+    kz = 2*np.pi/zmax
+    kr = 2*np.pi/(0.5*rmax)
+    for sim in [ serial_sim, radial_sim ]:
+        species = sim.ptcl[0]
+        r = np.sqrt( species.x**2 + species.y**2 )
+        species.ux[:] = u0 * np.sin( kz*species.z )
+        species.uy[:] = u0 * np.sin( kr*r ) * species.y/r
+        species.uz[:] = u0 * np.cos( kz*species.z )
+        species.inv_gamma[:] = 1./np.sqrt( 1 + species.ux**2
+                                        + species.uy**2 + species.uz**2 )
+        species.track( sim.comm )
+        sim.step( N_step, show_progress=False )
+
+    # The fields on the interpolation grid should be identical
+    for m in range(Nm):
+        for field in ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz', 'rho', 'Jz']:
+            serial_field = getattr( serial_sim.fld.interp[m], field )
+            radial_field = getattr( radial_sim.fld.interp[m], field )
+            assert np.allclose( radial_field, serial_field, rtol=0,
+                                atol=1.e-9*abs(serial_field).max() )
+
+    # The particles are in their radial domain (up to the distance that
+    # they travelled since the last exchange), and none was lost
+    # or duplicated by the exchanges
+    r = np.sqrt( radial_species.x**2 + radial_species.y**2 )
+    max_dr = radial_sim.comm.exchange_period*c*dt
+    assert np.all( (r >= rmin - max_dr) & (r <= rmax_local + max_dr) )
+    ids = np.concatenate( mpi_comm.allgather( radial_species.tracker.id ) )
+    assert len( ids ) == serial_species.Ntot
+    assert len( np.unique( ids ) ) == len( ids )
+    # Some particles were exchanged between the radial domains
+    assert radial_species.Ntot != N_local
+
+test_distributed_dht()
+test_radial_decomposition()
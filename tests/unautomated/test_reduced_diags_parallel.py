@@ -0,0 +1,86 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file tests the reduced diagnostics (ParticleMomentsDiagnostic,
+ParticleHistogramDiagnostic and FieldReductionDiagnostic) on 2 MPI ranks:
+their time series should match the quantities computed from the files of
+the regular diagnostics (which gather the data of all the ranks).
+The checks are those of `check_reduced_diags` in `test_reduced_diags.py`.
+The files are written in a temporary directory, which is removed at the end.
+
+This file is used by the automated test `test_reduced_diags_mpi.py`
+
+Usage:
+------
+$ mpirun -np 2 python tests/unautomated/test_reduced_diags_parallel.py
+"""
+import os, sys, shutil, tempfile
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+from fbpic.openpmd_diag import FieldDiagnostic, ParticleDiagnostic, \
+    ParticleMomentsDiagnostic, ParticleHistogramDiagnostic, \
+    FieldReductionDiagnostic
+from fbpic.utils.mpi import comm as mpi_comm
+# Import the checks of the automated test
+sys.path.insert( 0, os.path.dirname( os.path.dirname(
+                                    os.path.abspath(__file__) ) ) )
+from test_reduced_diags import check_reduced_diags, zmax, select, \
+    gamma_axis, uz_axis
+
+# The simulation box
+Nz = 200         # Number of gridpoints along z
+Nr = 16          # Number of gridpoints along r
+rmax = 20.e-6    # Length of the box along r (meters)
+Nm = 2           # Number of modes used
+n_order = 16     # Order of the stencil
+dt = zmax/Nz/c   # Timestep (seconds)
+N_step = 5       # Number of iterations
+diag_period = 2  # Period of the diagnostics
+
+sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                  p_rmin=0., p_rmax=0.5*rmax, p_nz=2, p_nr=2, p_nt=4,
+                  n_e=1.e24, n_order=n_order, particle_removal='mask',
+                  use_cuda=False, verbose_level=0 )
+# Give a random momentum to the particles, and remove some of them
+np.random.seed( mpi_comm.rank )
+species = sim.ptcl[0]
+species.ux[:] = 0.3*np.random.randn( species.Ntot )
+species.uz[:] = np.random.randn( species.Ntot )
+species.inv_gamma[:] = 1./np.sqrt( 1 + species.ux**2 + species.uz**2 )
+species.kill_particles( np.arange( 0, species.Ntot, 7 ) )
+
+# Write the diagnostics in a temporary directory (created by the first rank)
+if mpi_comm.rank == 0:
+    write_dir = tempfile.mkdtemp()
+else:
+    write_dir = None
+write_dir = mpi_comm.bcast( write_dir, root=0 )
+
+try:
+    sim.diags = [
+        FieldDiagnostic( diag_period, sim.fld, comm=sim.comm,
+                         fieldtypes=["E", "rho"], write_dir=write_dir ),
+        ParticleDiagnostic( diag_period, {"electrons": species},
+            comm=sim.comm, select=select, write_dir=write_dir,
+            particle_data=["position", "momentum", "weighting", "gamma"] ),
+        ParticleMomentsDiagnostic( diag_period, {"electrons": species},
+            comm=sim.comm, select=select, write_dir=write_dir ),
+        ParticleHistogramDiagnostic( diag_period, {"electrons": species},
+            comm=sim.comm, axes=[ gamma_axis ], select=select,
+            write_dir=write_dir, filename='spectrum.h5' ),
+        ParticleHistogramDiagnostic( diag_period, {"electrons": species},
+            comm=sim.comm, axes=[ ('z', 16, None, None), uz_axis ],
+            select=select, write_dir=write_dir, filename='phase_space.h5' ),
+        FieldReductionDiagnostic( diag_period, sim.fld, comm=sim.comm,
+            fieldtypes=["E", "rho"], write_dir=write_dir ) ]
+    sim.step( N_step, show_progress=False )
+
+    if mpi_comm.rank == 0:
+        check_reduced_diags( write_dir, range( 0, N_step, diag_period ) )
+finally:
+    mpi_comm.barrier()
+    if mpi_comm.rank == 0:
+        shutil.rmtree( write_dir )
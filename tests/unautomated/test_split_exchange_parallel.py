@@ -0,0 +1,152 @@
+# Copyright 2018, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file tests the split-phase exchange of the guard cells between MPI
+domains (`start_exchange`/`finish_exchange`):
+- Exchanges of E, B, J and rho that are in flight at the same time should
+  give the same fields as the blocking exchanges, done one after the other.
+- A plasma wave (with periodic boundaries) and a moving window with open
+  boundaries are run with `Simulation.step`, where the exchanges overlap
+  with the deposition and the transforms: the fields should be the same
+  as when every exchange is completed as soon as it is started.
+
+This file is used by the automated test `test_split_exchange.py`
+
+Usage:
+------
+$ mpirun -np 2 python tests/unautomated/test_split_exchange_parallel.py
+"""
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+from fbpic.utils.mpi import comm as mpi_comm
+
+# The simulation box
+Nz = 200         # Number of gridpoints along z
+zmax = 40.e-6    # Length of the box along z (meters)
+Nr = 16          # Number of gridpoints along r
+rmax = 10.e-6    # Length of the box along r (meters)
+Nm = 2           # Number of modes used
+n_order = 16     # Order of the stencil
+dt = zmax/Nz/c   # Timestep (seconds)
+N_step = 20      # Number of iterations
+
+# The plasma
+n_e = 1.e24
+# Initial longitudinal momentum of the plasma wave
+uz_0 = 1.e-3
+k0 = 2*np.pi/zmax
+
+# The exchanges performed during a PIC iteration
+exchanges = [ ('E', 'replace'), ('B', 'replace'),
+              ('J', 'add'), ('rho', 'add') ]
+
+def use_blocking_exchanges( comm ):
+    """
+    Replace the split-phase exchange of `comm` by a blocking exchange,
+    which is completed within `start_exchange` (`finish_exchange` then
+    does nothing)
+    """
+    start_exchange = comm.start_exchange
+    finish_exchange = comm.finish_exchange
+    def blocking_exchange( interp, fieldtype, method ):
+        start_exchange( interp, fieldtype, method )
+        finish_exchange( interp, fieldtype, method )
+    comm.start_exchange = blocking_exchange
+    comm.finish_exchange = lambda interp, fieldtype, method: None
+
+def get_exchanged_arrays( sim ):
+    """Return the list of arrays that are modified by the exchanges"""
+    arrays = []
+    for fieldtype, _ in exchanges:
+        for grids in sim.comm.get_exchanged_grids( sim.fld.interp, fieldtype ):
+            arrays += grids
+    return( arrays )
+
+def test_simultaneous_exchanges():
+    """
+    Fill the fields with random values, and check that the exchanges that
+    are in flight at the same time give the same result as the blocking
+    exchanges
+    """
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, n_order=n_order,
+                      use_cuda=False, verbose_level=0 )
+    np.random.seed( mpi_comm.rank )
+    arrays = get_exchanged_arrays( sim )
+    for array in arrays:
+        array[:] = np.random.rand( *array.shape ) \
+                    + 1.j*np.random.rand( *array.shape )
+    initial_arrays = [ array.copy() for array in arrays ]
+
+    # Blocking exchanges, one after the other
+    for fieldtype, method in exchanges:
+        sim.comm.exchange_fields( sim.fld.interp, fieldtype, method )
+    ref_arrays = [ array.copy() for array in arrays ]
+
+    # Split-phase exchanges, all in flight at the same time, and
+    # completed in a different order than they were started
+    for array, initial_array in zip( arrays, initial_arrays ):
+        array[:] = initial_array
+    for fieldtype, method in exchanges:
+        sim.comm.start_exchange( sim.fld.interp, fieldtype, method )
+    for fieldtype, method in exchanges[::-1]:
+        sim.comm.finish_exchange( sim.fld.interp, fieldtype, method )
+
+    assert sim.comm.pending_exchanges == {}
+    for array, ref_array, initial_array in \
+            zip( arrays, ref_arrays, initial_arrays ):
+        assert np.array_equal( array, ref_array )
+    # Check that the exchanges did modify the fields
+    assert not all( np.array_equal( array, initial_array )
+                    for array, initial_array in zip( arrays, initial_arrays ) )
+
+def run_simulation( blocking, moving_window ):
+    """
+    Run a plasma wave (periodic boundaries) or a plasma in a moving window
+    (open boundaries), and return the global fields on rank 0
+    """
+    boundaries = 'open' if moving_window else 'periodic'
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, p_zmin=0., p_zmax=zmax,
+                      p_rmin=0., p_rmax=0.5*rmax, p_nz=2, p_nr=2, p_nt=4,
+                      n_e=n_e, n_order=n_order, boundaries=boundaries,
+                      use_cuda=False, verbose_level=0 )
+    species = sim.ptcl[0]
+    species.uz[:] = uz_0*np.sin( k0*species.z )
+    species.inv_gamma[:] = 1./np.sqrt( 1 + species.uz**2 )
+    if moving_window:
+        sim.set_moving_window( v=c )
+    if blocking:
+        use_blocking_exchanges( sim.comm )
+
+    sim.step( N_step, show_progress=False )
+    assert sim.comm.pending_exchanges == {}
+    fields = {}
+    for fieldtype in ['Er', 'Ez', 'Bt', 'Jz', 'rho']:
+        fields[fieldtype] = [ sim.comm.gather_grid_array(
+            getattr( sim.fld.interp[m], fieldtype ) ) for m in range(Nm) ]
+    return( fields )
+
+def test_step( moving_window ):
+    """
+    Check that `Simulation.step` gives the same fields with the split-phase
+    exchanges as with the blocking exchanges
+    """
+    fields = run_simulation( blocking=False, moving_window=moving_window )
+    ref_fields = run_simulation( blocking=True, moving_window=moving_window )
+    if mpi_comm.rank == 0:
+        for fieldtype in fields:
+            # The fields are the same, up to the rounding errors (the
+            # result of the threaded deposition is not exactly reproducible)
+            field_max = max( abs( ref_field ).max()
+                             for ref_field in ref_fields[fieldtype] )
+            assert field_max > 0
+            for field, ref_field in zip( fields[fieldtype],
+                                         ref_fields[fieldtype] ):
+                assert np.allclose( field, ref_field,
+                                    rtol=0, atol=1.e-9*field_max )
+
+test_simultaneous_exchanges()
+test_step( moving_window=False )
+test_step( moving_window=True )